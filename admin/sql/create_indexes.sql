@@ -55,5 +55,7 @@ CREATE INDEX user_id_ndx_pinned_recording ON pinned_recording (user_id);
 
 CREATE INDEX release_mbid_ndx_release_color ON release_color (release_mbid);
 CREATE UNIQUE INDEX caa_id_ndx_release_color ON release_color (caa_id);
+-- NOTE: This index is used for KNN searches in listenbrainz/db/color.py, keep them in sync!
+CREATE INDEX color_ndx_release_color ON release_color USING gist (color);
 
 COMMIT;
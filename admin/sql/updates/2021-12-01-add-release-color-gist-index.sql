@@ -0,0 +1,5 @@
+BEGIN;
+
+CREATE INDEX color_ndx_release_color ON release_color USING gist (color);
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- Compress the chunks of the listen hypertable once no more listens are expected in them. The
+-- listens of each user are stored together in the compressed chunks, latest first, which is
+-- the order in which they are read. Writes to compressed chunks decompress them first, see
+-- listenbrainz/listenstore/timescale_compression.py.
+ALTER TABLE listen SET (timescaledb.compress, timescaledb.compress_segmentby = 'user_name', timescaledb.compress_orderby = 'listened_at DESC');
+
+-- 7776000 seconds = 90 days. The policy also compresses again the chunks which were decompressed to modify them.
+SELECT add_compression_policy('listen', compress_after => BIGINT '7776000');
@@ -11,6 +11,29 @@ CREATE TABLE listen (
 -- 86400 seconds * 5 = 432000 seconds = 5 days
 SELECT create_hypertable('listen', 'listened_at', chunk_time_interval => 432000);
 
+-- The listen count and the timestamps of the first and last listen of each user, maintained
+-- by the listenstore whenever listens are inserted or deleted
+CREATE TABLE listen_user_metadata (
+        user_name           TEXT                     NOT NULL,
+        count               BIGINT                   NOT NULL,
+        min_listened_at     BIGINT, -- NULL if the user has no listens
+        max_listened_at     BIGINT, -- NULL if the user has no listens
+        last_updated        TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+-- Deletions of all the listens of a user, which are processed in the background
+CREATE TABLE listen_delete_job (
+        id                  SERIAL,
+        user_name           TEXT                     NOT NULL,
+        min_listened_at     BIGINT                   NOT NULL,
+        max_listened_at     BIGINT                   NOT NULL,
+        next_listened_at    BIGINT                   NOT NULL, -- listens from min_listened_at up to this timestamp remain to be deleted
+        deleted_count       BIGINT                   NOT NULL DEFAULT 0,
+        created             TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+        last_updated        TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+        completed           TIMESTAMP WITH TIME ZONE
+);
+
 -- Playlists
 
 CREATE TABLE playlist.playlist (
@@ -1,5 +1,7 @@
 BEGIN;
 
 DROP TABLE IF EXISTS listen CASCADE;
+DROP TABLE IF EXISTS listen_user_metadata CASCADE;
+DROP TABLE IF EXISTS listen_delete_job CASCADE;
 
 COMMIT;
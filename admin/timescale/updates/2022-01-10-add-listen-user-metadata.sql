@@ -0,0 +1,23 @@
+-- Stop the timescale writer before running this script, so that the listens
+-- inserted while the table is filled are not left out of the counts.
+BEGIN;
+
+CREATE TABLE listen_user_metadata (
+        user_name           TEXT                     NOT NULL,
+        count               BIGINT                   NOT NULL,
+        min_listened_at     BIGINT, -- NULL if the user has no listens
+        max_listened_at     BIGINT, -- NULL if the user has no listens
+        last_updated        TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+INSERT INTO listen_user_metadata (user_name, count, min_listened_at, max_listened_at)
+     SELECT user_name
+          , count(*)
+          , min(listened_at)
+          , max(listened_at)
+       FROM listen
+   GROUP BY user_name;
+
+ALTER TABLE listen_user_metadata ADD CONSTRAINT listen_user_metadata_pkey PRIMARY KEY (user_name);
+
+COMMIT;
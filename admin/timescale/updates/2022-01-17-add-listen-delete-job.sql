@@ -0,0 +1,17 @@
+BEGIN;
+
+CREATE TABLE listen_delete_job (
+        id                  SERIAL,
+        user_name           TEXT                     NOT NULL,
+        min_listened_at     BIGINT                   NOT NULL,
+        max_listened_at     BIGINT                   NOT NULL,
+        next_listened_at    BIGINT                   NOT NULL, -- listens from min_listened_at up to this timestamp remain to be deleted
+        deleted_count       BIGINT                   NOT NULL DEFAULT 0,
+        created             TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+        last_updated        TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+        completed           TIMESTAMP WITH TIME ZONE
+);
+
+ALTER TABLE listen_delete_job ADD CONSTRAINT listen_delete_job_pkey PRIMARY KEY (id);
+
+COMMIT;
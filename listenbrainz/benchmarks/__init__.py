@@ -0,0 +1,13 @@
+""" Reproducible performance benchmarks of the hot paths of ListenBrainz.
+
+The scenarios of listenbrainz.benchmarks.scenarios time the listenstore, the listen submission,
+statistics and feedback apis, the listen dumps, the MBID mapping writer and the lookups of the
+MBID mapping index on data generated by listenbrainz.benchmarks.generators, and their results are
+compared with listenbrainz.benchmarks.results. Run them against the test stack with
+
+    ./develop.sh manage benchmark run --output results.json
+    ./develop.sh manage benchmark compare baseline.json results.json --threshold 10
+
+The results of the cover art benchmark of the MBID mapping container, written with
+python manage.py benchmark_coverart IMAGE_DIR --output coverart.json, are compared in the same way.
+"""
@@ -0,0 +1,76 @@
+""" This module contains a click group with commands to run the benchmarks and compare their results. """
+import sys
+
+import click
+
+from listenbrainz.benchmarks import results as benchmark_results
+from listenbrainz.benchmarks.scenarios import SCENARIOS, run_scenarios
+from listenbrainz.webserver import create_app
+
+cli = click.Group()
+
+
+def _print_result(name, result):
+    if "skipped" in result:
+        print("%-30s skipped: %s" % (name, result["skipped"]))
+    elif not result["operations"]:
+        print("%-30s no operations" % name)
+    else:
+        latency = result["latency_ms"]
+        print("%-30s %8d ops %12.1f items/s   p50 %9.1f ms   p90 %9.1f ms   p99 %9.1f ms%s" % (
+            name, result["operations"], result["items_per_second"], latency["p50"], latency["p90"], latency["p99"],
+            "   %.1f MB" % (result["size_bytes"] / 1024 / 1024) if "size_bytes" in result else ""))
+
+
+def _print_comparisons(comparisons):
+    """ Print the comparisons, returns whether any of them is a regression """
+    regressed = False
+    for comparison in comparisons:
+        regressed = regressed or comparison["regression"]
+        print("%-30s %-20s %12.1f -> %12.1f  %+7.1f%%%s" % (
+            comparison["scenario"], comparison["metric"], comparison["baseline"], comparison["current"],
+            comparison["change"], "  REGRESSION" if comparison["regression"] else ""))
+    return regressed
+
+
+def run_and_report(scenarios, seed=0, scale=1.0, output=None, baseline=None,
+                   threshold=benchmark_results.DEFAULT_THRESHOLD):
+    """ Run the given scenarios, print their results and write them to output, and compare them to
+        the results in baseline. Exits with 1 if any scenario regressed from the baseline. """
+    app = create_app()
+    with app.app_context():
+        results = run_scenarios(scenarios, seed, scale, on_result=_print_result)
+    if output:
+        benchmark_results.save(results, output)
+    if baseline:
+        comparisons = benchmark_results.compare(benchmark_results.load(baseline), results, threshold)
+        if _print_comparisons(comparisons):
+            sys.exit(1)
+
+
+@cli.command(name="run")
+@click.option("--scenario", "-s", "scenarios", multiple=True, type=click.Choice(list(SCENARIOS)),
+              help="Scenario to run, can be given several times. All scenarios are run by default.")
+@click.option("--seed", type=int, default=0, help="Seed of the generated data")
+@click.option("--scale", type=float, default=1.0, help="Size of the generated data, relative to the default size")
+@click.option("--output", "-o", default=None, help="Write the results as json to this file")
+@click.option("--baseline", "-b", default=None, help="Compare the results to those in this file")
+@click.option("--threshold", "-t", type=float, default=benchmark_results.DEFAULT_THRESHOLD,
+              help="Regressions beyond this change in % fail the comparison to the baseline")
+def run(scenarios, seed, scale, output, baseline, threshold):
+    """ Run the benchmark scenarios against the configured databases, redis and rabbitmq.
+        Only run this against a test stack: the generated users are created and removed. """
+    run_and_report(scenarios or list(SCENARIOS), seed, scale, output, baseline, threshold)
+
+
+@cli.command(name="compare")
+@click.argument("baseline", type=click.Path(exists=True))
+@click.argument("current", type=click.Path(exists=True))
+@click.option("--threshold", "-t", type=float, default=benchmark_results.DEFAULT_THRESHOLD,
+              help="Regressions beyond this change in % fail the comparison")
+def compare(baseline, current, threshold):
+    """ Compare the results of two runs of the benchmarks, exits with 1 if any scenario regressed. """
+    comparisons = benchmark_results.compare(benchmark_results.load(baseline), benchmark_results.load(current),
+                                            threshold)
+    if _print_comparisons(comparisons):
+        sys.exit(1)
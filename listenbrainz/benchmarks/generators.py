@@ -0,0 +1,229 @@
+""" Seeded generators of synthetic users, listens, feedback and statistics for the benchmarks.
+
+The same seed always generates the same data, so that the results of runs of the benchmarks
+against different versions of the code are comparable. The data mimics the shape of real
+listening histories where it matters for performance: the activity of users and the popularity
+of artists and tracks follow Zipf distributions, listens come in sessions during the waking hours
+of the users, and a fraction of the listens are imported long after they were listened to.
+"""
+import uuid
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+from random import Random
+from typing import Dict, Iterator, List, Tuple
+
+BENCHMARK_USER_PREFIX = "benchmark_user_"
+# the musicbrainz_row_ids of the benchmark users start here, well above those of the test data
+BENCHMARK_ROW_ID_OFFSET = 1000000000
+
+# the caa_ids of the benchmark release colors are negative, so that they never clash with real cover art
+BENCHMARK_CAA_ID_OFFSET = -1
+
+# the fraction of the release colors which are close to a shade of grey, as many covers are
+GREY_COLOR_FRACTION = 0.3
+
+MSID_NAMESPACE = uuid.UUID("8d3f4a52-2bd4-4f3e-8d6c-0a5b4a2c9d17")
+
+# The relative number of listens in each hour of the day, in the time zone of the user
+HOURLY_ACTIVITY = [3, 2, 1, 1, 1, 1, 2, 4, 6, 7, 7, 7, 8, 8, 7, 7, 8, 9, 10, 11, 11, 10, 8, 5]
+HOURLY_CUM_WEIGHTS = list(accumulate(HOURLY_ACTIVITY))
+
+
+class ZipfSampler:
+    """ Samples ranks from 1 to n, rank k being drawn with a probability proportional to 1 / k ** s """
+
+    def __init__(self, n: int, s: float = 1.1):
+        self.cum_weights = list(accumulate(1 / k ** s for k in range(1, n + 1)))
+
+    def sample(self, rng: Random) -> int:
+        return bisect_left(self.cum_weights, rng.random() * self.cum_weights[-1]) + 1
+
+
+@lru_cache(maxsize=None)
+def _msid(kind: str, name: str) -> str:
+    return str(uuid.uuid5(MSID_NAMESPACE, kind + ":" + name))
+
+
+class Catalogue:
+    """ The artists, releases and recordings that the generated listens are of. Each artist has
+        tracks_per_artist recordings on tracks_per_artist / 10 releases. """
+
+    def __init__(self, artists: int = 10000, tracks_per_artist: int = 30, s: float = 1.1):
+        self.artists = ZipfSampler(artists, s)
+        self.tracks = ZipfSampler(tracks_per_artist, s)
+
+    @staticmethod
+    def artist(artist: int) -> Dict:
+        name = "Artist %d" % artist
+        return {"artist_name": name, "artist_msid": _msid("artist", name)}
+
+    @staticmethod
+    def recording(artist: int, track: int) -> Dict:
+        recording = Catalogue.artist(artist)
+        recording["release_name"] = "Release %d-%d" % (artist, track // 10)
+        recording["release_msid"] = _msid("release", recording["release_name"])
+        recording["track_name"] = "Track %d-%d" % (artist, track)
+        recording["recording_msid"] = _msid("recording", recording["track_name"])
+        return recording
+
+    def sample_artist(self, rng: Random) -> int:
+        return self.artists.sample(rng)
+
+    def sample_recording(self, rng: Random, artist: int = None) -> Dict:
+        if artist is None:
+            artist = self.sample_artist(rng)
+        return self.recording(artist, self.tracks.sample(rng))
+
+
+def generate_users(rng: Random, count: int) -> List[Dict]:
+    """ Generate users, with an activity which is the relative number of listens they submit.
+
+        Returns:
+            a list of dicts with the musicbrainz_id, musicbrainz_row_id and activity of each user
+    """
+    return [{
+        "musicbrainz_id": BENCHMARK_USER_PREFIX + str(i),
+        "musicbrainz_row_id": BENCHMARK_ROW_ID_OFFSET + i,
+        # a few users submit most of the listens
+        "activity": rng.paretovariate(1.2),
+        "utc_offset": rng.randint(-10, 12) * 3600,
+    } for i in range(1, count + 1)]
+
+
+def _session(rng: Random, catalogue: Catalogue, user: Dict, start: int, length: int) -> List[Dict]:
+    """ A listening session of a user, a run of listens one after the other. Some of the
+        listens of a session are of the same artist, as when listening to an album. """
+    listens = []
+    listened_at = start
+    artist = catalogue.sample_artist(rng)
+    for _ in range(length):
+        if rng.random() < 0.4:
+            artist = catalogue.sample_artist(rng)
+        recording = catalogue.sample_recording(rng, artist)
+        listens.append({
+            "user_name": user["musicbrainz_id"],
+            "listened_at": listened_at,
+            "recording_msid": recording["recording_msid"],
+            "track_metadata": {
+                "artist_name": recording["artist_name"],
+                "track_name": recording["track_name"],
+                "release_name": recording["release_name"],
+                "additional_info": {
+                    "artist_msid": recording["artist_msid"],
+                    "release_msid": recording["release_msid"],
+                    "recording_msid": recording["recording_msid"],
+                    "listening_from": "benchmark",
+                },
+            },
+        })
+        listened_at += max(30, int(rng.gauss(220, 60)))
+    return listens
+
+
+def generate_listens(rng: Random, catalogue: Catalogue, users: List[Dict], count: int, now: int,
+                     days: int = 30, import_fraction: float = 0.1, import_years: int = 10) -> List[Dict]:
+    """ Generate listens of the given users, in sessions spread over the waking hours of the users
+        in the last days before now. A fraction of the sessions are older, as if imported from
+        another service, going back up to import_years.
+
+        Returns:
+            a list of listens in the json format of Listen.from_json, with the user_name but
+            not the user_id of their user, in the order in which they are submitted
+    """
+    user_cum_weights = list(accumulate(user["activity"] for user in users))
+    listens = []
+    while len(listens) < count:
+        user = rng.choices(users, cum_weights=user_cum_weights)[0]
+        if rng.random() < import_fraction:
+            day = rng.randint(days, import_years * 365)
+        else:
+            # recent days have more listens, the user count of the service grows
+            day = int(rng.triangular(0, days, 0))
+        hour = rng.choices(range(24), cum_weights=HOURLY_CUM_WEIGHTS)[0]
+        start = (now // 86400 - day) * 86400 + hour * 3600 + rng.randint(0, 3599) - user["utc_offset"]
+        length = min(count - len(listens), 1 + int(rng.expovariate(1 / 8)))
+        listens.extend(listen for listen in _session(rng, catalogue, user, start, length)
+                       if listen["listened_at"] < now)
+    return listens[:count]
+
+
+def submission_payload(listens: List[Dict]) -> List[Dict]:
+    """ The listens in the format in which they are submitted to the api, without their user
+        and msids. """
+    return [{
+        "listened_at": listen["listened_at"],
+        "track_metadata": {
+            "artist_name": listen["track_metadata"]["artist_name"],
+            "track_name": listen["track_metadata"]["track_name"],
+            "release_name": listen["track_metadata"]["release_name"],
+            "additional_info": {"listening_from": "benchmark"},
+        },
+    } for listen in listens]
+
+
+def generate_feedback(rng: Random, listens: List[Dict], count: int) -> List[Dict]:
+    """ Generate feedback of users on recordings they listened to, mostly loves.
+
+        Returns:
+            a list of dicts with the user_name, recording_msid and score of each feedback, at most
+            one per user and recording
+    """
+    feedback = {}
+    for _ in range(count * 10):
+        if len(feedback) == count:
+            break
+        listen = rng.choice(listens)
+        key = (listen["user_name"], listen["recording_msid"])
+        if key not in feedback:
+            feedback[key] = {"user_name": key[0], "recording_msid": key[1], "score": 1 if rng.random() < 0.8 else -1}
+    return list(feedback.values())
+
+
+def _stat_counts(rng: Random, count: int, total: int, s: float = 1.1) -> List[int]:
+    """ Listen counts of the top count entities of a statistic, in descending order """
+    weights = [1 / k ** s for k in range(1, count + 1)]
+    scale = total / sum(weights)
+    return sorted((max(1, int(weight * scale * rng.uniform(0.8, 1.2))) for weight in weights), reverse=True)
+
+
+def generate_user_stats(rng: Random, entity: str, stats_range: str, count: int, time_range: Tuple[int, int]) -> Dict:
+    """ Generate a document of the top artists, releases or recordings of a user, in the format
+        of a StatRange of UserEntityRecord.
+
+        Args:
+            entity: one of "artists", "releases" or "recordings"
+            stats_range: the range of the statistic, such as "all_time"
+            count: the number of entities in the document
+            time_range: the from_ts and to_ts of the statistic
+    """
+    total = count * rng.randint(5, 50)
+    data = []
+    for rank, listen_count in enumerate(_stat_counts(rng, count, total), start=1):
+        artist = Catalogue.artist(rank)
+        recording = Catalogue.recording(rank, rng.randint(0, 29))
+        record = {"artist_name": artist["artist_name"], "artist_mbids": [], "listen_count": listen_count}
+        if entity in ("releases", "recordings"):
+            record["release_name"] = recording["release_name"]
+        if entity == "recordings":
+            record["track_name"] = recording["track_name"]
+        data.append(record)
+    return {
+        "from_ts": time_range[0],
+        "to_ts": time_range[1],
+        "stats_range": stats_range,
+        "count": count,
+        "data": data,
+    }
+
+
+def generate_release_colors(rng: Random, count: int) -> Iterator[Tuple[int, str, int, int, int]]:
+    """ Generate the average colors of the cover art of releases, as (caa_id, release_mbid, red, green, blue)
+        tuples. The colors are generated one at a time, as the benchmarks insert millions of them. """
+    for i in range(count):
+        if rng.random() < GREY_COLOR_FRACTION:
+            grey = rng.randint(0, 255)
+            red, green, blue = (min(255, max(0, grey + rng.randint(-8, 8))) for _ in range(3))
+        else:
+            red, green, blue = rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)
+        yield BENCHMARK_CAA_ID_OFFSET - i, str(uuid.UUID(int=rng.getrandbits(128), version=4)), red, green, blue
@@ -0,0 +1,133 @@
+""" Machine-readable results of benchmark runs, and their comparison.
+
+The results of a run are a json document:
+
+    {
+        "meta": {"seed": 0, "scale": 1.0, "started": "2021-08-01T12:00:00", "listens": 50000, "users": 100},
+        "scenarios": {
+            "listenstore_insert": {
+                "operations": 50, "items": 50000, "seconds": 12.5, "items_per_second": 4000.0,
+                "latency_ms": {"p50": 240.1, "p90": 280.3, "p99": 350.2, "max": 371.0}
+            },
+            "mapping_writer": {"skipped": "MBID_MAPPING_DATABASE_URI is not configured"}
+        }
+    }
+
+An operation is one timed call, such as the insert of a batch of listens, and the items are
+what it processes, such as the listens of the batch. Scenarios can add other measurements to
+their result, such as size_bytes, the size of the data they read.
+
+Benchmarks which run where this package can't be imported, such as those of the MBID mapping
+container, write the raw durations of the operations of their scenarios instead, which load
+summarizes like the scenarios run here:
+
+    {"scenarios": {"coverart_pillow": {"durations": [0.012, 0.011, ...], "items": 100}}}
+
+The durations are in seconds.
+"""
+import json
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, List
+
+from listenbrainz.utils import percentile
+
+PERCENTILES = (50, 90, 99)
+
+# A scenario regressed if its throughput dropped, or its p50 or p99 latency or the size of the data
+# it measured grew, by more than this
+DEFAULT_THRESHOLD = 10  # in %
+
+
+class Timings:
+    """ The durations of the operations of a scenario """
+
+    def __init__(self):
+        self.durations = []
+        self.items = 0
+        # other measurements of the scenario, such as the size of the data it read, added to its result
+        self.extra = {}
+
+    @contextmanager
+    def time(self, items: int = 1):
+        """ Time the operation in the with block, which processes the given number of items """
+        start = perf_counter()
+        yield
+        self.durations.append(perf_counter() - start)
+        self.items += items
+
+
+def summarize(timings: Timings) -> Dict:
+    """ Returns the result of a scenario from the timings of its operations """
+    durations = sorted(duration * 1000 for duration in timings.durations)
+    if not durations:
+        return {"operations": 0, "items": 0, "seconds": 0.0, "items_per_second": 0.0, "latency_ms": {},
+                **timings.extra}
+    seconds = sum(durations) / 1000
+    latency = {"p%d" % p: round(percentile(durations, p), 3) for p in PERCENTILES}
+    latency["max"] = round(durations[-1], 3)
+    return {
+        "operations": len(durations),
+        "items": timings.items,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(timings.items / seconds, 1) if seconds else 0.0,
+        "latency_ms": latency,
+        **timings.extra,
+    }
+
+
+def save(results: Dict, path: str):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+
+
+def load(path: str) -> Dict:
+    with open(path) as f:
+        results = json.load(f)
+    for name, result in results["scenarios"].items():
+        if "durations" in result:
+            timings = Timings()
+            timings.durations = result["durations"]
+            timings.items = result.get("items", len(result["durations"]))
+            results["scenarios"][name] = summarize(timings)
+    return results
+
+
+def _change(baseline: float, current: float) -> float:
+    """ The relative change from baseline to current, in % """
+    return (current - baseline) / baseline * 100
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Dict]:
+    """ Compare the results of a run to those of a baseline run. Only the scenarios which ran in
+        both runs are compared.
+
+        Returns:
+            a list of the comparisons of the scenarios, dicts with the scenario, the metric, its value
+            in the baseline and current runs, its change in % and whether the change is a regression
+            beyond the threshold (in %)
+    """
+    comparisons = []
+    for scenario, result in sorted(current["scenarios"].items()):
+        base = baseline["scenarios"].get(scenario)
+        if not base or "skipped" in base or "skipped" in result or not base["operations"] or not result["operations"]:
+            continue
+
+        metrics = [("items_per_second", base["items_per_second"], result["items_per_second"], -1)]
+        for p in ("p50", "p99"):
+            metrics.append(("latency_ms." + p, base["latency_ms"][p], result["latency_ms"][p], 1))
+        if "size_bytes" in base and "size_bytes" in result:
+            metrics.append(("size_bytes", base["size_bytes"], result["size_bytes"], 1))
+        for metric, base_value, value, worse in metrics:
+            if not base_value:
+                continue
+            change = _change(base_value, value)
+            comparisons.append({
+                "scenario": scenario,
+                "metric": metric,
+                "baseline": base_value,
+                "current": value,
+                "change": round(change, 1),
+                "regression": change * worse > threshold,
+            })
+    return comparisons
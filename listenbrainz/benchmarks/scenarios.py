@@ -0,0 +1,603 @@
+""" Scenarios which time the hot paths of ListenBrainz on generated data.
+
+The scenarios run against the databases, redis and rabbitmq of the configured app, and are meant
+to be run against the stack of docker/docker-compose.test.yml, which is reset by the tests anyway.
+The generated users, their listens, feedback, statistics and mapping entries, the scratch
+hypertable of the compression scenarios and the generated release colors are removed before and
+after each run which uses them.
+"""
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from random import Random
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import psycopg2
+from psycopg2.extras import execute_values
+import sqlalchemy
+import ujson
+from flask import current_app
+
+import listenbrainz.db.feedback as db_feedback
+import listenbrainz.db.stats as db_stats
+import listenbrainz.db.user as db_user
+from data.model.common_stat import StatRange
+from data.model.user_entity import UserEntityRecord
+from listenbrainz import config, db
+from listenbrainz.benchmarks.generators import Catalogue, generate_feedback, generate_listens, generate_release_colors, \
+    generate_user_stats, generate_users, submission_payload
+from listenbrainz.benchmarks.results import Timings, summarize
+from listenbrainz.db import timescale
+from listenbrainz.db.color import INTERMEDIARY_COUNT_MULTIPLIER, RELEASES_FOR_COLOR_QUERY
+from listenbrainz.db.model.color import ColorCube
+from listenbrainz.db.model.feedback import Feedback
+from listenbrainz.labs_api.labs.api.mapping_index import INDEX_COLUMNS, MappingIndex, clean_lookup_string
+from listenbrainz.listen import Listen, timescale_row_to_api
+from listenbrainz.webserver import timescale_connection
+from listenbrainz.webserver.views.color_api import DEFAULT_NUMBER_OF_RELEASES
+
+# The number of generated items at scale 1
+USER_COUNT = 100
+LISTEN_COUNT = 50000
+FEEDBACK_COUNT = 5000
+QUERY_COUNT = 500
+
+INSERT_BATCH_SIZE = 1000
+SUBMIT_BATCH_SIZE = 100
+MAPPING_BATCH_SIZE = 100
+SERIALIZATION_BATCH_SIZE = 1000
+
+# A scratch hypertable, dropped after each run, to compare reads from compressed and uncompressed chunks
+COMPRESSION_TABLE = "listen_compression_benchmark"
+STATS_ENTITIES = ("artists", "releases", "recordings")
+STATS_ENTITY_COUNT = 1000
+
+MAPPING_LOOKUP_COUNT = 100000
+MAPPING_LOOKUP_BATCH_SIZE = 1000
+
+RELEASE_COLOR_COUNT = 1000000
+RELEASE_COLOR_BATCH_SIZE = 10000
+
+
+class BenchmarkData:
+    """ The data generated for a run of the benchmarks, and the state of the databases.
+
+        The listens are generated up to the start of the current day, so that runs on the
+        same day with the same seed and scale work on identical data.
+    """
+
+    def __init__(self, seed: int = 0, scale: float = 1.0):
+        self.seed = seed
+        self.scale = scale
+        self.now = int(time.time()) // 86400 * 86400
+        rng = Random(seed)
+        self.catalogue = Catalogue()
+        self.users = generate_users(rng, max(1, int(USER_COUNT * scale)))
+        self.listens = generate_listens(rng, self.catalogue, self.users, int(LISTEN_COUNT * scale), self.now)
+        self.feedback = generate_feedback(rng, self.listens, int(FEEDBACK_COUNT * scale))
+        self.query_count = max(1, int(QUERY_COUNT * scale))
+
+        self.started = None
+        self.mapping_lookups = None
+        self.timescale_rows = None
+        # None, or whether the chunks of COMPRESSION_TABLE are "uncompressed" or "compressed"
+        self.compression_table = None
+        self.listens_inserted = False
+        self.feedback_inserted = False
+        self.release_colors_inserted = False
+        self.stats_inserted = False
+
+    def rng(self, scenario: str) -> Random:
+        """ A random generator for the queries of a scenario, which doesn't depend on the other scenarios run """
+        return Random("%s:%s" % (self.seed, scenario))
+
+    def sample_users(self, rng: Random, count: int) -> List[Dict]:
+        """ Pick users to query in proportion to their activity, as active users are also read the most """
+        return rng.choices(self.users, weights=[user["activity"] for user in self.users], k=count)
+
+    def setup(self):
+        """ Create the generated users, removing what is left of the previous runs first """
+        self.cleanup()
+        self.started = datetime.utcnow()
+        for user in self.users:
+            row = db_user.get_or_create(user["musicbrainz_row_id"], user["musicbrainz_id"])
+            user["id"] = row["id"]
+            user["auth_token"] = row["auth_token"]
+        user_ids = {user["musicbrainz_id"]: user["id"] for user in self.users}
+        for listen in self.listens:
+            listen["user_id"] = user_ids[listen["user_name"]]
+
+    def cleanup(self):
+        """ Remove the generated users and everything which was stored for them """
+        listenstore = timescale_connection._ts
+        user_names = [user["musicbrainz_id"] for user in self.users]
+        for user in self.users:
+            row = db_user.get_by_mb_row_id(user["musicbrainz_row_id"])
+            if row:
+                listenstore.delete(row["musicbrainz_id"])
+                # the feedback and statistics of the user are deleted with it
+                db_user.delete(row["id"])
+        with timescale.engine.connect() as connection:
+            connection.execute(sqlalchemy.text("DELETE FROM listen_user_metadata WHERE user_name = ANY(:user_names)"),
+                               user_names=user_names)
+            connection.execute(sqlalchemy.text("DELETE FROM mbid_mapping WHERE recording_msid = ANY(CAST(:msids AS UUID[]))"),
+                               msids=list({listen["recording_msid"] for listen in self.listens}))
+
+
+def _batches(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _get(client, url: str):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError("GET %s failed with %d: %s" % (url, response.status_code, response.data))
+    return response
+
+
+def _insert_listens(data: BenchmarkData, timings: Timings = None):
+    listenstore = timescale_connection._ts
+    timings = timings or Timings()
+    for batch in _batches(data.listens, INSERT_BATCH_SIZE):
+        # Listen.from_json replaces the timestamp of the listen it is given
+        listens = [Listen.from_json(dict(listen)) for listen in batch]
+        with timings.time(len(listens)):
+            listenstore.insert(listens)
+    data.listens_inserted = True
+
+
+def _insert_feedback(data: BenchmarkData, timings: Timings = None):
+    user_ids = {user["musicbrainz_id"]: user["id"] for user in data.users}
+    timings = timings or Timings()
+    for feedback in data.feedback:
+        with timings.time():
+            db_feedback.insert(Feedback(user_id=user_ids[feedback["user_name"]],
+                                        recording_msid=feedback["recording_msid"],
+                                        score=feedback["score"]))
+    data.feedback_inserted = True
+
+
+def listenstore_insert(data: BenchmarkData) -> Timings:
+    """ Insert the listens into the listenstore in batches, as the timescale writer does """
+    timings = Timings()
+    _insert_listens(data, timings)
+    return timings
+
+
+def fetch_listens(data: BenchmarkData) -> Timings:
+    """ Fetch pages of listens of users, either their latest listens or from a point in their history """
+    if not data.listens_inserted:
+        _insert_listens(data)
+    listenstore = timescale_connection._ts
+    rng = data.rng("fetch_listens")
+    timings = Timings()
+    for user in data.sample_users(rng, data.query_count):
+        to_ts = rng.randint(data.now - 365 * 86400, data.now) if rng.random() < 0.5 else None
+        with timings.time():
+            listenstore.fetch_listens(user["musicbrainz_id"], to_ts=to_ts, limit=25, as_api=True)
+    return timings
+
+
+@contextmanager
+def _lifted_rate_limits():
+    """ Lift the rate limits of the api while the block runs, and restore the previous ones after it """
+    from brainzutils import cache
+    from brainzutils.ratelimit import set_rate_limits, ratelimit_cache_namespace, \
+        ratelimit_per_token_key, ratelimit_per_ip_key, ratelimit_window_key, \
+        ratelimit_per_token_default, ratelimit_per_ip_default, ratelimit_window_default
+
+    keys = (ratelimit_per_token_key, ratelimit_per_ip_key, ratelimit_window_key)
+    defaults = (ratelimit_per_token_default, ratelimit_per_ip_default, ratelimit_window_default)
+    # limits that were never set are set to the defaults by brainzutils when they are first checked
+    previous = []
+    for key, default in zip(keys, defaults):
+        value = cache.get(key, namespace=ratelimit_cache_namespace)
+        previous.append(int(value) if value else default)
+    set_rate_limits(10 ** 6, 10 ** 6, 10)
+    try:
+        yield
+    finally:
+        set_rate_limits(*previous)
+
+
+def submit_listens(data: BenchmarkData) -> Timings:
+    """ Submit imports of listens to /1/submit-listens. The submitted listens are only queued
+        for the timescale writer, which isn't part of the scenario. """
+    listens_by_user = defaultdict(list)
+    for listen in data.listens:
+        listens_by_user[listen["user_name"]].append(listen)
+    users = {user["musicbrainz_id"]: user for user in data.users}
+    requests = []
+    for user_name, listens in sorted(listens_by_user.items()):
+        for batch in _batches(listens, SUBMIT_BATCH_SIZE):
+            requests.append((users[user_name]["auth_token"], submission_payload(batch)))
+    data.rng("submit_listens").shuffle(requests)
+
+    client = current_app.test_client()
+    timings = Timings()
+    # the requests all come from the same ip, and would otherwise be throttled
+    with _lifted_rate_limits():
+        for auth_token, payload in requests[:data.query_count]:
+            with timings.time(len(payload)):
+                response = client.post("/1/submit-listens", json={"listen_type": "import", "payload": payload},
+                                       headers={"Authorization": "Token %s" % auth_token})
+            if response.status_code != 200:
+                raise RuntimeError("Submitting listens failed with %d: %s" % (response.status_code, response.data))
+    return timings
+
+
+def stats_read(data: BenchmarkData) -> Timings:
+    """ Read the top artists, releases and recordings of users from the statistics api """
+    rng = data.rng("stats_read")
+    if not data.stats_inserted:
+        time_range = (data.now - 365 * 86400, data.now)
+        for user in data.users:
+            for entity in STATS_ENTITIES:
+                stats = generate_user_stats(rng, entity, "all_time", STATS_ENTITY_COUNT, time_range)
+                db_stats.insert_user_jsonb_data(user["id"], entity, StatRange[UserEntityRecord](**stats))
+        data.stats_inserted = True
+
+    client = current_app.test_client()
+    timings = Timings()
+    for user in data.sample_users(rng, data.query_count):
+        url = "/1/stats/user/%s/%s?range=all_time&count=100" % (user["musicbrainz_id"], rng.choice(STATS_ENTITIES))
+        with timings.time():
+            _get(client, url)
+    return timings
+
+
+def feedback_insert(data: BenchmarkData) -> Timings:
+    """ Insert the feedback of users on recordings, one feedback at a time as the api does """
+    timings = Timings()
+    _insert_feedback(data, timings)
+    return timings
+
+
+def feedback_read(data: BenchmarkData) -> Timings:
+    """ Read the loved and hated recordings of users from the feedback api """
+    if not data.feedback_inserted:
+        _insert_feedback(data)
+    client = current_app.test_client()
+    timings = Timings()
+    for user in data.sample_users(data.rng("feedback_read"), data.query_count):
+        with timings.time():
+            _get(client, "/1/feedback/user/%s/get-feedback" % user["musicbrainz_id"])
+    return timings
+
+
+def dump(data: BenchmarkData) -> Timings:
+    """ Create an incremental dump of the listens inserted since the run started """
+    if not data.listens_inserted:
+        _insert_listens(data)
+    listenstore = timescale_connection._ts
+    timings = Timings()
+    with tempfile.TemporaryDirectory() as location:
+        with timings.time(len(data.listens)):
+            listenstore.dump_listens(location, dump_id=0, start_time=data.started, end_time=datetime.utcnow())
+    return timings
+
+
+def _serialization_batches(data: BenchmarkData):
+    """ The generated listens in batches, decoded from json as the api receives them. The decoding is
+        the work of the json parser and isn't timed. """
+    for batch in _batches(data.listens, SERIALIZATION_BATCH_SIZE):
+        yield ujson.loads(ujson.dumps(batch))
+
+
+def _timescale_rows(data: BenchmarkData):
+    """ The generated listens in batches of rows of the listen table, with their data decoded as the
+        database driver returns it """
+    if data.timescale_rows is None:
+        data.timescale_rows = [[Listen.from_json(listen).to_timescale() for listen in batch]
+                               for batch in _serialization_batches(data)]
+    for batch in data.timescale_rows:
+        yield [(listened_at, track_name, user_name, data.now, ujson.loads(j))
+               for listened_at, track_name, user_name, j in batch]
+
+
+def listen_serialization_write(data: BenchmarkData) -> Timings:
+    """ Convert submitted listens to the rows inserted into the listen table """
+    timings = Timings()
+    for batch in _serialization_batches(data):
+        with timings.time(len(batch)):
+            for listen in batch:
+                Listen.from_json(listen).to_timescale()
+    return timings
+
+
+def listen_serialization_read(data: BenchmarkData) -> Timings:
+    """ Convert rows of the listen table to the api format through Listen objects """
+    timings = Timings()
+    for batch in _timescale_rows(data):
+        with timings.time(len(batch)):
+            for row in batch:
+                Listen.from_timescale(*row).to_api()
+    return timings
+
+
+def listen_serialization_read_direct(data: BenchmarkData) -> Timings:
+    """ Convert rows of the listen table to the api format with timescale_row_to_api, as the api does """
+    timings = Timings()
+    for batch in _timescale_rows(data):
+        with timings.time(len(batch)):
+            for row in batch:
+                timescale_row_to_api(*row)
+    return timings
+
+
+def _create_compression_table(data: BenchmarkData):
+    """ Create a scratch hypertable with the compression settings of the listen table, and insert
+        the generated listens into it """
+    with timescale.engine.connect() as connection:
+        connection.execute(sqlalchemy.text(f"DROP TABLE IF EXISTS {COMPRESSION_TABLE}"))
+        connection.execute(sqlalchemy.text(f"CREATE TABLE {COMPRESSION_TABLE} (LIKE listen INCLUDING DEFAULTS INCLUDING INDEXES)"))
+        data.compression_table = "uncompressed"
+        connection.execute(sqlalchemy.text(f"SELECT create_hypertable('{COMPRESSION_TABLE}', 'listened_at', chunk_time_interval => 432000)"))
+        connection.execute(sqlalchemy.text(f"""ALTER TABLE {COMPRESSION_TABLE}
+                                                 SET (timescaledb.compress,
+                                                      timescaledb.compress_segmentby = 'user_name',
+                                                      timescaledb.compress_orderby = 'listened_at DESC')"""))
+
+    conn = timescale.engine.raw_connection()
+    try:
+        with conn.cursor() as curs:
+            for batch in _batches(data.listens, INSERT_BATCH_SIZE):
+                rows = [Listen.from_json(dict(listen)).to_timescale() for listen in batch]
+                execute_values(curs, f"""INSERT INTO {COMPRESSION_TABLE} (listened_at, track_name, user_name, data)
+                                              VALUES %s
+                                         ON CONFLICT DO NOTHING""", rows)
+            curs.execute(f"ANALYZE {COMPRESSION_TABLE}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _drop_compression_table(data: BenchmarkData):
+    with timescale.engine.connect() as connection:
+        connection.execute(sqlalchemy.text(f"DROP TABLE IF EXISTS {COMPRESSION_TABLE}"))
+    data.compression_table = None
+
+
+def _read_compression_table(data: BenchmarkData, scenario: str) -> Timings:
+    """ Read the listens of users in 30 day windows from the scratch hypertable, and measure its size """
+    query = f"""SELECT listened_at, track_name, user_name, created, data
+                  FROM {COMPRESSION_TABLE}
+                 WHERE user_name = :user_name
+                   AND listened_at > :from_ts
+                   AND listened_at < :to_ts
+              ORDER BY listened_at DESC
+                 LIMIT 25"""
+    rng = data.rng(scenario)
+    timings = Timings()
+    with timescale.engine.connect() as connection:
+        timings.extra["size_bytes"] = connection.execute(
+            sqlalchemy.text(f"SELECT hypertable_size('{COMPRESSION_TABLE}')")).fetchone()[0]
+        for user in data.sample_users(rng, data.query_count):
+            to_ts = rng.randint(data.now - 365 * 86400, data.now)
+            with timings.time():
+                connection.execute(sqlalchemy.text(query), user_name=user["musicbrainz_id"],
+                                   from_ts=to_ts - 30 * 86400, to_ts=to_ts).fetchall()
+    return timings
+
+
+def listen_reads_uncompressed(data: BenchmarkData) -> Timings:
+    """ Read listens from uncompressed chunks of a scratch hypertable with the settings of the listen table """
+    if data.compression_table is None:
+        _create_compression_table(data)
+    return _read_compression_table(data, "listen_reads_uncompressed")
+
+
+def listen_reads_compressed(data: BenchmarkData) -> Timings:
+    """ Read listens from the chunks of the scratch hypertable of listen_reads_uncompressed, once compressed """
+    if data.compression_table is None:
+        _create_compression_table(data)
+    if data.compression_table == "uncompressed":
+        with timescale.engine.connect() as connection:
+            connection.execute(sqlalchemy.text(f"SELECT compress_chunk(chunk) FROM show_chunks('{COMPRESSION_TABLE}') AS chunk"))
+            connection.execute(sqlalchemy.text(f"ANALYZE {COMPRESSION_TABLE}"))
+        data.compression_table = "compressed"
+    return _read_compression_table(data, "listen_reads_compressed")
+
+
+def _mapping_writer_skip_reason() -> Optional[str]:
+    if not getattr(config, "MBID_MAPPING_DATABASE_URI", None) and not getattr(config, "MBID_MAPPING_INDEX_PATH", None):
+        return "neither MBID_MAPPING_DATABASE_URI nor MBID_MAPPING_INDEX_PATH is configured"
+    return None
+
+
+def _mapping_index_skip_reason() -> Optional[str]:
+    if not getattr(config, "MBID_MAPPING_DATABASE_URI", None):
+        return "MBID_MAPPING_DATABASE_URI is not configured"
+    if not getattr(config, "MBID_MAPPING_INDEX_PATH", None):
+        return "MBID_MAPPING_INDEX_PATH is not configured"
+    return None
+
+
+def _get_mapping_lookups(data: BenchmarkData) -> List[str]:
+    """ The strings looked up by the mapping lookup scenarios. Half of them are the combined_lookup of
+        a repeatable sample of the mapping, the other half those of the generated listens, which aren't
+        in the mapping, as many of the listens the mapping writer looks up aren't. """
+    if data.mapping_lookups is not None:
+        return data.mapping_lookups
+
+    count = max(1, int(MAPPING_LOOKUP_COUNT * data.scale))
+    with psycopg2.connect(config.MBID_MAPPING_DATABASE_URI) as conn:
+        with conn.cursor() as curs:
+            curs.execute("SELECT reltuples FROM pg_class WHERE oid = 'mapping.mbid_mapping'::regclass")
+            rows = max(1.0, curs.fetchone()[0])
+            curs.execute("""SELECT combined_lookup
+                              FROM mapping.mbid_mapping TABLESAMPLE BERNOULLI (%s) REPEATABLE (%s)
+                             LIMIT %s""", (min(100.0, count / rows * 100 * 2), data.seed, count // 2))
+            lookups = [row[0] for row in curs.fetchall()]
+
+    generated = sorted({clean_lookup_string(listen["track_metadata"]["artist_name"],
+                                            listen["track_metadata"]["track_name"]) for listen in data.listens})
+    rng = data.rng("mapping_lookups")
+    lookups.extend(rng.choices(generated, k=count - len(lookups)))
+    rng.shuffle(lookups)
+    data.mapping_lookups = lookups
+    return lookups
+
+
+def mbid_mapping_index_lookup(data: BenchmarkData) -> Timings:
+    """ Look up batches of strings in the exact match index of the MBID mapping """
+    mapping_index = MappingIndex(config.MBID_MAPPING_INDEX_PATH)
+    timings = Timings()
+    for batch in _batches(_get_mapping_lookups(data), MAPPING_LOOKUP_BATCH_SIZE):
+        with timings.time(len(batch)):
+            mapping_index.lookup(batch)
+    return timings
+
+
+def mbid_mapping_database_lookup(data: BenchmarkData) -> Timings:
+    """ Look up batches of strings in the mapping table of the MBID mapping database, one query per batch,
+        for comparison with mbid_mapping_index_lookup """
+    query = """SELECT %s FROM mapping.mbid_mapping WHERE combined_lookup IN %%s""" % ", ".join(INDEX_COLUMNS)
+    timings = Timings()
+    for batch in _batches(_get_mapping_lookups(data), MAPPING_LOOKUP_BATCH_SIZE):
+        with timings.time(len(batch)):
+            with psycopg2.connect(config.MBID_MAPPING_DATABASE_URI) as conn:
+                with conn.cursor() as curs:
+                    curs.execute(query, (tuple(batch),))
+                    curs.fetchall()
+    return timings
+
+
+def mapping_writer(data: BenchmarkData) -> Timings:
+    """ Look up and store the MBID mapping of batches of the listens, as the MBID mapping writer does
+        with the listens it receives from the unique exchange """
+    from listenbrainz.mbid_mapping_writer.matcher import process_listens
+    app = current_app._get_current_object()
+    timings = Timings()
+    for batch in _batches(data.listens, MAPPING_BATCH_SIZE):
+        listens = [{"recording_msid": listen["recording_msid"], "data": listen["track_metadata"]} for listen in batch]
+        with timings.time(len(listens)):
+            process_listens(app, listens)
+    return timings
+
+
+def _insert_release_colors(data: BenchmarkData):
+    """ Insert the generated colors of releases into the release_color table """
+    _delete_release_colors(data)
+    colors = generate_release_colors(data.rng("release_color_rows"), int(RELEASE_COLOR_COUNT * data.scale))
+    data.release_colors_inserted = True
+    conn = db.engine.raw_connection()
+    try:
+        with conn.cursor() as curs:
+            while True:
+                batch = list(islice(colors, RELEASE_COLOR_BATCH_SIZE))
+                if not batch:
+                    break
+                execute_values(curs, """INSERT INTO release_color (caa_id, release_mbid, red, green, blue, color)
+                                             VALUES %s""",
+                               [row + (ColorCube(red=row[2], green=row[3], blue=row[4]),) for row in batch])
+            curs.execute("ANALYZE release_color")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _delete_release_colors(data: BenchmarkData):
+    with db.engine.connect() as connection:
+        connection.execute(sqlalchemy.text("DELETE FROM release_color WHERE caa_id < 0"))
+    data.release_colors_inserted = False
+
+
+def release_color(data: BenchmarkData) -> Timings:
+    """ Look up the releases whose cover art is nearest to random colors among a million, as huesound does """
+    if not data.release_colors_inserted:
+        _insert_release_colors(data)
+    rng = data.rng("release_color")
+    count = DEFAULT_NUMBER_OF_RELEASES
+    timings = Timings()
+    conn = db.engine.raw_connection()
+    try:
+        with conn.cursor() as curs:
+            for _ in range(data.query_count):
+                cube = ColorCube(red=rng.randint(0, 255), green=rng.randint(0, 255), blue=rng.randint(0, 255))
+                with timings.time():
+                    curs.execute(RELEASES_FOR_COLOR_QUERY, (cube, cube, INTERMEDIARY_COUNT_MULTIPLIER * count, count))
+                    curs.fetchall()
+    finally:
+        conn.close()
+    return timings
+
+
+class Scenario(NamedTuple):
+    """ A scenario, which takes the BenchmarkData of the run and returns the timings of its operations """
+    function: Callable[[BenchmarkData], Timings]
+    # returns why the scenario can't run in this setup, or None
+    skip_reason: Optional[Callable[[], Optional[str]]] = None
+    # whether the scenario needs the generated users to be created
+    uses_users: bool = True
+
+
+# The scenarios, in the order in which they are run
+SCENARIOS = {
+    "listenstore_insert": Scenario(listenstore_insert),
+    "fetch_listens": Scenario(fetch_listens),
+    "submit_listens": Scenario(submit_listens),
+    "stats_read": Scenario(stats_read),
+    "feedback_insert": Scenario(feedback_insert),
+    "feedback_read": Scenario(feedback_read),
+    "dump": Scenario(dump),
+    "listen_reads_uncompressed": Scenario(listen_reads_uncompressed, uses_users=False),
+    "listen_reads_compressed": Scenario(listen_reads_compressed, uses_users=False),
+    "mapping_writer": Scenario(mapping_writer, _mapping_writer_skip_reason),
+    "listen_serialization_write": Scenario(listen_serialization_write, uses_users=False),
+    "listen_serialization_read": Scenario(listen_serialization_read, uses_users=False),
+    "listen_serialization_read_direct": Scenario(listen_serialization_read_direct, uses_users=False),
+    "mbid_mapping_index_lookup": Scenario(mbid_mapping_index_lookup, _mapping_index_skip_reason, uses_users=False),
+    "mbid_mapping_database_lookup": Scenario(mbid_mapping_database_lookup, _mapping_index_skip_reason,
+                                             uses_users=False),
+    "release_color": Scenario(release_color, uses_users=False),
+}
+
+
+def run_scenarios(names: List[str], seed: int = 0, scale: float = 1.0,
+                  on_result: Callable[[str, Dict], None] = None) -> Dict:
+    """ Run the given scenarios, in the order of SCENARIOS, on data generated with the given seed
+        and scale. Must be called in an app context.
+
+        Args:
+            names: the names of the scenarios to run
+            seed: the seed of the generated data and queries
+            scale: the size of the generated data, relative to the defaults of this module
+            on_result: called with the name and result of each scenario as soon as it has run
+
+        Returns:
+            the results of the run, in the format described in listenbrainz.benchmarks.results
+    """
+    data = BenchmarkData(seed, scale)
+    results = {
+        "meta": {"seed": seed, "scale": scale, "started": datetime.utcnow().isoformat(timespec="seconds"),
+                 "listens": len(data.listens), "users": len(data.users)},
+        "scenarios": {},
+    }
+    try:
+        for name, scenario in SCENARIOS.items():
+            if name not in names:
+                continue
+            reason = scenario.skip_reason() if scenario.skip_reason else None
+            if reason:
+                result = {"skipped": reason}
+            else:
+                if scenario.uses_users and data.started is None:
+                    data.setup()
+                current_app.logger.info("Running benchmark scenario %s", name)
+                result = summarize(scenario.function(data))
+            results["scenarios"][name] = result
+            if on_result:
+                on_result(name, result)
+    finally:
+        if data.started is not None:
+            data.cleanup()
+        if data.compression_table is not None:
+            _drop_compression_table(data)
+        if data.release_colors_inserted:
+            _delete_release_colors(data)
+    return results
@@ -0,0 +1,65 @@
+import unittest
+from collections import Counter
+from random import Random
+
+from data.model.common_stat import StatRange
+from data.model.user_entity import UserEntityRecord
+from listenbrainz.benchmarks import generators
+from listenbrainz.listen import Listen
+
+NOW = 1600000000
+
+
+class GeneratorsTestCase(unittest.TestCase):
+
+    def generate(self, seed=0, count=5000):
+        rng = Random(seed)
+        catalogue = generators.Catalogue()
+        users = generators.generate_users(rng, 20)
+        listens = generators.generate_listens(rng, catalogue, users, count, NOW)
+        return users, listens
+
+    def test_generation_is_reproducible(self):
+        self.assertEqual(self.generate(), self.generate())
+        self.assertNotEqual(self.generate()[1], self.generate(seed=1)[1])
+
+    def test_listens(self):
+        users, listens = self.generate()
+        self.assertEqual(len(listens), 5000)
+        self.assertTrue(all(listen["listened_at"] < NOW for listen in listens))
+
+        # most listens are recent, some are imported from years ago
+        recent = [listen for listen in listens if listen["listened_at"] >= NOW - 30 * 86400]
+        self.assertGreater(len(recent), 0.8 * len(listens))
+        self.assertTrue(any(listen["listened_at"] < NOW - 365 * 86400 for listen in listens))
+
+        # the popularity of artists follows a Zipf distribution
+        artists = Counter(listen["track_metadata"]["artist_name"] for listen in listens).most_common()
+        self.assertEqual(artists[0][0], "Artist 1")
+        self.assertGreater(artists[0][1], 5 * artists[9][1])
+
+        listen = dict(listens[0], user_id=1)
+        self.assertTrue(Listen.from_json(listen).validate())
+        payload = generators.submission_payload(listens[:1])[0]
+        self.assertEqual(set(payload), {"listened_at", "track_metadata"})
+
+    def test_feedback(self):
+        _, listens = self.generate()
+        feedback = generators.generate_feedback(Random(0), listens, 100)
+        self.assertEqual(len(feedback), 100)
+        self.assertEqual(len({(f["user_name"], f["recording_msid"]) for f in feedback}), 100)
+        self.assertTrue(all(f["score"] in (1, -1) for f in feedback))
+
+    def test_user_stats(self):
+        for entity in ("artists", "releases", "recordings"):
+            stats = generators.generate_user_stats(Random(0), entity, "all_time", 100, (0, NOW))
+            counts = [record["listen_count"] for record in stats["data"]]
+            self.assertEqual(counts, sorted(counts, reverse=True))
+            StatRange[UserEntityRecord](**stats)
+
+    def test_release_colors(self):
+        colors = list(generators.generate_release_colors(Random(0), 1000))
+        self.assertEqual(colors, list(generators.generate_release_colors(Random(0), 1000)))
+        self.assertEqual(len({caa_id for caa_id, _, _, _, _ in colors}), 1000)
+        self.assertTrue(all(caa_id < 0 for caa_id, _, _, _, _ in colors))
+        self.assertTrue(all(0 <= component <= 255 for color in colors for component in color[2:]))
@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+
+from listenbrainz.benchmarks import results
+
+
+def result(items_per_second, p50, p99):
+    return {"operations": 10, "items": 100, "seconds": 1.0, "items_per_second": items_per_second,
+            "latency_ms": {"p50": p50, "p90": p99, "p99": p99, "max": p99}}
+
+
+class ResultsTestCase(unittest.TestCase):
+
+    def test_summarize(self):
+        timings = results.Timings()
+        timings.durations = [i / 1000 for i in range(1, 101)]
+        timings.items = 1000
+        summary = results.summarize(timings)
+        self.assertEqual(summary["operations"], 100)
+        self.assertEqual(summary["seconds"], 5.05)
+        self.assertEqual(summary["items_per_second"], 198.0)
+        self.assertEqual(summary["latency_ms"], {"p50": 51.0, "p90": 91.0, "p99": 100.0, "max": 100.0})
+        self.assertEqual(results.summarize(results.Timings())["operations"], 0)
+
+    def test_compare(self):
+        baseline = {"scenarios": {
+            "fetch_listens": result(1000, 10, 20),
+            "dump": result(1000, 10, 20),
+            "mapping_writer": {"skipped": "not configured"},
+        }}
+        current = {"scenarios": {
+            "fetch_listens": result(950, 10.5, 30),
+            "stats_read": result(100, 1, 2),
+            "mapping_writer": result(100, 1, 2),
+        }}
+        comparisons = results.compare(baseline, current, threshold=10)
+        # only the scenarios which ran in both runs are compared
+        self.assertEqual({c["scenario"] for c in comparisons}, {"fetch_listens"})
+        regressions = {c["metric"]: c["regression"] for c in comparisons}
+        self.assertEqual(regressions, {"items_per_second": False, "latency_ms.p50": False, "latency_ms.p99": True})
+        self.assertFalse(any(c["regression"] for c in results.compare(baseline, current, threshold=60)))
+
+    def test_compare_size(self):
+        baseline = {"scenarios": {"listen_reads_compressed": {**result(1000, 10, 20), "size_bytes": 1000}}}
+        current = {"scenarios": {"listen_reads_compressed": {**result(1000, 10, 20), "size_bytes": 1200}}}
+        regressions = {c["metric"]: c["regression"] for c in results.compare(baseline, current, threshold=10)}
+        self.assertTrue(regressions["size_bytes"])
+
+    def test_summarize_extra(self):
+        timings = results.Timings()
+        timings.durations = [0.001]
+        timings.extra["size_bytes"] = 1000
+        self.assertEqual(results.summarize(timings)["size_bytes"], 1000)
+
+    def test_load_durations(self):
+        # the raw durations written by the benchmarks of the MBID mapping container are summarized
+        raw = {"scenarios": {"coverart_pillow": {"durations": [i / 1000 for i in range(1, 101)], "items": 100},
+                             "fetch_listens": result(1000, 10, 20)}}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            with open(path, "w") as f:
+                json.dump(raw, f)
+            loaded = results.load(path)
+        self.assertEqual(loaded["scenarios"]["coverart_pillow"]["operations"], 100)
+        self.assertEqual(loaded["scenarios"]["coverart_pillow"]["latency_ms"]["p50"], 51.0)
+        self.assertEqual(loaded["scenarios"]["fetch_listens"], result(1000, 10, 20))
@@ -12,6 +12,29 @@ from psycopg2.extensions import adapt, AsIs, register_adapter
 # in the results and if it is too small, we get no variability at all.
 INTERMEDIARY_COUNT_MULTIPLIER = 4
 
+# The inner query orders by the <-> (euclidean distance) operator of the cube extension so that
+# postgres can walk the GiST index on release_color.color (a KNN search) instead of computing the
+# distance for every row in the table and sorting them all. The ORDER BY must use the operator
+# expression itself, not cube_distance() or the dist alias, for the index to be considered.
+RELEASES_FOR_COLOR_QUERY = """SELECT release_mbid
+                                   , caa_id
+                                   , red
+                                   , green
+                                   , blue
+                                   , dist
+                                FROM (SELECT release_mbid::TEXT
+                                           , caa_id
+                                           , red
+                                           , green
+                                           , blue
+                                           , color <-> %s AS dist
+                                           , random() AS sort_order
+                                       FROM release_color
+                                   ORDER BY color <-> %s
+                                      LIMIT %s) AS hs
+                            ORDER BY sort_order
+                               LIMIT %s"""
+
 
 def adapt_cube(cube):
     """ Function required by Postgres for inserting/searching cube extension colors """
@@ -32,27 +55,10 @@ def get_releases_for_color(red: int, green: int, blue: int, count: int) -> List[
           A list of ColorResult objects.
     """
 
-    query = """SELECT release_mbid
-                   , caa_id
-                   , red
-                   , green
-                   , blue
-                   , dist                                         
-                FROM (SELECT release_mbid::TEXT
-                           , caa_id
-                           , red
-                           , green
-                           , blue
-                           , cube_distance(color, %s) AS dist
-                           , random() AS sort_order
-                       FROM release_color
-                      ORDER BY dist
-                      LIMIT %s) AS hs
-                ORDER BY sort_order
-                   LIMIT %s"""
+    query = RELEASES_FOR_COLOR_QUERY
 
     cube = ColorCube(red=red, green=green, blue=blue)
-    args = (cube, INTERMEDIARY_COUNT_MULTIPLIER * count, count)
+    args = (cube, cube, INTERMEDIARY_COUNT_MULTIPLIER * count, count)
 
     mb_query = """SELECT rec.name AS recording_name
                        , rec.gid::TEXT AS recording_mbid
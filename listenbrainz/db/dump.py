@@ -44,6 +44,7 @@ from listenbrainz import DUMP_LICENSE_FILE_PATH
 import listenbrainz.db as db
 from listenbrainz.db import timescale
 from listenbrainz.db import DUMP_DEFAULT_THREAD_COUNT
+from listenbrainz.db.dump_checksum import pxz_compressed_archive
 from listenbrainz.utils import create_path, log_ioerrors
 
 from listenbrainz import config
@@ -355,14 +356,9 @@ def _create_dump(location: str, db_engine: sqlalchemy.engine.Engine, dump_type:
         archive_name=archive_name,
     ))
 
-    with open(archive_path, 'w') as archive:
+    with pxz_compressed_archive(archive_path, threads) as archive:
 
-        pxz_command = ['pxz', '--compress',
-                       '-T{threads}'.format(threads=threads)]
-        pxz = subprocess.Popen(
-            pxz_command, stdin=subprocess.PIPE, stdout=archive)
-
-        with tarfile.open(fileobj=pxz.stdin, mode='w|') as tar:
+        with tarfile.open(fileobj=archive, mode='w|') as tar:
 
             temp_dir = tempfile.mkdtemp()
 
@@ -393,7 +389,7 @@ def _create_dump(location: str, db_engine: sqlalchemy.engine.Engine, dump_type:
 
             with db_engine.connect() as connection:
                 if dump_type == "feedback":
-                    dump_user_feedback(connection, location=archive_tables_dir)
+                    dump_user_feedback(connection, tar, archive_name, location=archive_tables_dir)
                 else:
                     with connection.begin() as transaction:
                         cursor = connection.connection.cursor()
@@ -424,9 +420,6 @@ def _create_dump(location: str, db_engine: sqlalchemy.engine.Engine, dump_type:
 
             shutil.rmtree(temp_dir)
 
-        pxz.stdin.close()
-
-    pxz.wait()
     return archive_path
 
 
@@ -511,14 +504,57 @@ def create_feedback_dump(location: str, dump_time: datetime, threads=DUMP_DEFAUL
     )
 
 
-def dump_user_feedback(connection, location):
-    """ Carry out the actual dumping of user listen and user recommendation feedback.
+def _dump_feedback_by_day(connection, query, tar, archive_name, location, feedback_type, make_item):
+    """ Stream the rows of a feedback query, which must return the year, month and day of each
+        row as its last three columns and be ordered by creation time, into one file per day.
+        Each day's file is written as its rows arrive from a server side cursor and added to the
+        tar archive as soon as the day is complete, so only one row is held in memory at a time.
+
+        Returns:
+            the number of rows dumped
+    """
+
+    result = connection.execution_options(stream_results=True).execute(sqlalchemy.text(query))
+    count = 0
+    last_day = None
+    f = None
+    path = os.path.join(location, "data.json")
+
+    def add_day_file():
+        f.close()
+        tar.add(path, arcname=os.path.join(archive_name, "feedback", feedback_type, "%02d" % int(last_day[0]),
+                                           "%02d" % int(last_day[1]), "%02d" % int(last_day[2]), "data.json"))
+        os.remove(path)
+
+    for row in result:
+        today = (row[-3], row[-2], row[-1])
+        if today != last_day:
+            if f is not None:
+                add_day_file()
+            f = open(path, "wb")
+            last_day = today
+        f.write(bytes(ujson.dumps(make_item(row)) + "\n", "utf-8"))
+        count += 1
+
+    if f is not None:
+        add_day_file()
+    return count
+
+
+def dump_user_feedback(connection, tar, archive_name, location):
+    """ Carry out the actual dumping of user listen and user recommendation feedback into the tar archive.
+
+        Arguments:
+            connection: an sqlalchemy connection to the database
+            tar: the tar archive to add the feedback files to
+            archive_name: the name of the archive, the top level directory in the archive
+            location: a directory to write the files to before they are added to the archive
     """
 
     with connection.begin() as transaction:
 
         # First dump the user feedback
-        result = connection.execute(sqlalchemy.text("""
+        _dump_feedback_by_day(connection, """
             SELECT musicbrainz_id, recording_msid, score, r.created,
                    EXTRACT(YEAR FROM r.created) AS year,
                    EXTRACT(MONTH FROM r.created) AS month,
@@ -526,34 +562,14 @@ def dump_user_feedback(connection, location):
               FROM recording_feedback r
               JOIN "user"
                 ON r.user_id = "user".id
-          ORDER BY created"""))
-
-        last_day = ()
-        todays_items = []
-
-        while True:
-            row = result.fetchone()
-            today = (row[4], row[5], row[6]) if row else ()
-            if (not row or today != last_day) and len(todays_items) > 0:
-                full_path = os.path.join(location, "feedback", "listens", "%02d" % int(last_day[0]),
-                                         "%02d" % int(last_day[1]), "%02d" % int(last_day[2]))
-                os.makedirs(full_path)
-                with open(os.path.join(full_path, "data.json"), "wb") as f:
-                    for item in todays_items:
-                        f.write(bytes(ujson.dumps(item) + "\n", "utf-8"))
-                todays_items = []
-
-            if not row:
-                break
-
-            todays_items.append({'user_name': row[0],
-                                 'recording_msid': str(row[1]),
-                                 'feedback': row[2],
-                                 'created': row[3].isoformat()})
-            last_day = today
+          ORDER BY created""", tar, archive_name, location, "listens",
+                              lambda row: {'user_name': row[0],
+                                           'recording_msid': str(row[1]),
+                                           'feedback': row[2],
+                                           'created': row[3].isoformat()})
 
         # Now dump the recommendation feedback
-        result = connection.execute(sqlalchemy.text("""
+        _dump_feedback_by_day(connection, """
             SELECT musicbrainz_id, recording_mbid, rating, r.created,
                    EXTRACT(YEAR FROM r.created) AS year,
                    EXTRACT(MONTH FROM r.created) AS month,
@@ -561,31 +577,11 @@ def dump_user_feedback(connection, location):
               FROM recommendation_feedback r
               JOIN "user"
                 ON r.user_id = "user".id
-          ORDER BY created"""))
-
-        last_day = ()
-        todays_items = []
-
-        while True:
-            row = result.fetchone()
-            today = (row[4], row[5], row[6]) if row else ()
-            if (not row or today != last_day) and len(todays_items) > 0:
-                full_path = os.path.join(location, "feedback", "recommendation", "%02d" % int(last_day[0]),
-                                         "%02d" % int(last_day[1]), "%02d" % int(last_day[2]))
-                os.makedirs(full_path)
-                with open(os.path.join(full_path, "data.json"), "wb") as f:
-                    for item in todays_items:
-                        f.write(bytes(ujson.dumps(item) + "\n", "utf-8"))
-                todays_items = []
-
-            if not row:
-                break
-
-            todays_items.append({'user_name': row[0],
-                                 'mb_recording_mbid': str(row[1]),
-                                 'feedback': row[2],
-                                 'created': row[3].isoformat()})
-            last_day = today
+          ORDER BY created""", tar, archive_name, location, "recommendation",
+                              lambda row: {'user_name': row[0],
+                                           'mb_recording_mbid': str(row[1]),
+                                           'feedback': row[2],
+                                           'created': row[3].isoformat()})
         transaction.rollback()
 
 
@@ -0,0 +1,153 @@
+""" Checksums of the data dump archives.
+
+The MD5 and SHA256 checksums of an archive are computed while it is written, from the
+compressed bytes on their way to disk, so the archives don't have to be read again
+afterwards to hash them.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+CHECKSUM_ALGORITHMS = ('md5', 'sha256')
+
+# Files of a dump directory that are not archives and have no checksums
+UNCHECKED_FILES = ('DUMP_ID.txt',)
+
+# The size of the chunks that are read from the compressor and from files being hashed
+CHUNK_SIZE = 1024 * 1024
+
+
+class HashingWriter:
+    """ A write-only file object that writes to another file object and hashes
+        everything written on the way. """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in CHECKSUM_ALGORITHMS}
+        self.offset = 0
+
+    def write(self, data):
+        for h in self.hashes.values():
+            h.update(data)
+        self.offset += len(data)
+        return self.fileobj.write(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        self.fileobj.close()
+
+    def hexdigests(self):
+        """ Returns a dict of the hex digest of the data written so far, by algorithm """
+        return {algorithm: h.hexdigest() for algorithm, h in self.hashes.items()}
+
+
+def checksum_file_path(path, algorithm):
+    return '{}.{}'.format(path, algorithm)
+
+
+def write_checksum_files(path, digests):
+    """ Write the checksum files of the file at path, one per algorithm, next to it.
+
+    Args:
+        path (str): the path to the archive
+        digests (dict): the hex digests of the archive, by algorithm
+    """
+    for algorithm in CHECKSUM_ALGORITHMS:
+        with open(checksum_file_path(path, algorithm), 'w') as f:
+            f.write(digests[algorithm])
+
+
+@contextmanager
+def hashed_archive(archive_path):
+    """ Open archive_path for writing, and write its checksum files once the block is done.
+        Yields a file object which hashes all data written to the archive. """
+    with open(archive_path, 'wb') as archive:
+        writer = HashingWriter(archive)
+        yield writer
+    write_checksum_files(archive_path, writer.hexdigests())
+
+
+@contextmanager
+def pxz_compressed_archive(archive_path, threads):
+    """ Compress everything written to the yielded stream with pxz into archive_path. The
+        compressed output is hashed as it is copied to the archive, after which the checksum
+        files of the archive are written. """
+    pxz_command = ['pxz', '--compress', '-T{threads}'.format(threads=threads)]
+    with hashed_archive(archive_path) as archive:
+        pxz = subprocess.Popen(pxz_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        copier = threading.Thread(target=shutil.copyfileobj, args=(pxz.stdout, archive, CHUNK_SIZE))
+        copier.start()
+        try:
+            yield pxz.stdin
+        finally:
+            pxz.stdin.close()
+            copier.join()
+            pxz.stdout.close()
+            pxz.wait()
+        if pxz.returncode != 0:
+            raise IOError('pxz exited with status {} while compressing {}'.format(pxz.returncode, archive_path))
+
+
+def hash_file(path):
+    """ Returns a dict of the hex digests of the file at path, by algorithm """
+    hashes = {algorithm: hashlib.new(algorithm) for algorithm in CHECKSUM_ALGORITHMS}
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            for h in hashes.values():
+                h.update(chunk)
+    return {algorithm: h.hexdigest() for algorithm, h in hashes.items()}
+
+
+def is_checksum_file(filename):
+    return any(filename.endswith('.' + algorithm) for algorithm in CHECKSUM_ALGORITHMS)
+
+
+def verify_file(path):
+    """ Check the file at path against its checksum files.
+
+    Returns:
+        a list of the algorithms whose checksum file is missing or does not match
+    """
+    digests = hash_file(path)
+    failed = []
+    for algorithm in CHECKSUM_ALGORITHMS:
+        try:
+            with open(checksum_file_path(path, algorithm)) as f:
+                expected = f.read().split()[0]
+        except (OSError, IndexError):
+            failed.append(algorithm)
+            continue
+        if expected != digests[algorithm]:
+            failed.append(algorithm)
+    return failed
+
+
+def verify_checksums(location, threads=None):
+    """ Verify the checksums of all files in the given dump location, several files at a time.
+        hashlib releases the GIL while hashing, so the files are hashed in parallel.
+
+    Args:
+        location (str): the path in which the dump archive files are present
+        threads (int): the number of files to hash at the same time
+
+    Returns:
+        a dict of the failed algorithms by file name, for the files that failed verification
+    """
+    files = [f for f in sorted(os.listdir(location))
+             if not is_checksum_file(f) and f not in UNCHECKED_FILES and os.path.isfile(os.path.join(location, f))]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = executor.map(verify_file, (os.path.join(location, f) for f in files))
+        return {f: failed for f, failed in zip(files, results) if failed}
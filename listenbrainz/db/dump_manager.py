@@ -26,13 +26,14 @@ import listenbrainz.db.dump as db_dump
 import os
 import re
 import shutil
-import subprocess
 import sys
 
 import psycopg2
 from flask import current_app, render_template
 from brainzutils.mail import send_mail
 from listenbrainz.db import DUMP_DEFAULT_THREAD_COUNT
+from listenbrainz.db.dump_checksum import CHECKSUM_ALGORITHMS, checksum_file_path, hash_file, is_checksum_file, \
+    verify_checksums, write_checksum_files
 from listenbrainz.utils import create_path
 from listenbrainz.webserver import create_app
 from listenbrainz.db.dump import check_ftp_dump_ages
@@ -119,7 +120,7 @@ def create_full(location, threads, dump_id, do_listen_dump: bool, do_spark_dump:
         try:
             # 6 types of dumps, archive, md5, sha256 for each
             expected_num_dump_files = expected_num_dumps * 3
-            if not sanity_check_dumps(dump_path, expected_num_dump_files):
+            if not sanity_check_dumps(dump_path, expected_num_dump_files, threads):
                 return sys.exit(-1)
         except OSError:
             sys.exit(-1)
@@ -182,7 +183,7 @@ def create_incremental(location, threads, dump_id):
             sys.exit(-1)
 
         try:
-            if not sanity_check_dumps(dump_path, 6):
+            if not sanity_check_dumps(dump_path, 6, threads):
                 return sys.exit(-1)
         except OSError as e:
             sys.exit(-1)
@@ -228,7 +229,7 @@ def create_feedback(location, threads):
             sys.exit(-1)
 
         try:
-            if not sanity_check_dumps(dump_path, 3):
+            if not sanity_check_dumps(dump_path, 3, threads):
                 sys.exit(-1)
         except OSError as e:
             sys.exit(-1)
@@ -303,6 +304,17 @@ def delete_old_dumps(location):
     sys.exit(0)
 
 
+@cli.command(name="verify_dump")
+@click.argument('location', type=str)
+@click.option('--threads', '-t', type=int, default=DUMP_DEFAULT_THREAD_COUNT)
+def verify_dump(location, threads):
+    """ Verify the checksums of all archives of the dump in the given directory. """
+    failed = verify_checksums(location, threads)
+    for file, algorithms in failed.items():
+        print("Checksum verification failed for %s: %s" % (file, ", ".join(algorithms)))
+    sys.exit(-1 if failed else 0)
+
+
 @cli.command(name="check_dump_ages")
 def check_dump_ages():
     """Check to make sure that data dumps are sufficiently fresh. Send mail if they are not."""
@@ -394,34 +406,36 @@ def remove_dumps(location, dumps, remaining_count):
 
 
 def write_hashes(location):
-    """ Create hash files for each file in the given dump location
+    """ Create hash files for each file in the given dump location that doesn't have them yet.
+    The archives written by the dump functions are hashed while they are written and already
+    have their hash files, so this only has to read files which were added some other way.
 
     Args:
         location (str): the path in which the dump archive files are present
     """
     for file in os.listdir(location):
+        path = os.path.join(location, file)
+        if is_checksum_file(file) or all(os.path.exists(checksum_file_path(path, algorithm))
+                                         for algorithm in CHECKSUM_ALGORITHMS):
+            continue
         try:
-            with open(os.path.join(location, '{}.md5'.format(file)), 'w') as f:
-                md5sum = subprocess.check_output(
-                    ['md5sum', os.path.join(location, file)]).decode('utf-8').split()[0]
-                f.write(md5sum)
-            with open(os.path.join(location, '{}.sha256'.format(file)), 'w') as f:
-                sha256sum = subprocess.check_output(
-                    ['sha256sum', os.path.join(location, file)]).decode('utf-8').split()[0]
-                f.write(sha256sum)
+            write_checksum_files(path, hash_file(path))
         except OSError as e:
             current_app.logger.error(
                 'IOError while trying to write hash files for file %s: %s', file, str(e), exc_info=True)
             raise
 
 
-def sanity_check_dumps(location, expected_count):
+def sanity_check_dumps(location, expected_count, threads=None):
     """ Sanity check the generated dumps to ensure that none are empty
-        and make sure that the right number of dump files exist.
+        and make sure that the right number of dump files exist. If threads
+        is given, also verify the checksums of the archives, hashing that many
+        archives at a time.
 
     Args:
         location (str): the path in which the dump archive files are present
         expected_count (int): the number of files that are expected to be present
+        threads (int): the number of archives to verify at the same time
     Return:
         boolean: true if the dump passes the sanity check
     """
@@ -437,9 +451,16 @@ def sanity_check_dumps(location, expected_count):
         except OSError as e:
             return False
 
-    if expected_count == count:
-        return True
+    if expected_count != count:
+        print("Expected %d dump files, found %d. Aborting." %
+              (expected_count, count))
+        return False
+
+    if threads is not None:
+        failed = verify_checksums(location, threads)
+        for file, algorithms in failed.items():
+            print("Checksum verification failed for dump file %s: %s" % (file, ", ".join(algorithms)))
+        if failed:
+            return False
 
-    print("Expected %d dump files, found %d. Aborting." %
-          (expected_count, count))
-    return False
+    return True
@@ -1,12 +1,9 @@
 import sqlalchemy
 
 from listenbrainz import db
-from listenbrainz.db import timescale
+from listenbrainz.db import recording_metadata, replica
 from listenbrainz.db.model.feedback import Feedback
-from listenbrainz import messybrainz as msb_db
-from listenbrainz.messybrainz.data import load_recordings_from_msids
 from typing import List
-from listenbrainz.messybrainz.exceptions import NoDataFoundException
 
 
 def insert(feedback: Feedback):
@@ -31,6 +28,7 @@ def insert(feedback: Feedback):
             'score': feedback.score,
         }
         )
+    replica.mark_write(feedback.user_id)
 
 
 def delete(feedback: Feedback):
@@ -50,6 +48,7 @@ def delete(feedback: Feedback):
             'recording_msid': feedback.recording_msid,
         }
         )
+    replica.mark_write(feedback.user_id)
 
 
 def get_feedback_for_user(user_id: int, limit: int, offset: int, score: int = None, metadata: bool = False) -> List[Feedback]:
@@ -84,49 +83,25 @@ def get_feedback_for_user(user_id: int, limit: int, offset: int, score: int = No
     query += """ ORDER BY recording_feedback.created DESC
                  LIMIT :limit OFFSET :offset """
 
-    with db.engine.connect() as connection:
+    with replica.read_connection(db, users=[user_id]) as connection:
         result = connection.execute(sqlalchemy.text(query), args)
         feedback = [Feedback(**dict(row)) for row in result.fetchall()]
 
     if metadata and len(feedback) > 0:
-        msids = [f.recording_msid for f in feedback]
-        index = {f.recording_msid: f for f in feedback}
-
-        # Fetch the artist and track names from MSB
-        with msb_db.engine.connect() as connection:
-            try:
-                msb_recordings = load_recordings_from_msids(connection, msids)
-            except NoDataFoundException:
-                msb_recordings = []
-
-        artist_msids = {}
-        if msb_recordings:
-            for rec in msb_recordings:
-                index[rec["ids"]["recording_msid"]].track_metadata = {
-                    "artist_name": rec["payload"]["artist"],
-                    "release_name": rec["payload"].get("release_name", ""),
-                    "track_name": rec["payload"]["title"]}
-                artist_msids[rec["ids"]["recording_msid"]
-                             ] = rec["ids"]["artist_msid"]
-
-        # Fetch the mapped MBIDs from the mapping
-        query = """SELECT recording_msid::TEXT, m.recording_mbid::TEXT, release_mbid::TEXT, artist_mbids::TEXT[]
-                     FROM mbid_mapping m
-                     JOIN mbid_mapping_metadata mm
-                       ON m.recording_mbid = mm.recording_mbid
-                    WHERE recording_msid in :msids
-                 ORDER BY recording_msid"""
-
-        with timescale.engine.connect() as connection:
-            result = connection.execute(
-                sqlalchemy.text(query), msids=tuple(msids))
-            for row in result.fetchall():
-                if row["recording_mbid"] is not None:
-                    index[row["recording_msid"]].track_metadata['additional_info'] = {
-                        "recording_mbid": row["recording_mbid"],
-                        "release_mbid": row["release_mbid"],
-                        "artist_mbids": row["artist_mbids"],
-                        "artist_msid": artist_msids[row["recording_msid"]]}
+        msid_metadata, _ = recording_metadata.get_metadata(msids=[f.recording_msid for f in feedback])
+        for f in feedback:
+            recording = msid_metadata.get(f.recording_msid)
+            if recording is None:
+                continue
+
+            f.track_metadata = {
+                "artist_name": recording["artist_name"],
+                "release_name": recording["release_name"],
+                "track_name": recording["track_name"]}
+            if recording["mapping"] is not None:
+                f.track_metadata['additional_info'] = {
+                    **recording["mapping"],
+                    "artist_msid": recording["artist_msid"]}
 
     return feedback
 
@@ -151,7 +126,7 @@ def get_feedback_count_for_user(user_id: int, score=None) -> int:
         query += " AND score = :score"
         args['score'] = score
 
-    with db.engine.connect() as connection:
+    with replica.read_connection(db, users=[user_id]) as connection:
         result = connection.execute(sqlalchemy.text(query), args)
         count = int(result.fetchone()["value"])
 
@@ -189,7 +164,7 @@ def get_feedback_for_recording(recording_msid: str, limit: int, offset: int, sco
     query += """ ORDER BY recording_feedback.created DESC
                  LIMIT :limit OFFSET :offset """
 
-    with db.engine.connect() as connection:
+    with replica.read_connection(db) as connection:
         result = connection.execute(sqlalchemy.text(query), args)
         return [Feedback(**dict(row)) for row in result.fetchall()]
 
@@ -206,7 +181,7 @@ def get_feedback_count_for_recording(recording_msid: str) -> int:
 
     query = "SELECT count(*) AS value FROM recording_feedback WHERE recording_msid = :recording_msid"
 
-    with db.engine.connect() as connection:
+    with replica.read_connection(db) as connection:
         result = connection.execute(sqlalchemy.text(query), {
             'recording_msid': recording_msid,
         }
@@ -245,6 +220,6 @@ def get_feedback_for_multiple_recordings_for_user(user_id: int, recording_list:
                 JOIN "user"
                   ON "user".id = :user_id """
 
-    with db.engine.connect() as connection:
+    with replica.read_connection(db, users=[user_id]) as connection:
         result = connection.execute(sqlalchemy.text(query), args)
         return [Feedback(**dict(row)) for row in result.fetchall()]
@@ -4,7 +4,7 @@ from datetime import datetime
 
 from listenbrainz import db
 from listenbrainz.db.model.pinned_recording import PinnedRecording, WritablePinnedRecording
-from typing import List
+from typing import List, Optional
 
 
 PINNED_REC_GET_COLUMNS = [
@@ -177,14 +177,17 @@ def get_pins_for_user_following(user_id: int, count: int, offset: int) -> List[P
         return [PinnedRecording(**dict(row)) for row in result.fetchall()]
 
 
-def get_pins_for_feed(user_ids: List[int], min_ts: int, max_ts: int, count: int) -> List[PinnedRecording]:
-    """ Gets a list of PinnedRecordings for specified users in descending order of their created date.
+def get_pins_for_feed(user_ids: List[int], min_ts: int, max_ts: int, count: int,
+                      before_id: Optional[int] = None) -> List[PinnedRecording]:
+    """ Gets a list of PinnedRecordings for specified users in descending order of the second they were
+    created in and then of their row id.
 
     Args:
         user_ids: a list of user row IDs
         min_ts: History before this timestamp will not be returned
         max_ts: History after this timestamp will not be returned
         count: Maximum amount of objects to be returned
+        before_id: if given, the pins created in the second of max_ts with a lower row id are returned too
 
     Returns:
         A list of PinnedRecording objects.
@@ -196,13 +199,15 @@ def get_pins_for_feed(user_ids: List[int], min_ts: int, max_ts: int, count: int)
               FROM pinned_recording as pin
              WHERE pin.user_id IN :user_ids
                AND pin.created > :min_ts
-               AND pin.created < :max_ts
-          ORDER BY pin.created DESC
+               AND (pin.created < :max_ts OR (pin.created < :max_ts_end AND pin.id < :before_id))
+          ORDER BY date_trunc('second', pin.created) DESC, pin.id DESC
              LIMIT :count
         """.format(columns=','.join(PINNED_REC_GET_COLUMNS))), {
             "user_ids": tuple(user_ids),
             "min_ts": datetime.utcfromtimestamp(min_ts),
             "max_ts": datetime.utcfromtimestamp(max_ts),
+            "max_ts_end": datetime.utcfromtimestamp(max_ts + 1),
+            "before_id": before_id,
             "count": count,
         })
         return [PinnedRecording(**dict(row)) for row in result.fetchall()]
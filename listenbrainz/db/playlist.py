@@ -1,6 +1,6 @@
 import collections
 import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 import sqlalchemy
 import ujson
@@ -13,6 +13,9 @@ from listenbrainz.db import user as db_user
 def get_by_mbid(playlist_id: str, load_recordings: bool = True) -> Optional[model_playlist.Playlist]:
     """Get a playlist given its mbid
 
+    The playlist row, its collaborators and (optionally) its recordings are loaded in a single
+    query. The names of all users referred to by the playlist are then resolved in one more query.
+
     Arguments:
         playlist_id: the uuid of a playlist to get
         load_recordings: If true, load the recordings for the playlist too
@@ -37,34 +40,50 @@ def get_by_mbid(playlist_id: str, load_recordings: bool = True) -> Optional[mode
              , pl.created_for_id
              , pl.algorithm_metadata
              , copy.mbid as copied_from_mbid
+             , COALESCE(collaborator.collaborator_ids, '{}') AS collaborator_ids
+             , COALESCE(recording.recordings, '[]') AS recordings
           FROM playlist.playlist AS pl
      LEFT JOIN playlist.playlist AS copy
             ON pl.copied_from_id = copy.id
+     LEFT JOIN LATERAL (
+                SELECT array_agg(collaborator_id) AS collaborator_ids
+                  FROM playlist.playlist_collaborator
+                 WHERE playlist_id = pl.id
+               ) AS collaborator
+            ON TRUE
+     LEFT JOIN LATERAL (
+                SELECT json_agg(json_build_object('id', id
+                                                , 'playlist_id', playlist_id
+                                                , 'position', position
+                                                , 'mbid', mbid
+                                                , 'added_by_id', added_by_id
+                                                , 'created', created) ORDER BY position) AS recordings
+                  FROM playlist.playlist_recording
+                 WHERE playlist_id = pl.id
+                   AND :load_recordings
+               ) AS recording
+            ON TRUE
          WHERE pl.mbid = :mbid""")
     with ts.engine.connect() as connection:
-        result = connection.execute(query, {"mbid": playlist_id})
+        result = connection.execute(query, {"mbid": playlist_id, "load_recordings": load_recordings})
         obj = result.fetchone()
         if not obj:
             return None
         obj = dict(obj)
-        user_id = obj['creator_id']
-        user = db_user.get(user_id)
-        obj['creator'] = user['musicbrainz_id']
-        if obj['created_for_id']:
-            created_for_user = db_user.get(obj['created_for_id'])
-            if created_for_user:
-                obj['created_for'] = created_for_user['musicbrainz_id']
 
-        if load_recordings:
-            playlist_map = get_recordings_for_playlists(connection, [obj['id']])
-            obj['recordings'] = playlist_map.get(obj['id'], [])
-        else:
-            obj['recordings'] = []
-        playlist_collaborator_ids = get_collaborators_for_playlists(connection, [obj['id']])
-        collaborator_ids_list = playlist_collaborator_ids.get(obj['id'], [])
-        obj['collaborator_ids'] = collaborator_ids_list
-        obj['collaborators'] = get_collaborators_names_from_ids(collaborator_ids_list)
-        return model_playlist.Playlist.parse_obj(obj)
+    user_ids = {obj['creator_id'], *obj['collaborator_ids']}
+    if obj['created_for_id']:
+        user_ids.add(obj['created_for_id'])
+    user_ids.update(recording['added_by_id'] for recording in obj['recordings'])
+    user_names = db_user.get_users_by_id(list(user_ids))
+
+    obj['creator'] = user_names[obj['creator_id']]
+    if obj['created_for_id'] and obj['created_for_id'] in user_names:
+        obj['created_for'] = user_names[obj['created_for_id']]
+    obj['collaborators'] = _get_collaborator_names(obj['collaborator_ids'], user_names)
+    for recording in obj['recordings']:
+        recording['added_by'] = user_names[recording['added_by_id']]
+    return model_playlist.Playlist.parse_obj(obj)
 
 
 def get_playlists_for_user(user_id: int,
@@ -143,20 +162,19 @@ def _playlist_resultset_to_model(connection, result, load_recordings):
 
     Fill in related data (username, created_for username) and collaborators
     """
+    rows = [dict(row) for row in result]
+    user_ids = set()
+    for row in rows:
+        user_ids.add(row["creator_id"])
+        if row["created_for_id"]:
+            user_ids.add(row["created_for_id"])
+    user_names = db_user.get_users_by_id(list(user_ids))
+
     playlists = []
-    user_id_map = {}
-    for row in result:
-        creator_id = row["creator_id"]
-        if creator_id not in user_id_map:
-            # TODO: Do this lookup in bulk
-            user_id_map[creator_id] = db_user.get(creator_id)
-        created_for_id = row["created_for_id"]
-        if created_for_id and created_for_id not in user_id_map:
-            user_id_map[created_for_id] = db_user.get(created_for_id)
-        row = dict(row)
-        row["creator"] = user_id_map[creator_id]["musicbrainz_id"]
-        if created_for_id:
-            row["created_for"] = user_id_map[created_for_id]["musicbrainz_id"]
+    for row in rows:
+        row["creator"] = user_names[row["creator_id"]]
+        if row["created_for_id"]:
+            row["created_for"] = user_names[row["created_for_id"]]
         row["recordings"] = []
         playlist = model_playlist.Playlist.parse_obj(row)
         playlists.append(playlist)
@@ -168,9 +186,13 @@ def _playlist_resultset_to_model(connection, result, load_recordings):
             for p in playlists:
                 p.recordings = playlist_recordings.get(p.id, [])
         playlist_collaborator_ids = get_collaborators_for_playlists(connection, playlist_ids)
+        collaborator_ids = set()
         for p in playlists:
             p.collaborator_ids = playlist_collaborator_ids.get(p.id, [])
-            p.collaborators = get_collaborators_names_from_ids(p.collaborator_ids)
+            collaborator_ids.update(p.collaborator_ids)
+        collaborator_names = db_user.get_users_by_id(list(collaborator_ids))
+        for p in playlists:
+            p.collaborators = _get_collaborator_names(p.collaborator_ids, collaborator_names)
 
     return playlists
 
@@ -331,7 +353,15 @@ def get_collaborators_for_playlists(connection, playlist_ids: List[int]):
 
 
 def get_recordings_for_playlists(connection, playlist_ids: List[int]):
-    """"""
+    """Get all of the recordings for the given playlists
+
+    Args:
+        connection: an open database connection
+        playlist_ids: a list of playlist ids to get recordings for
+
+    Return:
+        a dictionary of {playlist_id: [PlaylistRecording]}, ordered by position
+    """
 
     query = sqlalchemy.text("""
         SELECT id
@@ -345,15 +375,12 @@ def get_recordings_for_playlists(connection, playlist_ids: List[int]):
       ORDER BY playlist_id, position
     """)
     result = connection.execute(query, {"playlist_ids": tuple(playlist_ids)})
-    user_id_map = {}
+    rows = [dict(row) for row in result]
+    user_names = db_user.get_users_by_id(list({row["added_by_id"] for row in rows}))
+
     playlist_recordings_map = collections.defaultdict(list)
-    for row in result:
-        added_by_id = row["added_by_id"]
-        if added_by_id not in user_id_map:
-            # TODO: Do this lookup in bulk
-            user_id_map[added_by_id] = db_user.get(added_by_id)
-        row = dict(row)
-        row["added_by"] = user_id_map[added_by_id]["musicbrainz_id"]
+    for row in rows:
+        row["added_by"] = user_names[row["added_by_id"]]
         playlist_recording = model_playlist.PlaylistRecording.parse_obj(row)
         playlist_recordings_map[playlist_recording.playlist_id].append(playlist_recording)
     for playlist_id in playlist_ids:
@@ -376,18 +403,14 @@ def create(playlist: model_playlist.WritablePlaylist) -> model_playlist.Playlist
         a Playlist, representing the playlist that was inserted, with the id, mbid, and created date added.
 
     """
-    # TODO: These two gets should be done in a single query
-    creator = db_user.get(playlist.creator_id)
-    if creator is None:
-        raise Exception("TODO: Custom exception")
-
     # TODO: In a way this is less than ideal -- the caller must take the string name and find the ID,
     # and then the name is fetched for verification again. Should we accept created_for here and do
     # lookup only here and not he in the API call validation?
-    if playlist.created_for_id:
-        created_for = db_user.get(playlist.created_for_id)
-        if created_for is None:
-            raise Exception("TODO: Custom exception")
+    user_names = db_user.get_users_by_id([playlist.creator_id] + ([playlist.created_for_id] if playlist.created_for_id else []))
+    if playlist.creator_id not in user_names:
+        raise Exception("TODO: Custom exception")
+    if playlist.created_for_id and playlist.created_for_id not in user_names:
+        raise Exception("TODO: Custom exception")
     query = sqlalchemy.text("""
         INSERT INTO playlist.playlist (creator_id
                                      , name
@@ -415,7 +438,7 @@ def create(playlist: model_playlist.WritablePlaylist) -> model_playlist.Playlist
         playlist.id = row['id']
         playlist.mbid = row['mbid']
         playlist.created = row['created']
-        playlist.creator = creator['musicbrainz_id']
+        playlist.creator = user_names[playlist.creator_id]
         playlist.recordings = insert_recordings(connection, playlist.id, playlist.recordings, 0)
 
         if playlist.collaborator_ids:
@@ -442,14 +465,12 @@ def add_playlist_collaborators(connection, playlist_id, collaborator_ids):
 
 
 def get_collaborators_names_from_ids(collaborator_ids: List[int]):
-    collaborators = []
-    # TODO: Look this up in one query
-    for user_id in collaborator_ids:
-        user = db_user.get(user_id)
-        if user:
-            collaborators.append(user["musicbrainz_id"])
-    collaborators.sort()
-    return collaborators
+    """Get the sorted names of the given collaborators, unknown user ids are skipped."""
+    return _get_collaborator_names(collaborator_ids, db_user.get_users_by_id(collaborator_ids))
+
+
+def _get_collaborator_names(collaborator_ids: List[int], user_names: Dict[int, str]):
+    return sorted(user_names[user_id] for user_id in collaborator_ids if user_id in user_names)
 
 
 def update_playlist(playlist: model_playlist.Playlist):
@@ -540,34 +561,48 @@ def insert_recordings(connection, playlist_id: int, recordings: List[model_playl
     """Insert recordings to an existing playlist. The position field will be computed based on the order
     of the provided recordings.
 
+    All recordings are inserted in a single statement, and the names of the users who added them
+    are looked up in a single query.
+
     Arguments:
         connection: an open database connection
         playlist_id: the playlist id to add the recordings to
         recordings: a list of recordings to add
         starting_position: The position number to set in the first recording. The first recording in a playlist is position 0
     """
+    if not recordings:
+        return []
+
+    insert_ts = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
     for position, recording in enumerate(recordings, starting_position):
         recording.playlist_id = playlist_id
         recording.position = position
+        if not recording.created:
+            recording.created = insert_ts
 
     query = sqlalchemy.text("""
         INSERT INTO playlist.playlist_recording (playlist_id, position, mbid, added_by_id, created)
-                                         VALUES (:playlist_id, :position, :mbid, :added_by_id, :created)
-                                      RETURNING id, created""")
+             SELECT :playlist_id, t.position, t.mbid, t.added_by_id, t.created
+               FROM unnest(:positions ::int[], :mbids ::uuid[], :added_by_ids ::int[], :created ::timestamptz[])
+                 AS t(position, mbid, added_by_id, created)
+          RETURNING id, position, created""")
+    result = connection.execute(query, {
+        "playlist_id": playlist_id,
+        "positions": [recording.position for recording in recordings],
+        "mbids": [str(recording.mbid) for recording in recordings],
+        "added_by_ids": [recording.added_by_id for recording in recordings],
+        "created": [recording.created for recording in recordings],
+    })
+    # the order of rows returned by INSERT ... SELECT isn't guaranteed, match them up by position
+    inserted = {row['position']: row for row in result.fetchall()}
+    user_names = db_user.get_users_by_id(list({recording.added_by_id for recording in recordings}))
+
     return_recordings = []
-    user_id_map = {}
-    insert_ts = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
     for recording in recordings:
-        if not recording.created:
-            recording.created = insert_ts
-        result = connection.execute(query, recording.dict(include={'playlist_id', 'position', 'mbid', 'added_by_id', 'created'}))
-        if recording.added_by_id not in user_id_map:
-            # TODO: Do this lookup in bulk
-            user_id_map[recording.added_by_id] = db_user.get(recording.added_by_id)
-        row = result.fetchone()
+        row = inserted[recording.position]
         recording.id = row['id']
         recording.created = row['created']
-        recording.added_by = user_id_map[recording.added_by_id]["musicbrainz_id"]
+        recording.added_by = user_names[recording.added_by_id]
         return_recordings.append(model_playlist.PlaylistRecording.parse_obj(recording.dict()))
     return return_recordings
 
@@ -0,0 +1,243 @@
+""" A shared resolver of recording metadata for MSIDs and MBIDs.
+
+Feedback, pinned recordings, feed events and playlists show the names of the recordings they
+refer to, which live in other databases: the names of an MSID in MessyBrainz and its mapped
+MBIDs in the mbid_mapping tables of timescale. This module looks up both for a whole page of
+recordings at once, querying the databases concurrently, and caches the merged results in an
+in-process LRU cache and in redis.
+
+Caching is enabled by setting RECORDING_METADATA_CACHE_TTL in the config to the number of
+seconds that metadata may be cached for.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Dict, Iterable, Tuple
+
+import sqlalchemy
+from brainzutils import cache
+
+from listenbrainz import config
+from listenbrainz import messybrainz as msb_db
+from listenbrainz.db import timescale
+
+CACHE_NAMESPACE = "recording_metadata"
+DEFAULT_LOCAL_CACHE_SIZE = 10000
+
+# The in-process cache keeps entries for at most this many seconds, so that processes
+# don't serve metadata that was updated in redis for long
+MAX_LOCAL_CACHE_TTL = 300
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="recording_metadata")
+        return _executor
+
+
+class LocalCache:
+    """ A thread safe LRU cache whose entries expire after ttl seconds. """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, dict]:
+        now = monotonic()
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                expires, value = entry
+                if expires < now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, values: Dict[str, dict], ttl: float):
+        expires = monotonic() + ttl
+        with self.lock:
+            for key, value in values.items():
+                self.entries[key] = (expires, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local_cache = None
+
+
+def _get_local_cache() -> LocalCache:
+    global _local_cache
+    if _local_cache is None:
+        _local_cache = LocalCache(getattr(config, "RECORDING_METADATA_LOCAL_CACHE_SIZE", DEFAULT_LOCAL_CACHE_SIZE))
+    return _local_cache
+
+
+def clear_local_cache():
+    """ Empty the in-process cache of this process """
+    if _local_cache is not None:
+        _local_cache.clear()
+
+
+def _msid_key(msid: str) -> str:
+    return "msid:" + msid
+
+
+def _mbid_key(mbid: str) -> str:
+    return "mbid:" + mbid
+
+
+def fetch_msid_names(msids) -> Dict[str, dict]:
+    """ Fetch the names of the given recordings from MessyBrainz. Unknown MSIDs are left out. """
+    query = """SELECT r.gid::TEXT AS recording_msid
+                    , r.artist::TEXT AS artist_msid
+                    , rj.data
+                 FROM recording r
+                 JOIN recording_json rj
+                   ON rj.id = r.data
+                WHERE r.gid IN :msids"""
+    with msb_db.engine.connect() as connection:
+        result = connection.execute(sqlalchemy.text(query), msids=tuple(msids))
+        return {
+            row["recording_msid"]: {
+                "artist_name": row["data"]["artist"],
+                "track_name": row["data"]["title"],
+                "release_name": row["data"].get("release_name", ""),
+                "artist_msid": row["artist_msid"],
+            } for row in result.fetchall()
+        }
+
+
+def fetch_msid_mappings(msids) -> Dict[str, dict]:
+    """ Fetch the MBIDs the given MSIDs are mapped to. Unmapped MSIDs are left out. """
+    query = """SELECT recording_msid::TEXT, m.recording_mbid::TEXT, release_mbid::TEXT, artist_mbids::TEXT[]
+                 FROM mbid_mapping m
+                 JOIN mbid_mapping_metadata mm
+                   ON m.recording_mbid = mm.recording_mbid
+                WHERE recording_msid IN :msids"""
+    with timescale.engine.connect() as connection:
+        result = connection.execute(sqlalchemy.text(query), msids=tuple(msids))
+        return {
+            row["recording_msid"]: {
+                "recording_mbid": row["recording_mbid"],
+                "release_mbid": row["release_mbid"],
+                "artist_mbids": row["artist_mbids"],
+            } for row in result.fetchall() if row["recording_mbid"] is not None
+        }
+
+
+def fetch_mbid_metadata(mbids) -> Dict[str, dict]:
+    """ Fetch the metadata of the given recording MBIDs from the mapping. Unknown MBIDs are left out. """
+    query = """SELECT artist_credit_name, recording_name, release_name,
+                      recording_mbid::TEXT, release_mbid::TEXT, artist_mbids::TEXT[]
+                 FROM mbid_mapping_metadata
+                WHERE recording_mbid IN :mbids"""
+    with timescale.engine.connect() as connection:
+        result = connection.execute(sqlalchemy.text(query), mbids=tuple(mbids))
+        return {
+            row["recording_mbid"]: {
+                "artist_name": row["artist_credit_name"],
+                "track_name": row["recording_name"],
+                "release_name": row["release_name"],
+                "recording_mbid": row["recording_mbid"],
+                "release_mbid": row["release_mbid"],
+                "artist_mbids": row["artist_mbids"],
+            } for row in result.fetchall()
+        }
+
+
+def _fetch(msids, mbids) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    """ Query the databases for the given MSIDs and MBIDs concurrently and merge the results. """
+    executor = _get_executor()
+    names = executor.submit(fetch_msid_names, msids) if msids else None
+    mappings = executor.submit(fetch_msid_mappings, msids) if msids else None
+    mbid_metadata = executor.submit(fetch_mbid_metadata, mbids) if mbids else None
+
+    msid_metadata = {}
+    if msids:
+        mapped = mappings.result()
+        for msid, metadata in names.result().items():
+            metadata["mapping"] = mapped.get(msid)
+            msid_metadata[msid] = metadata
+
+    return msid_metadata, mbid_metadata.result() if mbids else {}
+
+
+def _get_cached(keys) -> Dict[str, dict]:
+    local_cache = _get_local_cache()
+    found = local_cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        from_redis = {key: value for key, value in cache.get_many(missing, namespace=CACHE_NAMESPACE).items()
+                      if value is not None}
+        if from_redis:
+            local_cache.set_many(from_redis, min(_cache_ttl(), MAX_LOCAL_CACHE_TTL))
+            found.update(from_redis)
+    return found
+
+
+def _set_cached(values: Dict[str, dict]):
+    if not values:
+        return
+    ttl = _cache_ttl()
+    cache.set_many(values, expirein=ttl, namespace=CACHE_NAMESPACE)
+    _get_local_cache().set_many(values, min(ttl, MAX_LOCAL_CACHE_TTL))
+
+
+def _cache_ttl() -> int:
+    return getattr(config, "RECORDING_METADATA_CACHE_TTL", 0)
+
+
+def get_metadata(msids: Iterable[str] = (), mbids: Iterable[str] = ()) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    """ Get the metadata of recordings by MSID and by MBID.
+
+        Args:
+            msids: the MessyBrainz IDs of recordings
+            mbids: the MusicBrainz IDs of recordings
+
+        Returns:
+            A tuple of two dicts, of the metadata by MSID and by MBID. The recordings that aren't found are
+            left out. The metadata of an MSID has the artist_name, track_name, release_name and artist_msid
+            from MessyBrainz, and a mapping dict with the recording_mbid, release_mbid and artist_mbids it is
+            mapped to, or None if it isn't mapped. The metadata of an MBID has the artist_name, track_name,
+            release_name, recording_mbid, release_mbid and artist_mbids from the mapping.
+    """
+    msids = list(dict.fromkeys(str(msid) for msid in msids))
+    mbids = list(dict.fromkeys(str(mbid) for mbid in mbids))
+    if not msids and not mbids:
+        return {}, {}
+
+    if not _cache_ttl():
+        return _fetch(msids, mbids)
+
+    cached = _get_cached([_msid_key(msid) for msid in msids] + [_mbid_key(mbid) for mbid in mbids])
+    msid_metadata = {msid: cached[_msid_key(msid)] for msid in msids if _msid_key(msid) in cached}
+    mbid_metadata = {mbid: cached[_mbid_key(mbid)] for mbid in mbids if _mbid_key(mbid) in cached}
+
+    missing_msids = [msid for msid in msids if msid not in msid_metadata]
+    missing_mbids = [mbid for mbid in mbids if mbid not in mbid_metadata]
+    if missing_msids or missing_mbids:
+        fetched_msids, fetched_mbids = _fetch(missing_msids, missing_mbids)
+        _set_cached({**{_msid_key(msid): metadata for msid, metadata in fetched_msids.items()},
+                     **{_mbid_key(mbid): metadata for mbid, metadata in fetched_mbids.items()}})
+        msid_metadata.update(fetched_msids)
+        mbid_metadata.update(fetched_mbids)
+
+    return msid_metadata, mbid_metadata
+
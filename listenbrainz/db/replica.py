@@ -0,0 +1,121 @@
+""" Routing of read-only queries to read replicas.
+
+The main database and timescale can each have a streaming replica, configured by setting
+SQLALCHEMY_DATABASE_REPLICA_URI and SQLALCHEMY_TIMESCALE_REPLICA_URI in the config. Functions
+which only read open their connections with read_connection, which connects to the replica
+unless:
+  - the replica can't be connected to, or lags behind the primary by more than REPLICA_MAX_LAG seconds
+  - one of the users whose data is read wrote within the last READ_YOUR_WRITES_WINDOW seconds, so
+    that users see their own listens, feedback and follows right after submitting them
+
+in which case it connects to the primary. Writes, and reads whose results are cached elsewhere,
+keep using the engine of the primary.
+"""
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from typing import Iterable
+
+import sqlalchemy
+from brainzutils import cache
+
+from listenbrainz import config
+
+CACHE_NAMESPACE = "read_your_writes"
+
+DEFAULT_MAX_LAG = 5  # in s
+DEFAULT_READ_YOUR_WRITES_WINDOW = 30  # in s
+
+# How long the lag of a replica is trusted before it is measured again
+LAG_CHECK_INTERVAL = 5  # in s
+
+_lock = threading.Lock()
+# the time each replica was last checked at, and whether it was usable then, by engine url
+_replica_state = {}
+
+
+def get_replica_lag(connection) -> float:
+    """ Returns how many seconds the database of the connection lags behind its primary, 0 if it
+        isn't a replica or has replayed everything it received. """
+    result = connection.execute(sqlalchemy.text("""
+        SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+                    THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+                END AS lag
+    """))
+    return float(result.fetchone()["lag"])
+
+
+def _set_replica_state(engine, usable: bool):
+    with _lock:
+        _replica_state[str(engine.url)] = (monotonic(), usable)
+
+
+def _is_replica_usable(engine) -> bool:
+    with _lock:
+        state = _replica_state.get(str(engine.url))
+    if state is not None and monotonic() < state[0] + LAG_CHECK_INTERVAL:
+        return state[1]
+
+    try:
+        with engine.connect() as connection:
+            usable = get_replica_lag(connection) <= getattr(config, "REPLICA_MAX_LAG", DEFAULT_MAX_LAG)
+    except sqlalchemy.exc.OperationalError:
+        usable = False
+    _set_replica_state(engine, usable)
+    return usable
+
+
+def reset():
+    """ Forget the state of the replicas, so that their lag is measured again on the next read. """
+    with _lock:
+        _replica_state.clear()
+
+
+def mark_write(*users):
+    """ Route the reads of the data of the given users to the primary for the next
+        READ_YOUR_WRITES_WINDOW seconds. Listens are read by user name, and the data
+        of the main database by user id. """
+    # the writes may be read by other processes, check the config rather than the engines of this one
+    if not getattr(config, "SQLALCHEMY_DATABASE_REPLICA_URI", None) and \
+            not getattr(config, "SQLALCHEMY_TIMESCALE_REPLICA_URI", None):
+        return
+    window = getattr(config, "READ_YOUR_WRITES_WINDOW", DEFAULT_READ_YOUR_WRITES_WINDOW)
+    cache.set_many({str(user): 1 for user in users}, expirein=window, namespace=CACHE_NAMESPACE)
+
+
+def _recently_wrote(users: Iterable) -> bool:
+    keys = [str(user) for user in users]
+    if not keys:
+        return False
+    return any(value is not None for value in cache.get_many(keys, namespace=CACHE_NAMESPACE).values())
+
+
+def get_read_engine(database, users: Iterable = ()):
+    """ Returns the engine that reads of the data of the given users should use.
+
+        Args:
+            database: the listenbrainz.db or listenbrainz.db.timescale module
+            users: the user names (timescale) or ids (main database) whose data is read
+    """
+    replica = database.read_engine
+    if replica is None or _recently_wrote(users) or not _is_replica_usable(replica):
+        return database.engine
+    return replica
+
+
+@contextmanager
+def read_connection(database, users: Iterable = ()):
+    """ Connect to the replica of the database if it is usable for a read of the data of the
+        given users, to the primary otherwise. See get_read_engine for the arguments. """
+    engine = get_read_engine(database, users)
+    try:
+        connection = engine.connect()
+    except sqlalchemy.exc.OperationalError:
+        if engine is database.engine:
+            raise
+        _set_replica_state(engine, False)
+        connection = database.engine.connect()
+
+    with connection:
+        yield connection
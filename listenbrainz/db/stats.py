@@ -33,6 +33,7 @@ from data.model.user_entity import UserEntityRecord
 from data.model.user_listening_activity import UserListeningActivityRecord
 from flask import current_app
 from listenbrainz import db
+from listenbrainz.db import replica
 from pydantic import ValidationError
 
 
@@ -101,7 +102,7 @@ def get_user_stats(user_id: int, stats_range: str, stats_type: str) -> Optional[
             stats_range: the time range to fetch the stats for
             stats_type: the entity type to fetch stats for
     """
-    with db.engine.connect() as connection:
+    with replica.read_connection(db) as connection:
         result = connection.execute(sqlalchemy.text("""
             SELECT user_id, last_updated, data, count, from_ts, to_ts, stats_range
               FROM statistics.user
@@ -134,7 +135,7 @@ def get_user_activity_stats(user_id: int, stats_range: str, stats_type: str, sta
             stats_type: the entity type to fetch stats for
             stats_model: the pydantic model for the stats
     """
-    with db.engine.connect() as connection:
+    with replica.read_connection(db) as connection:
         result = connection.execute(sqlalchemy.text("""
             SELECT user_id, last_updated, data, from_ts, to_ts, stats_range
               FROM statistics.user
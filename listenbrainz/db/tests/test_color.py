@@ -5,7 +5,8 @@ import sqlalchemy
 from listenbrainz import db
 from listenbrainz.db.testing import DatabaseTestCase
 from listenbrainz.db.model.color import ColorCube
-from listenbrainz.db.color import get_releases_for_color
+from listenbrainz.db.color import get_releases_for_color, RELEASES_FOR_COLOR_QUERY, \
+    INTERMEDIARY_COUNT_MULTIPLIER
 
 
 class HuesoundTestCase(DatabaseTestCase):
@@ -39,3 +40,48 @@ class HuesoundTestCase(DatabaseTestCase):
         self.assertEqual(r[2].caa_id, 3)
         self.assertEqual(r[2].release_mbid, "8c276439-d5e8-4560-8df0-2b7c996fd1a4")
         self.assertEqual(r[2].color, ColorCube(red=255, green=0, blue=0))
+
+    def insert_synthetic_data(self, count):
+        with db.engine.connect() as connection:
+            connection.execute(sqlalchemy.text("""
+                INSERT INTO release_color (caa_id, release_mbid, red, green, blue, color)
+                     SELECT i, md5(i::TEXT)::UUID, r, g, b, cube(ARRAY[r, g, b]::FLOAT8[])
+                       FROM (SELECT i
+                                  , (i * 7919) % 256 AS r
+                                  , (i * 104729) % 256 AS g
+                                  , (i * 1299709) % 256 AS b
+                               FROM generate_series(1::BIGINT, :count) AS i) AS colors
+            """), {"count": count})
+            connection.execute("ANALYZE release_color")
+
+    def test_get_releases_for_color_uses_index(self):
+        self.insert_synthetic_data(20000)
+
+        cube = ColorCube(red=255, green=0, blue=0)
+        conn = db.engine.raw_connection()
+        try:
+            with conn.cursor() as curs:
+                curs.execute("EXPLAIN " + RELEASES_FOR_COLOR_QUERY, (cube, cube, 40, 10))
+                plan = "\n".join(row[0] for row in curs.fetchall())
+        finally:
+            conn.close()
+
+        self.assertIn("Index Scan using color_ndx_release_color", plan)
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_get_releases_for_color_nearest(self):
+        self.insert_synthetic_data(5000)
+
+        with db.engine.connect() as connection:
+            result = connection.execute(sqlalchemy.text("""
+                SELECT cube_distance(color, '(10, 200, 30)') AS dist
+                  FROM release_color
+              ORDER BY dist
+                 LIMIT :count
+            """), {"count": 5 * INTERMEDIARY_COUNT_MULTIPLIER})
+            max_distance = max(row["dist"] for row in result)
+
+        r = get_releases_for_color(10, 200, 30, 5)
+        self.assertEqual(5, len(r))
+        for release in r:
+            self.assertLessEqual(release.distance, max_distance)
@@ -27,7 +27,9 @@ import os
 import os.path
 import shutil
 import sqlalchemy
+import tarfile
 import tempfile
+import tracemalloc
 import listenbrainz.db.feedback as db_feedback
 
 from datetime import datetime
@@ -155,3 +157,36 @@ class DumpTestCase(DatabaseTestCase):
             self.assertEqual(dumped_feedback[0].user_id, feedback.user_id)
             self.assertEqual(dumped_feedback[0].recording_msid, feedback.recording_msid)
             self.assertEqual(dumped_feedback[0].score, feedback.score)
+
+    def test_dump_user_feedback_streams_rows(self):
+        """ Dump a million feedback rows, a third of them on each of three days, and check that
+            the dump doesn't hold a day's rows in memory while writing them. """
+        user_id = db_user.create(1, 'test_user')
+        with db.engine.connect() as connection:
+            connection.execute(sqlalchemy.text("""
+                INSERT INTO recording_feedback (user_id, recording_msid, score, created)
+                     SELECT :user_id, md5(i::TEXT)::UUID, CASE WHEN i % 2 = 0 THEN 1 ELSE -1 END,
+                            '2021-06-01T12:00:00Z'::TIMESTAMPTZ - (i % 3) * INTERVAL '1 day' + i * INTERVAL '1 microsecond'
+                       FROM generate_series(1, 1000000) AS i
+            """), user_id=user_id)
+
+        archive_path = os.path.join(self.tempdir, 'feedback.tar')
+        tracemalloc.start()
+        try:
+            with tarfile.open(archive_path, mode='w|') as tar, db.engine.connect() as connection:
+                db_dump.dump_user_feedback(connection, tar, 'feedback-dump', self.tempdir)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # holding one day's 333k rows in memory would take well over 100MB
+        self.assertLess(peak, 20 * 1024 * 1024)
+
+        with tarfile.open(archive_path) as tar:
+            names = sorted(tar.getnames())
+            self.assertEqual(len(names), 3)
+            self.assertTrue(names[0].startswith('feedback-dump/feedback/listens/2021/05/30/'))
+            rows = 0
+            for name in names:
+                rows += sum(1 for _ in tar.extractfile(name))
+        self.assertEqual(rows, 1000000)
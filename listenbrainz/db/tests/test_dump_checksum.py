@@ -0,0 +1,77 @@
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from listenbrainz.db.dump_checksum import HashingWriter, hashed_archive, pxz_compressed_archive, verify_checksums
+
+
+class DumpChecksumTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def read_checksum(self, path, algorithm):
+        with open('{}.{}'.format(path, algorithm)) as f:
+            return f.read()
+
+    def test_hashing_writer(self):
+        path = os.path.join(self.tempdir, 'data')
+        with open(path, 'wb') as f:
+            writer = HashingWriter(f)
+            for i in range(0, len(self.data), 4096):
+                writer.write(self.data[i:i + 4096])
+            self.assertEqual(writer.tell(), len(self.data))
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(writer.hexdigests(), {
+            'md5': hashlib.md5(self.data).hexdigest(),
+            'sha256': hashlib.sha256(self.data).hexdigest(),
+        })
+
+    def test_hashed_tar_archive(self):
+        member = os.path.join(self.tempdir, 'member')
+        with open(member, 'wb') as f:
+            f.write(self.data)
+
+        archive_path = os.path.join(self.tempdir, 'archive.tar')
+        with hashed_archive(archive_path) as archive, tarfile.open(fileobj=archive, mode='w') as tar:
+            tar.add(member, arcname='member')
+
+        with open(archive_path, 'rb') as f:
+            written = f.read()
+        self.assertEqual(self.read_checksum(archive_path, 'md5'), hashlib.md5(written).hexdigest())
+        self.assertEqual(self.read_checksum(archive_path, 'sha256'), hashlib.sha256(written).hexdigest())
+        with tarfile.open(archive_path) as tar:
+            self.assertEqual(tar.extractfile('member').read(), self.data)
+
+    @unittest.skipIf(shutil.which('pxz') is None, 'pxz is not installed')
+    def test_pxz_compressed_archive(self):
+        archive_path = os.path.join(self.tempdir, 'archive.xz')
+        with pxz_compressed_archive(archive_path, 2) as archive:
+            archive.write(self.data)
+
+        with open(archive_path, 'rb') as f:
+            written = f.read()
+        self.assertEqual(self.read_checksum(archive_path, 'md5'), hashlib.md5(written).hexdigest())
+        self.assertEqual(self.read_checksum(archive_path, 'sha256'), hashlib.sha256(written).hexdigest())
+
+    def test_verify_checksums(self):
+        for name in ('a.tar', 'b.tar', 'c.tar'):
+            with hashed_archive(os.path.join(self.tempdir, name)) as archive:
+                archive.write(self.data + name.encode('utf-8'))
+        with open(os.path.join(self.tempdir, 'DUMP_ID.txt'), 'w') as f:
+            f.write('20210101-000000 1 full\n')
+        self.assertEqual(verify_checksums(self.tempdir, threads=3), {})
+
+        with open(os.path.join(self.tempdir, 'b.tar'), 'r+b') as f:
+            f.write(b'x')
+        os.remove(os.path.join(self.tempdir, 'c.tar.md5'))
+        self.assertEqual(verify_checksums(self.tempdir, threads=3), {'b.tar': ['md5', 'sha256'], 'c.tar': ['md5']})
@@ -0,0 +1,108 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from listenbrainz.db import recording_metadata
+
+MSID_1 = "d23f4719-9212-49f0-ad08-ddbfbfc50d6f"
+MSID_2 = "222eb00d-9ead-42de-aec9-8f8c1509413d"
+MBID_1 = "076255b4-1575-11ec-ac84-135bf6a670e3"
+
+NAMES = {
+    MSID_1: {"artist_name": "Portishead", "track_name": "Strangers", "release_name": "Dummy",
+             "artist_msid": "a9a1bf9a-e1a0-4ab6-8e8c-0f8fa38f6c8c"},
+    MSID_2: {"artist_name": "Tom Ellis", "track_name": "Wicked Game", "release_name": "",
+             "artist_msid": "0ba2c1fa-06e6-45f8-9a3c-e1b4e2b0e2a6"},
+}
+MAPPINGS = {
+    MSID_1: {"recording_mbid": MBID_1, "release_mbid": "1fd178b4-1575-11ec-b98a-d72392cd8c97",
+             "artist_mbids": ["6a221fda-2200-11ec-ac7d-dfa16a57158f"]},
+}
+MBID_METADATA = {
+    MBID_1: {"artist_name": "Portishead", "track_name": "Strangers", "release_name": "Dummy",
+             "recording_mbid": MBID_1, "release_mbid": "1fd178b4-1575-11ec-b98a-d72392cd8c97",
+             "artist_mbids": ["6a221fda-2200-11ec-ac7d-dfa16a57158f"]},
+}
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.values = {}
+
+    def get_many(self, keys, namespace=None):
+        return {key: self.values.get((namespace, key)) for key in keys}
+
+    def set_many(self, mapping, expirein=None, namespace=None):
+        for key, value in mapping.items():
+            self.values[(namespace, key)] = value
+
+
+class RecordingMetadataTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        recording_metadata.clear_local_cache()
+        self.redis = FakeRedis()
+        self.patches = [
+            patch("listenbrainz.db.recording_metadata.fetch_msid_names", self.fake_fetch("names", NAMES)),
+            patch("listenbrainz.db.recording_metadata.fetch_msid_mappings", self.fake_fetch("mappings", MAPPINGS)),
+            patch("listenbrainz.db.recording_metadata.fetch_mbid_metadata", self.fake_fetch("mbids", MBID_METADATA)),
+            patch("listenbrainz.db.recording_metadata.cache", self.redis),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        recording_metadata.clear_local_cache()
+
+    def fake_fetch(self, name, data):
+        def fetch(ids):
+            with self.lock:
+                self.calls.append((name, sorted(ids)))
+            return {i: dict(data[i]) for i in ids if i in data}
+        return fetch
+
+    def test_merges_names_and_mappings(self):
+        msid_metadata, mbid_metadata = recording_metadata.get_metadata(
+            msids=[MSID_1, MSID_2, "00000000-0000-0000-0000-000000000000"], mbids=[MBID_1])
+
+        self.assertEqual(msid_metadata, {
+            MSID_1: {**NAMES[MSID_1], "mapping": MAPPINGS[MSID_1]},
+            MSID_2: {**NAMES[MSID_2], "mapping": None},
+        })
+        self.assertEqual(mbid_metadata, MBID_METADATA)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_get_metadata_without_ids(self):
+        self.assertEqual(recording_metadata.get_metadata(), ({}, {}))
+        self.assertEqual(self.calls, [])
+
+    @patch("listenbrainz.config.RECORDING_METADATA_CACHE_TTL", 60, create=True)
+    def test_caches_results(self):
+        expected = recording_metadata.get_metadata(msids=[MSID_1], mbids=[MBID_1])
+        self.calls.clear()
+
+        # served from the in-process cache
+        self.assertEqual(recording_metadata.get_metadata(msids=[MSID_1], mbids=[MBID_1]), expected)
+        self.assertEqual(self.calls, [])
+
+        # another process finds the results in redis
+        recording_metadata.clear_local_cache()
+        self.assertEqual(recording_metadata.get_metadata(msids=[MSID_1], mbids=[MBID_1]), expected)
+        self.assertEqual(self.calls, [])
+
+        # only the missing recordings are fetched
+        msid_metadata, _ = recording_metadata.get_metadata(msids=[MSID_1, MSID_2])
+        self.assertEqual(set(msid_metadata), {MSID_1, MSID_2})
+        self.assertEqual(sorted(self.calls), [("mappings", [MSID_2]), ("names", [MSID_2])])
+
+    @patch("listenbrainz.config.RECORDING_METADATA_CACHE_TTL", 0, create=True)
+    def test_disabled_cache(self):
+        recording_metadata.get_metadata(msids=[MSID_1])
+        recording_metadata.get_metadata(msids=[MSID_1])
+        self.assertEqual(len(self.calls), 4)
+        self.assertEqual(self.redis.values, {})
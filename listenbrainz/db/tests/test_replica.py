@@ -0,0 +1,109 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import sqlalchemy
+
+from listenbrainz.db import replica
+
+
+class FakeCache:
+
+    def __init__(self):
+        self.values = {}
+
+    def get_many(self, keys, namespace=None):
+        return {key: self.values.get((namespace, key)) for key in keys}
+
+    def set_many(self, mapping, expirein=None, namespace=None):
+        for key, value in mapping.items():
+            self.values[(namespace, key)] = value
+
+
+class FakeConnection:
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeEngine:
+    """ An engine whose lag is simulated by the lag attribute, None if it is down. """
+
+    def __init__(self, url, lag=0.0):
+        self.url = url
+        self.lag = lag
+
+    def connect(self):
+        if self.lag is None:
+            raise sqlalchemy.exc.OperationalError("connect", {}, Exception("down"))
+        return FakeConnection(self)
+
+
+def fake_replica_lag(connection):
+    return connection.engine.lag
+
+
+@patch("listenbrainz.config.SQLALCHEMY_TIMESCALE_REPLICA_URI", "postgresql://replica", create=True)
+@patch("listenbrainz.config.REPLICA_MAX_LAG", 5, create=True)
+@patch("listenbrainz.db.replica.get_replica_lag", fake_replica_lag)
+class ReplicaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        replica.reset()
+        self.primary = FakeEngine("postgresql://primary")
+        self.replica = FakeEngine("postgresql://replica")
+        self.database = SimpleNamespace(engine=self.primary, read_engine=self.replica)
+        self.cache = FakeCache()
+        self.cache_patch = patch("listenbrainz.db.replica.cache", self.cache)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        replica.reset()
+
+    def read(self, users=()):
+        with replica.read_connection(self.database, users=users) as connection:
+            return connection.engine
+
+    def test_reads_from_replica(self):
+        self.assertIs(self.read(["iliekcomputers"]), self.replica)
+
+    def test_no_replica(self):
+        self.database.read_engine = None
+        self.assertIs(self.read(), self.primary)
+
+    def test_lagging_replica(self):
+        self.replica.lag = 60
+        self.assertIs(self.read(), self.primary)
+
+        # the lag is measured again after LAG_CHECK_INTERVAL
+        self.replica.lag = 1
+        self.assertIs(self.read(), self.primary)
+        with patch("listenbrainz.db.replica.LAG_CHECK_INTERVAL", 0):
+            self.assertIs(self.read(), self.replica)
+
+    def test_replica_down(self):
+        self.assertIs(self.read(), self.replica)
+        # the replica was usable when it was last checked, but it can't be connected to anymore
+        self.replica.lag = None
+        self.assertIs(self.read(), self.primary)
+        self.replica.lag = 0
+        self.assertIs(self.read(), self.primary)
+
+    def test_read_your_writes(self):
+        replica.mark_write("iliekcomputers")
+        self.assertIs(self.read(["iliekcomputers"]), self.primary)
+        self.assertIs(self.read(["rob", "iliekcomputers"]), self.primary)
+        self.assertIs(self.read(["rob"]), self.replica)
+        self.assertIs(self.read(), self.replica)
+
+    def test_writes_not_tracked_without_replicas(self):
+        with patch("listenbrainz.config.SQLALCHEMY_TIMESCALE_REPLICA_URI", "", create=True):
+            replica.mark_write("iliekcomputers")
+        self.assertEqual(self.cache.values, {})
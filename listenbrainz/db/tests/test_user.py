@@ -7,11 +7,14 @@ import listenbrainz.db.stats as db_stats
 import sqlalchemy
 import time
 import ujson
+from unittest.mock import patch
 
 from data.model.common_stat import StatRange
 from data.model.external_service import ExternalServiceType
 from data.model.user_entity import UserEntityRecord
 from listenbrainz import db
+from listenbrainz.db import user_cache
+from listenbrainz.db.lastfm_session import Session
 from listenbrainz.db.similar_users import import_user_similarities
 from listenbrainz.db.testing import DatabaseTestCase
 
@@ -203,6 +206,14 @@ class UserTestCase(DatabaseTestCase):
 
         self.assertDictEqual(users, db_user.get_users_by_id([user_id_24, user_id_25]))
 
+    def test_get_user_ids_by_mb_id(self):
+        user_id_26 = db_user.create(26, "Twenty_Six")
+        user_id_27 = db_user.create(27, "twenty_seven")
+
+        self.assertDictEqual({"twenty_six": user_id_26, "twenty_seven": user_id_27},
+                             db_user.get_user_ids_by_mb_id(["twenty_SIX", "twenty_seven", "unknown"]))
+        self.assertDictEqual({}, db_user.get_user_ids_by_mb_id([]))
+
     def test_fetch_email(self):
         musicbrainz_id = "one"
         email = "one@one.one"
@@ -232,3 +243,105 @@ class UserTestCase(DatabaseTestCase):
 
         results = db_user.search("cif", 10, searcher_id)
         self.assertEqual(results, [("Cécile", 0.1, None), ("Cecile", 0.1, 0.42), ("lucifer", 0.0909091, 0.61)])
+
+
+class FakeCache:
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key, namespace=None):
+        return self.values.get((namespace, key))
+
+    def set(self, key, value, expirein=None, namespace=None):
+        self.values[(namespace, key)] = dict(value)
+
+    def set_many(self, mapping, expirein=None, namespace=None):
+        for key, value in mapping.items():
+            self.values[(namespace, key)] = dict(value)
+
+    def delete_many(self, keys, namespace=None):
+        for key in keys:
+            self.values.pop((namespace, key), None)
+
+
+@patch("listenbrainz.config.USER_CACHE_TTL", 30, create=True)
+class UserCacheTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super(UserCacheTestCase, self).setUp()
+        self.cache = FakeCache()
+        self.cache_patch = patch("listenbrainz.db.user_cache.cache", self.cache)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        super(UserCacheTestCase, self).tearDown()
+
+    def test_lookups_are_cached(self):
+        user_id = db_user.create(1, "Frank", "frank@example.com")
+        token = db_user.get(user_id)["auth_token"]
+
+        stats = user_cache.get_stats()
+        user = db_user.get_by_token(token)
+        self.assertEqual(user["id"], user_id)
+        self.assertEqual(db_user.get_by_mb_id("frank"), user)
+        self.assertEqual(user_cache.get_stats()["misses"], stats["misses"] + 1)
+        self.assertEqual(user_cache.get_stats()["hits"], stats["hits"] + 1)
+
+        # the cached user is served without querying the database
+        with db.engine.connect() as connection:
+            connection.execute(sqlalchemy.text('UPDATE "user" SET gdpr_agreed = NOW() WHERE id = :id'), id=user_id)
+        self.assertEqual(db_user.get_by_mb_id("FRANK"), user)
+        self.assertNotIn("email", db_user.get_by_token(token))
+        self.assertEqual(db_user.get_by_token(token, fetch_email=True)["email"], "frank@example.com")
+
+    def test_revoked_token_is_rejected(self):
+        user_id = db_user.create(1, "frank")
+        old_token = db_user.get(user_id)["auth_token"]
+        self.assertEqual(db_user.get_by_token(old_token)["id"], user_id)
+
+        db_user.update_token(user_id)
+        self.assertIsNone(db_user.get_by_token(old_token))
+        new_token = db_user.get(user_id)["auth_token"]
+        self.assertEqual(db_user.get_by_token(new_token)["id"], user_id)
+        self.assertEqual(db_user.get_by_mb_id("frank")["auth_token"], new_token)
+
+    def test_deleted_user_is_not_found(self):
+        user_id = db_user.create(1, "frank")
+        token = db_user.get(user_id)["auth_token"]
+        self.assertIsNotNone(db_user.get_by_token(token))
+        self.assertIsNotNone(db_user.get_by_mb_id("frank"))
+
+        db_user.delete(user_id)
+        self.assertIsNone(db_user.get_by_token(token))
+        self.assertIsNone(db_user.get_by_mb_id("frank"))
+
+    def test_updates_invalidate_cached_user(self):
+        user_id = db_user.create(1, "frank")
+        self.assertIsNone(db_user.get_by_mb_id("frank")["last_login"])
+        db_user.update_last_login("frank")
+        self.assertIsNotNone(db_user.get_by_mb_id("frank")["last_login"])
+
+        db_user.update_user_email("frank", "frank@example.com")
+        self.assertEqual(db_user.get_by_mb_id("frank", fetch_email=True)["email"], "frank@example.com")
+
+        db_user.update_musicbrainz_row_id("frank", 5)
+        self.assertEqual(db_user.get_by_mb_id("frank")["musicbrainz_row_id"], 5)
+
+    def test_session_lookups_are_cached(self):
+        user_id = db_user.create(1, "frank", "frank@example.com")
+        Session.generate(user_id, "frank_session", "api_key")
+        self.assertIsNone(db_user.get_by_session_key("unknown_session"))
+
+        user = db_user.get_by_session_key("frank_session", fetch_email=True)
+        self.assertEqual(user["id"], user_id)
+        self.assertEqual(user["email"], "frank@example.com")
+        self.assertNotIn("email", db_user.get_by_session_key("frank_session"))
+
+        # the user of the session is invalidated along with its other cached entries
+        db_user.update_user_email("frank", "frank2@example.com")
+        self.assertEqual(db_user.get_by_session_key("frank_session", fetch_email=True)["email"], "frank2@example.com")
+
+        db_user.delete(user_id)
+        self.assertIsNone(db_user.get_by_session_key("frank_session"))
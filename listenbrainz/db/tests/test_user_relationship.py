@@ -143,6 +143,30 @@ class UserRelationshipTestCase(DatabaseTestCase):
         )
         self.assertEqual(1, len(events))
 
+    def test_get_follow_events_after_a_follow_event(self):
+        db_user_relationship.insert(self.main_user['id'], self.followed_user_1['id'], 'follow')
+        db_user_relationship.insert(self.main_user['id'], self.followed_user_2['id'], 'follow')
+
+        events = db_user_relationship.get_follow_events(
+            user_ids=(self.main_user['id'],),
+            min_ts=0,
+            max_ts=int(time.time()) + 10,
+            count=1,
+        )
+        self.assertEqual('followed_user_2', events[0]['user_name_1'])
+
+        # the next page starts after the last event
+        last = events[-1]
+        events = db_user_relationship.get_follow_events(
+            user_ids=(self.main_user['id'],),
+            min_ts=0,
+            max_ts=int(last['created'].timestamp()),
+            count=1,
+            before=(last['user_0'], last['user_1']),
+        )
+        self.assertEqual(1, len(events))
+        self.assertEqual('followed_user_1', events[0]['user_name_1'])
+
     def test_get_follow_events_honors_count_parameter(self):
         db_user_relationship.insert(self.main_user['id'], self.followed_user_1['id'], 'follow')
         db_user_relationship.insert(self.main_user['id'], self.followed_user_2['id'], 'follow')
@@ -278,6 +278,45 @@ class UserTimelineEventDatabaseTestCase(DatabaseTestCase):
         )
         self.assertEqual(0, len(event_not))
 
+    def test_get_user_notification_events_for_feed(self):
+        ts = int(time.time())
+        events = [
+            db_user_timeline_event.create_user_notification_event(
+                user_id=self.user['id'],
+                metadata=NotificationMetadata(creator='troi-bot', message='notification %d' % i),
+            )
+            for i in range(3)
+        ]
+
+        # newest first, and with the same second the highest id first
+        notifications = db_user_timeline_event.get_user_notification_events_for_feed(
+            user_id=self.user['id'],
+            min_ts=ts - 10,
+            max_ts=ts + 10,
+            count=2,
+        )
+        self.assertListEqual([event.id for event in notifications], [events[2].id, events[1].id])
+
+        # the page after the last notification returned
+        last = notifications[-1]
+        notifications = db_user_timeline_event.get_user_notification_events_for_feed(
+            user_id=self.user['id'],
+            min_ts=ts - 10,
+            max_ts=int(last.created.timestamp()),
+            count=2,
+            before_id=last.id,
+        )
+        self.assertListEqual([event.id for event in notifications], [events[0].id])
+
+        # honors min_ts
+        notifications = db_user_timeline_event.get_user_notification_events_for_feed(
+            user_id=self.user['id'],
+            min_ts=ts + 10,
+            max_ts=ts + 20,
+            count=2,
+        )
+        self.assertListEqual(notifications, [])
+
     def test_delete_feed_events_for_something_goes_wrong(self):
         # creating recording recommendation
         event_rec = db_user_timeline_event.create_user_track_recommendation_event(
@@ -16,6 +16,8 @@ from listenbrainz import config
 SCHEMA_VERSION_TIMESCALE = 7
 
 engine = None
+# The engine of the read replica, None if there is none. See listenbrainz.db.replica
+read_engine = None
 
 DUMP_DEFAULT_THREAD_COUNT = 4
 
@@ -41,6 +43,15 @@ def init_db_connection(connect_str):
             time.sleep(2)
 
 
+def init_read_db_connection(connect_str):
+    """ Initializes the connection to the read replica of the timescale database, if one is configured. """
+    global read_engine
+    if not connect_str:
+        read_engine = None
+        return
+    read_engine = create_engine(connect_str, poolclass=NullPool)
+
+
 def run_sql_script(sql_file_path):
     with open(sql_file_path) as sql:
         with engine.connect() as connection:
@@ -1,5 +1,5 @@
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 import sqlalchemy
 import uuid
@@ -7,6 +7,7 @@ import ujson
 
 from datetime import datetime
 from listenbrainz import db
+from listenbrainz.db import user_cache
 from listenbrainz.db.exceptions import DatabaseException
 from data.model.similar_user_model import SimilarUsers
 from typing import Tuple, List
@@ -50,10 +51,12 @@ def update_token(id):
     """
     with db.engine.connect() as connection:
         try:
-            connection.execute(sqlalchemy.text("""
-                UPDATE "user"
+            result = connection.execute(sqlalchemy.text("""
+                UPDATE "user" u
                    SET auth_token = :token
-                 WHERE id = :id
+                  FROM (SELECT id, auth_token FROM "user" WHERE id = :id FOR UPDATE) old
+                 WHERE u.id = old.id
+             RETURNING u.musicbrainz_id, old.auth_token
             """), {
                 "token": str(uuid.uuid4()),
                 "id": id
@@ -61,12 +64,37 @@ def update_token(id):
         except DatabaseException as e:
             logger.error(e)
             raise
+        _invalidate_cached(result)
 
 
 USER_GET_COLUMNS = ['id', 'created', 'musicbrainz_id', 'auth_token',
                     'last_login', 'latest_import', 'gdpr_agreed', 'musicbrainz_row_id', 'login_id']
 
 
+def _invalidate_cached(result):
+    """ Remove the modified users from the user cache. result is the result of a query which
+        returns the musicbrainz_id and auth_token of the users it modified. """
+    for row in result.fetchall():
+        user_cache.invalidate(musicbrainz_id=row["musicbrainz_id"], auth_token=row["auth_token"])
+
+
+def _get_cached(cached_user, fetch_user, fetch_email):
+    """ Return a user from the user cache if it is enabled, or fetch it from the database and
+        cache it. The cached users include the email, which is removed unless fetch_email is set. """
+    if not user_cache.is_enabled():
+        return fetch_user(fetch_email)
+
+    user = cached_user()
+    if user is None:
+        user = fetch_user(True)
+        if user is None:
+            return None
+        user_cache.set_user(user)
+    if not fetch_email:
+        user = {k: v for k, v in user.items() if k != 'email'}
+    return user
+
+
 def get(id: int, *, fetch_email: bool = False):
     """Get user with a specified ID.
 
@@ -170,15 +198,18 @@ def get_by_mb_id(musicbrainz_id, *, fetch_email: bool = False):
             "login_id": <token used for login sessions>
         }
     """
-    columns = USER_GET_COLUMNS + ['email'] if fetch_email else USER_GET_COLUMNS
-    with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT {columns}
-              FROM "user"
-             WHERE LOWER(musicbrainz_id) = LOWER(:mb_id)
-        """.format(columns=','.join(columns))), {"mb_id": musicbrainz_id})
-        row = result.fetchone()
-        return dict(row) if row else None
+    def fetch_user(fetch_email):
+        columns = USER_GET_COLUMNS + ['email'] if fetch_email else USER_GET_COLUMNS
+        with db.engine.connect() as connection:
+            result = connection.execute(sqlalchemy.text("""
+                SELECT {columns}
+                  FROM "user"
+                 WHERE LOWER(musicbrainz_id) = LOWER(:mb_id)
+            """.format(columns=','.join(columns))), {"mb_id": musicbrainz_id})
+            row = result.fetchone()
+            return dict(row) if row else None
+
+    return _get_cached(lambda: user_cache.get_by_mb_id(musicbrainz_id), fetch_user, fetch_email)
 
 
 def get_by_token(token: str, *, fetch_email: bool = False):
@@ -196,15 +227,62 @@ def get_by_token(token: str, *, fetch_email: bool = False):
             "musicbrainz_id": <MusicBrainz username>,
         }
     """
-    columns = USER_GET_COLUMNS + ['email'] if fetch_email else USER_GET_COLUMNS
-    with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT {columns}
-              FROM "user"
-             WHERE auth_token = :auth_token
-        """.format(columns=','.join(columns))), {"auth_token": token})
-        row = result.fetchone()
-        return dict(row) if row else None
+    def fetch_user(fetch_email):
+        columns = USER_GET_COLUMNS + ['email'] if fetch_email else USER_GET_COLUMNS
+        with db.engine.connect() as connection:
+            result = connection.execute(sqlalchemy.text("""
+                SELECT {columns}
+                  FROM "user"
+                 WHERE auth_token = :auth_token
+            """.format(columns=','.join(columns))), {"auth_token": token})
+            row = result.fetchone()
+            return dict(row) if row else None
+
+    return _get_cached(lambda: user_cache.get_by_token(token), fetch_user, fetch_email)
+
+
+def get_by_session_key(session_key: str, *, fetch_email: bool = False):
+    """Get the user of a session of the Last.fm compatible API.
+
+    Args:
+        session_key: the key (sid) of the session
+        fetch_email: whether to return email in response
+
+    Returns:
+        Dictionary with the same structure as the one returned by get, or None if there is no
+        session with the given key
+    """
+    def fetch_user(fetch_email):
+        columns = USER_GET_COLUMNS + ['email'] if fetch_email else USER_GET_COLUMNS
+        with db.engine.connect() as connection:
+            result = connection.execute(sqlalchemy.text("""
+                SELECT {columns}
+                  FROM api_compat.session s
+                  JOIN "user" u
+                    ON u.id = s.user_id
+                 WHERE s.sid = :sid
+            """.format(columns=','.join('u.' + column for column in columns))), {"sid": session_key})
+            row = result.fetchone()
+            return dict(row) if row else None
+
+    if not user_cache.is_enabled():
+        return fetch_user(fetch_email)
+
+    # sessions are never moved to another user, but the user may have been deleted since
+    session = user_cache.get_session(session_key)
+    if session is not None:
+        user = get_by_mb_id(session["musicbrainz_id"], fetch_email=fetch_email)
+        if user is not None and user["id"] == session["id"]:
+            return user
+
+    user = fetch_user(True)
+    if user is None:
+        return None
+    user_cache.set_session(session_key, user)
+    user_cache.set_user(user)
+    if not fetch_email:
+        user = {k: v for k, v in user.items() if k != 'email'}
+    return user
 
 
 def get_user_count():
@@ -259,10 +337,11 @@ def update_last_login(musicbrainz_id):
 
     with db.engine.connect() as connection:
         try:
-            connection.execute(sqlalchemy.text("""
+            result = connection.execute(sqlalchemy.text("""
                 UPDATE "user"
                    SET last_login = NOW()
                  WHERE musicbrainz_id = :musicbrainz_id
+             RETURNING musicbrainz_id, auth_token
                 """), {
                 "musicbrainz_id": musicbrainz_id,
             })
@@ -270,6 +349,7 @@ def update_last_login(musicbrainz_id):
             logger.error(err)
             raise DatabaseException(
                 "Couldn't update last_login: %s" % str(err))
+        _invalidate_cached(result)
 
 
 def get_all_users(created_before=None, columns=None):
@@ -322,15 +402,17 @@ def delete(id):
     """
     with db.engine.connect() as connection:
         try:
-            connection.execute(sqlalchemy.text("""
+            result = connection.execute(sqlalchemy.text("""
                 DELETE FROM "user"
                       WHERE id = :id
+                  RETURNING musicbrainz_id, auth_token
                 """), {
                 'id': id,
             })
         except sqlalchemy.exc.ProgrammingError as err:
             logger.error(err)
             raise DatabaseException("Couldn't delete user: %s" % str(err))
+        _invalidate_cached(result)
 
 
 def agree_to_gdpr(musicbrainz_id):
@@ -341,10 +423,11 @@ def agree_to_gdpr(musicbrainz_id):
     """
     with db.engine.connect() as connection:
         try:
-            connection.execute(sqlalchemy.text("""
+            result = connection.execute(sqlalchemy.text("""
                 UPDATE "user"
                    SET gdpr_agreed = NOW()
                  WHERE LOWER(musicbrainz_id) = LOWER(:mb_id)
+             RETURNING musicbrainz_id, auth_token
                 """), {
                 'mb_id': musicbrainz_id,
             })
@@ -352,6 +435,7 @@ def agree_to_gdpr(musicbrainz_id):
             logger.error(err)
             raise DatabaseException(
                 "Couldn't update gdpr agreement for user: %s" % str(err))
+        _invalidate_cached(result)
 
 
 def update_musicbrainz_row_id(musicbrainz_id, musicbrainz_row_id):
@@ -363,10 +447,11 @@ def update_musicbrainz_row_id(musicbrainz_id, musicbrainz_row_id):
     """
     with db.engine.connect() as connection:
         try:
-            connection.execute(sqlalchemy.text("""
+            result = connection.execute(sqlalchemy.text("""
                 UPDATE "user"
                    SET musicbrainz_row_id = :musicbrainz_row_id
                  WHERE LOWER(musicbrainz_id) = LOWER(:mb_id)
+             RETURNING musicbrainz_id, auth_token
                 """), {
                 'musicbrainz_row_id': musicbrainz_row_id,
                 'mb_id': musicbrainz_id,
@@ -375,6 +460,7 @@ def update_musicbrainz_row_id(musicbrainz_id, musicbrainz_row_id):
             logger.error(err)
             raise DatabaseException(
                 "Couldn't update musicbrainz row id for user: %s" % str(err))
+        _invalidate_cached(result)
 
 
 def get_by_mb_row_id(musicbrainz_row_id, musicbrainz_id=None):
@@ -469,6 +555,8 @@ def get_similar_users(user_id: int) -> Optional[SimilarUsers]:
 def get_users_by_id(user_ids: List[int]):
     """ Given a list of user ids, fetch one ore more users at the same time.
         Returns a dict mapping user_ids to user_names. """
+    if not user_ids:
+        return {}
 
     with db.engine.connect() as connection:
         result = connection.execute(sqlalchemy.text("""
@@ -484,6 +572,23 @@ def get_users_by_id(user_ids: List[int]):
         return row_id_username_map
 
 
+def get_user_ids_by_mb_id(musicbrainz_ids: List[str]) -> Dict[str, int]:
+    """ Given a list of MusicBrainz usernames, fetch the ids of one or more users at the same time.
+        Returns a dict mapping lower cased user_names to user_ids, unknown users are left out. """
+    if not musicbrainz_ids:
+        return {}
+
+    with db.engine.connect() as connection:
+        result = connection.execute(sqlalchemy.text("""
+            SELECT id, musicbrainz_id
+              FROM "user"
+             WHERE LOWER(musicbrainz_id) IN :mb_ids
+        """), {
+            'mb_ids': tuple(mb_id.lower() for mb_id in musicbrainz_ids)
+        })
+        return {row['musicbrainz_id'].lower(): row['id'] for row in result.fetchall()}
+
+
 def is_user_reported(reporter_id: int, reported_id: int):
     """ Check whether the user identified by reporter_id has reported the
     user identified by reported_id"""
@@ -525,10 +630,11 @@ def update_user_email(musicbrainz_id, email):
 
     with db.engine.connect() as connection:
         try:
-            connection.execute(sqlalchemy.text("""
+            result = connection.execute(sqlalchemy.text("""
                 UPDATE "user"
                    SET email = :email
                  WHERE musicbrainz_id = :musicbrainz_id
+             RETURNING musicbrainz_id, auth_token
                 """), {
                 "musicbrainz_id": musicbrainz_id,
                 "email": email
@@ -537,6 +643,7 @@ def update_user_email(musicbrainz_id, email):
             logger.error(err)
             raise DatabaseException(
                 "Couldn't update user's email: %s" % str(err))
+        _invalidate_cached(result)
 
 
 def search(search_term: str, limit: int, searcher_id: int = None) -> List[Tuple[str, float, float]]:
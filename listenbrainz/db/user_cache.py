@@ -0,0 +1,125 @@
+""" A cache of the users looked up by auth token and by MusicBrainz username.
+
+Almost every API request resolves a user from its auth token or from the username in the
+URL. The rows of these users are cached in redis for a few seconds, so that all processes
+share the cache and see its invalidation: the functions of listenbrainz.db.user that modify
+a user remove the cached entries of that user, and a regenerated or deleted token is rejected
+by the next request. The scrobble endpoint of the Last.fm compatible API resolves its user
+from a session key instead, the user of each session is cached as well.
+
+Caching is enabled by setting USER_CACHE_TTL in the config to the number of seconds that
+users may be cached for.
+"""
+import threading
+from time import monotonic
+from typing import Optional
+
+from brainzutils import cache, metrics
+
+from listenbrainz import config
+
+CACHE_NAMESPACE = "user_identity"
+
+# How often the hit and miss counts are reported, in seconds
+REPORT_INTERVAL = 60
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+_enabled = False
+_next_report = 0
+
+
+def _token_key(token: str) -> str:
+    return "token:" + token
+
+
+def _name_key(musicbrainz_id: str) -> str:
+    return "name:" + musicbrainz_id.lower()
+
+
+def _session_key(session_key: str) -> str:
+    return "session:" + session_key
+
+
+def is_enabled() -> bool:
+    return bool(getattr(config, "USER_CACHE_TTL", 0))
+
+
+def enable_reporting():
+    """ Start reporting the hit and miss counts. The metrics module of brainzutils must be initialized. """
+    global _enabled
+    _enabled = True
+
+
+def get_stats() -> dict:
+    """ Return the hit and miss counts collected since they were last reported. """
+    with _lock:
+        return dict(_stats)
+
+
+def _record_lookup(hit: bool):
+    global _next_report
+    with _lock:
+        _stats["hits" if hit else "misses"] += 1
+        if not _enabled or monotonic() < _next_report:
+            return
+        _next_report = monotonic() + REPORT_INTERVAL
+        result = dict(_stats)
+        _stats.update(hits=0, misses=0)
+
+    lookups = result["hits"] + result["misses"]
+    metrics.set("user_identity_cache",
+                hits=result["hits"],
+                misses=result["misses"],
+                hit_rate=result["hits"] / lookups if lookups else 0.0)
+
+
+def _get(key: str) -> Optional[dict]:
+    user = cache.get(key, namespace=CACHE_NAMESPACE)
+    _record_lookup(user is not None)
+    return user
+
+
+def get_by_token(token: str) -> Optional[dict]:
+    """ Return the cached user with the given auth token, or None if it isn't cached. """
+    return _get(_token_key(token))
+
+
+def get_by_mb_id(musicbrainz_id: str) -> Optional[dict]:
+    """ Return the cached user with the given MusicBrainz username, or None if it isn't cached. """
+    return _get(_name_key(musicbrainz_id))
+
+
+def get_session(session_key: str) -> Optional[dict]:
+    """ Return the id and MusicBrainz username of the user of a Last.fm compatible API session,
+        or None if the session isn't cached. """
+    return _get(_session_key(session_key))
+
+
+def set_session(session_key: str, user: dict):
+    """ Cache the user of a Last.fm compatible API session. Only the id and username of the user
+        are cached with the session, the user itself is looked up by username so that it is
+        invalidated along with the other entries of the user. """
+    cache.set(_session_key(session_key), {"id": user["id"], "musicbrainz_id": user["musicbrainz_id"]},
+              expirein=getattr(config, "USER_CACHE_TTL", 0), namespace=CACHE_NAMESPACE)
+
+
+def set_user(user: dict):
+    """ Cache the given user by its auth token and by its MusicBrainz username. """
+    keys = {_name_key(user["musicbrainz_id"]): user}
+    if user["auth_token"]:
+        keys[_token_key(user["auth_token"])] = user
+    cache.set_many(keys, expirein=getattr(config, "USER_CACHE_TTL", 0), namespace=CACHE_NAMESPACE)
+
+
+def invalidate(musicbrainz_id: str = None, auth_token: str = None):
+    """ Remove the cached entries of a user, by its MusicBrainz username and its auth token. """
+    if not is_enabled():
+        return
+    keys = []
+    if musicbrainz_id:
+        keys.append(_name_key(musicbrainz_id))
+    if auth_token:
+        keys.append(_token_key(auth_token))
+    if keys:
+        cache.delete_many(keys, namespace=CACHE_NAMESPACE)
@@ -17,9 +17,10 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
 from datetime import datetime
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from listenbrainz import db
+from listenbrainz.db import replica
 from listenbrainz.db.exceptions import DatabaseException
 
 import sqlalchemy
@@ -42,6 +43,7 @@ def insert(user_0: int, user_1: int, relationship_type: str) -> None:
             "user_1": user_1,
             "relationship_type": relationship_type,
         })
+    replica.mark_write(user_0, user_1)
 
 
 def is_following_user(follower: int, followed: int) -> bool:
@@ -75,12 +77,13 @@ def delete(user_0: int, user_1: int, relationship_type: str) -> None:
             "user_1": user_1,
             "relationship_type": relationship_type,
         })
+    replica.mark_write(user_0, user_1)
 
 
 def get_followers_of_user(user: int) -> List[dict]:
     """ Returns a list of users who follow the specified user.
     """
-    with db.engine.connect() as connection:
+    with replica.read_connection(db, users=[user]) as connection:
         result = connection.execute(sqlalchemy.text("""
             SELECT "user".musicbrainz_id AS musicbrainz_id
               FROM user_relationship
@@ -98,7 +101,7 @@ def get_followers_of_user(user: int) -> List[dict]:
 def get_following_for_user(user: int) -> List[dict]:
     """ Returns a list of users who the specified user follows.
     """
-    with db.engine.connect() as connection:
+    with replica.read_connection(db, users=[user]) as connection:
         result = connection.execute(sqlalchemy.text("""
             SELECT "user".musicbrainz_id AS musicbrainz_id, "user".id as id
               FROM user_relationship
@@ -112,33 +115,44 @@ def get_following_for_user(user: int) -> List[dict]:
         })
         return [dict(row) for row in result.fetchall()]
 
-def get_follow_events(user_ids: Tuple[int], min_ts: int, max_ts: int, count: int) -> List[dict]:
-    """ Gets a list of follow events for specified users.
+def get_follow_events(user_ids: Tuple[int], min_ts: int, max_ts: int, count: int,
+                      before: Optional[Tuple[int, int]] = None) -> List[dict]:
+    """ Gets a list of follow events for specified users, ordered by the second they were created in
+    and then by the row IDs of the follower and the followed user, all descending.
 
-    user_ids is a tuple of user row IDs.
+    user_ids is a tuple of user row IDs. Events created after min_ts and before max_ts are returned,
+    and if before is a (follower, followed) tuple of user row IDs, the events created in the second of
+    max_ts which come after it in that order too.
 
     Returns a list of dicts of the following format:
         {
+            user_0: int,
+            user_1: int,
             user_name_0: str,
             user_name_1: str,
             created: datetime,
         }
     """
-    with db.engine.connect() as connection:
+    before_user_0, before_user_1 = before or (None, None)
+    with replica.read_connection(db, users=user_ids) as connection:
         result = connection.execute(sqlalchemy.text("""
-            SELECT follower.musicbrainz_id as user_name_0, followed.musicbrainz_id as user_name_1, ur.created
+            SELECT ur.user_0, ur.user_1, follower.musicbrainz_id as user_name_0, followed.musicbrainz_id as user_name_1, ur.created
               FROM user_relationship ur
               JOIN "user" follower ON ur.user_0 = follower.id
               JOIN "user" followed ON ur.user_1 = followed.id
              WHERE ur.user_0 IN :user_ids
                AND ur.created > :min_ts
-               AND ur.created < :max_ts
-          ORDER BY created DESC
+               AND (ur.created < :max_ts
+                    OR (ur.created < :max_ts_end AND (ur.user_0, ur.user_1) < (:before_user_0, :before_user_1)))
+          ORDER BY date_trunc('second', ur.created) DESC, ur.user_0 DESC, ur.user_1 DESC
              LIMIT :count
         """), {
             "user_ids": tuple(user_ids),
             "min_ts": datetime.utcfromtimestamp(min_ts),
             "max_ts": datetime.utcfromtimestamp(max_ts),
+            "max_ts_end": datetime.utcfromtimestamp(max_ts + 1),
+            "before_user_0": before_user_0,
+            "before_user_1": before_user_1,
             "count": count
         })
 
@@ -31,7 +31,7 @@ from data.model.user_timeline_event import (
 from enum import Enum
 from listenbrainz import db
 from listenbrainz.db.exceptions import DatabaseException
-from typing import List
+from typing import List, Optional
 
 
 def create_user_timeline_event(
@@ -132,10 +132,13 @@ def get_user_track_recommendation_events(user_id: int, count: int = 50) -> List[
     )
 
 
-def get_recording_recommendation_events_for_feed(user_ids: List[int], min_ts: int, max_ts: int, count: int) -> List[UserTimelineEvent]:
-    """ Gets a list of recording_recommendation events for specified users.
+def get_timeline_events_for_feed(user_ids: List[int], event_type: UserTimelineEventType, min_ts: int, max_ts: int,
+                                 count: int, before_id: Optional[int] = None) -> List[UserTimelineEvent]:
+    """ Gets a page of timeline events of the specified type for the specified users, ordered by the
+    second they were created in and then by id, both descending.
 
-    user_ids is a tuple of user row IDs.
+    user_ids is a tuple of user row IDs. Events created after min_ts and before max_ts are returned,
+    and if before_id is given, the events created in the second of max_ts with an id lower than before_id too.
     """
     with db.engine.connect() as connection:
         result = connection.execute(sqlalchemy.text("""
@@ -143,21 +146,39 @@ def get_recording_recommendation_events_for_feed(user_ids: List[int], min_ts: in
               FROM user_timeline_event
              WHERE user_id IN :user_ids
                AND created > :min_ts
-               AND created < :max_ts
+               AND (created < :max_ts OR (created < :max_ts_end AND id < :before_id))
                AND event_type = :event_type
-          ORDER BY created DESC
+          ORDER BY date_trunc('second', created) DESC, id DESC
              LIMIT :count
         """), {
             "user_ids": tuple(user_ids),
             "min_ts": datetime.utcfromtimestamp(min_ts),
             "max_ts": datetime.utcfromtimestamp(max_ts),
+            "max_ts_end": datetime.utcfromtimestamp(max_ts + 1),
+            "before_id": before_id,
             "count": count,
-            "event_type": UserTimelineEventType.RECORDING_RECOMMENDATION.value,
+            "event_type": event_type.value,
         })
 
         return [UserTimelineEvent(**row) for row in result.fetchall()]
 
 
+def get_recording_recommendation_events_for_feed(user_ids: List[int], min_ts: int, max_ts: int, count: int,
+                                                 before_id: Optional[int] = None) -> List[UserTimelineEvent]:
+    """ Gets a list of recording_recommendation events for specified users.
+
+    user_ids is a tuple of user row IDs. See get_timeline_events_for_feed for the other arguments.
+    """
+    return get_timeline_events_for_feed(
+        user_ids=user_ids,
+        event_type=UserTimelineEventType.RECORDING_RECOMMENDATION,
+        min_ts=min_ts,
+        max_ts=max_ts,
+        count=count,
+        before_id=before_id,
+    )
+
+
 def get_user_notification_events(user_id: int, count: int = 50) -> List[UserTimelineEvent]:
     """ Gets notification posted on the user's timeline.
 
@@ -168,3 +189,19 @@ def get_user_notification_events(user_id: int, count: int = 50) -> List[UserTime
         event_type=UserTimelineEventType.NOTIFICATION,
         count=count
     )
+
+
+def get_user_notification_events_for_feed(user_id: int, min_ts: int, max_ts: int, count: int,
+                                          before_id: Optional[int] = None) -> List[UserTimelineEvent]:
+    """ Gets notifications posted on the user's timeline for their feed.
+
+    See get_timeline_events_for_feed for the arguments.
+    """
+    return get_timeline_events_for_feed(
+        user_ids=(user_id,),
+        event_type=UserTimelineEventType.NOTIFICATION,
+        min_ts=min_ts,
+        max_ts=max_ts,
+        count=count,
+        before_id=before_id,
+    )
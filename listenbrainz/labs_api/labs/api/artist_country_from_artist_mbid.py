@@ -5,6 +5,8 @@ import psycopg2
 import psycopg2.extras
 from werkzeug.exceptions import NotFound
 from listenbrainz import config
+from listenbrainz.labs_api.labs.api.db_pool import pooled_connection
+from listenbrainz.labs_api.labs.api.query_cache import cached
 
 
 class ArtistCountryFromArtistMBIDQuery(Query):
@@ -23,9 +25,10 @@ class ArtistCountryFromArtistMBIDQuery(Query):
     def outputs(self):
         return ['artist_mbid', 'country_code']
 
+    @cached
     def fetch(self, params, count=-1, offset=-1):
 
-        with psycopg2.connect(config.MB_DATABASE_URI) as conn:
+        with pooled_connection(config.MB_DATABASE_URI) as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as curs:
 
                 acs = tuple([r['artist_mbid'] for r in params])
@@ -4,6 +4,8 @@ import psycopg2
 import psycopg2.extras
 from datasethoster import Query
 from listenbrainz import config
+from listenbrainz.labs_api.labs.api.db_pool import pooled_connection
+from listenbrainz.labs_api.labs.api.query_cache import cached
 
 
 class ArtistCreditIdFromArtistMBIDQuery(Query):
@@ -20,9 +22,10 @@ class ArtistCreditIdFromArtistMBIDQuery(Query):
     def outputs(self):
         return ['artist_mbid', 'artist_credit_id']
 
+    @cached
     def fetch(self, params, count=-1, offset=-1):
 
-        with psycopg2.connect(config.MB_DATABASE_URI) as conn:
+        with pooled_connection(config.MB_DATABASE_URI) as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as curs:
 
                 acs = tuple([p['artist_mbid'] for p in params])
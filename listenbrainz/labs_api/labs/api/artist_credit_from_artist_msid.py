@@ -4,6 +4,8 @@ import psycopg2
 import psycopg2.extras
 from datasethoster import Query
 from listenbrainz import config
+from listenbrainz.labs_api.labs.api.db_pool import pooled_connection
+from listenbrainz.labs_api.labs.api.query_cache import cached
 
 
 class ArtistCreditIdFromArtistMSIDQuery(Query):
@@ -21,10 +23,11 @@ class ArtistCreditIdFromArtistMSIDQuery(Query):
     def outputs(self):
         return ['artist_msid', 'artist_credit_id', '[artist_credit_mbid]', 'artist_credit_name']
 
+    @cached
     def fetch(self, params, offset=-1, count=-1):
 
         msid = tuple([p['artist_msid'] for p in params])
-        with psycopg2.connect(config.MBID_MAPPING_DATABASE_URI) as conn:
+        with pooled_connection(config.MBID_MAPPING_DATABASE_URI) as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as curs:
                 query = """SELECT map.artist_msid as artist_msid,
                                        ac.id AS artist_credit_id,
@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 
-import re
-
 import psycopg2
 import psycopg2.extras
 from datasethoster import Query
-from unidecode import unidecode
 from listenbrainz import config
+from listenbrainz.labs_api.labs.api.db_pool import pooled_connection
+from listenbrainz.labs_api.labs.api.query_cache import cached
+from listenbrainz.labs_api.labs.api.mapping_index import clean_lookup_string, get_mapping_index
 
 
 class ArtistCreditRecordingLookupQuery(Query):
@@ -26,18 +26,40 @@ class ArtistCreditRecordingLookupQuery(Query):
                 'artist_credit_name', 'release_name', 'recording_name',
                 'artist_credit_id', 'artist_mbids', 'release_mbid', 'recording_mbid']
 
+    @cached
     def fetch(self, params, offset=-1, count=-1):
         lookup_strings = []
         string_index = {}
         for i, param in enumerate(params):
-            cleaned = unidecode(re.sub(
-                r'[^\w]+', '', param["[artist_credit_name]"] + param["[recording_name]"]).lower())
+            cleaned = clean_lookup_string(param["[artist_credit_name]"], param["[recording_name]"])
             lookup_strings.append(cleaned)
             string_index[cleaned] = i
 
-        lookup_strings = tuple(lookup_strings)
+        index_path = getattr(config, "MBID_MAPPING_INDEX_PATH", None)
+        mapping_index = get_mapping_index(index_path) if index_path else None
+        if mapping_index is not None:
+            rows = self.fetch_from_index(mapping_index, lookup_strings)
+        else:
+            rows = self.fetch_from_db(lookup_strings)
+
+        results = []
+        for data in rows:
+            index = string_index[data["combined_lookup"]]
+            data["recording_arg"] = params[index]["[recording_name]"]
+            data["artist_credit_arg"] = params[index]["[artist_credit_name]"]
+            data["index"] = index
+            results.append(data)
+
+        return results
 
-        with psycopg2.connect(config.MBID_MAPPING_DATABASE_URI) as conn:
+    def fetch_from_index(self, mapping_index, lookup_strings):
+        """ Look up the strings in the in-memory mapping index. """
+        unique_strings = list(dict.fromkeys(lookup_strings))
+        return [row for rows in mapping_index.lookup(unique_strings) for row in rows]
+
+    def fetch_from_db(self, lookup_strings):
+        """ Look up the strings in the mapping table. """
+        with pooled_connection(config.MBID_MAPPING_DATABASE_URI) as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as curs:
                 curs.execute("""SELECT artist_credit_name,
                                        artist_credit_id,
@@ -48,19 +70,13 @@ class ArtistCreditRecordingLookupQuery(Query):
                                        recording_mbid,
                                        combined_lookup
                                   FROM mapping.mbid_mapping
-                                 WHERE combined_lookup IN %s""", (lookup_strings,))
+                                 WHERE combined_lookup IN %s""", (tuple(lookup_strings),))
 
                 results = []
                 while True:
                     data = curs.fetchone()
                     if not data:
                         break
-
-                    data = dict(data)
-                    index = string_index[data["combined_lookup"]]
-                    data["recording_arg"] = params[index]["[recording_name]"]
-                    data["artist_credit_arg"] = params[index]["[artist_credit_name]"]
-                    data["index"] = index
-                    results.append(data)
+                    results.append(dict(data))
 
                 return results
@@ -0,0 +1,98 @@
+""" Shared database connection pools for the labs API queries.
+
+Connecting to postgres for every request costs a TCP round trip and authentication,
+so all queries borrow their connections from one pool per DSN instead.
+"""
+import threading
+from contextlib import contextmanager
+from time import monotonic
+
+import psycopg2
+
+from listenbrainz import config
+from listenbrainz.labs_api.labs.api import stats
+
+# The default maximum number of open connections per DSN
+DEFAULT_POOL_SIZE = 10
+
+
+class ConnectionPool:
+    """ A pool of connections to one database. Up to max_size connections are opened as needed
+        and kept open once returned. When all of them are in use, callers wait for one to be
+        returned, instead of failing like psycopg2's pools do. """
+
+    def __init__(self, dsn: str, max_size: int):
+        self.dsn = dsn
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_size)
+
+    def _getconn(self):
+        with self.lock:
+            while self.idle:
+                conn = self.idle.pop()
+                # skip connections the server closed while they were idle in the pool
+                if not conn.closed:
+                    return conn
+        return psycopg2.connect(self.dsn)
+
+    def _putconn(self, conn, close: bool):
+        if close or conn.closed:
+            conn.close()
+            return
+        with self.lock:
+            self.idle.append(conn)
+
+    @contextmanager
+    def connection(self):
+        """ Borrow a connection from the pool. Like psycopg2's connection context manager,
+            the transaction is committed if the block succeeds and rolled back otherwise. """
+        start = monotonic()
+        self.slots.acquire()
+        stats.record_pool_wait(monotonic() - start)
+        try:
+            conn = self._getconn()
+            broken = False
+            try:
+                with conn as c:
+                    yield c
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                raise
+            finally:
+                self._putconn(conn, close=broken)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn: str) -> ConnectionPool:
+    """ Return the connection pool for the given DSN, creating it if needed. """
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = ConnectionPool(dsn, getattr(config, "LABS_API_DB_POOL_SIZE", DEFAULT_POOL_SIZE))
+            _pools[dsn] = pool
+        return pool
+
+
+def pooled_connection(dsn: str):
+    """ Borrow a connection to the given DSN. Use as a context manager, in place of psycopg2.connect. """
+    return get_pool(dsn).connection()
+
+
+def close_pools():
+    """ Close all connections of all pools. """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
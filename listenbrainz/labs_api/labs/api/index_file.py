@@ -0,0 +1,65 @@
+""" Shared loading of the memory-mapped index files of the labs API.
+
+The index files are rebuilt by manage.py commands which write a new file and atomically
+move it in place. The running API notices the new file by its inode and modification time
+and switches to it, checking for a new file at most every RELOAD_CHECK_INTERVAL seconds.
+"""
+import os
+import threading
+from time import monotonic
+from typing import Callable, Generic, Optional, Tuple, TypeVar
+
+# How often to check whether an index file has been replaced, in seconds
+RELOAD_CHECK_INTERVAL = 60
+
+
+def file_id(path: str) -> Tuple[int, int]:
+    """ Return the inode and modification time of the file at path, which change when it is replaced. """
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class IndexFile:
+    """ Base class of the index file readers, which remembers which file was opened. """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file_id = file_id(path)
+
+    def is_stale(self) -> bool:
+        """ Return True if the index file on disk has been replaced since it was opened. """
+        try:
+            return file_id(self.path) != self.file_id
+        except FileNotFoundError:
+            return False
+
+
+Index = TypeVar("Index", bound=IndexFile)
+
+
+class IndexLoader(Generic[Index]):
+    """ Keeps the index of the last requested path open, and reopens it when the file has been
+        replaced by a rebuild. The index is opened with open_index(path). """
+
+    def __init__(self, open_index: Callable[[str], Index]):
+        self.open_index = open_index
+        self.index = None
+        self.next_reload_check = 0
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[Index]:
+        """ Return the index stored at path, or None if no index has been built. """
+        with self.lock:
+            if self.index is not None and self.index.path == path:
+                if monotonic() < self.next_reload_check:
+                    return self.index
+                self.next_reload_check = monotonic() + RELOAD_CHECK_INTERVAL
+                if not self.index.is_stale():
+                    return self.index
+
+            try:
+                self.index = self.open_index(path)
+            except FileNotFoundError:
+                self.index = None
+            self.next_reload_check = monotonic() + RELOAD_CHECK_INTERVAL
+            return self.index
@@ -0,0 +1,186 @@
+""" An on-disk, memory-mapped index of mapping.mbid_mapping keyed on combined_lookup.
+
+The index file is laid out as follows:
+
+    header   -- magic, version and number of entries
+    keys     -- int64[count], the sorted lookup hashes of all combined_lookup strings
+    offsets  -- uint64[count + 1], the offset of each record in the records section
+    records  -- the ujson encoded lists of the mapping rows of each combined_lookup string,
+                in the same order as the keys
+
+Lookups hash all the requested strings at once, find them in the keys array with a
+single vectorized binary search and only decode the records that were found. Like a
+query on the mapping table, a lookup returns every mapping row of the string. The
+hash is the first 8 bytes of the md5 of the string, which can also be computed by
+postgres, so the rows can be streamed out of the database already in key order.
+"""
+import os
+import re
+import struct
+from array import array
+from hashlib import md5
+from typing import Iterable, List, Optional
+
+import numpy as np
+import psycopg2
+import psycopg2.extras
+import ujson
+from unidecode import unidecode
+
+from listenbrainz.labs_api.labs.api.index_file import IndexFile, IndexLoader
+
+MAGIC = b"LBMAPIDX"
+VERSION = 2
+HEADER = struct.Struct("<8sIQ")
+
+# The columns of mapping.mbid_mapping stored in the index
+INDEX_COLUMNS = ["artist_credit_name", "artist_credit_id", "artist_mbids", "release_name",
+                 "release_mbid", "recording_name", "recording_mbid", "combined_lookup"]
+
+# Compute the same hash as lookup_hash() in postgres, so that the rows can be ordered by it
+LOOKUP_HASH_SQL = "('x' || substr(md5(combined_lookup), 1, 16))::bit(64)::bigint"
+
+
+def clean_lookup_string(artist_credit_name: str, recording_name: str) -> str:
+    """ Build the combined_lookup string for an artist credit and recording name: non-word
+        characters are removed, and the rest is unaccented and lower cased. """
+    return unidecode(re.sub(r'[^\w]+', '', artist_credit_name + recording_name).lower())
+
+
+def lookup_hash(combined_lookup: str) -> int:
+    """ Return the signed 64-bit hash of a combined_lookup string used as the index key. """
+    return int.from_bytes(md5(combined_lookup.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+def write_index(path: str, rows: Iterable[dict]):
+    """ Write an index file from the given mapping rows.
+
+        The rows must be ordered by the lookup hash of their combined_lookup, so that the
+        rows which share a combined_lookup follow each other. They are all stored in one
+        record, in the order they are given. The file is written next to path and then atomically moved in place, so that
+        readers never see a partially written index.
+
+        Returns:
+            the number of entries written to the index
+    """
+    tmp_path = path + ".tmp"
+    records_path = path + ".records.tmp"
+    keys = array("q")
+    offsets = array("Q", [0])
+    last_key, last_lookup = None, None
+    group = []
+
+    def write_group():
+        data = ujson.dumps(group).encode("utf-8")
+        records.write(data)
+        keys.append(last_key)
+        offsets.append(offsets[-1] + len(data))
+
+    with open(records_path, "wb") as records:
+        for row in rows:
+            lookup = row["combined_lookup"]
+            key = lookup_hash(lookup)
+            if last_key is not None and key < last_key:
+                raise ValueError("rows must be ordered by the lookup hash of combined_lookup")
+            if group and (key != last_key or lookup != last_lookup):
+                write_group()
+                group = []
+            group.append({column: row[column] for column in INDEX_COLUMNS})
+            last_key, last_lookup = key, lookup
+        if group:
+            write_group()
+
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+            f.write(np.frombuffer(keys, dtype=np.int64).astype("<i8").tobytes())
+            f.write(np.frombuffer(offsets, dtype=np.uint64).astype("<u8").tobytes())
+            with open(records_path, "rb") as records:
+                while True:
+                    chunk = records.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        os.unlink(records_path)
+
+    return len(keys)
+
+
+def build_index(path: str, mapping_db_uri: str):
+    """ Build the index file from the mapping.mbid_mapping table, streaming the rows
+        through a server side cursor. Returns the number of entries in the index. """
+
+    query = f"""SELECT {", ".join(INDEX_COLUMNS)}
+                  FROM mapping.mbid_mapping
+              ORDER BY {LOOKUP_HASH_SQL}, combined_lookup, artist_credit_id, recording_mbid"""
+
+    with psycopg2.connect(mapping_db_uri) as conn:
+        with conn.cursor("mapping_index", cursor_factory=psycopg2.extras.DictCursor) as curs:
+            curs.itersize = 50000
+            curs.execute(query)
+            return write_index(path, ({**row, "artist_mbids": [str(m) for m in row["artist_mbids"]],
+                                       "release_mbid": str(row["release_mbid"]),
+                                       "recording_mbid": str(row["recording_mbid"])} for row in curs))
+
+
+class MappingIndex(IndexFile):
+    """ A read-only view of an index file. The file is memory mapped, so only the pages
+        touched by lookups are read from disk. """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a mapping index file" % path)
+
+        keys_start = HEADER.size
+        offsets_start = keys_start + count * 8
+        self.records_start = offsets_start + (count + 1) * 8
+        self.count = count
+        self.keys = np.frombuffer(self.data, dtype="<i8", count=count, offset=keys_start)
+        self.offsets = np.frombuffer(self.data, dtype="<u8", count=count + 1, offset=offsets_start)
+
+    def _record(self, position: int) -> List[dict]:
+        start = self.records_start + int(self.offsets[position])
+        end = self.records_start + int(self.offsets[position + 1])
+        return ujson.loads(self.data[start:end].tobytes())
+
+    def lookup(self, lookup_strings: List[str]) -> List[List[dict]]:
+        """ Look up a batch of combined_lookup strings.
+
+            Returns:
+                a list with the mapping rows of each of the given strings, ordered as in the
+                index, which is empty if there are none.
+        """
+        results = [[] for _ in lookup_strings]
+        if self.count == 0 or not lookup_strings:
+            return results
+
+        hashes = np.fromiter((lookup_hash(s) for s in lookup_strings), dtype=np.int64, count=len(lookup_strings))
+        positions = np.searchsorted(self.keys, hashes)
+        found = self.keys[np.minimum(positions, self.count - 1)] == hashes
+        for i in np.flatnonzero(found):
+            position = int(positions[i])
+            # different strings may have the same hash, check all records with this hash
+            while position < self.count and self.keys[position] == hashes[i]:
+                record = self._record(position)
+                if record[0]["combined_lookup"] == lookup_strings[i]:
+                    results[i] = record
+                    break
+                position += 1
+        return results
+
+
+_loader = IndexLoader(MappingIndex)
+
+
+def get_mapping_index(path: str) -> Optional[MappingIndex]:
+    """ Return the index stored at path, reloading it if the file has been replaced
+        by a rebuild since it was loaded. Returns None if no index has been built. """
+    return _loader.get(path)
+
@@ -1,4 +1,5 @@
 import re
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 
 import typesense
@@ -8,11 +9,21 @@ from datasethoster import Query
 from unidecode import unidecode
 from Levenshtein import distance
 
+from werkzeug.exceptions import ServiceUnavailable
+
 from listenbrainz import config
+from listenbrainz.labs_api.labs.api.query_cache import cached
 from listenbrainz.labs_api.labs.api.stop_words import ENGLISH_STOP_WORDS
+from listenbrainz.labs_api.labs.api.trigram_index import get_trigram_index
 
 DEFAULT_TIMEOUT=2
 COLLECTION_NAME = "mbid_mapping_latest"
+
+# The number of searches sent to typesense in one multi_search request
+MULTI_SEARCH_BATCH_SIZE = 50
+# The maximum number of multi_search requests in flight at the same time, across all queries
+MAX_CONCURRENT_SEARCHES = 4
+
 MATCH_TYPES = ('no_match', 'low_quality', 'med_quality', 'high_quality', 'exact_match')
 MATCH_TYPE_NO_MATCH = 0
 MATCH_TYPE_LOW_QUALITY = 1
@@ -29,6 +40,112 @@ def prepare_query(text):
     return unidecode(re.sub(" +", " ", re.sub(r'[^\w ]+', '', text)).strip().lower())
 
 
+_search_executor = None
+
+
+def get_search_executor():
+    """ Return the thread pool used to send multi_search requests, shared by all queries """
+    global _search_executor
+    if _search_executor is None:
+        _search_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SEARCHES)
+    return _search_executor
+
+
+class TypesenseSearchBackend:
+    """ Searches the mbid_mapping_latest collection of the typesense server """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, remove_stop_words=False):
+        self.client = typesense.Client({
+            'nodes': [{
+                'host': config.TYPESENSE_HOST,
+                'port': config.TYPESENSE_PORT,
+                'protocol': 'http',
+            }],
+            'api_key': config.TYPESENSE_API_KEY,
+            'connection_timeout_seconds': timeout
+        })
+        self.remove_stop_words = remove_stop_words
+
+    def build_query(self, artist_credit_name_p, recording_name_p):
+        """ Return the typesense query string for the prepared search terms """
+
+        query = artist_credit_name_p + " " + recording_name_p
+        if self.remove_stop_words:
+            cleaned_query = []
+            for word in query.split(" "):
+                if word not in ENGLISH_STOP_WORD_INDEX:
+                    cleaned_query.append(word)
+
+            query = " ".join(cleaned_query)
+
+        return query
+
+    def multi_search(self, queries):
+        """ Send the given query strings to typesense in one request and return
+            the top hit for each of them, or None if there was no hit. """
+
+        search_parameters = {
+            'query_by': "combined",
+            'prefix': 'no',
+            'num_typos': MATCH_TYPE_MED_QUALITY_MAX_EDIT_DISTANCE
+        }
+        searches = {"searches": [{"collection": COLLECTION_NAME, "q": query} for query in queries]}
+
+        while True:
+            try:
+                response = self.client.api_call.post("/multi_search", searches, search_parameters)
+                break
+            except requests.exceptions.ReadTimeout:
+                print("Got socket timeout, sleeping 5 seconds, trying again.")
+                sleep(5)
+
+        hits = []
+        for result in response["results"]:
+            if "error" in result:
+                raise typesense.exceptions.TypesenseClientError(result["error"])
+            hits.append(result["hits"][0] if result["hits"] else None)
+
+        return hits
+
+    def lookup_many(self, terms):
+        """ Look up a list of (artist_credit_name_p, recording_name_p) prepared search terms.
+            The searches are sent in batches of MULTI_SEARCH_BATCH_SIZE, several batches at a time.
+            Returns the top hit for each of the terms, or None. """
+
+        queries = [self.build_query(artist_credit_name_p, recording_name_p)
+                   for artist_credit_name_p, recording_name_p in terms]
+        batches = [queries[i:i + MULTI_SEARCH_BATCH_SIZE] for i in range(0, len(queries), MULTI_SEARCH_BATCH_SIZE)]
+        if len(batches) == 1:
+            return self.multi_search(batches[0])
+
+        hits = []
+        for batch_hits in get_search_executor().map(self.multi_search, batches):
+            hits.extend(batch_hits)
+        return hits
+
+
+class TrigramSearchBackend:
+    """ Searches the embedded trigram index of the mapping, built with manage.py build_mbid_mapping_trigram_index """
+
+    def __init__(self, path):
+        self.path = path
+
+    def lookup_many(self, terms):
+        """ Look up a list of (artist_credit_name_p, recording_name_p) prepared search terms.
+            Returns the top hit for each of the terms, or None. """
+        index = get_trigram_index(self.path)
+        if index is None:
+            raise ServiceUnavailable("The MBID mapping trigram index has not been built.")
+        return index.lookup_many(terms)
+
+
+def get_search_backend(timeout=DEFAULT_TIMEOUT, remove_stop_words=False):
+    """ Return the search backend selected by the MBID_MAPPING_SEARCH_BACKEND config """
+    if getattr(config, "MBID_MAPPING_SEARCH_BACKEND", "typesense") == "trigram":
+        return TrigramSearchBackend(config.MBID_MAPPING_TRIGRAM_INDEX_PATH)
+    return TypesenseSearchBackend(timeout, remove_stop_words)
+
+
 class MBIDMappingQuery(Query):
     """
         This query performs a lookup of one or more artist credit name and recording name pairs
@@ -53,19 +170,9 @@ class MBIDMappingQuery(Query):
     MATCH_TYPE_HIGH_QUALITY_MAX_EDIT_DISTANCE = 2
     MATCH_TYPE_MED_QUALITY_MAX_EDIT_DISTANCE = 5
 
-    def __init__(self, timeout=DEFAULT_TIMEOUT, remove_stop_words=False):
+    def __init__(self, timeout=DEFAULT_TIMEOUT, remove_stop_words=False, backend=None):
         self.debug = False
-
-        self.client = typesense.Client({
-            'nodes': [{
-                'host': config.TYPESENSE_HOST,
-                'port': config.TYPESENSE_PORT,
-                'protocol': 'http',
-            }],
-            'api_key': config.TYPESENSE_API_KEY,
-            'connection_timeout_seconds': timeout
-        })
-        self.remove_stop_words = remove_stop_words
+        self.backend = backend or get_search_backend(timeout, remove_stop_words)
 
     def names(self):
         return ("mbid-mapping", "MusicBrainz ID Mapping lookup")
@@ -82,20 +189,17 @@ class MBIDMappingQuery(Query):
                 'artist_credit_name', 'artist_mbids', 'release_name', 'recording_name',
                 'release_mbid', 'recording_mbid', 'artist_credit_id']
 
+    @cached
     def fetch(self, params, offset=-1, count=-1):
         """ Main entry point for the query """
 
-        args = []
-        for i, param in enumerate(params):
-            args.append((i, param['[artist_credit_name]'],
-                         param['[recording_name]']))
+        matches = self.search_many([(param['[artist_credit_name]'], param['[recording_name]']) for param in params])
 
         results = []
-        for index, artist_credit_name, recording_name in args:
-            hit = self.search(artist_credit_name, recording_name)
+        for index, (param, hit) in enumerate(zip(params, matches)):
             if hit:
-                hit["artist_credit_arg"] = artist_credit_name
-                hit["recording_arg"] = recording_name
+                hit["artist_credit_arg"] = param['[artist_credit_name]']
+                hit["recording_arg"] = param['[recording_name]']
                 hit["index"] = index
                 results.append(hit)
 
@@ -177,83 +281,66 @@ class MBIDMappingQuery(Query):
 
             return (None, MATCH_TYPE_NO_MATCH)
 
-    def lookup(self, artist_credit_name_p, recording_name_p):
-
-        query = artist_credit_name_p + " " + recording_name_p
-        if self.remove_stop_words:
-            cleaned_query = []
-            for word in query.split(" "):
-                if word not in ENGLISH_STOP_WORD_INDEX:
-                    cleaned_query.append(word)
-
-            query = " ".join(cleaned_query)
-
-        search_parameters = {
-            'q': query,
-            'query_by': "combined",
-            'prefix': 'no',
-            'num_typos': self.MATCH_TYPE_MED_QUALITY_MAX_EDIT_DISTANCE
-        }
-
-        while True:
-            try:
-                hits = self.client.collections[COLLECTION_NAME].documents.search(
-                    search_parameters)
-                break
-            except requests.exceptions.ReadTimeout:
-                print("Got socket timeout, sleeping 5 seconds, trying again.")
-                sleep(5)
-
-        if len(hits["hits"]) == 0:
-            return None
-
-        return hits["hits"][0]
-
-    def search(self, artist_credit_name, recording_name):
+    def search_many(self, pairs):
         """
             Main query body: Prepare the search query terms and prepare
-            detuned query terms. Then attempt to find the given search terms
-            and if not found, sequentially try the detuned versions of the
-            query terms. Return a match dict (properly formatted for this
-            query) or None if not match.
+            detuned query terms for all given (artist_credit_name, recording_name) pairs.
+            Then look up all of the search terms at once, and for the ones that were
+            not found, look up the detuned versions of their query terms together
+            in the next round. Return a match dict (properly formatted for this
+            query) or None for each of the pairs.
         """
 
-        if self.debug:
-            print("- %-60s %-60s" %
-                  (artist_credit_name[:59], recording_name[:59]))
-
-        artist_credit_name_p = prepare_query(artist_credit_name)
-        recording_name_p = prepare_query(recording_name)
-
-        ac_detuned = prepare_query(
-            self.detune_query_string(artist_credit_name_p))
-        r_detuned = prepare_query(self.detune_query_string(recording_name_p))
-
-        while True:
-            hit = self.lookup(artist_credit_name_p, recording_name_p)
-            if hit:
-                (hit, match_type) = self.evaluate_hit(
-                    hit, artist_credit_name_p, recording_name_p)
-
-            if not hit:
-                hit = None
-                if ac_detuned:
-                    artist_credit_name_p = ac_detuned
-                    ac_detuned = None
-                    continue
-
-                if r_detuned:
-                    recording_name_p = r_detuned
-                    r_detuned = None
+        pending = []
+        for index, (artist_credit_name, recording_name) in enumerate(pairs):
+            if self.debug:
+                print("- %-60s %-60s" %
+                      (artist_credit_name[:59], recording_name[:59]))
+
+            artist_credit_name_p = prepare_query(artist_credit_name)
+            recording_name_p = prepare_query(recording_name)
+            pending.append({
+                "index": index,
+                "artist_credit_name_p": artist_credit_name_p,
+                "recording_name_p": recording_name_p,
+                "ac_detuned": prepare_query(self.detune_query_string(artist_credit_name_p)),
+                "r_detuned": prepare_query(self.detune_query_string(recording_name_p)),
+            })
+
+        results = [None] * len(pairs)
+        while pending:
+            hits = self.backend.lookup_many([(p["artist_credit_name_p"], p["recording_name_p"]) for p in pending])
+
+            retry = []
+            for p, hit in zip(pending, hits):
+                if hit:
+                    (hit, match_type) = self.evaluate_hit(
+                        hit, p["artist_credit_name_p"], p["recording_name_p"])
+
+                if hit:
+                    results[p["index"]] = self.format_hit(hit, match_type)
                     continue
 
-                if self.debug:
+                if p["ac_detuned"]:
+                    p["artist_credit_name_p"] = p["ac_detuned"]
+                    p["ac_detuned"] = None
+                    retry.append(p)
+                elif p["r_detuned"]:
+                    p["recording_name_p"] = p["r_detuned"]
+                    p["r_detuned"] = None
+                    retry.append(p)
+                elif self.debug:
                     print("FAIL.\n")
 
-                return None
+            pending = retry
 
-            break
+        return results
+
+    def search(self, artist_credit_name, recording_name):
+        """ Search for a single artist credit name and recording name pair. """
+        return self.search_many([(artist_credit_name, recording_name)])[0]
 
+    def format_hit(self, hit, match_type):
         if self.debug:
             print("OK.\n")
 
@@ -0,0 +1,105 @@
+""" An opt-in, in-process cache of labs API query results.
+
+Caching is enabled per query in the LABS_API_QUERY_CACHE config, keyed by query name, e.g.
+
+    LABS_API_QUERY_CACHE = {
+        "artist-country-code-from-artist-mbid": {"ttl": 3600, "max_size": 10000},
+    }
+
+Results are cached for the whole request, keyed by its normalized input rows.
+"""
+import copy
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import monotonic
+
+from listenbrainz import config
+from listenbrainz.labs_api.labs.api import stats
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_SIZE = 10000
+
+
+class QueryCache:
+    """ A thread safe cache which expires entries after ttl seconds and evicts the
+        least recently used entries once it holds more than max_size of them. """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_size: int = DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """ Return (True, value) if the key is cached and has not expired, (False, None) otherwise. """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def make_key(params, *args, **kwargs) -> tuple:
+    """ Build a cache key from the input rows and the other arguments of a request. Values are
+        stripped of surrounding whitespace, so that requests that only differ in it share an entry. """
+    rows = []
+    for row in params:
+        rows.append(tuple(sorted((key, value.strip() if isinstance(value, str) else value)
+                                 for key, value in row.items())))
+    return tuple(rows), args, tuple(sorted(kwargs.items()))
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_query_cache(name: str):
+    """ Return the result cache of the named query, or None if caching is not enabled for it. """
+    settings = getattr(config, "LABS_API_QUERY_CACHE", {}).get(name)
+    if settings is None:
+        return None
+
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = QueryCache(settings.get("ttl", DEFAULT_TTL), settings.get("max_size", DEFAULT_MAX_SIZE))
+            _caches[name] = cache
+        return cache
+
+
+def cached(fetch):
+    """ Decorator for the fetch method of a Query, which serves results from the query's
+        cache if caching is enabled for it. Errors, such as a 404, are not cached. """
+
+    @wraps(fetch)
+    def wrapper(self, params, *args, **kwargs):
+        cache = get_query_cache(self.names()[0])
+        if cache is None:
+            return fetch(self, params, *args, **kwargs)
+
+        key = make_key(params, *args, **kwargs)
+        hit, result = cache.get(key)
+        stats.record_cache_lookup(hit)
+        if not hit:
+            result = fetch(self, params, *args, **kwargs)
+            cache.set(key, result)
+        # callers may modify the results, so never hand out the cached objects themselves
+        return copy.deepcopy(result)
+
+    return wrapper
@@ -2,6 +2,8 @@ import psycopg2
 import psycopg2.extras
 from datasethoster import Query
 from listenbrainz import config
+from listenbrainz.labs_api.labs.api.db_pool import pooled_connection
+from listenbrainz.labs_api.labs.api.query_cache import cached
 
 psycopg2.extras.register_uuid()
 
@@ -24,10 +26,11 @@ class RecordingFromRecordingMBIDQuery(Query):
         return ['recording_mbid', 'recording_name', 'length', 'comment', 'artist_credit_id',
                 'artist_credit_name', '[artist_credit_mbids]', 'original_recording_mbid']
 
+    @cached
     def fetch(self, params, offset=-1, count=-1):
 
         mbids = [p['[recording_mbid]'] for p in params]
-        with psycopg2.connect(config.MB_DATABASE_URI) as conn:
+        with pooled_connection(config.MB_DATABASE_URI) as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as curs:
 
                 # First lookup and MBIDs that may have been redirected
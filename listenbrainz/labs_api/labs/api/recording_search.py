@@ -7,6 +7,7 @@ from datasethoster.main import register_query
 from unidecode import unidecode
 
 from listenbrainz import config
+from listenbrainz.labs_api.labs.api.query_cache import cached
 from listenbrainz.labs_api.labs.api.mbid_mapping import prepare_query, COLLECTION_NAME
 
 
@@ -50,6 +51,7 @@ class RecordingSearchQuery(Query):
                 'release_name', 'release_mbid',
                 'artist_credit_name', 'artist_credit_id']
 
+    @cached
     def fetch(self, params, offset=-1, count=-1):
 
         search_parameters = {
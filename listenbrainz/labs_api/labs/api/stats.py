@@ -0,0 +1,82 @@
+""" Connection pool and result cache statistics of the labs API, reported to the metrics store. """
+import threading
+from time import monotonic
+
+from brainzutils import metrics
+
+# How often the statistics are reported, in seconds
+REPORT_INTERVAL = 60
+
+_lock = threading.Lock()
+_stats = {}
+_enabled = False
+_next_report = 0
+
+
+def _reset():
+    _stats.update({
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "pool_requests": 0,
+        "pool_waits": 0,
+        "pool_wait_time": 0.0,
+    })
+
+
+_reset()
+
+
+def enable_reporting():
+    """ Start reporting the statistics. The metrics module of brainzutils must be initialized. """
+    global _enabled
+    _enabled = True
+
+
+def record_cache_lookup(hit: bool):
+    with _lock:
+        _stats["cache_hits" if hit else "cache_misses"] += 1
+    _maybe_report()
+
+
+def record_pool_wait(duration: float):
+    with _lock:
+        _stats["pool_requests"] += 1
+        # acquiring a free slot takes a few microseconds, anything longer means the pool was exhausted
+        if duration > 0.001:
+            _stats["pool_waits"] += 1
+            _stats["pool_wait_time"] += duration
+    _maybe_report()
+
+
+def _with_rates(result: dict) -> dict:
+    lookups = result["cache_hits"] + result["cache_misses"]
+    result["cache_hit_rate"] = result["cache_hits"] / lookups if lookups else 0.0
+    result["pool_wait_avg_ms"] = result["pool_wait_time"] * 1000 / result["pool_waits"] if result["pool_waits"] else 0.0
+    return result
+
+
+def get_stats() -> dict:
+    """ Return the statistics collected since they were last reported, with the derived rates. """
+    with _lock:
+        return _with_rates(dict(_stats))
+
+
+def _maybe_report():
+    global _next_report
+    if not _enabled or monotonic() < _next_report:
+        return
+
+    with _lock:
+        if monotonic() < _next_report:
+            return
+        _next_report = monotonic() + REPORT_INTERVAL
+        result = _with_rates(dict(_stats))
+        _reset()
+
+    metrics.set("listenbrainz-labs-api",
+                cache_hits=result["cache_hits"],
+                cache_misses=result["cache_misses"],
+                cache_hit_rate=result["cache_hit_rate"],
+                pool_requests=result["pool_requests"],
+                pool_waits=result["pool_waits"],
+                pool_wait_avg_ms=result["pool_wait_avg_ms"])
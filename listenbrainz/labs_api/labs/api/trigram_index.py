@@ -0,0 +1,264 @@
+""" An on-disk, memory-mapped trigram index of mapping.mbid_mapping for fuzzy recording lookups,
+which can be used by the MBID mapping query instead of typesense.
+
+Each mapping row is indexed by the trigrams of its artist credit and recording names, prepared
+like the search terms of the query and with spaces removed. The index file is laid out as follows:
+
+    header           -- magic, version, number of documents, trigrams and postings
+    doc_offsets      -- uint64[documents + 1], the offset of each record in the records section
+    posting_offsets  -- uint64[trigrams + 1], the offset of each trigram's list in the postings section
+    keys             -- uint32[trigrams], the sorted hashes of all trigrams
+    postings         -- uint32[postings], the sorted document ids of each trigram, one list after the other
+    doc_trigrams     -- uint16[documents], the number of distinct trigrams of each document
+    records          -- the ujson encoded mapping rows, by document id
+
+Documents are numbered in the order of their mapping score, best first. A lookup collects the
+documents that share trigrams with the search terms, ranks them by trigram similarity and then
+returns the closest of the best candidates by edit distance, in the shape of a typesense hit.
+"""
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import psycopg2
+import psycopg2.extras
+import ujson
+from Levenshtein import distance
+
+from listenbrainz.labs_api.labs.api.index_file import IndexFile, IndexLoader
+
+MAGIC = b"LBTRIIDX"
+VERSION = 1
+HEADER = struct.Struct("<8sIQQQ")
+
+# While the index is built, the (trigram, document) pairs are sorted in chunks of this many pairs and
+# spilled to 2 ** PAIR_BUCKET_BITS bucket files by the high bits of their trigram, so that only one chunk
+# and then one bucket at a time are held in memory
+PAIR_CHUNK_SIZE = 4 * 1024 * 1024
+PAIR_BUCKET_BITS = 6
+
+# Trigrams that occur in more documents than this are too common to narrow down the candidates,
+# they are only used if the search terms have no rarer trigrams
+MAX_POSTINGS = 100000
+
+# The number of candidates with the most similar trigrams that are compared by edit distance
+CANDIDATES = 20
+
+# The columns of mapping.mbid_mapping stored in the index
+INDEX_COLUMNS = ["artist_credit_name", "artist_credit_id", "artist_mbids", "release_name",
+                 "release_mbid", "recording_name", "recording_mbid"]
+
+
+def index_text(artist_credit_name_p: str, recording_name_p: str) -> str:
+    """ Return the indexed text for prepared artist credit and recording names """
+    return (artist_credit_name_p + recording_name_p).replace(" ", "")
+
+
+def trigram_hashes(text: str) -> np.ndarray:
+    """ Return the sorted, distinct hashes of the trigrams of text. Texts shorter than
+        three characters are their own single trigram. """
+    if len(text) < 3:
+        grams = {text} if text else set()
+    else:
+        grams = {text[i:i + 3] for i in range(len(text) - 2)}
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint32, count=len(grams)))
+
+
+def _copy_file(f, path: str):
+    """ Append the contents of the file at path to the open file f """
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(1024 * 1024)
+            if not chunk:
+                break
+            f.write(chunk)
+
+
+def _spill_pairs(bucket_files, pairs: array):
+    """ Sort a chunk of (trigram << 32 | document) pairs and append them to the bucket files of their trigrams """
+    pairs = np.frombuffer(pairs, dtype=np.uint64).copy()
+    pairs.sort()
+    buckets = pairs >> np.uint64(64 - PAIR_BUCKET_BITS)
+    bounds = np.searchsorted(buckets, np.arange(len(bucket_files) + 1, dtype=np.uint64))
+    for bucket_file, start, end in zip(bucket_files, bounds[:-1], bounds[1:]):
+        bucket_file.write(pairs[start:end].astype("<u8").tobytes())
+
+
+def write_index(path: str, rows: Iterable[dict]) -> int:
+    """ Write an index file from the given mapping rows, best mapping score first. Each row
+        needs the INDEX_COLUMNS. The file is written next to path and then atomically moved
+        in place, so that readers never see a partially written index.
+
+        The (trigram, document) pairs are sorted on disk: each chunk of PAIR_CHUNK_SIZE pairs
+        is spilled to bucket files by trigram, and the buckets, which are in trigram order,
+        are then sorted one at a time into the postings.
+
+        Returns:
+            the number of documents written to the index
+    """
+    from listenbrainz.labs_api.labs.api.mbid_mapping import prepare_query
+
+    tmp_path = path + ".tmp"
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp_dir:
+        records_path = os.path.join(tmp_dir, "records")
+        postings_path = os.path.join(tmp_dir, "postings")
+        bucket_paths = [os.path.join(tmp_dir, "pairs.%d" % i) for i in range(2 ** PAIR_BUCKET_BITS)]
+
+        pairs = array("Q")
+        doc_offsets = array("Q", [0])
+        doc_trigrams = array("H")
+        bucket_files = [open(bucket_path, "wb") for bucket_path in bucket_paths]
+        try:
+            with open(records_path, "wb") as records:
+                for doc_id, row in enumerate(rows):
+                    text = index_text(prepare_query(row["artist_credit_name"]), prepare_query(row["recording_name"]))
+                    hashes = trigram_hashes(text)
+                    pairs.frombytes(((hashes.astype(np.uint64) << np.uint64(32)) | np.uint64(doc_id)).tobytes())
+                    doc_trigrams.append(min(len(hashes), 0xffff))
+                    if len(pairs) >= PAIR_CHUNK_SIZE:
+                        _spill_pairs(bucket_files, pairs)
+                        pairs = array("Q")
+
+                    record = {column: row[column] for column in INDEX_COLUMNS}
+                    record["text"] = text
+                    data = ujson.dumps(record).encode("utf-8")
+                    records.write(data)
+                    doc_offsets.append(doc_offsets[-1] + len(data))
+            _spill_pairs(bucket_files, pairs)
+            del pairs
+        finally:
+            for bucket_file in bucket_files:
+                bucket_file.close()
+
+        keys, key_counts = [], []
+        with open(postings_path, "wb") as postings:
+            for bucket_path in bucket_paths:
+                bucket = np.fromfile(bucket_path, dtype="<u8")
+                os.unlink(bucket_path)
+                bucket.sort()
+                unique_keys, counts = np.unique((bucket >> np.uint64(32)).astype(np.uint32), return_counts=True)
+                keys.append(unique_keys)
+                key_counts.append(counts)
+                postings.write((bucket & np.uint64(0xffffffff)).astype("<u4").tobytes())
+        unique_keys = np.concatenate(keys).astype(np.uint32)
+        posting_offsets = np.concatenate([[0], np.cumsum(np.concatenate(key_counts))]).astype(np.uint64)
+        posting_count = int(posting_offsets[-1])
+
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(doc_trigrams), len(unique_keys), posting_count))
+            f.write(np.frombuffer(doc_offsets, dtype=np.uint64).astype("<u8").tobytes())
+            f.write(posting_offsets.astype("<u8").tobytes())
+            f.write(unique_keys.astype("<u4").tobytes())
+            _copy_file(f, postings_path)
+            f.write(np.frombuffer(doc_trigrams, dtype=np.uint16).astype("<u2").tobytes())
+            _copy_file(f, records_path)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    return len(doc_trigrams)
+
+
+def build_index(path: str, mapping_db_uri: str) -> int:
+    """ Build the index file from the mapping.mbid_mapping table, streaming the rows
+        through a server side cursor. Returns the number of documents in the index. """
+
+    query = f"""SELECT {", ".join(INDEX_COLUMNS)}
+                  FROM mapping.mbid_mapping
+              ORDER BY score, recording_mbid"""
+
+    with psycopg2.connect(mapping_db_uri) as conn:
+        with conn.cursor("mapping_trigram_index", cursor_factory=psycopg2.extras.DictCursor) as curs:
+            curs.itersize = 50000
+            curs.execute(query)
+            return write_index(path, ({**row, "artist_mbids": [str(m) for m in row["artist_mbids"]],
+                                       "release_mbid": str(row["release_mbid"]),
+                                       "recording_mbid": str(row["recording_mbid"])} for row in curs))
+
+
+class TrigramIndex(IndexFile):
+    """ A read-only view of a trigram index file. The file is memory mapped, so only the pages
+        touched by lookups are read from disk. """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, doc_count, key_count, posting_count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a trigram index file" % path)
+
+        offset = HEADER.size
+        self.doc_offsets = np.frombuffer(self.data, dtype="<u8", count=doc_count + 1, offset=offset)
+        offset += (doc_count + 1) * 8
+        self.posting_offsets = np.frombuffer(self.data, dtype="<u8", count=key_count + 1, offset=offset)
+        offset += (key_count + 1) * 8
+        self.keys = np.frombuffer(self.data, dtype="<u4", count=key_count, offset=offset)
+        offset += key_count * 4
+        self.postings = np.frombuffer(self.data, dtype="<u4", count=posting_count, offset=offset)
+        offset += posting_count * 4
+        self.doc_trigrams = np.frombuffer(self.data, dtype="<u2", count=doc_count, offset=offset)
+        self.records_start = offset + doc_count * 2
+        self.doc_count = doc_count
+
+    def _record(self, doc_id: int) -> dict:
+        start = self.records_start + int(self.doc_offsets[doc_id])
+        end = self.records_start + int(self.doc_offsets[doc_id + 1])
+        return ujson.loads(self.data[start:end].tobytes())
+
+    def candidates(self, text: str, limit: int = CANDIDATES) -> np.ndarray:
+        """ Return the ids of up to limit documents with the most trigrams in common with text,
+            most similar first. """
+        hashes = trigram_hashes(text)
+        positions = np.searchsorted(self.keys, hashes)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == hashes[found]
+        positions = positions[found]
+        if len(positions) == 0:
+            return np.array([], dtype=np.uint32)
+
+        lengths = self.posting_offsets[positions + 1] - self.posting_offsets[positions]
+        selected = positions[lengths <= MAX_POSTINGS]
+        if len(selected) == 0:
+            # only common trigrams, use the least common of them
+            selected = positions[np.argsort(lengths, kind="stable")[:3]]
+
+        doc_ids, shared = np.unique(np.concatenate([
+            self.postings[int(self.posting_offsets[p]):int(self.posting_offsets[p + 1])] for p in selected
+        ]), return_counts=True)
+
+        # rank by the dice coefficient of the trigram sets, ties go to the better mapping score
+        similarity = 2 * shared / (len(hashes) + self.doc_trigrams[doc_ids].astype(np.float64))
+        order = np.lexsort((doc_ids, -similarity))[:limit]
+        return doc_ids[order]
+
+    def lookup(self, artist_credit_name_p: str, recording_name_p: str) -> Optional[dict]:
+        """ Look up prepared artist credit and recording names. Returns the best match as a typesense
+            style hit, with the mapping row in its "document", or None if nothing came close. """
+        text = index_text(artist_credit_name_p, recording_name_p)
+        best, best_distance = None, None
+        for doc_id in self.candidates(text):
+            record = self._record(int(doc_id))
+            d = distance(text, record["text"])
+            if best is None or d < best_distance:
+                best, best_distance = record, d
+        if best is None:
+            return None
+        return {"document": best}
+
+    def lookup_many(self, terms: List[Tuple[str, str]]) -> List[Optional[dict]]:
+        """ Look up a list of (artist_credit_name_p, recording_name_p) prepared search terms. """
+        return [self.lookup(artist_credit_name_p, recording_name_p)
+                for artist_credit_name_p, recording_name_p in terms]
+
+
+_loader = IndexLoader(TrigramIndex)
+
+
+def get_trigram_index(path: str) -> Optional[TrigramIndex]:
+    """ Return the index stored at path, reloading it if the file has been replaced
+        by a rebuild since it was loaded. Returns None if no index has been built. """
+    return _loader.get(path)
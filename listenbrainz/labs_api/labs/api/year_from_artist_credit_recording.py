@@ -7,6 +7,8 @@ import psycopg2.extras
 from datasethoster import Query
 from unidecode import unidecode
 from listenbrainz import config
+from listenbrainz.labs_api.labs.api.db_pool import pooled_connection
+from listenbrainz.labs_api.labs.api.query_cache import cached
 
 
 class YearFromArtistCreditRecordingQuery(Query):
@@ -33,10 +35,11 @@ class YearFromArtistCreditRecordingQuery(Query):
     def outputs(self):
         return ['artist_credit_name', 'recording_name', 'recording_mbid', 'year']
 
+    @cached
     def fetch(self, params, offset=-1, count=-1):
         artists = tuple([p['[artist_credit_name]'].lower() for p in params])
         recordings = tuple([p['[recording_name]'].lower() for p in params])
-        with psycopg2.connect(config.MBID_MAPPING_DATABASE_URI) as conn:
+        with pooled_connection(config.MBID_MAPPING_DATABASE_URI) as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as curs:
                 curs.execute("""SELECT DISTINCT artist_credit_name,
                                        recording_name,
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+""" Load tests for the labs API queries.
+
+query-layer creates a small synthetic MusicBrainz schema (artists, areas and countries) in a
+local postgres database and runs the artist country lookup from many threads, first opening a
+connection per request as the queries used to, then with the connection pool, and then
+with the connection pool and result cache.
+
+    python -m listenbrainz.labs_api.labs.load_test query-layer postgresql://musicbrainz@localhost/lb_load_test
+
+mbid-mapping measures how many listens per second the MBID mapping query maps for several listen
+batch sizes, against a local typesense stub and with the embedded trigram index of the same documents.
+
+    python -m listenbrainz.labs_api.labs.load_test mbid-mapping --latency 0.005
+"""
+import os
+import random
+import tempfile
+import threading
+import uuid
+from time import monotonic
+from unittest.mock import patch
+
+import click
+import psycopg2
+import psycopg2.extras
+
+from listenbrainz.labs_api.labs.api import db_pool, query_cache, stats, trigram_index
+from listenbrainz.labs_api.labs.api.artist_country_from_artist_mbid import ArtistCountryFromArtistMBIDQuery
+from listenbrainz.labs_api.labs.api.mbid_mapping import MBIDMappingQuery, TypesenseSearchBackend, TrigramSearchBackend
+from listenbrainz.labs_api.labs.tests.typesense_stub import TypesenseStub, make_documents
+
+CREATE_SCHEMA = """
+    DROP TABLE IF EXISTS artist, area, iso_3166_1, l_area_area, link;
+    CREATE TABLE area (id SERIAL PRIMARY KEY, name TEXT NOT NULL);
+    CREATE TABLE iso_3166_1 (area INTEGER NOT NULL, code CHAR(2) PRIMARY KEY);
+    CREATE TABLE link (id SERIAL PRIMARY KEY, link_type INTEGER NOT NULL);
+    CREATE TABLE l_area_area (id SERIAL PRIMARY KEY, link INTEGER NOT NULL, entity0 INTEGER NOT NULL, entity1 INTEGER NOT NULL);
+    CREATE TABLE artist (id SERIAL PRIMARY KEY, gid UUID NOT NULL UNIQUE, name TEXT NOT NULL, area INTEGER);
+    CREATE INDEX l_area_area_entity1_idx ON l_area_area (entity1);
+    CREATE INDEX iso_3166_1_area_idx ON iso_3166_1 (area);
+"""
+
+# "part of" relationship between areas
+AREA_PART_OF = 356
+
+
+def create_synthetic_mb(dsn: str, countries: int, cities_per_country: int, artists: int):
+    """ Create areas for countries with cities that are part of them, and artists in random areas.
+        Returns the MBIDs of the artists. """
+
+    with psycopg2.connect(dsn) as conn:
+        with conn.cursor() as curs:
+            curs.execute(CREATE_SCHEMA)
+            curs.execute("INSERT INTO link (link_type) VALUES (%s) RETURNING id", (AREA_PART_OF,))
+            link_id = curs.fetchone()[0]
+
+            area_ids = []
+            for c in range(countries):
+                curs.execute("INSERT INTO area (name) VALUES (%s) RETURNING id", ("country %d" % c,))
+                country_id = curs.fetchone()[0]
+                code = chr(ord("A") + c // 26 % 26) + chr(ord("A") + c % 26)
+                curs.execute("INSERT INTO iso_3166_1 (area, code) VALUES (%s, %s)", (country_id, code))
+                area_ids.append(country_id)
+                for i in range(cities_per_country):
+                    curs.execute("INSERT INTO area (name) VALUES (%s) RETURNING id", ("city %d-%d" % (c, i),))
+                    city_id = curs.fetchone()[0]
+                    curs.execute("INSERT INTO l_area_area (link, entity0, entity1) VALUES (%s, %s, %s)",
+                                 (link_id, country_id, city_id))
+                    area_ids.append(city_id)
+
+            mbids = [str(uuid.uuid4()) for _ in range(artists)]
+            psycopg2.extras.execute_values(curs, "INSERT INTO artist (gid, name, area) VALUES %s",
+                                           [(mbid, "artist %d" % i, random.choice(area_ids))
+                                            for i, mbid in enumerate(mbids)])
+            curs.execute("ANALYZE")
+    return mbids
+
+
+def run_load(query, requests, threads, batch_size, mbids, popular):
+    """ Send requests from threads at once, each for batch_size artists. Most requests
+        are repeats of a few popular requests. Returns the requests per second. """
+
+    popular_requests = [random.sample(mbids, batch_size) for _ in range(popular)]
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            if random.random() < 0.8:
+                batch = random.choice(popular_requests)
+            else:
+                batch = random.sample(mbids, batch_size)
+            query.fetch([{"artist_mbid": mbid} for mbid in batch])
+
+    start = monotonic()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return requests / (monotonic() - start)
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(name="query-layer")
+@click.argument("dsn")
+@click.option("--requests", default=2000, help="number of requests per run")
+@click.option("--threads", default=16, help="number of concurrent clients")
+@click.option("--batch-size", default=5, help="number of artists per request")
+@click.option("--artists", default=20000, help="number of artists in the synthetic database")
+@click.option("--popular", default=50, help="number of distinct requests most requests repeat")
+def query_layer(dsn, requests, threads, batch_size, artists, popular):
+    click.echo("creating synthetic database")
+    mbids = create_synthetic_mb(dsn, countries=200, cities_per_country=20, artists=artists)
+    query = ArtistCountryFromArtistMBIDQuery()
+    name = query.names()[0]
+
+    with patch("listenbrainz.config.MB_DATABASE_URI", dsn, create=True), \
+            patch("listenbrainz.config.LABS_API_QUERY_CACHE", {}, create=True):
+        with patch("listenbrainz.labs_api.labs.api.artist_country_from_artist_mbid.pooled_connection",
+                   psycopg2.connect):
+            rate = run_load(query, requests, threads, batch_size, mbids, popular)
+        click.echo("connection per request: %.1f requests/s" % rate)
+
+        rate = run_load(query, requests, threads, batch_size, mbids, popular)
+        result = stats.get_stats()
+        click.echo("connection pool: %.1f requests/s, %d of %d requests waited for a connection, avg wait %.2fms" %
+                   (rate, result["pool_waits"], result["pool_requests"], result["pool_wait_avg_ms"]))
+
+    with patch("listenbrainz.config.MB_DATABASE_URI", dsn, create=True), \
+            patch("listenbrainz.config.LABS_API_QUERY_CACHE", {name: {"ttl": 600, "max_size": 10000}}, create=True):
+        query_cache._caches.clear()
+        before = stats.get_stats()
+        rate = run_load(query, requests, threads, batch_size, mbids, popular)
+        result = stats.get_stats()
+        hits = result["cache_hits"] - before["cache_hits"]
+        lookups = hits + result["cache_misses"] - before["cache_misses"]
+        click.echo("connection pool and cache: %.1f requests/s, hit rate %.1f%%" % (rate, hits * 100 / lookups))
+
+    db_pool.close_pools()
+
+
+@cli.command(name="mbid-mapping")
+@click.option("--listens", default=1000, help="number of listens to map for each batch size")
+@click.option("--documents", default=500, help="number of documents in the typesense stub and trigram index")
+@click.option("--latency", default=0.005, help="time the typesense stub takes per request, in seconds")
+def mbid_mapping(listens, documents, latency):
+    docs = make_documents(documents)
+    params = []
+    for i in range(listens):
+        n = random.randrange(documents)
+        params.append({"[artist_credit_name]": "Artist %d" % n, "[recording_name]": "Recording number %d" % n})
+
+    def run(backend):
+        for batch_size in (1, 50, 250):
+            query = MBIDMappingQuery(backend=backend)
+            start = monotonic()
+            for i in range(0, listens, batch_size):
+                query.fetch(params[i:i + batch_size])
+            rate = listens / (monotonic() - start)
+            click.echo("  batch size %3d: %.1f listens/s" % (batch_size, rate))
+
+    stub = TypesenseStub(docs, latency=latency)
+    stub.start()
+    try:
+        with patch("listenbrainz.config.TYPESENSE_HOST", "127.0.0.1", create=True), \
+                patch("listenbrainz.config.TYPESENSE_PORT", stub.port, create=True), \
+                patch("listenbrainz.config.LABS_API_QUERY_CACHE", {}, create=True):
+            click.echo("typesense stub, %.1fms per request:" % (latency * 1000))
+            run(TypesenseSearchBackend())
+    finally:
+        stub.stop()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            patch("listenbrainz.config.LABS_API_QUERY_CACHE", {}, create=True):
+        path = os.path.join(tmp_dir, "trigram.idx")
+        trigram_index.write_index(path, docs)
+        click.echo("embedded trigram index:")
+        run(TrigramSearchBackend(path))
+
+
+if __name__ == "__main__":
+    cli()
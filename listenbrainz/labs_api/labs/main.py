@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
+from brainzutils import cache, metrics
 from datasethoster.main import create_app, init_sentry, register_query
+from listenbrainz.labs_api.labs.api import stats
 from listenbrainz.labs_api.labs.api.artist_country_from_artist_mbid import ArtistCountryFromArtistMBIDQuery
 from listenbrainz.labs_api.labs.api.artist_credit_from_artist_mbid import ArtistCreditIdFromArtistMBIDQuery
 from listenbrainz.labs_api.labs.api.artist_credit_from_artist_msid import ArtistCreditIdFromArtistMSIDQuery
@@ -23,3 +25,8 @@ register_query(ArtistCreditRecordingLookupQuery())
 app = create_app()
 load_config(app)
 init_sentry(app, "DATASETS_SENTRY_DSN")
+
+# Report connection pool and result cache statistics
+cache.init(host=app.config['REDIS_HOST'], port=app.config['REDIS_PORT'], namespace=app.config['REDIS_NAMESPACE'])
+metrics.init("listenbrainz")
+stats.enable_reporting()
@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import psycopg2
+
+from listenbrainz.labs_api.labs.api import db_pool, stats
+from listenbrainz.labs_api.labs.api.db_pool import ConnectionPool, pooled_connection
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        db_pool.close_pools()
+
+    def tearDown(self):
+        db_pool.close_pools()
+
+    @patch('psycopg2.connect', side_effect=lambda *args, **kwargs: FakeConnection())
+    def test_connections_are_reused(self, mock_connect):
+        for _ in range(3):
+            with pooled_connection("dbname=test") as conn:
+                self.assertIsInstance(conn, FakeConnection)
+        self.assertEqual(mock_connect.call_count, 1)
+        self.assertIs(db_pool.get_pool("dbname=test"), db_pool.get_pool("dbname=test"))
+
+    @patch('psycopg2.connect', side_effect=lambda *args, **kwargs: FakeConnection())
+    def test_closed_and_broken_connections_are_replaced(self, mock_connect):
+        with pooled_connection("dbname=test") as conn:
+            conn.close()
+        with pooled_connection("dbname=test"):
+            pass
+        self.assertEqual(mock_connect.call_count, 2)
+
+        with self.assertRaises(psycopg2.OperationalError):
+            with pooled_connection("dbname=test"):
+                raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        with pooled_connection("dbname=test"):
+            pass
+        self.assertEqual(mock_connect.call_count, 3)
+
+    @patch('psycopg2.connect', side_effect=lambda *args, **kwargs: FakeConnection())
+    def test_callers_wait_for_a_free_connection(self, mock_connect):
+        pool = ConnectionPool("dbname=test", max_size=2)
+        before = stats.get_stats()
+
+        def use_connection():
+            with pool.connection():
+                time.sleep(0.1)
+
+        threads = [threading.Thread(target=use_connection) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        after = stats.get_stats()
+        self.assertEqual(mock_connect.call_count, 2)
+        self.assertEqual(after["pool_requests"] - before["pool_requests"], 4)
+        self.assertEqual(after["pool_waits"] - before["pool_waits"], 2)
+        pool.close()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from listenbrainz.labs_api.labs.api import mapping_index
+from listenbrainz.labs_api.labs.api.artist_credit_recording_lookup import ArtistCreditRecordingLookupQuery
+from listenbrainz.labs_api.labs.api.mapping_index import MappingIndex, write_index, lookup_hash, \
+    clean_lookup_string, get_mapping_index
+from listenbrainz.labs_api.labs.tests.test_artist_credit_recording_lookup import json_request, json_response, \
+    db_response
+
+
+def sorted_rows(rows):
+    return sorted(rows, key=lambda row: lookup_hash(row["combined_lookup"]))
+
+
+class MappingIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "mapping.idx")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_clean_lookup_string(self):
+        self.assertEqual(clean_lookup_string("Sigur Rós", "Hoppípolla!"), "sigurroshoppipolla")
+
+    def test_lookup(self):
+        self.assertEqual(write_index(self.path, sorted_rows(db_response)), 2)
+        index = MappingIndex(self.path)
+
+        result = index.lookup(["portisheadstrangers", "reosmumisnevergoingtobefound", "morcheebatriggerhippie"])
+        self.assertListEqual(result[0], [db_response[1]])
+        self.assertListEqual(result[1], [])
+        self.assertListEqual(result[2], [db_response[0]])
+
+    def test_lookup_many(self):
+        rows = [{**db_response[0], "combined_lookup": "artist%drecording%d" % (i, i), "artist_credit_id": i}
+                for i in range(5000)]
+        write_index(self.path, sorted_rows(rows))
+        index = MappingIndex(self.path)
+
+        lookups = ["artist%drecording%d" % (i, i) for i in range(0, 10000, 2)]
+        result = index.lookup(lookups)
+        for i, rows in enumerate(result):
+            if i * 2 < 5000:
+                self.assertEqual(rows[0]["artist_credit_id"], i * 2)
+            else:
+                self.assertListEqual(rows, [])
+
+    def test_empty_index(self):
+        write_index(self.path, [])
+        self.assertListEqual(MappingIndex(self.path).lookup(["portisheadstrangers"]), [[]])
+
+    def test_lookup_returns_all_rows_of_a_string(self):
+        rows = sorted_rows(db_response)
+        duplicate = {**rows[0], "artist_credit_id": 1}
+        self.assertEqual(write_index(self.path, [rows[0], duplicate, rows[1]]), 2)
+        result = MappingIndex(self.path).lookup([rows[0]["combined_lookup"], rows[1]["combined_lookup"]])
+        self.assertListEqual(result, [[rows[0], duplicate], [rows[1]]])
+
+    def test_strings_with_the_same_hash(self):
+        rows = sorted_rows(db_response)
+        other = {**rows[0], "combined_lookup": "notindexed"}
+        with patch.object(mapping_index, "lookup_hash", return_value=1):
+            write_index(self.path, [rows[0], other])
+            result = MappingIndex(self.path).lookup([rows[0]["combined_lookup"], "notindexed", "missing"])
+        self.assertListEqual(result, [[rows[0]], [other], []])
+
+    def test_unsorted_rows(self):
+        with self.assertRaises(ValueError):
+            write_index(self.path, list(reversed(sorted_rows(db_response))))
+
+    def test_hot_reload(self):
+        write_index(self.path, sorted_rows(db_response[:1]))
+        index = get_mapping_index(self.path)
+        self.assertListEqual(index.lookup(["portisheadstrangers"])[0], [])
+
+        write_index(self.path, sorted_rows(db_response))
+        # the index is only checked for changes every RELOAD_CHECK_INTERVAL seconds
+        self.assertIs(get_mapping_index(self.path), index)
+        with patch.object(mapping_index._loader, "next_reload_check", 0):
+            reloaded = get_mapping_index(self.path)
+        self.assertIsNot(reloaded, index)
+        self.assertEqual(len(reloaded.lookup(["portisheadstrangers"])[0]), 1)
+
+    @patch('psycopg2.connect')
+    def test_query_uses_index(self, mock_connect):
+        write_index(self.path, sorted_rows(db_response))
+        with patch("listenbrainz.config.MBID_MAPPING_INDEX_PATH", self.path, create=True):
+            resp = ArtistCreditRecordingLookupQuery().fetch(json_request)
+
+        mock_connect.assert_not_called()
+        resp = sorted(resp, key=lambda row: row["index"], reverse=True)
+        self.assertListEqual(resp, json_response)
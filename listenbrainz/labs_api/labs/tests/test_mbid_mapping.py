@@ -2,7 +2,9 @@ from unittest.mock import patch
 
 import flask_testing
 from datasethoster.main import create_app
+from listenbrainz.labs_api.labs.api import mbid_mapping
 from listenbrainz.labs_api.labs.api.mbid_mapping import MBIDMappingQuery, COLLECTION_NAME
+from listenbrainz.labs_api.labs.tests.typesense_stub import TypesenseStub, make_documents
 
 
 json_request_0 = [
@@ -160,6 +162,17 @@ json_response_1 = [
     }
 ]
 
+
+def multi_search_responses(responses):
+    """ Answer each multi_search request with the next responses, one for each search in the request """
+    responses = iter(responses)
+
+    def post(endpoint, body, params=None):
+        return {"results": [next(responses) for _ in body["searches"]]}
+
+    return post
+
+
 class MainTestCase(flask_testing.TestCase):
 
     def create_app(self):
@@ -183,9 +196,9 @@ class MainTestCase(flask_testing.TestCase):
                                        'artist_credit_name', 'artist_mbids', 'release_name', 'recording_name',
                                        'release_mbid', 'recording_mbid', 'artist_credit_id'])
 
-    @patch('typesense.documents.Documents.search')
-    def test_fetch(self, search):
-        search.side_effect = typesense_response_0
+    @patch('typesense.api_call.ApiCall.post')
+    def test_fetch(self, post):
+        post.side_effect = multi_search_responses(typesense_response_0)
 
         q = MBIDMappingQuery()
         resp = q.fetch(json_request_0)
@@ -194,11 +207,43 @@ class MainTestCase(flask_testing.TestCase):
         self.assertDictEqual(resp[1], json_response_0[1])
         self.assertDictEqual(resp[2], json_response_0[2])
 
-    @patch('typesense.documents.Documents.search')
-    def test_fetch_without_stop_words(self, search):
-        search.side_effect = typesense_response_1
+        # all rows are searched at once, and then the detuned "glory box"
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(len(post.call_args_list[0][0][1]["searches"]), 3)
+        self.assertEqual(post.call_args_list[1][0][1]["searches"], [{"collection": COLLECTION_NAME, "q": "portishead glory box"}])
+
+    @patch('typesense.api_call.ApiCall.post')
+    def test_fetch_without_stop_words(self, post):
+        post.side_effect = multi_search_responses(typesense_response_1)
 
         q = MBIDMappingQuery(remove_stop_words=True)
         resp = q.fetch(json_request_1)
         self.assertEqual(len(resp), 1)
         self.assertDictEqual(resp[0], json_response_1[0])
+
+    @patch.object(mbid_mapping, 'MULTI_SEARCH_BATCH_SIZE', 10)
+    def test_fetch_from_typesense_stub(self):
+        stub = TypesenseStub(make_documents(100))
+        stub.start()
+        try:
+            with patch('listenbrainz.config.TYPESENSE_HOST', '127.0.0.1', create=True), \
+                    patch('listenbrainz.config.TYPESENSE_PORT', stub.port, create=True):
+                q = MBIDMappingQuery()
+                params = [{"[artist_credit_name]": "Artist %d" % i, "[recording_name]": "Recording number %d" % i}
+                          for i in range(25)]
+                # this one is only found once the featured artist is removed
+                params.append({"[artist_credit_name]": "Artist 42", "[recording_name]": "Recording number 42 feat. Somebody Else"})
+                # and this one is not found at all
+                params.append({"[artist_credit_name]": "Nobody", "[recording_name]": "Nothing that anyone ever recorded"})
+                resp = q.fetch(params)
+        finally:
+            stub.stop()
+
+        self.assertEqual([r["index"] for r in resp], list(range(26)))
+        self.assertEqual(resp[25]["match_type"], mbid_mapping.MATCH_TYPE_EXACT_MATCH)
+        for i, r in enumerate(resp[:25]):
+            self.assertEqual(r["artist_credit_id"], i)
+            self.assertEqual(r["match_type"], mbid_mapping.MATCH_TYPE_EXACT_MATCH)
+        self.assertEqual(resp[25]["artist_credit_id"], 42)
+        # 27 searches in batches of 10, then the detuned search
+        self.assertEqual(stub.requests, ["/multi_search"] * 4)
@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import patch
+
+from listenbrainz.labs_api.labs.api import query_cache, stats
+from listenbrainz.labs_api.labs.api.artist_country_from_artist_mbid import ArtistCountryFromArtistMBIDQuery
+from listenbrainz.labs_api.labs.api.query_cache import QueryCache, make_key
+from listenbrainz.labs_api.labs.tests.test_artist_country_code_from_artist_mbid import json_request, json_response, \
+    area_response, country_response
+
+
+class QueryCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        query_cache._caches.clear()
+
+    def test_expiry(self):
+        cache = QueryCache(ttl=10)
+        with patch.object(query_cache, "monotonic", return_value=100):
+            cache.set("key", [1])
+        with patch.object(query_cache, "monotonic", return_value=105):
+            self.assertEqual(cache.get("key"), (True, [1]))
+        with patch.object(query_cache, "monotonic", return_value=111):
+            self.assertEqual(cache.get("key"), (False, None))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = QueryCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), (True, 1))
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertEqual(cache.get("c"), (True, 3))
+
+    def test_make_key(self):
+        self.assertEqual(make_key([{"a": " x", "b": "y "}], count=5),
+                         make_key([{"b": "y", "a": "x"}], count=5))
+        self.assertNotEqual(make_key([{"a": "x"}, {"a": "y"}]), make_key([{"a": "y"}, {"a": "x"}]))
+        self.assertNotEqual(make_key([{"a": "x"}], count=5), make_key([{"a": "x"}], count=6))
+
+    def test_cache_is_opt_in(self):
+        with patch("listenbrainz.config.LABS_API_QUERY_CACHE", {}, create=True):
+            self.assertIsNone(query_cache.get_query_cache("artist-country-code-from-artist-mbid"))
+
+    @patch('psycopg2.connect')
+    def test_cached_query(self, mock_connect):
+        fetchone = mock_connect().__enter__().cursor().__enter__().fetchone
+        fetchone.side_effect = [area_response[0], area_response[1], None, country_response[0], None]
+        settings = {"artist-country-code-from-artist-mbid": {"ttl": 60, "max_size": 10}}
+        before = stats.get_stats()
+
+        with patch("listenbrainz.config.LABS_API_QUERY_CACHE", settings, create=True):
+            q = ArtistCountryFromArtistMBIDQuery()
+            first = q.fetch(json_request)
+            first[0]["country_code"] = "XX"
+            second = q.fetch([{"artist_mbid": " " + row["artist_mbid"]} for row in json_request])
+
+        self.assertEqual(second, json_response)
+        self.assertEqual(fetchone.call_count, 5)
+        after = stats.get_stats()
+        self.assertEqual(after["cache_hits"] - before["cache_hits"], 1)
+        self.assertEqual(after["cache_misses"] - before["cache_misses"], 1)
@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from werkzeug.exceptions import ServiceUnavailable
+
+from listenbrainz.labs_api.labs.api import trigram_index
+from listenbrainz.labs_api.labs.api.mbid_mapping import MBIDMappingQuery, TrigramSearchBackend, \
+    TypesenseSearchBackend, MATCH_TYPE_EXACT_MATCH
+from listenbrainz.labs_api.labs.api.trigram_index import TrigramIndex, write_index, trigram_hashes
+from listenbrainz.labs_api.labs.tests.typesense_stub import TypesenseStub, make_documents
+
+documents = make_documents(200) + [
+    {
+        "artist_credit_id": 65,
+        "artist_mbids": ["8f6bd1e4-fbe1-4f50-aa9b-94c450ec0f11"],
+        "artist_credit_name": "Portishead",
+        "recording_mbid": "145f5c43-0ac2-4886-8b09-63d0e92ded5d",
+        "recording_name": "Glory Box",
+        "release_mbid": "76df3287-6cda-33eb-8e9a-044b5e15ffdd",
+        "release_name": "Dummy",
+        "combined": "portishead glory box",
+    },
+    {
+        "artist_credit_id": 1160,
+        "artist_mbids": ["7249b899-8db8-43e7-9e6e-22f1e736024e"],
+        "artist_credit_name": "Sigur Rós",
+        "recording_mbid": "7a4b0c1c-2d5e-4bc4-9a3e-5a1b8a4c7d2f",
+        "recording_name": "Hoppípolla",
+        "release_mbid": "9c2a8c9f-44b1-4e5c-a8b1-8a1d0c2b3a4d",
+        "release_name": "Takk…",
+        "combined": "sigur ros hoppipolla",
+    },
+]
+
+# (artist credit, recording) pairs to look up: exact, with typos, with extra cruft and unknown
+queries = [("Artist %d" % i, "Recording number %d" % i) for i in range(0, 200, 7)] + [
+    ("Artsit 12", "Recording numbr 12"),
+    ("artist 150", "recording number 150 ft. DJ Remaster"),
+    ("Portishead", "Glory Box (feat. Somebody)"),
+    ("portishead", "glory box"),
+    ("Sigur Ros", "Hoppipolla"),
+    ("Sigur Rós", "Hopipolla"),
+    ("Nobody", "Nothing that anyone ever recorded"),
+]
+
+
+class TrigramIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "trigram.idx")
+        self.assertEqual(write_index(self.path, documents), len(documents))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_trigram_hashes(self):
+        self.assertEqual(len(trigram_hashes("abcab")), 3)
+        self.assertEqual(len(trigram_hashes("ab")), 1)
+        self.assertEqual(len(trigram_hashes("")), 0)
+
+    def test_lookup(self):
+        index = TrigramIndex(self.path)
+        hit = index.lookup("artist 17", "recording numbr 17")
+        self.assertEqual(hit["document"]["artist_credit_id"], 17)
+        self.assertEqual(hit["document"]["recording_name"], "Recording number 17")
+
+        hit = index.lookup("sigur ros", "hoppipolla")
+        self.assertEqual(hit["document"]["artist_credit_name"], "Sigur Rós")
+
+        self.assertIsNone(index.lookup("zzz", "qqq"))
+
+    def test_common_trigrams_are_skipped(self):
+        index = TrigramIndex(self.path)
+        with patch.object(trigram_index, "MAX_POSTINGS", 5):
+            # "artist" and "recording number" are in 200 documents, the numbers still find the right one
+            self.assertEqual(index.lookup("artist 123", "recording number 123")["document"]["artist_credit_id"], 123)
+            # only common trigrams, fall back to the least common ones
+            self.assertIsNotNone(index.lookup("artist", "recording number"))
+
+    def test_pairs_sorted_in_chunks(self):
+        chunked_path = os.path.join(self.tmp_dir.name, "chunked.idx")
+        with patch.object(trigram_index, "PAIR_CHUNK_SIZE", 100):
+            write_index(chunked_path, documents)
+        with open(self.path, "rb") as f, open(chunked_path, "rb") as chunked:
+            self.assertEqual(f.read(), chunked.read())
+        # the temporary files are removed
+        self.assertCountEqual(os.listdir(self.tmp_dir.name), ["trigram.idx", "chunked.idx"])
+
+    def test_empty_index(self):
+        write_index(self.path, [])
+        self.assertIsNone(TrigramIndex(self.path).lookup("portishead", "strangers"))
+
+    def test_missing_index(self):
+        backend = TrigramSearchBackend(os.path.join(self.tmp_dir.name, "missing.idx"))
+        with self.assertRaises(ServiceUnavailable):
+            backend.lookup_many([("portishead", "strangers")])
+
+    def test_selected_by_config(self):
+        with patch("listenbrainz.config.MBID_MAPPING_SEARCH_BACKEND", "trigram", create=True), \
+                patch("listenbrainz.config.MBID_MAPPING_TRIGRAM_INDEX_PATH", self.path, create=True):
+            q = MBIDMappingQuery()
+            self.assertIsInstance(q.backend, TrigramSearchBackend)
+            resp = q.fetch([{"[artist_credit_name]": "Artist 3", "[recording_name]": "Recording number 3"}])
+        self.assertEqual(resp[0]["artist_credit_id"], 3)
+        self.assertEqual(resp[0]["match_type"], MATCH_TYPE_EXACT_MATCH)
+
+    def test_accuracy_parity_with_typesense(self):
+        params = [{"[artist_credit_name]": ac, "[recording_name]": r} for ac, r in queries]
+        stub = TypesenseStub(documents)
+        stub.start()
+        try:
+            with patch("listenbrainz.config.TYPESENSE_HOST", "127.0.0.1", create=True), \
+                    patch("listenbrainz.config.TYPESENSE_PORT", stub.port, create=True):
+                typesense_resp = MBIDMappingQuery(backend=TypesenseSearchBackend()).fetch(params)
+        finally:
+            stub.stop()
+        trigram_resp = MBIDMappingQuery(backend=TrigramSearchBackend(self.path)).fetch(params)
+
+        def matches(resp):
+            return {r["index"]: (r["recording_mbid"], r["match_type"]) for r in resp}
+
+        self.assertEqual(matches(trigram_resp), matches(typesense_resp))
+        # everything except the unknown recording is found
+        self.assertEqual(len(trigram_resp), len(queries) - 1)
@@ -0,0 +1,101 @@
+""" A minimal stand-in for a typesense server, serving the search and multi_search
+endpoints for a small set of documents, with an optional latency per request. """
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from Levenshtein import distance
+
+
+class TypesenseStub:
+
+    def __init__(self, documents, latency=0.0):
+        """ Args:
+                documents: the documents to search, each one needs a "combined" field
+                latency: the time in seconds each request takes
+        """
+        self.documents = documents
+        self.latency = latency
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def search(self, q):
+        """ Return the search result for q: the document with the closest combined field,
+            if it is within an edit distance of half the length of q. """
+        best, best_distance = None, None
+        for document in self.documents:
+            d = distance(q, document["combined"])
+            if best_distance is None or d < best_distance:
+                best, best_distance = document, d
+
+        if best is None or best_distance > len(q) // 2:
+            return {"hits": [], "found": 0}
+        return {"hits": [{"document": best}], "found": 1}
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _respond(self, data):
+                time.sleep(stub.latency)
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                with stub.lock:
+                    stub.requests.append(url.path)
+                self._respond(stub.search(parse_qs(url.query)["q"][0]))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.requests.append(url.path)
+                self._respond({"results": [stub.search(search["q"]) for search in body["searches"]]})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_documents(count):
+    """ Make count synthetic mapping documents """
+    documents = []
+    for i in range(count):
+        artist_credit_name = "Artist %d" % i
+        recording_name = "Recording number %d" % i
+        documents.append({
+            "artist_credit_id": i,
+            "artist_mbids": ["00000000-0000-0000-0000-%012d" % i],
+            "artist_credit_name": artist_credit_name,
+            "recording_mbid": "10000000-0000-0000-0000-%012d" % i,
+            "recording_name": recording_name,
+            "release_mbid": "20000000-0000-0000-0000-%012d" % i,
+            "release_name": "Release %d" % i,
+            "combined": ("artist %d recording number %d" % (i, i)),
+        })
+    return documents
@@ -3,7 +3,6 @@ import calendar
 import time
 import ujson
 import yaml
-from copy import deepcopy
 
 from datetime import datetime
 from listenbrainz.utils import escape
@@ -21,14 +20,54 @@ def flatten_dict(d, seperator='', parent_key=''):
     Returns:
         Flattened dict with keys such as key1.key2
     """
-    result = []
+    result = {}
+    _flatten_into(result, d, parent_key + seperator)
+    return result
+
+
+def _flatten_into(result, d, prefix):
     for key, value in d.items():
-        new_key = "{}{}{}".format(parent_key, seperator, str(key))
         if isinstance(value, dict):
-            result.extend(list(flatten_dict(value, '.', new_key).items()))
+            _flatten_into(result, value, prefix + str(key) + '.')
         else:
-            result.append((new_key, value))
-    return dict(result)
+            result[prefix + str(key)] = value
+
+
+def _mbid_mapping(recording_mbid, release_mbid, artist_mbids):
+    """ The mbid_mapping of the track_metadata of a listen, None if the listen isn't mapped """
+    if recording_mbid is None or release_mbid is None or artist_mbids is None:
+        return None
+    return {
+        "recording_mbid": str(recording_mbid),
+        "release_mbid": str(release_mbid),
+        "artist_mbids": [str(m) for m in artist_mbids]
+    }
+
+
+def timescale_row_to_api(listened_at, track_name, user_name, created, j,
+                         recording_mbid=None, release_mbid=None, artist_mbids=None):
+    """ Converts a row of the listen table into the format in which listens are returned by the api.
+        This is the same as Listen.from_timescale(...).to_api(), without creating a Listen. The JSONB
+        data of the row is modified and reused.
+    """
+    track_metadata = j['track_metadata']
+    track_metadata['track_name'] = track_name
+    mbid_mapping = _mbid_mapping(recording_mbid, release_mbid, artist_mbids)
+    if mbid_mapping is not None:
+        track_metadata['mbid_mapping'] = mbid_mapping
+
+    additional_info = flatten_dict(track_metadata['additional_info'])
+    additional_info['artist_msid'] = additional_info.get('artist_msid')
+    additional_info['release_msid'] = additional_info.get('release_msid')
+    track_metadata['additional_info'] = additional_info
+
+    return {
+        'track_metadata': track_metadata,
+        'listened_at': int(listened_at),
+        'recording_msid': additional_info.get('recording_msid'),
+        'user_name': user_name,
+        'inserted_at': created or 0
+    }
 
 
 def convert_comma_seperated_string_to_list(string):
@@ -42,6 +81,9 @@ def convert_comma_seperated_string_to_list(string):
 class Listen(object):
     """ Represents a listen object """
 
+    __slots__ = ('user_id', 'user_name', 'timestamp', 'ts_since_epoch', 'artist_msid', 'release_msid',
+                 'recording_msid', 'dedup_tag', 'inserted_timestamp', 'data')
+
     # keys that we use ourselves for private usage
     PRIVATE_KEYS = (
         'inserted_timestamp',
@@ -138,11 +180,9 @@ class Listen(object):
 
         j['listened_at'] = datetime.utcfromtimestamp(float(listened_at))
         j['track_metadata']['track_name'] = track_name
-        if recording_mbid is not None and release_mbid is not None and artist_mbids is not None:
-            j["track_metadata"]["mbid_mapping"] = {
-                "recording_mbid": str(recording_mbid),
-                "release_mbid": str(release_mbid),
-                "artist_mbids": [ str(m) for m in artist_mbids ] }
+        mbid_mapping = _mbid_mapping(recording_mbid, release_mbid, artist_mbids)
+        if mbid_mapping is not None:
+            j["track_metadata"]["mbid_mapping"] = mbid_mapping
         return cls(
             user_id=j.get('user_id'),
             user_name=user_name,
@@ -187,12 +227,14 @@ class Listen(object):
         }
 
     def to_timescale(self):
-        track_metadata = deepcopy(self.data)
-        track_metadata['additional_info']['artist_msid'] = self.artist_msid
-        track_metadata['additional_info']['release_msid'] = self.release_msid
-        track_metadata['additional_info']['recording_msid'] = self.recording_msid
-        track_name = track_metadata['track_name']
-        del track_metadata['track_name']
+        # only the top level and additional_info are changed, the rest of the data is shared
+        additional_info = dict(self.data['additional_info'])
+        additional_info['artist_msid'] = self.artist_msid
+        additional_info['release_msid'] = self.release_msid
+        additional_info['recording_msid'] = self.recording_msid
+        track_metadata = {key: value for key, value in self.data.items() if key != 'track_name'}
+        track_metadata['additional_info'] = additional_info
+        track_name = self.data['track_name']
         return (self.ts_since_epoch, track_name, self.user_name, ujson.dumps({
             'user_id': self.user_id,
             'track_metadata': track_metadata
@@ -208,7 +250,7 @@ class Listen(object):
 
     def __repr__(self):
         from pprint import pformat
-        return pformat(vars(self))
+        return pformat({name: getattr(self, name) for name in self.__slots__})
 
     def __unicode__(self):
         return "<Listen: user_name: %s, time: %s, artist_msid: %s, release_msid: %s, recording_msid: %s, artist_name: %s, track_name: %s>" % \
@@ -218,6 +260,8 @@ class Listen(object):
 class NowPlayingListen:
     """Represents a now playing listen"""
 
+    __slots__ = ('user_id', 'user_name', 'data')
+
     def __init__(self, user_id=None, user_name=None, data=None):
         self.user_id = user_id
         self.user_name = user_name
@@ -240,7 +284,7 @@ class NowPlayingListen:
 
     def __repr__(self):
         from pprint import pformat
-        return pformat(vars(self))
+        return pformat({name: getattr(self, name) for name in self.__slots__})
 
     def __str__(self):
         return "<Now Playing Listen: user_name: %s, artist_name: %s, track_name: %s>" % \
@@ -269,3 +313,4 @@ def convert_dump_row_to_spark_row(row):
         data['inserted_timestamp'] = str(datetime.utcfromtimestamp(0))
 
     return data
+
@@ -0,0 +1,120 @@
+""" Latency tracing of submitted listens through the listen pipeline.
+
+A batch of listens submitted to the API goes through the incoming queue to the timescale writer,
+which looks them up in MessyBrainz and inserts them into the listenstore, and then through the
+unique exchange to the websockets and to the MBID mapping writer. A sample of the batches, set by
+LISTEN_TRACE_SAMPLE_RATE in the config, is stamped with a trace context by insert_payload. The
+context travels with the batch in the headers of its RabbitMQ messages, and every stage records
+its timing into a capped redis stream per stage, from which manage.py listen_pipeline_latency
+reports the percentiles.
+
+The time since submission is measured with the wall clocks of the processes involved, so it is
+only as accurate as the synchronization of the clocks of their hosts.
+"""
+import logging
+import random
+import time
+import uuid
+from typing import Dict, Optional
+
+from brainzutils import cache, metrics
+
+from listenbrainz import config
+from listenbrainz.utils import percentile
+
+logger = logging.getLogger(__name__)
+
+TRACE_ID_HEADER = "trace_id"
+SUBMITTED_HEADER = "trace_submitted_ms"
+
+# The stages of the pipeline, in the order in which batches go through them. Stages whose name
+# starts with "submit_to_" are timed from the submission of the batch, the others on their own.
+STAGE_INCOMING = "submit_to_timescale_writer"  # waited in the incoming queue
+STAGE_MESSYBRAINZ = "messybrainz_lookup"
+STAGE_INSERT = "listenstore_insert"
+STAGE_DURABLE = "submit_to_durable"  # inserted into the listenstore
+STAGE_UNIQUE = "submit_to_unique"  # published to the unique exchange
+STAGE_WEBSOCKET = "submit_to_websocket"  # sent to the websockets
+STAGE_MAPPING = "submit_to_mapping_writer"  # received by the MBID mapping writer
+
+STAGES = [STAGE_INCOMING, STAGE_MESSYBRAINZ, STAGE_INSERT, STAGE_DURABLE, STAGE_UNIQUE, STAGE_WEBSOCKET,
+          STAGE_MAPPING]
+
+STREAM_KEY_PREFIX = "listen_trace."
+# The number of timings kept per stage
+STREAM_MAX_LENGTH = 10000
+
+PERCENTILES = (50, 90, 99)
+
+
+def new_trace() -> Optional[Dict]:
+    """ Start tracing a batch of listens being submitted, if it is sampled.
+
+        Returns:
+            the trace context of the batch, to be sent as the headers of its messages, or None
+            if the batch isn't traced
+    """
+    sample_rate = getattr(config, "LISTEN_TRACE_SAMPLE_RATE", 0)
+    if not sample_rate or random.random() >= sample_rate:
+        return None
+    return {TRACE_ID_HEADER: uuid.uuid4().hex, SUBMITTED_HEADER: int(time.time() * 1000)}
+
+
+def from_headers(headers: Optional[Dict]) -> Optional[Dict]:
+    """ Returns the trace context in the headers of a message, None if the batch isn't traced. """
+    if not headers or TRACE_ID_HEADER not in headers or SUBMITTED_HEADER not in headers:
+        return None
+    return {TRACE_ID_HEADER: headers[TRACE_ID_HEADER], SUBMITTED_HEADER: headers[SUBMITTED_HEADER]}
+
+
+def record(trace: Optional[Dict], stage: str, duration_ms: float = None):
+    """ Record the timing of a stage of a traced batch. Nothing is recorded for batches which
+        aren't traced, and errors are only logged, tracing never fails the pipeline.
+
+        Args:
+            trace: the trace context of the batch, as returned by from_headers
+            stage: one of STAGES
+            duration_ms: how long the stage took, by default the time since the batch was submitted
+    """
+    if trace is None:
+        return
+    if duration_ms is None:
+        duration_ms = time.time() * 1000 - trace[SUBMITTED_HEADER]
+    try:
+        cache._r.xadd(cache._prep_key(STREAM_KEY_PREFIX + stage),
+                      {"trace_id": trace[TRACE_ID_HEADER], "ms": "%.3f" % duration_ms},
+                      maxlen=STREAM_MAX_LENGTH, approximate=True)
+    except Exception:
+        logger.warning("Could not record the timing of stage %s of trace %s", stage, trace[TRACE_ID_HEADER],
+                       exc_info=True)
+
+
+def get_stage_latencies(window: int = 3600) -> Dict[str, Dict]:
+    """ Returns the distribution of the timings recorded for each stage in the last window seconds.
+
+        Returns:
+            dict of stage -> dict with the count of timings, the p50, p90, p99 and max in ms,
+            for the stages of STAGES which have any timings
+    """
+    min_id = "%d-0" % ((time.time() - window) * 1000)
+    latencies = {}
+    for stage in STAGES:
+        entries = cache._r.xrevrange(cache._prep_key(STREAM_KEY_PREFIX + stage), max="+", min=min_id,
+                                     count=STREAM_MAX_LENGTH)
+        values = sorted(float(fields.get(b"ms", fields.get("ms"))) for _, fields in entries)
+        if not values:
+            continue
+        latencies[stage] = {"count": len(values), "max": values[-1]}
+        for p in PERCENTILES:
+            latencies[stage]["p%d" % p] = percentile(values, p)
+    return latencies
+
+
+def submit_stage_latencies(latencies: Dict[str, Dict]):
+    """ Report the latencies returned by get_stage_latencies to the metrics store. """
+    fields = {}
+    for stage, latency in latencies.items():
+        for key, value in latency.items():
+            fields["%s_%s" % (stage, key)] = value
+    if fields:
+        metrics.set("listen_pipeline_latency", **fields)
@@ -0,0 +1,246 @@
+""" Deletion of all the listens of a user in the background.
+
+No index of the listen table leads with user_name, so a single DELETE of all the listens of a
+user scans every chunk of the hypertable in one long transaction. Instead, a deletion job is
+queued and the listens are deleted by process_listen_delete_jobs, one chunk of the hypertable at
+a time, in small batches. Only the chunks between the first and last listen of the user are
+visited, and decompressed first if they are compressed. The progress of the job is saved with
+each batch, so an interrupted job resumes where it stopped.
+
+Only the listens which were created before the job was queued are deleted, so that a new user
+with the same name doesn't lose their listens.
+"""
+import logging
+import time
+
+import sqlalchemy
+from brainzutils import cache
+
+from listenbrainz.db import timescale
+from listenbrainz.listenstore import timescale_compression
+from listenbrainz.listenstore.timescale_listenstore import REDIS_USER_LISTEN_COUNT, REDIS_USER_TIMESTAMPS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10000
+
+# How long to wait before checking the replication lag again, once it is too high
+REPLICATION_LAG_WAIT = 10  # in s
+
+
+def queue_listen_deletion(user_name: str) -> int:
+    """ Queue the deletion of all the listens of a user.
+
+        Args:
+            user_name: the MusicBrainz ID of the user
+
+        Returns:
+            the id of the deletion job
+    """
+    query = """INSERT INTO listen_delete_job (user_name, min_listened_at, max_listened_at, next_listened_at)
+                    SELECT :user_name
+                         , COALESCE(min_listened_at, 0)
+                         , COALESCE(max_listened_at, -1)
+                         , COALESCE(max_listened_at, -1) + 1
+                      FROM (SELECT min(min_listened_at) AS min_listened_at
+                                 , max(max_listened_at) AS max_listened_at
+                              FROM listen_user_metadata
+                             WHERE user_name = :user_name) AS metadata
+                 RETURNING id"""
+    with timescale.engine.connect() as connection:
+        job_id = connection.execute(sqlalchemy.text(query), user_name=user_name).fetchone()["id"]
+    logger.info("Queued deletion of the listens of %s as job %d", user_name, job_id)
+    return job_id
+
+
+def get_listen_delete_job(job_id: int):
+    """ Get a listen deletion job.
+
+        Returns:
+            a dict with the id, user_name, min_listened_at, max_listened_at, next_listened_at (listens
+            from min_listened_at up to this timestamp remain to be deleted), deleted_count, created,
+            last_updated and completed (None while the job is pending) of the job, or None if there is
+            no such job
+    """
+    with timescale.engine.connect() as connection:
+        result = connection.execute(sqlalchemy.text("SELECT * FROM listen_delete_job WHERE id = :id"), id=job_id)
+        row = result.fetchone()
+        return dict(row) if row else None
+
+
+def get_replication_lag(connection) -> float:
+    """ Returns the replay lag of the most lagging replica of the timescale database in seconds,
+        or 0 if there are no replicas. """
+    result = connection.execute(sqlalchemy.text(
+        "SELECT COALESCE(EXTRACT(EPOCH FROM max(replay_lag)), 0) FROM pg_stat_replication"))
+    return float(result.fetchone()[0])
+
+
+def _get_chunk_ranges(job):
+    """ Return the listened_at ranges of the hypertable chunks in which listens of the job remain to be
+        deleted, latest first. The ranges are limited to the timestamps of the listens of the user. """
+    query = """SELECT range_start_integer, range_end_integer
+                 FROM timescaledb_information.chunks
+                WHERE hypertable_name = 'listen'
+                  AND range_start_integer < :next_listened_at
+                  AND range_end_integer > :min_listened_at
+             ORDER BY range_start_integer DESC"""
+    with timescale.engine.connect() as connection:
+        result = connection.execute(sqlalchemy.text(query),
+                                    next_listened_at=job["next_listened_at"],
+                                    min_listened_at=job["min_listened_at"])
+        return [(max(start, job["min_listened_at"]), min(end, job["next_listened_at"])) for start, end in result]
+
+
+def _delete_batch(job_id: int, start: int, end: int, batch_size: int) -> int:
+    """ Delete a batch of the listens of a job in the [start, end) range of listened_at, and save the
+        progress of the job in the same transaction. Once the range has no more listens to delete,
+        the job moves on to the listens before start.
+
+        Returns:
+            the number of listens deleted
+    """
+    delete_query = """WITH batch AS (
+                          SELECT listened_at, track_name, user_name
+                            FROM listen
+                           WHERE user_name = :user_name
+                             AND listened_at >= :start
+                             AND listened_at < :end
+                             AND created <= :created
+                           LIMIT :batch_size
+                      )
+                      DELETE FROM listen l
+                            USING batch b
+                            WHERE l.listened_at = b.listened_at
+                              AND l.track_name = b.track_name
+                              AND l.user_name = b.user_name
+                              AND l.listened_at >= :start
+                              AND l.listened_at < :end"""
+    job_query = """UPDATE listen_delete_job
+                      SET deleted_count = deleted_count + :deleted
+                        , next_listened_at = :next_listened_at
+                        , last_updated = NOW()
+                    WHERE id = :id"""
+    metadata_query = """UPDATE listen_user_metadata
+                           SET count = GREATEST(count - :deleted, 0)
+                             , last_updated = NOW()
+                         WHERE user_name = :user_name"""
+
+    with timescale.engine.connect() as connection:
+        with connection.begin():
+            job = connection.execute(sqlalchemy.text("SELECT * FROM listen_delete_job WHERE id = :id FOR UPDATE"),
+                                     id=job_id).fetchone()
+            # another worker has already moved past this range
+            if job["completed"] is not None or job["next_listened_at"] <= start:
+                return 0
+            end = min(end, job["next_listened_at"])
+
+            with connection.connection.cursor() as curs:
+                timescale_compression.decompress_chunks_in_range(curs, start, end)
+            deleted = connection.execute(sqlalchemy.text(delete_query),
+                                         user_name=job["user_name"],
+                                         start=start,
+                                         end=end,
+                                         created=job["created"],
+                                         batch_size=batch_size).rowcount
+            connection.execute(sqlalchemy.text(job_query),
+                               id=job_id,
+                               deleted=deleted,
+                               next_listened_at=end if deleted == batch_size else start)
+            if deleted:
+                connection.execute(sqlalchemy.text(metadata_query), user_name=job["user_name"], deleted=deleted)
+
+    if deleted:
+        cache.delete_many([REDIS_USER_LISTEN_COUNT + job["user_name"], REDIS_USER_TIMESTAMPS + job["user_name"]])
+    return deleted
+
+
+def _complete_job(job_id: int):
+    """ Mark a job as completed, and recalculate the listen count and timestamps of the user from the
+        listens created after the job was queued, which are the only ones left. """
+    lock_query = "SELECT 1 FROM listen_user_metadata WHERE user_name = :user_name FOR UPDATE"
+    metadata_query = """UPDATE listen_user_metadata
+                           SET count = remaining.count
+                             , min_listened_at = remaining.min_listened_at
+                             , max_listened_at = remaining.max_listened_at
+                             , last_updated = NOW()
+                          FROM (SELECT count(*) AS count
+                                     , min(listened_at) AS min_listened_at
+                                     , max(listened_at) AS max_listened_at
+                                  FROM listen
+                                 WHERE user_name = :user_name
+                                   AND created > :created) AS remaining
+                         WHERE user_name = :user_name"""
+
+    with timescale.engine.connect() as connection:
+        with connection.begin():
+            job = connection.execute(sqlalchemy.text("""UPDATE listen_delete_job
+                                                           SET completed = NOW()
+                                                             , last_updated = NOW()
+                                                         WHERE id = :id
+                                                     RETURNING user_name, created, deleted_count"""), id=job_id).fetchone()
+            connection.execute(sqlalchemy.text(lock_query), user_name=job["user_name"])
+            connection.execute(sqlalchemy.text(metadata_query), user_name=job["user_name"], created=job["created"])
+
+    cache.delete_many([REDIS_USER_LISTEN_COUNT + job["user_name"], REDIS_USER_TIMESTAMPS + job["user_name"]])
+    logger.info("Deleted %d listens of %s in job %d", job["deleted_count"], job["user_name"], job_id)
+
+
+def _throttle(deleted: int, elapsed: float, max_rows_per_second: int, max_replication_lag: float):
+    """ Wait after a batch so that no more than max_rows_per_second listens are deleted per second,
+        and until the replication lag is at most max_replication_lag seconds. """
+    if max_rows_per_second:
+        delay = deleted / max_rows_per_second - elapsed
+        if delay > 0:
+            time.sleep(delay)
+
+    if max_replication_lag:
+        while True:
+            with timescale.engine.connect() as connection:
+                lag = get_replication_lag(connection)
+            if lag <= max_replication_lag:
+                break
+            logger.info("Replication lag is %.1fs, waiting before deleting more listens", lag)
+            time.sleep(REPLICATION_LAG_WAIT)
+
+
+def process_listen_delete_job(job_id: int, batch_size: int = DEFAULT_BATCH_SIZE,
+                              max_rows_per_second: int = 0, max_replication_lag: float = 0):
+    """ Delete the listens of a job, resuming from its saved progress.
+
+        Args:
+            job_id: the id of the job
+            batch_size: the maximum number of listens deleted per transaction
+            max_rows_per_second: the maximum number of listens deleted per second, 0 for no limit
+            max_replication_lag: pause while the replication lag is above this many seconds, 0 to not check
+    """
+    job = get_listen_delete_job(job_id)
+    if job is None or job["completed"] is not None:
+        return
+
+    logger.info("Deleting the listens of %s in job %d", job["user_name"], job_id)
+    for start, end in _get_chunk_ranges(job):
+        while True:
+            t0 = time.monotonic()
+            deleted = _delete_batch(job_id, start, end, batch_size)
+            _throttle(deleted, time.monotonic() - t0, max_rows_per_second, max_replication_lag)
+            if deleted < batch_size:
+                break
+
+    _complete_job(job_id)
+
+
+def process_listen_delete_jobs(batch_size: int = DEFAULT_BATCH_SIZE,
+                               max_rows_per_second: int = 0, max_replication_lag: float = 0) -> int:
+    """ Process all pending listen deletion jobs, oldest first.
+
+        Returns:
+            the number of jobs processed
+    """
+    query = "SELECT id FROM listen_delete_job WHERE completed IS NULL ORDER BY id"
+    with timescale.engine.connect() as connection:
+        job_ids = [row["id"] for row in connection.execute(sqlalchemy.text(query))]
+
+    for job_id in job_ids:
+        process_listen_delete_job(job_id, batch_size, max_rows_per_second, max_replication_lag)
+    return len(job_ids)
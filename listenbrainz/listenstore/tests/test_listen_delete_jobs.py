@@ -0,0 +1,85 @@
+import logging
+from unittest.mock import patch
+
+import sqlalchemy
+
+from listenbrainz import config
+from listenbrainz.db import timescale as ts
+from listenbrainz.db.testing import TimescaleTestCase
+from listenbrainz.listenstore import listen_delete_jobs
+from listenbrainz.listenstore.tests.util import generate_data
+from listenbrainz.webserver.timescale_connection import init_timescale_connection
+
+# 86400 * 5 seconds apart, so that the listens of each batch are in a different chunk
+CHUNK_TIMESTAMPS = (1400000000, 1400432000, 1400864000)
+
+
+class ListenDeleteJobsTestCase(TimescaleTestCase):
+
+    def setUp(self):
+        super(ListenDeleteJobsTestCase, self).setUp()
+        self.logstore = init_timescale_connection(logging.getLogger(__name__), {
+            'REDIS_HOST': config.REDIS_HOST,
+            'REDIS_PORT': config.REDIS_PORT,
+            'REDIS_NAMESPACE': config.REDIS_NAMESPACE,
+            'SQLALCHEMY_TIMESCALE_URI': config.SQLALCHEMY_TIMESCALE_URI,
+        })
+        for ts_start in CHUNK_TIMESTAMPS:
+            self.logstore.insert(generate_data(1, "frank", ts_start, 20))
+            self.logstore.insert(generate_data(2, "kishore", ts_start, 5))
+
+    def count_listens(self, user_name):
+        with ts.engine.connect() as connection:
+            return connection.execute(sqlalchemy.text("SELECT count(*) FROM listen WHERE user_name = :user_name"),
+                                      user_name=user_name).fetchone()[0]
+
+    def test_delete_listens(self):
+        job_id = listen_delete_jobs.queue_listen_deletion("frank")
+        job = listen_delete_jobs.get_listen_delete_job(job_id)
+        self.assertEqual(job["min_listened_at"], CHUNK_TIMESTAMPS[0])
+        self.assertEqual(job["max_listened_at"], CHUNK_TIMESTAMPS[2] + 19)
+        self.assertIsNone(job["completed"])
+        # nothing is deleted until the job is processed
+        self.assertEqual(self.count_listens("frank"), 60)
+
+        self.assertEqual(listen_delete_jobs.process_listen_delete_jobs(batch_size=7), 1)
+
+        job = listen_delete_jobs.get_listen_delete_job(job_id)
+        self.assertIsNotNone(job["completed"])
+        self.assertEqual(job["deleted_count"], 60)
+        self.assertEqual(self.count_listens("frank"), 0)
+        self.assertEqual(self.count_listens("kishore"), 15)
+        self.assertEqual(self.logstore.get_listen_count_for_user("frank"), 0)
+        self.assertEqual(self.logstore.get_timestamps_for_user("frank"), (0, 0))
+        self.assertEqual(listen_delete_jobs.process_listen_delete_jobs(), 0)
+
+    def test_resume_job(self):
+        job_id = listen_delete_jobs.queue_listen_deletion("frank")
+        job = listen_delete_jobs.get_listen_delete_job(job_id)
+        start, end = listen_delete_jobs._get_chunk_ranges(job)[0]
+        self.assertEqual(listen_delete_jobs._delete_batch(job_id, start, end, 15), 15)
+        self.assertEqual(listen_delete_jobs._delete_batch(job_id, start, end, 15), 5)
+
+        # the job was interrupted after deleting the listens of the latest chunk
+        job = listen_delete_jobs.get_listen_delete_job(job_id)
+        self.assertEqual(job["deleted_count"], 20)
+        self.assertEqual(job["next_listened_at"], start)
+        self.assertEqual(self.logstore.get_listen_count_for_user("frank"), 40)
+
+        # listens submitted after the deletion was queued are kept
+        self.logstore.insert(generate_data(1, "frank", CHUNK_TIMESTAMPS[1] + 100, 2))
+
+        listen_delete_jobs.process_listen_delete_job(job_id, batch_size=15)
+        self.assertEqual(listen_delete_jobs.get_listen_delete_job(job_id)["deleted_count"], 60)
+        self.assertEqual(self.count_listens("frank"), 2)
+        self.assertEqual(self.logstore.get_listen_count_for_user("frank"), 2)
+        self.assertEqual(self.logstore.get_timestamps_for_user("frank"),
+                         (CHUNK_TIMESTAMPS[1] + 100, CHUNK_TIMESTAMPS[1] + 101))
+
+    @patch("listenbrainz.listenstore.listen_delete_jobs.REPLICATION_LAG_WAIT", 0)
+    def test_throttle(self):
+        with patch("listenbrainz.listenstore.listen_delete_jobs.get_replication_lag", side_effect=[60, 45, 5]) as lag, \
+                patch("listenbrainz.listenstore.listen_delete_jobs.time.sleep") as sleep:
+            listen_delete_jobs._throttle(1000, 0.5, max_rows_per_second=500, max_replication_lag=30)
+        self.assertEqual(lag.call_count, 3)
+        self.assertEqual(sleep.call_args_list[0][0][0], 1.5)
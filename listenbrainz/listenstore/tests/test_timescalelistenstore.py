@@ -23,6 +23,8 @@ from listenbrainz.webserver.timescale_connection import init_timescale_connectio
 from listenbrainz.db.dump import SchemaMismatchException
 from listenbrainz.listenstore import LISTENS_DUMP_SCHEMA_VERSION
 from listenbrainz.listenstore.timescale_listenstore import REDIS_USER_LISTEN_COUNT, REDIS_USER_TIMESTAMPS
+from listenbrainz.listenstore.timescale_utils import check_listen_user_metadata
+from listenbrainz.listenstore.timescale_compression import compress_listen_chunks
 from brainzutils import cache
 
 TIMESCALE_SQL_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', '..', 'admin', 'timescale')
@@ -438,8 +440,62 @@ class TestTimescaleListenStore(DatabaseTestCase):
 
         batch = generate_data(uid, testuser_name, int(time()), 1)
         self.logstore.insert(batch)
+        self.assertIsNone(cache.get(user_key, decode=False))
+        self.assertEqual(count + 1, self.logstore.get_listen_count_for_user(testuser_name))
         self.assertEqual(count + 1, int(cache.get(user_key, decode=False) or 0))
 
+    def _get_listen_user_metadata(self, user_name):
+        with ts.engine.connect() as connection:
+            row = connection.execute(sqlalchemy.text("""SELECT count, min_listened_at, max_listened_at
+                                                          FROM listen_user_metadata
+                                                         WHERE user_name = :user_name"""), user_name=user_name).fetchone()
+            return tuple(row) if row else None
+
+    def test_listen_user_metadata(self):
+        self._create_test_data(self.testuser_name)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (5, 1400000000, 1400000200))
+
+        # duplicates are not counted
+        self._create_test_data(self.testuser_name)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (5, 1400000000, 1400000200))
+
+        self.logstore.delete_listen(1400000200, self.testuser_name, "4269ddbc-9241-46da-935d-4fa9e0f7f371")
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (4, 1400000000, 1400000150))
+        self.assertEqual(self.logstore.get_timestamps_for_user(self.testuser_name), (1400000000, 1400000150))
+
+        self.logstore.delete(self.testuser_name)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (0, None, None))
+        self.assertEqual(self.logstore.get_listen_count_for_user(self.testuser_name), 0)
+        self.assertEqual(self.logstore.get_timestamps_for_user(self.testuser_name), (0, 0))
+
+    def test_reset_listen_count(self):
+        self._create_test_data(self.testuser_name)
+        with ts.engine.connect() as connection:
+            connection.execute(sqlalchemy.text("UPDATE listen_user_metadata SET count = 42, min_listened_at = 1"))
+        self.assertEqual(self.logstore.reset_listen_count(self.testuser_name), 5)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (5, 1400000000, 1400000200))
+
+    def test_check_listen_user_metadata(self):
+        uid = random.randint(2000, 1 << 31)
+        other_user_name = db_user.get_or_create(uid, "user_%d" % uid)["musicbrainz_id"]
+        self._create_test_data(self.testuser_name)
+        self._create_test_data(other_user_name)
+        with ts.engine.connect() as connection:
+            connection.execute(sqlalchemy.text("""UPDATE listen_user_metadata
+                                                     SET count = count + 3
+                                                       , last_updated = NOW() - INTERVAL '1 day'
+                                                   WHERE user_name = :user_name"""), user_name=self.testuser_name)
+            # a row updated while the check runs is left alone
+            connection.execute(sqlalchemy.text("UPDATE listen_user_metadata SET count = 42 WHERE user_name = :user_name"),
+                               user_name=other_user_name)
+
+        self.assertEqual(check_listen_user_metadata(dry_run=True), 1)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (8, 1400000000, 1400000200))
+
+        self.assertEqual(check_listen_user_metadata(), 1)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (5, 1400000000, 1400000200))
+        self.assertEqual(self._get_listen_user_metadata(other_user_name), (42, 1400000000, 1400000200))
+
     def test_delete_listens(self):
         uid = random.randint(2000, 1 << 31)
         testuser = db_user.get_or_create(uid, "user_%d" % uid)
@@ -483,6 +539,59 @@ class TestTimescaleListenStore(DatabaseTestCase):
         self.assertEqual(min_ts, 1400000000)
         self.assertEqual(max_ts, 1400000200)
 
+    def _compress_chunks(self):
+        with ts.engine.connect() as connection:
+            with connection.begin():
+                connection.execute(sqlalchemy.text("""SELECT compress_chunk(chunk, if_not_compressed => true)
+                                                        FROM show_chunks('listen') AS chunk"""))
+
+    def _count_compressed_chunks(self):
+        with ts.engine.connect() as connection:
+            return connection.execute(sqlalchemy.text("""SELECT count(*)
+                                                           FROM timescaledb_information.chunks
+                                                          WHERE hypertable_name = 'listen'
+                                                            AND is_compressed""")).fetchone()[0]
+
+    def test_write_to_compressed_chunks(self):
+        ts.run_sql_script_without_transaction(os.path.join(TIMESCALE_SQL_DIR, 'create_compression.sql'))
+        self._create_test_data(self.testuser_name)
+        self._compress_chunks()
+        self.assertEqual(self._count_compressed_chunks(), 1)
+
+        # the logstore doesn't know yet that the chunk was compressed, the insert is retried
+        self.logstore.insert(generate_data(self.testuser_id, self.testuser_name, 1400000101, 1))
+        self.assertEqual(self._count_compressed_chunks(), 0)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (6, 1400000000, 1400000200))
+
+        self._compress_chunks()
+        self.logstore.delete_listen(1400000050, self.testuser_name, "c7a41965-9f1e-456c-8b1d-27c0f0dde280")
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (5, 1400000000, 1400000200))
+
+        self.assertEqual(compress_listen_chunks(), 1)
+        self.assertEqual(self._count_compressed_chunks(), 1)
+        listens, _, _ = self.logstore.fetch_listens(user_name=self.testuser_name, to_ts=1400000300)
+        self.assertEqual([listen.ts_since_epoch for listen in listens],
+                         [1400000200, 1400000150, 1400000101, 1400000100, 1400000000])
+
+        self.logstore.delete(self.testuser_name)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (0, None, None))
+
+    def test_writes_without_listens_keep_chunks_compressed(self):
+        ts.run_sql_script_without_transaction(os.path.join(TIMESCALE_SQL_DIR, 'create_compression.sql'))
+        self._create_test_data(self.testuser_name)
+        self._compress_chunks()
+        self.assertEqual(self._count_compressed_chunks(), 1)
+
+        # a re-import of listens which are all there already
+        self.assertEqual(self._create_test_data(self.testuser_name), 5)
+        self.assertEqual(self._count_compressed_chunks(), 1)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (5, 1400000000, 1400000200))
+
+        # a listen which doesn't exist
+        self.logstore.delete_listen(1400000050, self.testuser_name, "2cfad207-3f55-4aec-8120-86cf66e34d59")
+        self.assertEqual(self._count_compressed_chunks(), 1)
+        self.assertEqual(self._get_listen_user_metadata(self.testuser_name), (5, 1400000000, 1400000200))
+
     def test_for_empty_timestamps(self):
         """
             Even if a user has no listens they should have the sentinel timestamps of 0,0 stored in the
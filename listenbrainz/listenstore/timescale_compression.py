@@ -0,0 +1,154 @@
+""" Writes to the compressed chunks of the listen hypertable.
+
+The chunks of the listen hypertable are compressed by a timescale policy once they are older
+than the compress_after of the policy (see admin/timescale/create_compression.sql). Timescale
+refuses to insert or delete rows in a compressed chunk, so the listenstore decompresses the
+chunks a write touches in the same transaction as the write, which keeps the compression policy
+from compressing them again before the write is committed. The decompressed chunks are
+compressed again by the next run of the policy, or by compress_listen_chunks.
+"""
+import logging
+from bisect import bisect_right
+from typing import Iterable, List, Set, Tuple
+
+import sqlalchemy
+from psycopg2.extras import execute_values
+
+from listenbrainz.db import timescale
+
+logger = logging.getLogger(__name__)
+
+# Decompress the compressed chunks which contain any of the given timestamps
+DECOMPRESS_CHUNKS_QUERY = """
+    SELECT decompress_chunk((quote_ident(chunk_schema) || '.' || quote_ident(chunk_name))::regclass, if_compressed => true)
+      FROM timescaledb_information.chunks
+     WHERE hypertable_name = 'listen'
+       AND is_compressed
+       AND EXISTS(SELECT 1
+                    FROM unnest(%(timestamps)s::BIGINT[]) AS t(listened_at)
+                   WHERE listened_at >= range_start_integer
+                     AND listened_at < range_end_integer)
+"""
+
+# Decompress the compressed chunks which overlap the [start, end) range of timestamps
+DECOMPRESS_CHUNKS_IN_RANGE_QUERY = """
+    SELECT decompress_chunk((quote_ident(chunk_schema) || '.' || quote_ident(chunk_name))::regclass, if_compressed => true)
+      FROM timescaledb_information.chunks
+     WHERE hypertable_name = 'listen'
+       AND is_compressed
+       AND range_start_integer < %(end)s
+       AND range_end_integer > %(start)s
+"""
+
+# The keys of the given listens which are already in the listen hypertable, compressed chunks are
+# read without decompressing them
+EXISTING_LISTENS_QUERY = """
+    SELECT listened_at, track_name, user_name
+      FROM listen
+     WHERE (listened_at, track_name, user_name) IN (VALUES %s)
+"""
+
+COMPRESSED_RANGES_QUERY = """
+    SELECT range_start_integer, range_end_integer
+      FROM timescaledb_information.chunks
+     WHERE hypertable_name = 'listen'
+       AND is_compressed
+  ORDER BY range_start_integer
+"""
+
+
+def decompress_chunks(cursor, timestamps: Iterable[int]) -> int:
+    """ Decompress the compressed chunks of the listen hypertable which contain any of the given
+        timestamps, so that listens with these timestamps can be inserted or deleted.
+
+        Args:
+            cursor: a psycopg2 cursor, the chunks remain locked until its transaction ends
+            timestamps: the listened_at of the listens to be written
+
+        Returns:
+            the number of chunks decompressed
+    """
+    cursor.execute(DECOMPRESS_CHUNKS_QUERY, {"timestamps": sorted(set(timestamps))})
+    decompressed = cursor.rowcount
+    if decompressed:
+        logger.info("Decompressed %d listen chunks to write to them", decompressed)
+    return decompressed
+
+
+def decompress_chunks_in_range(cursor, start: int, end: int) -> int:
+    """ Decompress the compressed chunks of the listen hypertable which overlap the [start, end)
+        range of listened_at.
+
+        Returns:
+            the number of chunks decompressed
+    """
+    cursor.execute(DECOMPRESS_CHUNKS_IN_RANGE_QUERY, {"start": start, "end": end})
+    decompressed = cursor.rowcount
+    if decompressed:
+        logger.info("Decompressed %d listen chunks to write to them", decompressed)
+    return decompressed
+
+
+def find_existing_listens(cursor, keys: Iterable[Tuple[int, str, str]]) -> Set[Tuple[int, str, str]]:
+    """ Returns the (listened_at, track_name, user_name) keys out of the given ones of the listens
+        which are already in the listen hypertable. """
+    rows = execute_values(cursor, EXISTING_LISTENS_QUERY, list(keys), template=None, fetch=True)
+    return {(listened_at, track_name, user_name) for listened_at, track_name, user_name in rows}
+
+
+def get_compressed_ranges(cursor) -> List[Tuple[int, int]]:
+    """ Returns the [start, end) ranges of listened_at of the compressed chunks of the listen
+        hypertable, in ascending order. """
+    cursor.execute(COMPRESSED_RANGES_QUERY)
+    return [(start, end) for start, end in cursor.fetchall()]
+
+
+def find_ranges(ranges: List[Tuple[int, int]], timestamps: Iterable[int]) -> List[Tuple[int, int]]:
+    """ Returns the ranges in which any of the timestamps falls, out of the given [start, end) ranges,
+        which must be sorted and must not overlap, as returned by get_compressed_ranges. """
+    if not ranges:
+        return []
+    starts = [start for start, _ in ranges]
+    found = set()
+    for ts in timestamps:
+        i = bisect_right(starts, ts) - 1
+        if i >= 0 and ts < ranges[i][1]:
+            found.add(ranges[i])
+    return sorted(found)
+
+
+def compress_listen_chunks() -> int:
+    """ Compress the uncompressed chunks of the listen hypertable which the compression policy
+        would compress, such as the chunks which were decompressed to write to them. Each chunk
+        is compressed in its own transaction, so that writes are blocked for one chunk at a time.
+
+        Returns:
+            the number of chunks compressed
+    """
+    policy_query = """SELECT (config->>'compress_after')::BIGINT AS compress_after
+                        FROM timescaledb_information.jobs
+                       WHERE proc_name = 'policy_compression'
+                         AND hypertable_name = 'listen'"""
+    chunks_query = """SELECT chunk::TEXT AS chunk
+                        FROM show_chunks('listen', older_than => unix_now() - :compress_after) AS chunk
+                       WHERE NOT EXISTS(SELECT 1
+                                          FROM timescaledb_information.chunks
+                                         WHERE hypertable_name = 'listen'
+                                           AND is_compressed
+                                           AND (quote_ident(chunk_schema) || '.' || quote_ident(chunk_name))::regclass = chunk)"""
+    with timescale.engine.connect() as connection:
+        policy = connection.execute(sqlalchemy.text(policy_query)).fetchone()
+        if policy is None:
+            logger.info("The listen hypertable has no compression policy, not compressing any chunks")
+            return 0
+        chunks = [row["chunk"] for row in connection.execute(sqlalchemy.text(chunks_query),
+                                                             compress_after=policy["compress_after"])]
+
+    for chunk in chunks:
+        with timescale.engine.connect() as connection:
+            with connection.begin():
+                connection.execute(sqlalchemy.text("SELECT compress_chunk(CAST(:chunk AS regclass), if_not_compressed => true)"),
+                                   chunk=chunk)
+    logger.info("Compressed %d listen chunks", len(chunks))
+    return len(chunks)
+
@@ -7,14 +7,13 @@ import tempfile
 import time
 import shutil
 import uuid
-from collections import defaultdict
 from datetime import datetime, timedelta
 import ujson
 import psycopg2
 import psycopg2.sql
 from psycopg2.extras import execute_values
-from psycopg2.errors import UntranslatableCharacter
-from typing import List
+from psycopg2.errors import FeatureNotSupported, UntranslatableCharacter
+from typing import List, Optional, Tuple
 import sqlalchemy
 import pandas as pd
 import pyarrow as pa
@@ -22,20 +21,27 @@ import pyarrow.parquet as pq
 
 from brainzutils import cache
 
-from listenbrainz.db import timescale
+from listenbrainz.db import replica, timescale
 from listenbrainz import DUMP_LICENSE_FILE_PATH
 from listenbrainz.db import DUMP_DEFAULT_THREAD_COUNT
 from listenbrainz.db.dump import SchemaMismatchException
-from listenbrainz.listen import Listen
+from listenbrainz.db.dump_checksum import hashed_archive, pxz_compressed_archive
+from listenbrainz.listen import Listen, timescale_row_to_api
 from listenbrainz.listenstore import ListenStore
 from listenbrainz.listenstore import ORDER_ASC, ORDER_TEXT, LISTENS_DUMP_SCHEMA_VERSION
+from listenbrainz.listenstore import timescale_compression
 from listenbrainz.utils import create_path, init_cache
 
 # Append the user name for both of these keys
 REDIS_USER_LISTEN_COUNT = "lc."
 REDIS_USER_TIMESTAMPS = "ts."
 REDIS_TOTAL_LISTEN_COUNT = "lc-total"
-REDIS_POST_IMPORT_LISTEN_COUNT_EXPIRY = 86400  # 24 hours
+# The listen counts and timestamps of users are removed from the cache when they change, the
+# expiry only limits how long a value cached while a change was being committed is kept
+REDIS_USER_LISTEN_METADATA_EXPIRY = 3600  # 1 hour
+
+# How long the listened_at ranges of the compressed chunks are kept before they are looked up again
+COMPRESSED_RANGES_CACHE_TIME = 60  # in s
 
 DUMP_CHUNK_SIZE = 100000
 NUMBER_OF_USERS_PER_DIRECTORY = 1000
@@ -74,154 +80,115 @@ class TimescaleListenStore(ListenStore):
                    namespace=conf['REDIS_NAMESPACE'])
         self.dump_temp_dir_root = conf.get(
             'LISTEN_DUMP_TEMP_DIR_ROOT', tempfile.mkdtemp())
+        self._compressed_ranges = []
+        self._compressed_ranges_expiry = 0
 
     def set_empty_cache_values_for_user(self, user_name):
         """When a user is created, set the listen_count and timestamp keys so that we
-           can avoid the expensive lookup for a brand new user."""
+           can avoid the lookup for a brand new user."""
+
+        cache.set(REDIS_USER_LISTEN_COUNT + user_name, 0, expirein=REDIS_USER_LISTEN_METADATA_EXPIRY, encode=False)
+        cache.set(REDIS_USER_TIMESTAMPS + user_name, "0,0", expirein=REDIS_USER_LISTEN_METADATA_EXPIRY)
+
+    def _invalidate_cached_metadata(self, user_names):
+        """ Remove the cached listen counts and timestamps of the given users, after their rows
+            in listen_user_metadata were changed. """
+        keys = []
+        for user_name in user_names:
+            keys.append(REDIS_USER_LISTEN_COUNT + user_name)
+            keys.append(REDIS_USER_TIMESTAMPS + user_name)
+        if keys:
+            cache.delete_many(keys)
+
+    def _fetch_metadata_for_user(self, user_name):
+        """ Read the listen count and timestamps of a user from listen_user_metadata and cache them.
+
+            Returns:
+                a tuple of the listen count, min and max listened_at of the user. The timestamps are 0
+                if the user has no listens.
+        """
+        query = """SELECT count, min_listened_at, max_listened_at
+                     FROM listen_user_metadata
+                    WHERE user_name = :user_name"""
+        try:
+            with timescale.engine.connect() as connection:
+                row = connection.execute(sqlalchemy.text(query), user_name=user_name).fetchone()
+        except psycopg2.OperationalError as e:
+            self.log.error("Cannot query listen_user_metadata: %s" % str(e), exc_info=True)
+            raise
 
-        cache.set(REDIS_USER_LISTEN_COUNT + user_name, 0, expirein=0, encode=False)
-        cache.set(REDIS_USER_TIMESTAMPS + user_name, "0,0", expirein=0)
+        count, min_ts, max_ts = (row["count"], row["min_listened_at"] or 0, row["max_listened_at"] or 0) if row else (0, 0, 0)
+        cache.set(REDIS_USER_LISTEN_COUNT + user_name, count, expirein=REDIS_USER_LISTEN_METADATA_EXPIRY, encode=False)
+        cache.set(REDIS_USER_TIMESTAMPS + user_name, "%d,%d" % (min_ts, max_ts), expirein=REDIS_USER_LISTEN_METADATA_EXPIRY)
+        return count, min_ts, max_ts
 
     def get_listen_count_for_user(self, user_name):
         """Get the total number of listens for a user. The number of listens comes from
-           brainzutils cache unless an exact number is asked for.
+           brainzutils cache, which is filled from the listen_user_metadata table.
 
         Args:
             user_name: the user to get listens for
         """
 
         count = cache.get(REDIS_USER_LISTEN_COUNT + user_name, decode=False)
-        # count < 0, yeah that's possible. when a user imports from last.fm,
-        # we call set_listen_count_expiry_for_user to set a TTL on the count.
-        # the intent is that when the key expires and the listen counts will
-        # be recalculated and put into redis again. the issue is that listen
-        # counts are only calculated when the listen-count api endpoint is
-        # called. So imagine this, I do a last.fm import at 13:00 on 2021-10-23.
-        # The key expires at 13:00 on 2021-10-24. From this moment, redis has no
-        # key for my listens. Then, I delete a listen using the API at say 13:05.
-        # The listen is deleted and the listenstore tries to decrement the listen
-        # count but hey redis has no key. So what does it do, it creates one with
-        # a value of 0 and decrements that. Voila, we have the key with a negative
-        # value.
-        # Note that the check is still incomplete. If instead of deleting, one had
-        # inserted a listen. redis would create a key with value 0 and increment it
-        # by 1. only now we don't have a way to detect this.
-        if count is None or int(count) < 0:
-            return self.reset_listen_count(user_name)
-        else:
-            return int(count)
+        if count is None:
+            count, _, _ = self._fetch_metadata_for_user(user_name)
+        return int(count)
 
     def reset_listen_count(self, user_name):
-        """ Reset the listen count of a user from cache and put in a new calculated value.
-            returns the re-calculated listen count.
+        """ Recalculate the listen count and timestamps of a user from the listen table, and
+            store them in listen_user_metadata. Returns the re-calculated listen count.
 
             Args:
                 user_name: the musicbrainz id of user whose listen count needs to be reset
         """
-        query = "SELECT SUM(count) FROM listen_count_30day WHERE user_name = :user_name"
+        # lock the row of the user first, so that listens inserted or deleted meanwhile
+        # update the row after it has been recalculated
+        lock_query = """INSERT INTO listen_user_metadata (user_name, count)
+                             VALUES (:user_name, 0)
+                        ON CONFLICT (user_name)
+                          DO UPDATE SET last_updated = NOW()"""
+        query = """UPDATE listen_user_metadata
+                      SET count = stats.count
+                        , min_listened_at = stats.min_listened_at
+                        , max_listened_at = stats.max_listened_at
+                        , last_updated = NOW()
+                     FROM (SELECT count(*) AS count
+                                , min(listened_at) AS min_listened_at
+                                , max(listened_at) AS max_listened_at
+                             FROM listen
+                            WHERE user_name = :user_name) AS stats
+                    WHERE user_name = :user_name
+                RETURNING listen_user_metadata.count"""
         t0 = time.monotonic()
         try:
             with timescale.engine.connect() as connection:
-                result = connection.execute(sqlalchemy.text(query), {
-                    "user_name": user_name,
-                })
-                count = int(result.fetchone()[0] or 0)
-
+                with connection.begin():
+                    connection.execute(sqlalchemy.text(lock_query), user_name=user_name)
+                    count = connection.execute(sqlalchemy.text(query), user_name=user_name).fetchone()["count"]
         except psycopg2.OperationalError as e:
-            self.log.error("Cannot query timescale listen_count: %s" %
+            self.log.error("Cannot recalculate listen_user_metadata: %s" %
                            str(e), exc_info=True)
             raise
 
         # intended for production monitoring
         self.log.info("listen counts %s %.2fs" % (user_name, time.monotonic() - t0))
-        # put this value into brainzutils cache without an expiry time
-        cache.set(REDIS_USER_LISTEN_COUNT + user_name,
-                  count, expirein=0, encode=False)
+        self._invalidate_cached_metadata([user_name])
         return count
 
-    def set_listen_count_expiry_for_user(self, user_name):
-        """ Set an expire time for the listen count cache item. This is called after
-            a bulk import which allows for timescale continuous aggregates to catch up
-            to listen counts. Once the key expires, the correct value can be calculated
-            from the aggregate.
-
-            Args:
-                user_name: the musicbrainz id of user whose listen count needs an expiry time
-        """
-        cache._r.expire(cache._prep_key(REDIS_USER_LISTEN_COUNT + user_name), REDIS_POST_IMPORT_LISTEN_COUNT_EXPIRY)
-
-    def update_timestamps_for_user(self, user_name, min_ts, max_ts):
-        """
-            If any code adds/removes listens it should update the timestamps for the user
-            using this function, so that they values in redis are always current.
-
-            If the given timestamps represent a new min or max value, these values will be
-            saved in the cache, otherwise the user timestamps remain unchanged.
-        """
-
-        cached_min_ts, cached_max_ts = self.get_timestamps_for_user(user_name)
-        if min_ts < cached_min_ts or max_ts > cached_max_ts:
-            if min_ts < cached_min_ts:
-                cached_min_ts = min_ts
-            if max_ts > cached_max_ts:
-                cached_max_ts = max_ts
-            cache.set(REDIS_USER_TIMESTAMPS + user_name, "%d,%d" %
-                      (cached_min_ts, cached_max_ts), expirein=0)
-
     def get_timestamps_for_user(self, user_name):
-        """ Return the max_ts and min_ts for a given user and cache the result in brainzutils cache
+        """ Return the min_ts and max_ts for a given user. They come from brainzutils cache,
+            which is filled from the listen_user_metadata table.
         """
 
         tss = cache.get(REDIS_USER_TIMESTAMPS + user_name)
         if tss:
             (min_ts, max_ts) = tss.split(",")
-            min_ts = int(min_ts)
-            max_ts = int(max_ts)
-        else:
-            t0 = time.monotonic()
-            min_ts = self._select_single_timestamp(True, user_name)
-            max_ts = self._select_single_timestamp(False, user_name)
-            cache.set(REDIS_USER_TIMESTAMPS + user_name, "%d,%d" % (min_ts, max_ts), expirein=0)
-            # intended for production monitoring
-            self.log.info("timestamps %s %.2fs" % (user_name, time.monotonic() - t0))
+            return int(min_ts), int(max_ts)
 
+        _, min_ts, max_ts = self._fetch_metadata_for_user(user_name)
         return min_ts, max_ts
 
-    def _select_single_timestamp(self, select_min_timestamp, user_name):
-        """ Fetch a single timestamp (min or max) from the listenstore for a given user.
-
-            Args:
-                select_min_timestamp: boolean. Select the min timestamp if true, max if false.
-                user_name: the user for whom to fetch the timestamp.
-
-            Returns:
-
-                The selected timestamp for the user or 0 if no timestamp was found.
-        """
-
-        function = "max"
-        if select_min_timestamp:
-            function = "min"
-
-        query = """SELECT %s(listened_at) AS ts
-                     FROM listen
-                     WHERE user_name = :user_name""" % function
-        try:
-            with timescale.engine.connect() as connection:
-                result = connection.execute(sqlalchemy.text(query), {
-                    "user_name": user_name
-                })
-                row = result.fetchone()
-                if row is None or row['ts'] is None:
-                    return 0
-
-                return row['ts']
-
-        except psycopg2.OperationalError as e:
-            self.log.error("Cannot fetch min/max timestamp: %s" %
-                           str(e), exc_info=True)
-            raise
-
     def get_total_listen_count(self, cache_value=True):
         """ Returns the total number of listens stored in the ListenStore.
             First checks the brainzutils cache for the value, if not present there
@@ -248,62 +215,102 @@ class TimescaleListenStore(ListenStore):
             cache.set(REDIS_TOTAL_LISTEN_COUNT, count, expirein=0)
         return count
 
+    def _get_compressed_ranges(self, curs, refresh=False):
+        """ Return the listened_at ranges of the compressed chunks of the listen table, which are
+            looked up at most every COMPRESSED_RANGES_CACHE_TIME seconds unless refresh is set. """
+        if refresh or time.monotonic() >= self._compressed_ranges_expiry:
+            self._compressed_ranges = timescale_compression.get_compressed_ranges(curs)
+            self._compressed_ranges_expiry = time.monotonic() + COMPRESSED_RANGES_CACHE_TIME
+        return self._compressed_ranges
+
+    def _insert_listens(self, conn, submit, refresh_compressed_ranges=False):
+        """ Insert the listens and update the metadata of their users, without committing.
+
+            Returns:
+                a tuple of the inserted rows and a dict of the user metadata rows by user name
+        """
+        query = """INSERT INTO listen (listened_at, track_name, user_name, data)
+                        VALUES %s
+                   ON CONFLICT (listened_at, track_name, user_name)
+                    DO NOTHING
+                     RETURNING listened_at, track_name, user_name"""
+
+        # the counts and timestamps of the users are updated in the same transaction as the
+        # listens are inserted, so that they can't drift apart
+        metadata_query = """INSERT INTO listen_user_metadata AS m (user_name, count, min_listened_at, max_listened_at)
+                                 VALUES %s
+                            ON CONFLICT (user_name)
+                              DO UPDATE SET count = m.count + EXCLUDED.count
+                                          , min_listened_at = LEAST(m.min_listened_at, EXCLUDED.min_listened_at)
+                                          , max_listened_at = GREATEST(m.max_listened_at, EXCLUDED.max_listened_at)
+                                          , last_updated = NOW()"""
+
+        with conn.cursor() as curs:
+            # late and backfilled listens may belong in compressed chunks, which have to be decompressed first
+            compressed_ranges = self._get_compressed_ranges(curs, refresh_compressed_ranges)
+            ranges = timescale_compression.find_ranges(compressed_ranges, (row[0] for row in submit))
+            if ranges:
+                # the listens which are already there would be skipped by the insert anyway, drop them
+                # first so that batches of duplicates, such as re-imports, don't decompress chunks
+                existing = timescale_compression.find_existing_listens(curs, (row[:3] for row in submit))
+                if existing:
+                    submit = [row for row in submit if row[:3] not in existing]
+                    ranges = timescale_compression.find_ranges(ranges, (row[0] for row in submit))
+            if ranges:
+                timescale_compression.decompress_chunks(curs, [start for start, _ in ranges])
+                self._compressed_ranges = [r for r in compressed_ranges if r not in ranges]
+
+            inserted_rows = execute_values(curs, query, submit, template=None, fetch=True) if submit else []
+
+            user_metadata = {}
+            for ts, _, user_name in inserted_rows:
+                if user_name in user_metadata:
+                    metadata = user_metadata[user_name]
+                    metadata[1] += 1
+                    metadata[2] = min(metadata[2], ts)
+                    metadata[3] = max(metadata[3], ts)
+                else:
+                    user_metadata[user_name] = [user_name, 1, ts, ts]
+
+            # update the rows in a fixed order to avoid deadlocks between concurrent inserts
+            if user_metadata:
+                execute_values(curs, metadata_query, sorted(user_metadata.values()), template=None)
+
+        return inserted_rows, user_metadata
+
     def insert(self, listens):
         """
             Insert a batch of listens. Returns a list of (listened_at, track_name, user_name) that indicates
             which rows were inserted into the DB. If the row is not listed in the return values, it was a duplicate.
+
+            The compressed chunks in which new listens of the batch belong are decompressed first.
         """
 
         submit = []
         for listen in listens:
             submit.append(listen.to_timescale())
 
-        query = """INSERT INTO listen (listened_at, track_name, user_name, data)
-                        VALUES %s
-                   ON CONFLICT (listened_at, track_name, user_name)
-                    DO NOTHING
-                     RETURNING listened_at, track_name, user_name"""
-
-        inserted_rows = []
         conn = timescale.engine.raw_connection()
-        with conn.cursor() as curs:
+        try:
             try:
-                execute_values(curs, query, submit, template=None)
-                while True:
-                    result = curs.fetchone()
-                    if not result:
-                        break
-                    inserted_rows.append((result[0], result[1], result[2]))
+                try:
+                    inserted_rows, user_metadata = self._insert_listens(conn, submit)
+                except FeatureNotSupported:
+                    # a chunk was compressed since the compressed chunks were looked up
+                    conn.rollback()
+                    inserted_rows, user_metadata = self._insert_listens(conn, submit, refresh_compressed_ranges=True)
             except UntranslatableCharacter:
                 conn.rollback()
                 return
+            conn.commit()
+        finally:
+            conn.close()
 
-        conn.commit()
-
-        # update the listen counts and timestamps for the users
-        user_timestamps = {}
-        user_counts = defaultdict(int)
-        for ts, _, user_name in inserted_rows:
-            if user_name in user_timestamps:
-                if ts < user_timestamps[user_name][0]:
-                    user_timestamps[user_name][0] = ts
-                if ts > user_timestamps[user_name][1]:
-                    user_timestamps[user_name][1] = ts
-            else:
-                user_timestamps[user_name] = [ts, ts]
-
-            user_counts[user_name] += 1
-
-        for user_name in user_counts:
-            cache.increment(REDIS_USER_LISTEN_COUNT + user_name, amount=user_counts[user_name])
+        self._invalidate_cached_metadata(user_metadata.keys())
 
-        for user in user_timestamps:
-            self.update_timestamps_for_user(
-                user, user_timestamps[user][0], user_timestamps[user][1])
+        return [tuple(row) for row in inserted_rows]
 
-        return inserted_rows
-
-    def fetch_listens_from_storage(self, user_name, from_ts, to_ts, limit, order):
+    def fetch_listens_from_storage(self, user_name, from_ts, to_ts, limit, order, as_api=False):
         """ The timestamps are stored as UTC in the postgres datebase while on retrieving
             the value they are converted to the local server's timezone. So to compare
             datetime object we need to create a object in the same timezone as the server.
@@ -315,11 +322,13 @@ class TimescaleListenStore(ListenStore):
             to_ts: seconds since epoch, in float
             limit: the maximum number of items to return
             order: 0 for ASCending order, 1 for DESCending order
+            as_api: return the listens in the format of the api instead of as Listen objects
         """
 
-        return self.fetch_listens_for_multiple_users_from_storage([user_name], from_ts, to_ts, limit, order)
+        return self.fetch_listens_for_multiple_users_from_storage([user_name], from_ts, to_ts, limit, order, as_api)
 
-    def fetch_listens_for_multiple_users_from_storage(self, user_names: List[str], from_ts: float, to_ts: float, limit: int, order: int):
+    def fetch_listens_for_multiple_users_from_storage(self, user_names: List[str], from_ts: float, to_ts: float, limit: int, order: int,
+                                                      as_api: bool = False):
         """ The timestamps are stored as UTC in the postgres datebase while on retrieving
             the value they are converted to the local server's timezone. So to compare
             datetime object we need to create a object in the same timezone as the server.
@@ -331,6 +340,7 @@ class TimescaleListenStore(ListenStore):
             to_ts: seconds since epoch, in float
             limit: the maximum number of items to return
             order: 0 for DESCending order, 1 for ASCending order
+            as_api: return the listens in the format of the api instead of as Listen objects
         """
 
         min_user_ts = max_user_ts = None
@@ -369,9 +379,10 @@ class TimescaleListenStore(ListenStore):
             to_dynamic = False
             from_dynamic = True
 
+        make_listen = timescale_row_to_api if as_api else Listen.from_timescale
         listens = []
         done = False
-        with timescale.engine.connect() as connection:
+        with replica.read_connection(timescale, users=user_names) as connection:
             t0 = time.monotonic()
 
             passes = 0
@@ -412,7 +423,7 @@ class TimescaleListenStore(ListenStore):
 
                         break
 
-                    listens.append(Listen.from_timescale(*result))
+                    listens.append(make_listen(*result))
                     if len(listens) == limit:
                         done = True
                         break
@@ -430,13 +441,14 @@ class TimescaleListenStore(ListenStore):
 
         return (listens, min_user_ts, max_user_ts)
 
-    def fetch_recent_listens_for_users(self, user_list, limit=2, max_age=3600):
+    def fetch_recent_listens_for_users(self, user_list, limit=2, max_age=3600, as_api=False):
         """ Fetch recent listens for a list of users, given a limit which applies per user. If you
             have a limit of 3 and 3 users you should get 9 listens if they are available.
 
             user_list: A list containing the users for which you'd like to retrieve recent listens.
             limit: the maximum number of listens for each user to fetch.
             max_age: Only return listens if they are no more than max_age seconds old. Default 3600 seconds
+            as_api: return the listens in the format of the api instead of as Listen objects
         """
 
         args = {'user_list': tuple(user_list), 'ts': int(
@@ -455,18 +467,58 @@ class TimescaleListenStore(ListenStore):
                             ORDER BY listened_at DESC) tmp
                                WHERE rownum <= :limit"""
 
+        make_listen = timescale_row_to_api if as_api else Listen.from_timescale
         listens = []
-        with timescale.engine.connect() as connection:
+        with replica.read_connection(timescale, users=user_list) as connection:
             curs = connection.execute(sqlalchemy.text(query), args)
             while True:
                 result = curs.fetchone()
                 if not result:
                     break
 
-                listens.append(Listen.from_timescale(*result[0:8]))
+                listens.append(make_listen(*result[0:8]))
 
         return listens
 
+    def fetch_listens_for_feed(self, user_names: List[str], min_ts: int, max_ts: int, count: int,
+                               per_user: int, before: Optional[Tuple[str, str]] = None):
+        """ Fetch a page of the listens of the given users for their followers' feed, in the api format,
+            ordered by listened_at, user_name and track_name, all descending.
+
+            user_names: the users whose listens are fetched
+            min_ts: only return listens listened after this timestamp
+            max_ts: only return listens listened before this timestamp
+            count: the maximum number of listens to return
+            per_user: the maximum number of listens of each user to return
+            before: if given, a (user_name, track_name) tuple, the listens listened at max_ts which
+                come after it in the order of the page are returned too
+        """
+        before_user_name, before_track_name = before or (None, None)
+        query = """SELECT l.listened_at, l.track_name, l.user_name, l.created, l.data, mm.recording_mbid, m.release_mbid, m.artist_mbids
+                     FROM unnest(CAST(:user_names AS TEXT[])) AS u(user_name)
+               CROSS JOIN LATERAL (
+                           SELECT listened_at, track_name, user_name, created, data
+                             FROM listen
+                            WHERE listen.user_name = u.user_name
+                              AND listened_at > :min_ts
+                              AND (listened_at < :max_ts
+                                   OR (listened_at = :max_ts AND (listen.user_name, track_name) < (:before_user_name, :before_track_name)))
+                         ORDER BY listened_at DESC, track_name DESC
+                            LIMIT :per_user
+                          ) l
+                LEFT JOIN mbid_mapping mm
+                       ON (l.data->'track_metadata'->'additional_info'->>'recording_msid')::uuid = mm.recording_msid
+                LEFT JOIN mbid_mapping_metadata m
+                       ON mm.recording_mbid = m.recording_mbid
+                 ORDER BY l.listened_at DESC, l.user_name DESC, l.track_name DESC
+                    LIMIT :count"""
+
+        with replica.read_connection(timescale, users=user_names) as connection:
+            result = connection.execute(sqlalchemy.text(query), user_names=list(user_names), min_ts=min_ts,
+                                        max_ts=max_ts, before_user_name=before_user_name,
+                                        before_track_name=before_track_name, per_user=per_user, count=count)
+            return [timescale_row_to_api(*row) for row in result.fetchall()]
+
     def get_listens_query_for_dump(self, start_time, end_time):
         """
             Get a query and its args dict to select a batch for listens for the full dump.
@@ -668,14 +720,9 @@ class TimescaleListenStore(ListenStore):
             archive_name = '{}-incremental'.format(archive_name)
         archive_path = os.path.join(
             location, '{filename}.tar.xz'.format(filename=archive_name))
-        with open(archive_path, 'w') as archive:
+        with pxz_compressed_archive(archive_path, threads) as archive:
 
-            pxz_command = ['pxz', '--compress',
-                           '-T{threads}'.format(threads=threads)]
-            pxz = subprocess.Popen(
-                pxz_command, stdin=subprocess.PIPE, stdout=archive)
-
-            with tarfile.open(fileobj=pxz.stdin, mode='w|') as tar:
+            with tarfile.open(fileobj=archive, mode='w|') as tar:
 
                 temp_dir = os.path.join(
                     self.dump_temp_dir_root, str(uuid.uuid4()))
@@ -690,9 +737,6 @@ class TimescaleListenStore(ListenStore):
                 # remove the temporary directory
                 shutil.rmtree(temp_dir)
 
-            pxz.stdin.close()
-
-        pxz.wait()
         self.log.info('ListenBrainz listen dump done!')
         self.log.info('Dump present at %s!', archive_path)
         return archive_path
@@ -883,7 +927,7 @@ class TimescaleListenStore(ListenStore):
             location, '{filename}.tar'.format(filename=archive_name))
 
         parquet_index = 0
-        with tarfile.open(archive_path, "w") as tar:
+        with hashed_archive(archive_path) as archive, tarfile.open(fileobj=archive, mode="w") as tar:
 
             temp_dir = os.path.join(self.dump_temp_dir_root, str(uuid.uuid4()))
             create_path(temp_dir)
@@ -985,6 +1029,10 @@ class TimescaleListenStore(ListenStore):
         self.log.info('Import of listens from dump %s done!', archive_path)
         pxz.stdout.close()
 
+        # the listens of the dump were inserted into old chunks, which are compressed again here
+        # rather than by the next runs of the compression policy
+        timescale_compression.compress_listen_chunks()
+
         return total_imported
 
     def delete(self, musicbrainz_id):
@@ -998,16 +1046,31 @@ class TimescaleListenStore(ListenStore):
         Raises: Exception if unable to delete the user in 5 retries
         """
 
-        self.set_empty_cache_values_for_user(musicbrainz_id)
         args = {'user_name': musicbrainz_id}
         query = "DELETE FROM listen WHERE user_name = :user_name"
+        metadata_query = """INSERT INTO listen_user_metadata (user_name, count)
+                                 VALUES (:user_name, 0)
+                            ON CONFLICT (user_name)
+                              DO UPDATE SET count = 0
+                                          , min_listened_at = NULL
+                                          , max_listened_at = NULL
+                                          , last_updated = NOW()"""
+
+        range_query = "SELECT min(listened_at) AS min_ts, max(listened_at) AS max_ts FROM listen WHERE user_name = :user_name"
 
         try:
             with timescale.engine.connect() as connection:
-                connection.execute(sqlalchemy.text(query), args)
+                with connection.begin():
+                    user_range = connection.execute(sqlalchemy.text(range_query), args).fetchone()
+                    if user_range["min_ts"] is not None:
+                        with connection.connection.cursor() as curs:
+                            timescale_compression.decompress_chunks_in_range(curs, user_range["min_ts"], user_range["max_ts"] + 1)
+                    connection.execute(sqlalchemy.text(query), args)
+                    connection.execute(sqlalchemy.text(metadata_query), args)
         except psycopg2.OperationalError as e:
             self.log.error("Cannot delete listens for user: %s" % str(e))
             raise
+        self._invalidate_cached_metadata([musicbrainz_id])
 
     def delete_listen(self, listened_at: int, user_name: str, recording_msid: str):
         """ Delete a particular listen for user with specified MusicBrainz ID.
@@ -1015,24 +1078,50 @@ class TimescaleListenStore(ListenStore):
             listened_at: The timestamp of the listen
             user_name: the username of the user
             recording_msid: the MessyBrainz ID of the recording
+        The chunk of the listen is decompressed first if it is compressed and the listen exists.
         Raises: TimescaleListenStoreException if unable to delete the listen
         """
 
         args = {'listened_at': listened_at, 'user_name': user_name,
                 'recording_msid': recording_msid}
-        query = """DELETE FROM listen
-                    WHERE listened_at = :listened_at
-                      AND user_name = :user_name
-                      AND data -> 'track_metadata' -> 'additional_info' ->> 'recording_msid' = :recording_msid """
+        where_clause = """ WHERE listened_at = :listened_at
+                             AND user_name = :user_name
+                             AND data -> 'track_metadata' -> 'additional_info' ->> 'recording_msid' = :recording_msid"""
+        exists_query = "SELECT 1 FROM listen" + where_clause
+        query = "DELETE FROM listen" + where_clause
+        # the timestamps only need to be looked up again if the first or last listen was deleted
+        metadata_query = """UPDATE listen_user_metadata
+                               SET count = count - :count
+                                 , min_listened_at = CASE WHEN min_listened_at = :listened_at
+                                                          THEN (SELECT min(listened_at) FROM listen WHERE user_name = :user_name)
+                                                          ELSE min_listened_at END
+                                 , max_listened_at = CASE WHEN max_listened_at = :listened_at
+                                                          THEN (SELECT max(listened_at) FROM listen WHERE user_name = :user_name)
+                                                          ELSE max_listened_at END
+                                 , last_updated = NOW()
+                             WHERE user_name = :user_name"""
 
         try:
             with timescale.engine.connect() as connection:
-                connection.execute(sqlalchemy.text(query), args)
-
-            cache._r.decrby(cache._prep_key(REDIS_USER_LISTEN_COUNT + user_name))
+                with connection.begin():
+                    # compressed chunks can be read, only decompress the chunk if there's a listen to delete
+                    deleted = 0
+                    if connection.execute(sqlalchemy.text(exists_query), args).fetchone() is not None:
+                        with connection.connection.cursor() as curs:
+                            timescale_compression.decompress_chunks(curs, [listened_at])
+                        deleted = connection.execute(sqlalchemy.text(query), args).rowcount
+                    if deleted:
+                        connection.execute(sqlalchemy.text(metadata_query), {
+                            'count': deleted,
+                            'listened_at': listened_at,
+                            'user_name': user_name,
+                        })
         except psycopg2.OperationalError as e:
             self.log.error("Cannot delete listen for user: %s" % str(e))
             raise TimescaleListenStoreException
+        if deleted:
+            self._invalidate_cached_metadata([user_name])
+            replica.mark_write(user_name)
 
 
 class TimescaleListenStoreException(Exception):
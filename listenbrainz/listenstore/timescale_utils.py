@@ -1,15 +1,12 @@
 import time
-from collections import defaultdict
 from datetime import datetime, timedelta
 import psycopg2
-from psycopg2.errors import UntranslatableCharacter
 import sqlalchemy
 import subprocess
 import logging
 
 from brainzutils import cache
 from listenbrainz.utils import init_cache
-from listenbrainz import db
 from listenbrainz.db import timescale
 from listenbrainz.listenstore.timescale_listenstore import REDIS_USER_LISTEN_COUNT, REDIS_USER_TIMESTAMPS, DATA_START_YEAR_IN_SECONDS
 from listenbrainz import config
@@ -20,99 +17,126 @@ logger = logging.getLogger(__name__)
 NUM_YEARS_TO_PROCESS_FOR_CONTINUOUS_AGGREGATE_REFRESH = 3
 SECONDS_IN_A_YEAR = 31536000
 
+# Rows of listen_user_metadata updated less than this long before a check started are not checked
+CHECK_LISTEN_USER_METADATA_MARGIN = timedelta(minutes=5)
+CHECK_LISTEN_USER_METADATA_BATCH_SIZE = 1000
 
-def recalculate_all_user_data():
 
-    timescale.init_db_connection(config.SQLALCHEMY_TIMESCALE_URI)
-    db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
-    init_cache(host=config.REDIS_HOST, port=config.REDIS_PORT,
-               namespace=config.REDIS_NAMESPACE)
+def _scan_listen_user_metadata(scan_start):
+    """ Count the listens of every user which were created before scan_start, one chunk of the
+        listen hypertable at a time.
 
-    # Find the created timestamp of the last listen
-    query = "SELECT max(created) FROM listen WHERE created > :date"
-    try:
-        with timescale.engine.connect() as connection:
-            result = connection.execute(sqlalchemy.text(
-                query), date=datetime.now() - timedelta(weeks=4))
-            row = result.fetchone()
-            last_created_ts = row[0]
-    except psycopg2.OperationalError as e:
-        logger.error("Cannot query ts to fetch latest listen." %
-                     str(e), exc_info=True)
-        raise
-
-    logger.info("Last created timestamp: " + str(last_created_ts))
-
-    # Select a list of users
-    user_list = []
-    query = 'SELECT musicbrainz_id FROM "user"'
-    try:
-        with db.engine.connect() as connection:
-            result = connection.execute(sqlalchemy.text(query))
-            for row in result:
-                user_list.append(row[0])
-    except psycopg2.OperationalError as e:
-        logger.error("Cannot query db to fetch user list." %
-                     str(e), exc_info=True)
-        raise
-
-    logger.info("Fetched %d users. Setting empty cache entries." %
-                len(user_list))
-
-    # Reset the timestamps and listen counts to 0 for all users
-    for user_name in user_list:
-        cache.set(REDIS_USER_LISTEN_COUNT + user_name, 0, expirein=0, encode=False)
-        cache.set(REDIS_USER_LISTEN_COUNT + user_name, 0, expirein=0, encode=False)
-        cache.set(REDIS_USER_TIMESTAMPS + user_name, "0,0", expirein=0)
-
-    # Tabulate all of the listen counts/timestamps for all users
-    logger.info("Scan the whole listen table...")
-    listen_counts = defaultdict(int)
-    user_timestamps = {}
-    query = "SELECT listened_at, user_name FROM listen where created <= :ts"
-    try:
+        Returns:
+            a dict of [count, min listened_at, max listened_at] by user name
+    """
+    chunks_query = """SELECT range_start_integer, range_end_integer
+                        FROM timescaledb_information.chunks
+                       WHERE hypertable_name = 'listen'
+                    ORDER BY range_start_integer"""
+    chunk_query = """SELECT user_name, count(*), min(listened_at), max(listened_at)
+                       FROM listen
+                      WHERE listened_at >= :start
+                        AND listened_at < :end
+                        AND created < :scan_start
+                   GROUP BY user_name"""
+
+    with timescale.engine.connect() as connection:
+        chunks = connection.execute(sqlalchemy.text(chunks_query)).fetchall()
+
+    user_metadata = {}
+    for i, (start, end) in enumerate(chunks):
+        t0 = time.monotonic()
         with timescale.engine.connect() as connection:
-            result = connection.execute(
-                sqlalchemy.text(query), ts=last_created_ts)
-            for row in result:
-                ts = row[0]
-                user_name = row[1]
-                if user_name not in user_timestamps:
-                    user_timestamps[user_name] = [ts, ts]
+            result = connection.execute(sqlalchemy.text(chunk_query), start=start, end=end, scan_start=scan_start)
+            for user_name, count, min_ts, max_ts in result:
+                metadata = user_metadata.get(user_name)
+                if metadata is None:
+                    user_metadata[user_name] = [count, min_ts, max_ts]
                 else:
-                    if ts > user_timestamps[user_name][1]:
-                        user_timestamps[user_name][1] = ts
-                    if ts < user_timestamps[user_name][0]:
-                        user_timestamps[user_name][0] = ts
+                    metadata[0] += count
+                    metadata[1] = min(metadata[1], min_ts)
+                    metadata[2] = max(metadata[2], max_ts)
+        logger.info("Scanned chunk %d of %d (%s to %s) in %.2fs", i + 1, len(chunks),
+                    datetime.utcfromtimestamp(start), datetime.utcfromtimestamp(end), time.monotonic() - t0)
 
-                listen_counts[user_name] += 1
+    return user_metadata
 
-    except psycopg2.OperationalError as e:
-        logger.error("Cannot query db to fetch user list." %
-                     str(e), exc_info=True)
-        raise
 
-    logger.info("Setting updated cache entries.")
-    # Set the timestamps and listen counts for all users
-    for user_name in user_list:
-        try:
-            cache.increment(REDIS_USER_LISTEN_COUNT + user_name, amount=listen_counts[user_name])
-        except KeyError:
-            pass
+def check_listen_user_metadata(dry_run=False):
+    """ Check the listen counts and timestamps of the users in listen_user_metadata against the
+        listen table and fix the rows which have drifted.
 
-        try:
-            tss = cache.get(REDIS_USER_TIMESTAMPS + user_name)
-            (min_ts, max_ts) = tss.split(",")
-            min_ts = int(min_ts)
-            max_ts = int(max_ts)
-            if min_ts and min_ts < user_timestamps[user_name][0]:
-                user_timestamps[user_name][0] = min_ts
-            if max_ts and max_ts > user_timestamps[user_name][1]:
-                user_timestamps[user_name][1] = max_ts
-            cache.set(REDIS_USER_TIMESTAMPS + user_name, "%d,%d" %
-                      (user_timestamps[user_name][0], user_timestamps[user_name][1]), expirein=0)
-        except KeyError:
-            pass
+        The listen table is scanned a chunk at a time while listens are being inserted and deleted,
+        so only the rows which were not updated since shortly before the scan started are checked. The
+        other rows are left for the next run.
+
+        Args:
+            dry_run: only log the rows which have drifted, without fixing them
+
+        Returns:
+            the number of rows which have drifted
+    """
+    timescale.init_db_connection(config.SQLALCHEMY_TIMESCALE_URI)
+    init_cache(host=config.REDIS_HOST, port=config.REDIS_PORT,
+               namespace=config.REDIS_NAMESPACE)
+
+    with timescale.engine.connect() as connection:
+        scan_start = connection.execute(sqlalchemy.text("SELECT NOW()")).fetchone()[0]
+    # rows updated by transactions which began shortly before the scan could contain listens that
+    # were committed after their chunk was scanned
+    checked_before = scan_start - CHECK_LISTEN_USER_METADATA_MARGIN
+
+    logger.info("Scanning the listen table...")
+    scanned = _scan_listen_user_metadata(scan_start)
+
+    select_query = """SELECT user_name, count, min_listened_at, max_listened_at
+                        FROM listen_user_metadata
+                       WHERE last_updated < :checked_before"""
+    with timescale.engine.connect() as connection:
+        stored = {row["user_name"]: (row["count"], row["min_listened_at"], row["max_listened_at"])
+                  for row in connection.execute(sqlalchemy.text(select_query), checked_before=checked_before)}
+        recently_updated = {row[0] for row in connection.execute(sqlalchemy.text(
+            "SELECT user_name FROM listen_user_metadata WHERE last_updated >= :checked_before"), checked_before=checked_before)}
+
+    checked = (set(stored) | set(scanned)) - recently_updated
+    drifted = []
+    for user_name in sorted(checked):
+        expected = tuple(scanned.get(user_name, (0, None, None)))
+        if stored.get(user_name) != expected:
+            logger.info("Listen metadata of %s has drifted: stored %s, counted %s", user_name, stored.get(user_name), expected)
+            drifted.append({
+                "user_name": user_name,
+                "count": expected[0],
+                "min_listened_at": expected[1],
+                "max_listened_at": expected[2],
+                "checked_before": checked_before,
+            })
+
+    logger.info("Checked %d users, %d have drifted, %d were updated during the check",
+                len(checked), len(drifted), len(recently_updated))
+    if dry_run or not drifted:
+        return len(drifted)
+
+    # the last_updated condition is checked again once the row is locked, so rows which were
+    # updated since they were read are not overwritten
+    fix_query = """INSERT INTO listen_user_metadata AS m (user_name, count, min_listened_at, max_listened_at)
+                        VALUES (:user_name, :count, :min_listened_at, :max_listened_at)
+                   ON CONFLICT (user_name)
+                     DO UPDATE SET count = EXCLUDED.count
+                                 , min_listened_at = EXCLUDED.min_listened_at
+                                 , max_listened_at = EXCLUDED.max_listened_at
+                                 , last_updated = NOW()
+                         WHERE m.last_updated < :checked_before"""
+    for i in range(0, len(drifted), CHECK_LISTEN_USER_METADATA_BATCH_SIZE):
+        batch = drifted[i:i + CHECK_LISTEN_USER_METADATA_BATCH_SIZE]
+        with timescale.engine.connect() as connection:
+            with connection.begin():
+                connection.execute(sqlalchemy.text(fix_query), batch)
+        cache.delete_many([REDIS_USER_LISTEN_COUNT + row["user_name"] for row in batch] +
+                          [REDIS_USER_TIMESTAMPS + row["user_name"] for row in batch])
+
+    logger.info("Fixed the listen metadata of %d users", len(drifted))
+    return len(drifted)
 
 
 def unlock_cron():
@@ -6,12 +6,13 @@ import subprocess
 
 import click
 
-from mapping.mbid_mapping import create_mbid_mapping
+from mapping.mbid_mapping import create_mbid_mapping, create_mbid_mapping_parallel, DEFAULT_WORKERS
 from mapping.typesense_index import build_index as action_build_index
 from mapping.year_mapping import create_year_mapping
 from mapping.mapping_test.mapping_test import test_mapping as action_test_mapping
 from mapping.utils import log, CRON_LOG_FILE
-from mapping.release_colors import sync_release_color_table, incremental_update_release_color_table
+from mapping.release_colors import sync_release_color_table, incremental_update_release_color_table, \
+    benchmark_image_processing
 
 
 @click.group()
@@ -20,22 +21,30 @@ def cli():
 
 
 @cli.command()
-def create_all():
+@click.option("--workers", default=DEFAULT_WORKERS, help="number of processes that build the mbid mapping")
+def create_all(workers):
     """
         Create all mappings in one go. First mbid mapping, then its typesense index and finally the year lookup mapping.
     """
-    create_mbid_mapping()
+    create_mbid_mapping_parallel(workers)
     action_build_index()
     create_year_mapping()
 
 
 @cli.command()
-def mbid_mapping():
+@click.option("--workers", default=DEFAULT_WORKERS, help="number of processes that build the mapping")
+@click.option("--partitions", default=None, type=int, help="number of artist credit ranges to split the work into")
+@click.option("--serial", is_flag=True, help="build the mapping in a single process")
+def mbid_mapping(workers, partitions, serial):
     """
         Create the MBID mapping, which also creates the prerequisit artist-credit pairs table. This can be done during
-        production as new tables are moved in place atomically.
+        production as new tables are moved in place atomically. If a parallel build is interrupted, running this again
+        resumes it.
     """
-    create_mbid_mapping()
+    if serial:
+        create_mbid_mapping()
+    else:
+        create_mbid_mapping_parallel(workers, partitions)
 
 
 @cli.command()
@@ -79,6 +88,17 @@ def update_coverart():
     incremental_update_release_color_table()
 
 
+@cli.command()
+@click.argument("image_dir")
+@click.option("--output", "-o", default=None, help="Write the durations of the processing of each image as json to this file")
+def benchmark_coverart(image_dir, output):
+    """
+        Compare the speed of computing cover art colors in process and with the netpbm tools, using the
+        .jpg images in IMAGE_DIR.
+    """
+    benchmark_image_processing(image_dir, output)
+
+
 @cli.command()
 def cron_log():
     """
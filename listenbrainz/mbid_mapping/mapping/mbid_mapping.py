@@ -1,6 +1,11 @@
+import csv
+import io
 import re
+from contextlib import closing
+from multiprocessing import Pool
 
 import psycopg2
+import psycopg2.extras
 from psycopg2.errors import OperationalError
 from unidecode import unidecode
 
@@ -9,6 +14,10 @@ from mapping.formats import create_formats_table
 import config
 
 BATCH_SIZE = 5000
+DEFAULT_WORKERS = 4
+# The artist credit range is split into this many partitions per worker, so that a slow partition
+# does not leave the other workers idle for long
+PARTITIONS_PER_WORKER = 4
 TEST_ARTIST_IDS = [1160983, 49627]  # Gun'n'roses, beyoncé
 
 
@@ -65,7 +74,7 @@ def create_indexes(conn):
                                                 SELECT id 
                                                   FROM (
                                                           SELECT id, combined_lookup, score,
-                                                                 row_number() OVER (PARTITION BY combined_lookup ORDER BY score)
+                                                                 row_number() OVER (PARTITION BY combined_lookup ORDER BY score, id)
                                                             FROM mapping.tmp_mbid_mapping
                                                         GROUP BY combined_lookup, score, id
                                                        ) AS q
@@ -183,6 +192,80 @@ def swap_table_and_indexes(conn):
         raise
 
 
+RECORDINGS_QUERY = """SELECT ac.id as artist_credit_id,
+                              r.name AS recording_name,
+                              r.gid AS recording_mbid,
+                              ac.name AS artist_credit_name,
+                              s.artist_mbids,
+                              rl.name AS release_name,
+                              rl.gid AS release_mbid,
+                              rpr.id AS score
+                         FROM recording r
+                         JOIN artist_credit ac
+                           ON r.artist_credit = ac.id
+                         JOIN artist_credit_name acn
+                           ON ac.id = acn.artist_credit
+                         JOIN artist a
+                           ON acn.artist = a.id
+                         JOIN track t
+                           ON t.recording = r.id
+                         JOIN medium m
+                           ON m.id = t.medium
+                         JOIN release rl
+                           ON rl.id = m.release
+                         JOIN mapping.tmp_mbid_mapping_releases rpr
+                           ON rl.id = rpr.release
+                         JOIN (SELECT artist_credit, array_agg(gid) AS artist_mbids
+                                 FROM artist_credit_name acn2
+                                 JOIN artist a2
+                                   ON acn2.artist = a2.id
+                             GROUP BY acn2.artist_credit) s
+                           ON acn.artist_credit = s.artist_credit
+                    LEFT JOIN release_country rc
+                           ON rc.release = rl.id
+                        {where}
+                     GROUP BY rpr.id, ac.id, s.artist_mbids, rl.gid, artist_credit_name, r.gid, r.name, release_name
+                     ORDER BY ac.id, rpr.id, r.gid"""
+
+
+def mapping_rows(curs):
+    """
+        Turn the recordings fetched by curs with RECORDINGS_QUERY into mapping rows. For each artist credit,
+        only the first (best scored) recording of each name is kept. The rows are yielded in the order in
+        which they are first seen, as tuples of all the columns of the mapping table but the id.
+    """
+
+    last_artist_credit_id = None
+    artist_recordings = {}
+    for row in curs:
+        if row['artist_credit_id'] != last_artist_credit_id:
+            yield from artist_recordings.values()
+            artist_recordings = {}
+
+        try:
+            recording_name = row['recording_name']
+            artist_credit_name = row['artist_credit_name']
+            if recording_name not in artist_recordings:
+                combined_lookup = unidecode(
+                    re.sub(r'[^\w]+', '', artist_credit_name + recording_name).lower())
+                artist_recordings[recording_name] = (row['artist_credit_id'],
+                                                     row['artist_mbids'],
+                                                     artist_credit_name,
+                                                     row['release_mbid'],
+                                                     row['release_name'],
+                                                     row['recording_mbid'],
+                                                     recording_name,
+                                                     combined_lookup,
+                                                     row['score'])
+        except TypeError:
+            log(row)
+            raise
+
+        last_artist_credit_id = row['artist_credit_id']
+
+    yield from artist_recordings.values()
+
+
 def create_mbid_mapping():
     """
         This function is the heart of the mbid mapping. It
@@ -190,6 +273,9 @@ def create_mbid_mapping():
         from these tables so that duplicate recording-artist pairs all
         resolve to the "canonical" release-artist pairs that make
         them suitable for inclusion in the msid-mapping.
+
+        This builds the mapping in a single process, see create_mbid_mapping_parallel
+        for the partitioned build used in production.
     """
 
     log("mbid mapping: start")
@@ -205,96 +291,23 @@ def create_mbid_mapping():
             create_temp_release_table(mb_conn)
             with mb_conn.cursor() as mb_curs2:
                 rows = []
-                last_artist_credit_id = None
-                artist_recordings = {}
                 count = 0
                 batch_count = 0
-                serial = 1
                 log("mbid mapping: fetch recordings")
-                mb_curs.execute("""SELECT ac.id as artist_credit_id,
-                                          r.name AS recording_name,
-                                          r.gid AS recording_mbid,
-                                          ac.name AS artist_credit_name,
-                                          s.artist_mbids,
-                                          rl.name AS release_name,
-                                          rl.gid AS release_mbid,
-                                          rpr.id AS score
-                                     FROM recording r
-                                     JOIN artist_credit ac
-                                       ON r.artist_credit = ac.id
-                                     JOIN artist_credit_name acn
-                                       ON ac.id = acn.artist_credit
-                                     JOIN artist a
-                                       ON acn.artist = a.id
-                                     JOIN track t
-                                       ON t.recording = r.id
-                                     JOIN medium m
-                                       ON m.id = t.medium
-                                     JOIN release rl
-                                       ON rl.id = m.release
-                                     JOIN mapping.tmp_mbid_mapping_releases rpr
-                                       ON rl.id = rpr.release
-                                     JOIN (SELECT artist_credit, array_agg(gid) AS artist_mbids
-                                             FROM artist_credit_name acn2
-                                             JOIN artist a2
-                                               ON acn2.artist = a2.id
-                                         GROUP BY acn2.artist_credit) s
-                                       ON acn.artist_credit = s.artist_credit
-                                LEFT JOIN release_country rc
-                                       ON rc.release = rl.id
-                                 GROUP BY rpr.id, ac.id, s.artist_mbids, rl.gid, artist_credit_name, r.gid, r.name, release_name
-                                 ORDER BY ac.id, rpr.id""")
-
-                row_count = 0
-                while True:
-                    row = mb_curs.fetchone()
-                    if not row:
-                        break
-
-                    if not last_artist_credit_id:
-                        last_artist_credit_id = row['artist_credit_id']
-
-                    if row['artist_credit_id'] != last_artist_credit_id:
-                        # insert the rows that made it
-                        rows.extend(artist_recordings.values())
-                        artist_recordings = {}
-
-                        if len(rows) >= BATCH_SIZE:
-                            insert_rows(mb_curs2, "mapping.tmp_mbid_mapping", rows)
-                            count += len(rows)
-                            mb_conn.commit()
-                            rows = []
-                            batch_count += 1
-
-                            if batch_count % 200 == 0:
-                                log("mbid mapping: inserted %d rows." % count)
-
-                    try:
-                        recording_name = row['recording_name']
-                        artist_credit_name = row['artist_credit_name']
-
-                        release_name = row['release_name']
-                        combined_lookup = unidecode(
-                            re.sub(r'[^\w]+', '', artist_credit_name + recording_name).lower())
-                        if recording_name not in artist_recordings:
-                            artist_recordings[recording_name] = (serial,
-                                                                 row['artist_credit_id'],
-                                                                 row['artist_mbids'],
-                                                                 artist_credit_name,
-                                                                 row['release_mbid'],
-                                                                 release_name,
-                                                                 row['recording_mbid'],
-                                                                 recording_name,
-                                                                 combined_lookup,
-                                                                 row['score'])
-                            serial += 1
-                    except TypeError:
-                        log(row)
-                        raise
-
-                    last_artist_credit_id = row['artist_credit_id']
-
-                rows.extend(artist_recordings.values())
+                mb_curs.execute(RECORDINGS_QUERY.format(where=""))
+
+                for serial, row in enumerate(mapping_rows(mb_curs), start=1):
+                    rows.append((serial,) + row)
+                    if len(rows) >= BATCH_SIZE:
+                        insert_rows(mb_curs2, "mapping.tmp_mbid_mapping", rows)
+                        count += len(rows)
+                        mb_conn.commit()
+                        rows = []
+                        batch_count += 1
+
+                        if batch_count % 200 == 0:
+                            log("mbid mapping: inserted %d rows." % count)
+
                 if rows:
                     insert_rows(mb_curs2, "mapping.tmp_mbid_mapping", rows)
                     mb_conn.commit()
@@ -308,3 +321,235 @@ def create_mbid_mapping():
             swap_table_and_indexes(mb_conn)
 
     log("mbid mapping: done")
+
+
+def create_staging_tables(conn, partitions):
+    """
+        Create the staging table the workers of the parallel build copy their rows into and the progress
+        table which records which artist credit ranges are done, so that an interrupted build can be resumed.
+        The staging table is unlogged: it is rebuilt from scratch on failure anyway, so there's no point in
+        writing it to the WAL.
+    """
+
+    with conn.cursor() as curs:
+        curs.execute("DROP TABLE IF EXISTS mapping.tmp_mbid_mapping_staging")
+        curs.execute("""CREATE UNLOGGED TABLE mapping.tmp_mbid_mapping_staging (
+                                              part                      INTEGER NOT NULL,
+                                              seq                       INTEGER NOT NULL,
+                                              artist_credit_id          INT NOT NULL,
+                                              artist_mbids              UUID[] NOT NULL,
+                                              artist_credit_name        TEXT NOT NULL,
+                                              release_mbid              UUID NOT NULL,
+                                              release_name              TEXT NOT NULL,
+                                              recording_mbid            UUID NOT NULL,
+                                              recording_name            TEXT NOT NULL,
+                                              combined_lookup           TEXT NOT NULL,
+                                              score                     INTEGER NOT NULL)""")
+        curs.execute("""CREATE INDEX tmp_mbid_mapping_staging_idx_part
+                                  ON mapping.tmp_mbid_mapping_staging(part)""")
+
+        # This table is created last: its presence marks a build that can be resumed
+        curs.execute("DROP TABLE IF EXISTS mapping.tmp_mbid_mapping_build_progress")
+        curs.execute("""CREATE TABLE mapping.tmp_mbid_mapping_build_progress (
+                                     part                      INTEGER NOT NULL PRIMARY KEY,
+                                     min_artist_credit_id      INTEGER NOT NULL,
+                                     max_artist_credit_id      INTEGER NOT NULL,
+                                     done                      BOOLEAN NOT NULL DEFAULT FALSE,
+                                     rows                      INTEGER)""")
+        insert_rows(curs, "mapping.tmp_mbid_mapping_build_progress (part, min_artist_credit_id, max_artist_credit_id)",
+                    partitions)
+    conn.commit()
+
+
+def split_artist_credits(conn, count):
+    """
+        Split the range of artist credit ids into count partitions of (part, min id, max id), inclusive.
+    """
+
+    with conn.cursor() as curs:
+        curs.execute("SELECT min(id), max(id) FROM artist_credit")
+        min_id, max_id = curs.fetchone()
+
+    if min_id is None:
+        return [(0, 0, 0)]
+
+    step = max(1, (max_id - min_id + 1) // count + 1)
+    partitions = []
+    for part, start in enumerate(range(min_id, max_id + 1, step)):
+        partitions.append((part, start, min(start + step - 1, max_id)))
+    return partitions
+
+
+def build_progress_exists(conn):
+    """
+        Returns True if an interrupted parallel build left its progress table behind.
+    """
+
+    with conn.cursor() as curs:
+        curs.execute("SELECT to_regclass('mapping.tmp_mbid_mapping_build_progress') IS NOT NULL")
+        return curs.fetchone()[0]
+
+
+def pending_partitions(conn):
+    """
+        Return the partitions that still need to be built. A partition that is marked as done but whose
+        rows do not all exist in the staging table (as happens when postgres truncates unlogged tables
+        after a crash) is built again.
+    """
+
+    with conn.cursor() as curs:
+        curs.execute("""SELECT p.part, p.min_artist_credit_id, p.max_artist_credit_id
+                          FROM mapping.tmp_mbid_mapping_build_progress p
+                     LEFT JOIN (SELECT part, count(*) AS rows
+                                  FROM mapping.tmp_mbid_mapping_staging
+                              GROUP BY part) s
+                            ON p.part = s.part
+                         WHERE NOT p.done
+                            OR p.rows != COALESCE(s.rows, 0)
+                      ORDER BY p.part""")
+        return curs.fetchall()
+
+
+def _format_uuid_array(value):
+    """ Format a list of UUIDs as a postgres array literal. Without a registered adapter psycopg2
+        returns UUID[] columns as the literal already. """
+    if isinstance(value, str):
+        return value
+    return "{" + ",".join(str(v) for v in value) + "}"
+
+
+def _copy_rows(curs, rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    curs.copy_expert("COPY mapping.tmp_mbid_mapping_staging FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def build_partition(partition):
+    """
+        Fetch the recordings of one range of artist credits and copy the mapping rows into the staging
+        table. Runs in a worker process, with its own connection. The rows and the progress mark are
+        committed in one transaction, so a partition is either done completely or not at all.
+
+        Returns the partition number and the number of rows written.
+    """
+
+    part, min_artist_credit_id, max_artist_credit_id = partition
+    count = 0
+    # the context manager of the connection only ends the transaction, and a pool worker builds many partitions
+    with closing(psycopg2.connect(config.MBID_MAPPING_DATABASE_URI)) as conn, conn:
+        with conn.cursor() as curs:
+            curs.execute("DELETE FROM mapping.tmp_mbid_mapping_staging WHERE part = %s", (part,))
+
+            with conn.cursor("mbid_mapping_part_%d" % part, cursor_factory=psycopg2.extras.DictCursor) as mb_curs:
+                mb_curs.itersize = BATCH_SIZE
+                mb_curs.execute(RECORDINGS_QUERY.format(where="WHERE ac.id BETWEEN %s AND %s"),
+                                (min_artist_credit_id, max_artist_credit_id))
+
+                rows = []
+                for row in mapping_rows(mb_curs):
+                    row = list(row)
+                    row[1] = _format_uuid_array(row[1])
+                    rows.append([part, count] + row)
+                    count += 1
+                    if len(rows) >= BATCH_SIZE:
+                        _copy_rows(curs, rows)
+                        rows = []
+
+                if rows:
+                    _copy_rows(curs, rows)
+
+            curs.execute("""UPDATE mapping.tmp_mbid_mapping_build_progress
+                               SET done = TRUE, rows = %s
+                             WHERE part = %s""", (count, part))
+
+    return part, count
+
+
+def merge_staging_table(conn):
+    """
+        Move the rows of all partitions into the mapping table. Ids are assigned in partition order,
+        which is the order the single process build inserts the rows in, and of the rows that share
+        a combined lookup only the best scored one is kept, so both builds give the same table.
+    """
+
+    with conn.cursor() as curs:
+        # A resumed build may have been interrupted during or after a previous merge
+        curs.execute("DROP INDEX IF EXISTS mapping.tmp_mbid_mapping_idx_artist_credit_recording_name")
+        curs.execute("DROP INDEX IF EXISTS mapping.tmp_mbid_mapping_idx_combined_lookup")
+        curs.execute("TRUNCATE mapping.tmp_mbid_mapping")
+        curs.execute("""INSERT INTO mapping.tmp_mbid_mapping (id, artist_credit_id, artist_mbids, artist_credit_name,
+                                                              release_mbid, release_name, recording_mbid,
+                                                              recording_name, combined_lookup, score)
+                             SELECT id, artist_credit_id, artist_mbids, artist_credit_name, release_mbid,
+                                    release_name, recording_mbid, recording_name, combined_lookup, score
+                               FROM (
+                                      SELECT *, row_number() OVER (PARTITION BY combined_lookup ORDER BY score, id) AS rank
+                                        FROM (
+                                               SELECT *, row_number() OVER (ORDER BY part, seq) AS id
+                                                 FROM mapping.tmp_mbid_mapping_staging
+                                             ) AS numbered
+                                    ) AS ranked
+                              WHERE rank = 1""")
+        count = curs.rowcount
+    conn.commit()
+    return count
+
+
+def drop_staging_tables(conn):
+    with conn.cursor() as curs:
+        curs.execute("DROP TABLE IF EXISTS mapping.tmp_mbid_mapping_staging")
+        curs.execute("DROP TABLE IF EXISTS mapping.tmp_mbid_mapping_build_progress")
+    conn.commit()
+
+
+def create_mbid_mapping_parallel(workers=DEFAULT_WORKERS, partitions=None):
+    """
+        Build the same mbid mapping as create_mbid_mapping, but split the artist credits into ranges
+        that are fetched by a pool of worker processes and bulk loaded with COPY into a staging table.
+        The staging table is then merged into the mapping table in one statement.
+
+        Each finished range is recorded in a progress table, so if the build is interrupted, running it
+        again only builds the ranges that were not finished. The progress table is dropped once the new
+        mapping has been swapped into production.
+    """
+
+    log("mbid mapping: start, %d workers" % workers)
+    mb_conn = psycopg2.connect(config.MBID_MAPPING_DATABASE_URI)
+    try:
+        log("mbid mapping: create schema")
+        create_schema(mb_conn)
+        if build_progress_exists(mb_conn):
+            log("mbid mapping: resume interrupted build")
+        else:
+            log("mbid mapping: drop old tables, create new tables")
+            create_tables(mb_conn)
+            create_temp_release_table(mb_conn)
+            mb_conn.commit()
+            create_staging_tables(mb_conn, split_artist_credits(mb_conn, partitions or workers * PARTITIONS_PER_WORKER))
+
+        pending = pending_partitions(mb_conn)
+    finally:
+        # Close the connection before forking, so that the workers can't inherit it
+        mb_conn.close()
+
+    log("mbid mapping: fetch recordings for %d artist credit ranges" % len(pending))
+    with Pool(workers) as pool:
+        for i, (part, count) in enumerate(pool.imap_unordered(build_partition, pending), start=1):
+            log("mbid mapping: range %d done, %d rows (%d of %d)" % (part, count, i, len(pending)))
+
+    with psycopg2.connect(config.MBID_MAPPING_DATABASE_URI) as mb_conn:
+        log("mbid mapping: merge ranges")
+        count = merge_staging_table(mb_conn)
+        log("mbid mapping: inserted %d rows total." % count)
+
+        log("mbid mapping: create indexes")
+        create_indexes(mb_conn)
+
+        # Once the staging tables are gone, an interrupted build starts from scratch again
+        drop_staging_tables(mb_conn)
+
+        log("mbid mapping: swap tables and indexes into production.")
+        swap_table_and_indexes(mb_conn)
+
+    log("mbid mapping: done")
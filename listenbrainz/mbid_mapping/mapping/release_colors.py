@@ -1,14 +1,19 @@
 import datetime
 import os
-import re
 import subprocess
-from time import sleep
-from threading import Thread, get_ident
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from io import BytesIO
+from threading import BoundedSemaphore, Lock
+from time import monotonic, sleep
 
+from PIL import Image
 import psycopg2
 from psycopg2.errors import OperationalError
 from psycopg2.extensions import register_adapter
+from psycopg2.extras import execute_values
 import requests
+import ujson
 
 from brainzutils import metrics, cache
 import config
@@ -21,23 +26,40 @@ register_adapter(Cube, adapt_cube)
 # max number of threads to use -- with 2 we don't need to worry about rate limiting.
 MAX_THREADS = 2
 
+# max number of rows that can be waiting for a free thread, beyond which adding rows blocks
+MAX_QUEUED_ROWS = MAX_THREADS * 4
+
 # The number of items to compare in one batch
 SYNC_BATCH_SIZE = 10000
 
+# The number of colors to collect before inserting them into the DB in one go
+INSERT_BATCH_SIZE = 100
+
 # cache key for the last_updated timestamp for the sync
 LAST_UPDATED_CACHE_KEY = "mbid.release_color_timestamp"
 
 
-def process_image(filename, mime_type):
+def process_image(image_data):
+    """ Decode the downloaded image with Pillow, scale it to 1 pixel
+        and return the (red, green, blue) tuple.
+
+        Box resampling averages all pixels of the image, like pnmscale does. """
+
+    with Image.open(BytesIO(image_data)) as image:
+        image.draft("RGB", (1, 1))  # let the JPEG decoder scale down while decoding
+        pixel = image.convert("RGB").resize((1, 1), Image.BOX).getpixel((0, 0))
+
+    return pixel[0], pixel[1], pixel[2]
+
+
+def process_image_netpbm(filename):
     """ Process the downloaded image with netpbm to scale it to 1 pixel
-        and return the (reg, green, blue) tuple """
+        and return the (red, green, blue) tuple. This was used before process_image
+        and is only kept around to compare the throughput of both. """
 
-    with open(filename, "rb") as raw:
-        proc = subprocess.Popen(["file", filename], stdout=subprocess.PIPE)
-        tmp = proc.communicate(raw.read())
-        proc = subprocess.Popen(["jpegtopnm", filename],
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        tmp = proc.communicate(raw.read())
+    proc = subprocess.Popen(["jpegtopnm", filename],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    tmp = proc.communicate()
 
     proc = subprocess.Popen(["pnmscale", "-xsize", "1", "-ysize", "1"],
                             stdin=subprocess.PIPE, stdout=subprocess.PIPE)
@@ -53,80 +75,160 @@ def process_image(filename, mime_type):
     raise RuntimeError
 
 
-def insert_row(release_mbid, red, green, blue, caa_id):
-    """ Insert a row into release_color mapping """
-
-    with psycopg2.connect(config.SQLALCHEMY_DATABASE_URI) as conn:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as curs:
-            sql = """INSERT INTO release_color (release_mbid, red, green, blue, color, caa_id)
-                          VALUES (%s, %s, %s, %s, %s::cube, %s)
-                     ON CONFLICT DO NOTHING"""
-
-            args = (release_mbid, red, green, blue,
-                    Cube(red, green, blue), caa_id)
-            try:
-                curs.execute(sql, args)
-                conn.commit()
-            except psycopg2.IntegrityError:
-                conn.rollback()
-
-
-def process_row(row):
-    """ Process one CAA query row, by fetching the 250px thumbnail,
-        process the color, then import into the DB """
-
-    sleep_duation = 2
-    while True:
-        headers = {
-            'User-Agent': 'ListenBrainz HueSound Color Bot ( rob@metabrainz.org )'}
+def image_filename(release_mbid, caa_id):
+    """ The name of the 250px thumbnail for a piece of cover art in the CAA """
+
+    return f"mbid-{release_mbid}-{caa_id}_thumb250.jpg"
+
+
+class CAAFetcher:
+    """ Fetch cover art thumbnails from the cover art archive. """
+
+    def fetch(self, release_mbid, caa_id):
+        """ Return the image data of the 250px thumbnail, or None if it cannot be fetched. """
+
+        sleep_duration = 2
+        while True:
+            headers = {
+                'User-Agent': 'ListenBrainz HueSound Color Bot ( rob@metabrainz.org )'}
+            url = f"https://archive.org/download/mbid-{release_mbid}/" + image_filename(release_mbid, caa_id)
+            r = requests.get(url, headers=headers)
+            if r.status_code == 200:
+                return r.content
+
+            if r.status_code in (403, 404):
+                return None
+
+            if r.status_code in (429, 503):
+                if r.status_code == 429:
+                    log("Exceeded rate limit. sleeping %d seconds." % sleep_duration)
+                else:
+                    log("Service not available. sleeping %d seconds." % sleep_duration)
+                sleep(sleep_duration)
+                sleep_duration *= 2
+                if sleep_duration > 100:
+                    return None
+                continue
+
+            log("Unhandled %d" % r.status_code)
+            return None
+
+
+class LocalDirectoryFetcher:
+    """ Fetch cover art thumbnails from a local directory, named the same way as in the
+        cover art archive. Useful for testing and benchmarking without hitting the CAA. """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, release_mbid, caa_id):
+        try:
+            with open(os.path.join(self.directory, image_filename(release_mbid, caa_id)), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+def insert_colors(rows):
+    """ Insert or update a batch of (release_mbid, red, green, blue, caa_id) rows
+        in the release_color table. """
+
+    with closing(psycopg2.connect(config.SQLALCHEMY_DATABASE_URI)) as conn, conn.cursor() as curs:
+        query = """INSERT INTO release_color (release_mbid, red, green, blue, color, caa_id)
+                        VALUES %s
+                   ON CONFLICT (caa_id)
+                 DO UPDATE SET release_mbid = EXCLUDED.release_mbid
+                             , red = EXCLUDED.red
+                             , green = EXCLUDED.green
+                             , blue = EXCLUDED.blue
+                             , color = EXCLUDED.color
+                             , last_updated = NOW()"""
+
+        values = [(release_mbid, red, green, blue, Cube(red, green, blue), caa_id)
+                  for release_mbid, red, green, blue, caa_id in rows]
+        execute_values(curs, query, values, template="(%s, %s, %s, %s, %s::cube, %s)")
+        conn.commit()
+
+
+class ReleaseColorProcessor:
+    """ Fetch and process cover art on a pool of threads and insert the resulting colors
+        into the DB in batches.
+
+        add() blocks once MAX_QUEUED_ROWS rows are waiting to be processed, so that
+        the caller cannot run ahead of the fetchers. Call finish() to wait for all
+        rows to be processed and to insert the remaining colors. """
+
+    def __init__(self, fetcher=None, insert=insert_colors,
+                 max_threads=MAX_THREADS, batch_size=INSERT_BATCH_SIZE):
+        self.fetcher = fetcher or CAAFetcher()
+        self.insert = insert
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=max_threads)
+        self.slots = BoundedSemaphore(max_threads + MAX_QUEUED_ROWS)
+        self.lock = Lock()
+        self.colors = []
+        self.processed = 0
+        self.errors = 0
+
+    def add(self, row):
+        """ Queue one CAA query row to be fetched and processed. """
+
+        self.slots.acquire()
+        future = self.executor.submit(self._process_row, row)
+        future.add_done_callback(self._row_done)
+
+    def _row_done(self, future):
+        self.slots.release()
+        exc = future.exception()
+        if exc:
+            log("Error while processing cover art: %s" % exc)
+            with self.lock:
+                self.errors += 1
+
+    def _process_row(self, row):
         release_mbid, caa_id = row["release_mbid"], row["caa_id"]
-        url = f"https://archive.org/download/mbid-{release_mbid}/mbid-{release_mbid}-{caa_id}_thumb250.jpg"
-        r = requests.get(url, headers=headers)
-        if r.status_code == 200:
-            filename = "/tmp/release-colors-%s.img" % get_ident()
-            with open(filename, 'wb') as f:
-                for chunk in r:
-                    f.write(chunk)
-
-            try:
-                red, green, blue = process_image(filename, row["mime_type"])
-                insert_row(row["release_mbid"], red,
-                           green, blue, row["caa_id"])
-                log("%s %s: (%s, %s, %s)" %
-                      (row["caa_id"], row["release_mbid"], red, green, blue))
-            except Exception as err:
-                log("Could not process %s" % url)
-                log(err)
-
-            os.unlink(filename)
-            sleep_duation = 2
-            break
-
-        if r.status_code == 403:
-            break
-
-        if r.status_code == 404:
-            break
-
-        if r.status_code == 429:
-            log("Exceeded rate limit. sleeping %d seconds." % sleep_duration)
-            sleep(sleep_duration)
-            sleep_duration *= 2
-            if sleep_duration > 100:
-                return
-
-            continue
-
-        if r.status_code == 503:
-            log("Service not available. sleeping %d seconds." % sleep_duration)
-            sleep(sleep_duration)
-            sleep_duration *= 2
-            if sleep_duration > 100:
-                return
-            continue
-
-        log("Unhandled %d" % r.status_code)
-        break
+        image_data = self.fetcher.fetch(release_mbid, caa_id)
+        if image_data is None:
+            return
+
+        try:
+            red, green, blue = process_image(image_data)
+        except Exception as err:
+            log("Could not process %s" % image_filename(release_mbid, caa_id))
+            log(err)
+            with self.lock:
+                self.errors += 1
+            return
+
+        batch = None
+        with self.lock:
+            self.processed += 1
+            self.colors.append((release_mbid, red, green, blue, caa_id))
+            if len(self.colors) >= self.batch_size:
+                batch, self.colors = self.colors, []
+
+        if batch:
+            self._insert_batch(batch)
+
+    def _insert_batch(self, batch):
+        """ Insert a batch of colors. If the insert fails, the colors are put back to be inserted
+            with the next batch. """
+
+        try:
+            self.insert(batch)
+        except Exception:
+            with self.lock:
+                self.colors = batch + self.colors
+            raise
+
+    def finish(self):
+        """ Wait for all queued rows to be processed and insert the remaining colors. If the insert
+            fails, the colors are kept and finish can be called again. """
+
+        self.executor.shutdown(wait=True)
+        if self.colors:
+            self.insert(self.colors)
+            self.colors = []
 
 
 def delete_from_lb(caa_id):
@@ -138,35 +240,41 @@ def delete_from_lb(caa_id):
                 """DELETE FROM release_color WHERE caa_id = %s """, (caa_id,))
 
 
-def process_cover_art(threads, row):
-    """ Process one row of the CAA query, waiting for a thread to free up.
-        This function blocks until a thread is available. """
+def benchmark_image_processing(directory, output=None):
+    """ Compare the throughput of processing all the images in the given directory
+        with Pillow in process and with the netpbm tools in a subprocess.
 
-    while len(threads) == MAX_THREADS:
-        for i, thread in enumerate(threads):
-            if not thread.is_alive():
-                thread.join()
-                threads.pop(i)
-                break
-        else:
-            sleep(.001)
+        If output is given, the durations of the processing of each image are written to it in the
+        raw format of the results of the ListenBrainz benchmarks (see listenbrainz.benchmarks.results),
+        as the coverart_pillow and coverart_netpbm scenarios, so that they can be compared with
+        manage.py benchmark compare.
+    """
 
-    t = Thread(target=process_row, args=(row,))
-    t.start()
-    threads.append(t)
+    filenames = [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith(".jpg")]
+    if not filenames:
+        log("No .jpg images found in %s" % directory)
+        return
+
+    scenarios = {}
+    for name, process in (("pillow", lambda filename: process_image(open_image_data(filename))),
+                          ("netpbm", process_image_netpbm)):
+        durations = []
+        for filename in filenames:
+            start = monotonic()
+            process(filename)
+            durations.append(monotonic() - start)
+        total = sum(durations)
+        log("%s: %d images in %.2fs, %.1f images/s" % (name, len(filenames), total, len(filenames) / total))
+        scenarios["coverart_" + name] = {"durations": durations, "items": len(filenames)}
 
+    if output:
+        with open(output, "w") as f:
+            ujson.dump({"meta": {"images": len(filenames)}, "scenarios": scenarios}, f, indent=4)
 
-def join_threads(threads):
-    """ Given the currently active threads, wait for all active threads to finish. """
 
-    while len(threads) > 0:
-        for i, thread in enumerate(threads):
-            if not thread.is_alive():
-                thread.join()
-                threads.pop(i)
-                break
-        else:
-            sleep(.001)
+def open_image_data(filename):
+    with open(filename, "rb") as f:
+        return f.read()
 
 
 def get_cover_art_counts(mb_curs, lb_curs):
@@ -205,7 +313,7 @@ def get_last_updated_from_caa():
             return last_updated
 
 
-def sync_release_color_table():
+def sync_release_color_table(fetcher=None):
     """ Top level function to sync the two CAA and LB cover art tables
         by fetching all rows sorted by caa_id and adding or removing
         cover art as needed. """
@@ -231,10 +339,10 @@ def sync_release_color_table():
                  ORDER BY caa_id
                     LIMIT %s"""
 
-    compare_coverart(mb_query, lb_query, 0, 0, "caa_id", "caa_id")
+    compare_coverart(mb_query, lb_query, 0, 0, "caa_id", "caa_id", fetcher)
 
 
-def incremental_update_release_color_table():
+def incremental_update_release_color_table(fetcher=None):
     """ Incrementally update the cover art mapping. This is designed to run hourly
         and save a last_updated timestamp in the cache. If the cache value cannot be
         found, a complete sync is run instead and the cache value is set. """
@@ -249,7 +357,7 @@ def incremental_update_release_color_table():
 
     if not last_updated:
         log("No timestamp found, performing full sync")
-        sync_release_color_table()
+        sync_release_color_table(fetcher)
         last_updated = get_last_updated_from_caa()
         cache.set(LAST_UPDATED_CACHE_KEY, last_updated,
                   expirein=0, encode=True)
@@ -272,19 +380,22 @@ def incremental_update_release_color_table():
                    LIMIT %s"""
 
     compare_coverart(mb_query, None, last_updated, None,
-                     "date_uploaded", "last_updated")
+                     "date_uploaded", "last_updated", fetcher)
 
     last_updated = get_last_updated_from_caa()
     cache.set(LAST_UPDATED_CACHE_KEY, last_updated, expirein=0, encode=True)
 
 
-def compare_coverart(mb_query, lb_query, mb_caa_index, lb_caa_index, mb_compare_key, lb_compare_key):
+def compare_coverart(mb_query, lb_query, mb_caa_index, lb_caa_index, mb_compare_key, lb_compare_key, fetcher=None):
     """ The core cover art comparison function. Given two sets of queries, index values, and 
         comparison keys this function can perform a complete sync as well as an incremental update.
 
         The queries must fetch chunks of data from the MB and LB tables ordered by
         the corresponding compare key. The starting indexes (the current comparison index
-        into the data) must be provided and match the type of the comparison keys. """
+        into the data) must be provided and match the type of the comparison keys.
+
+        Missing cover art is fetched with the given fetcher, which defaults to fetching
+        from the cover art archive. """
 
     with psycopg2.connect(config.MBID_MAPPING_DATABASE_URI) as mb_conn:
         with mb_conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as mb_curs:
@@ -294,7 +405,7 @@ def compare_coverart(mb_query, lb_query, mb_caa_index, lb_caa_index, mb_compare_
                     mb_count, lb_count = get_cover_art_counts(mb_curs, lb_curs)
                     log("CAA count: %d\n LB count: %d" % (mb_count, lb_count))
 
-                    threads = []
+                    processor = ReleaseColorProcessor(fetcher)
                     mb_row = None
                     lb_row = None
 
@@ -339,7 +450,7 @@ def compare_coverart(mb_query, lb_query, mb_caa_index, lb_caa_index, mb_compare_
 
                         # If the item is in MB, but not in LB, add to LB
                         if lb_row is None or mb_row[mb_compare_key] < lb_row[lb_compare_key]:
-                            process_cover_art(threads, mb_row)
+                            processor.add(mb_row)
                             missing += 1
                             mb_caa_index = mb_row[mb_compare_key]
                             mb_row = None
@@ -363,8 +474,9 @@ def compare_coverart(mb_query, lb_query, mb_caa_index, lb_caa_index, mb_compare_
 
                         assert False
 
-                    join_threads(threads)
+                    processor.finish()
                     log( "Finished! added/skipped %d removed %d from release_color" % (missing, extra))
+                    log("Processed %d images, %d could not be processed" % (processor.processed, processor.errors))
 
                     mb_count, lb_count = get_cover_art_counts(mb_curs, lb_curs)
                     log("CAA count: %d\n LB count: %d" % (mb_count, lb_count))
@@ -0,0 +1,181 @@
+import os
+import random
+import unittest
+import uuid
+from unittest.mock import patch
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+from mapping.mbid_mapping import mapping_rows, create_mbid_mapping, create_mbid_mapping_parallel
+
+# A postgres database the build tests may create the musicbrainz and mapping schemas in, e.g.
+# "dbname=mbid_mapping_test user=musicbrainz host=localhost". The build tests are skipped without it.
+TEST_DATABASE_URI = os.environ.get("MBID_MAPPING_TEST_DATABASE_URI")
+
+CREATE_MUSICBRAINZ_SCHEMA = """
+    DROP SCHEMA IF EXISTS musicbrainz CASCADE;
+    DROP SCHEMA IF EXISTS mapping CASCADE;
+    CREATE SCHEMA musicbrainz;
+    CREATE TABLE musicbrainz.artist (id INTEGER PRIMARY KEY, gid UUID NOT NULL, name TEXT NOT NULL);
+    CREATE TABLE musicbrainz.artist_credit (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+    CREATE TABLE musicbrainz.artist_credit_name (artist_credit INTEGER NOT NULL, position INTEGER NOT NULL,
+                                                 artist INTEGER NOT NULL);
+    CREATE TABLE musicbrainz.recording (id INTEGER PRIMARY KEY, gid UUID NOT NULL, name TEXT NOT NULL,
+                                        artist_credit INTEGER NOT NULL);
+    CREATE TABLE musicbrainz.release_group_primary_type (id INTEGER PRIMARY KEY);
+    CREATE TABLE musicbrainz.release_group_secondary_type (id INTEGER PRIMARY KEY);
+    CREATE TABLE musicbrainz.release_group (id INTEGER PRIMARY KEY, name TEXT NOT NULL,
+                                            artist_credit INTEGER NOT NULL, type INTEGER);
+    CREATE TABLE musicbrainz.release_group_secondary_type_join (release_group INTEGER NOT NULL,
+                                                                secondary_type INTEGER NOT NULL);
+    CREATE TABLE musicbrainz.release (id INTEGER PRIMARY KEY, gid UUID NOT NULL, name TEXT NOT NULL,
+                                      release_group INTEGER NOT NULL);
+    CREATE TABLE musicbrainz.release_country (release INTEGER NOT NULL, country INTEGER NOT NULL,
+                                              date_year SMALLINT, date_month SMALLINT, date_day SMALLINT);
+    CREATE TABLE musicbrainz.medium_format (id INTEGER PRIMARY KEY);
+    CREATE TABLE musicbrainz.medium (id INTEGER PRIMARY KEY, release INTEGER NOT NULL, format INTEGER);
+    CREATE TABLE musicbrainz.track (id INTEGER PRIMARY KEY, recording INTEGER NOT NULL, medium INTEGER NOT NULL);
+    INSERT INTO musicbrainz.release_group_primary_type VALUES (1), (2), (3);
+    INSERT INTO musicbrainz.release_group_secondary_type VALUES (1), (2);
+    INSERT INTO musicbrainz.medium_format VALUES (1), (7), (12);
+"""
+
+# A tiny vocabulary, so that names repeat within and across artist credits and different
+# artist credit and recording names run together into the same combined lookup
+WORDS = ["a", "b", "ab", "ba", "love", "song", "Love", "Song!", "réve"]
+
+
+def create_synthetic_musicbrainz(conn, artist_credits=60, recordings=400, releases=120):
+    rnd = random.Random(23)
+
+    def name(count):
+        return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, count)))
+
+    def gid():
+        return str(uuid.UUID(int=rnd.getrandbits(128)))
+
+    with conn.cursor() as curs:
+        curs.execute(CREATE_MUSICBRAINZ_SCHEMA)
+        artists = [(i, gid(), name(2)) for i in range(1, 40)]
+        psycopg2.extras.execute_values(curs, "INSERT INTO musicbrainz.artist VALUES %s", artists)
+
+        credits, credit_names = [], []
+        for ac in range(1, artist_credits + 1):
+            members = rnd.sample(artists, rnd.randint(1, 2))
+            credits.append((ac, " & ".join(a[2] for a in members)))
+            credit_names.extend((ac, pos, a[0]) for pos, a in enumerate(members))
+        # Various Artists
+        credits.append((artist_credits + 1, "Various Artists"))
+        credit_names.append((artist_credits + 1, 0, 1))
+        psycopg2.extras.execute_values(curs, "INSERT INTO musicbrainz.artist_credit VALUES %s", credits)
+        psycopg2.extras.execute_values(curs, "INSERT INTO musicbrainz.artist_credit_name VALUES %s", credit_names)
+
+        recording_rows = [(i, gid(), name(3), rnd.randint(1, artist_credits)) for i in range(1, recordings + 1)]
+        psycopg2.extras.execute_values(curs, "INSERT INTO musicbrainz.recording VALUES %s", recording_rows)
+
+        track_id = 0
+        for rel in range(1, releases + 1):
+            ac = rnd.randint(1, artist_credits + 1)
+            curs.execute("INSERT INTO musicbrainz.release_group VALUES (%s, %s, %s, %s)",
+                         (rel, name(2), ac, rnd.randint(1, 3)))
+            if rnd.random() < 0.3:
+                curs.execute("INSERT INTO musicbrainz.release_group_secondary_type_join VALUES (%s, %s)",
+                             (rel, rnd.randint(1, 2)))
+            curs.execute("INSERT INTO musicbrainz.release VALUES (%s, %s, %s, %s)", (rel, gid(), name(2), rel))
+            curs.execute("INSERT INTO musicbrainz.release_country VALUES (%s, %s, %s, %s, %s)",
+                         (rel, rnd.randint(1, 5), rnd.randint(1960, 2020), rnd.choice([None, 1, 6]), None))
+            curs.execute("INSERT INTO musicbrainz.medium VALUES (%s, %s, %s)", (rel, rel, rnd.choice([1, 7, 12])))
+            if ac > artist_credits:
+                tracks = rnd.sample(recording_rows, 8)
+            else:
+                tracks = [r for r in recording_rows if r[3] == ac] or rnd.sample(recording_rows, 2)
+            for recording in tracks[:12]:
+                track_id += 1
+                curs.execute("INSERT INTO musicbrainz.track VALUES (%s, %s, %s)", (track_id, recording[0], rel))
+    conn.commit()
+
+
+def fetch_mapping(conn):
+    with conn.cursor() as curs:
+        curs.execute("""SELECT id, artist_credit_id, artist_mbids::TEXT[], artist_credit_name, release_mbid::TEXT,
+                               release_name, recording_mbid::TEXT, recording_name, combined_lookup, score
+                          FROM mapping.mbid_mapping
+                      ORDER BY id""")
+        return curs.fetchall()
+
+
+class MappingRowsTestCase(unittest.TestCase):
+
+    def make_row(self, artist_credit_id, recording_name, score):
+        return {
+            "artist_credit_id": artist_credit_id,
+            "artist_mbids": ["8f6bd1e4-fbe1-4f50-aa9b-94c450ec0f11"],
+            "artist_credit_name": "Portishead",
+            "release_mbid": "76df3287-6cda-33eb-8e9a-044b5e15ffdd",
+            "release_name": "Dummy",
+            "recording_mbid": "e97f805a-ab48-4c52-855e-07049142113d",
+            "recording_name": recording_name,
+            "score": score,
+        }
+
+    def test_keeps_first_recording_of_each_name_per_artist_credit(self):
+        rows = list(mapping_rows([
+            self.make_row(1, "Roads", 1),
+            self.make_row(1, "Sour Times", 2),
+            self.make_row(1, "Roads", 3),
+            self.make_row(2, "Roads", 4),
+        ]))
+
+        self.assertEqual([(row[0], row[6], row[8]) for row in rows], [(1, "Roads", 1), (1, "Sour Times", 2), (2, "Roads", 4)])
+        self.assertEqual(rows[0][7], "portisheadroads")
+
+    def test_empty(self):
+        self.assertEqual(list(mapping_rows([])), [])
+
+
+@unittest.skipUnless(TEST_DATABASE_URI, "MBID_MAPPING_TEST_DATABASE_URI is not set")
+class ParallelBuildTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # the recordings query uses unqualified musicbrainz table names
+        self.dsn = psycopg2.extensions.make_dsn(TEST_DATABASE_URI, options="-c search_path=musicbrainz,public")
+        self.conn = psycopg2.connect(self.dsn)
+        create_synthetic_musicbrainz(self.conn)
+        self.patches = [patch("config.MBID_MAPPING_DATABASE_URI", self.dsn, create=True),
+                        patch("config.USE_MINIMAL_DATASET", False, create=True)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.conn.close()
+
+    def test_parallel_build_matches_serial_build(self):
+        create_mbid_mapping()
+        expected = fetch_mapping(self.conn)
+        self.assertGreater(len(expected), 100)
+
+        create_mbid_mapping_parallel(workers=3, partitions=7)
+        self.assertEqual(fetch_mapping(self.conn), expected)
+
+    def test_resumes_interrupted_build(self):
+        create_mbid_mapping()
+        expected = fetch_mapping(self.conn)
+
+        with patch("mapping.mbid_mapping.merge_staging_table", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                create_mbid_mapping_parallel(workers=2, partitions=5)
+
+        # lose one finished range, as if postgres truncated the unlogged staging table
+        with self.conn.cursor() as curs:
+            curs.execute("DELETE FROM mapping.tmp_mbid_mapping_staging WHERE part = 2")
+        self.conn.commit()
+
+        create_mbid_mapping_parallel(workers=2, partitions=5)
+        self.assertEqual(fetch_mapping(self.conn), expected)
+        with self.conn.cursor() as curs:
+            curs.execute("SELECT to_regclass('mapping.tmp_mbid_mapping_build_progress')")
+            self.assertIsNone(curs.fetchone()[0])
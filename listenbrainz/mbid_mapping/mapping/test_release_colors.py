@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from mapping.release_colors import process_image, image_filename, LocalDirectoryFetcher, ReleaseColorProcessor
+
+
+def make_jpeg(colors):
+    """ Make a 256px JPEG with one horizontal band for each of the given colors """
+
+    image = Image.new("RGB", (256, 256))
+    band = 256 // len(colors)
+    for i, color in enumerate(colors):
+        image.paste(color, (0, i * band, 256, (i + 1) * band if i < len(colors) - 1 else 256))
+    data = BytesIO()
+    image.save(data, format="JPEG", quality=95)
+    return data.getvalue()
+
+
+class ReleaseColorsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.image_dir = tempfile.TemporaryDirectory()
+        self.images = {
+            1: ("e97f805a-ab48-4c52-855e-07049142113d", [(255, 0, 0)]),
+            2: ("7ffff8fc-cd98-47af-9805-5fac5f9d2e04", [(0, 0, 255), (255, 255, 255)]),
+            3: ("8c276439-d5e8-4560-8df0-2b7c996fd1a4", [(20, 200, 40)]),
+        }
+        for caa_id, (release_mbid, colors) in self.images.items():
+            with open(os.path.join(self.image_dir.name, image_filename(release_mbid, caa_id)), "wb") as f:
+                f.write(make_jpeg(colors))
+
+    def tearDown(self):
+        self.image_dir.cleanup()
+
+    def assertColorAlmostEqual(self, actual, expected):
+        for a, e in zip(actual, expected):
+            self.assertAlmostEqual(a, e, delta=3)
+
+    def test_process_image(self):
+        self.assertColorAlmostEqual(process_image(make_jpeg([(255, 0, 0)])), (255, 0, 0))
+        # the color is the average of all pixels
+        self.assertColorAlmostEqual(process_image(make_jpeg([(0, 0, 255), (255, 255, 255)])), (127, 127, 255))
+
+    def test_local_directory_fetcher(self):
+        fetcher = LocalDirectoryFetcher(self.image_dir.name)
+        self.assertIsNotNone(fetcher.fetch("e97f805a-ab48-4c52-855e-07049142113d", 1))
+        self.assertIsNone(fetcher.fetch("e97f805a-ab48-4c52-855e-07049142113d", 2))
+
+    def test_processor_inserts_in_batches(self):
+        batches = []
+        processor = ReleaseColorProcessor(LocalDirectoryFetcher(self.image_dir.name),
+                                          insert=batches.append, batch_size=2)
+        for caa_id, (release_mbid, _) in self.images.items():
+            processor.add({"release_mbid": release_mbid, "caa_id": caa_id})
+        # images that cannot be fetched are skipped
+        processor.add({"release_mbid": "6d5a9d4b-5f44-4c2a-9a14-0d5bd4ff3ed5", "caa_id": 4})
+        processor.finish()
+
+        self.assertEqual(sorted(len(batch) for batch in batches), [1, 2])
+        self.assertEqual(processor.processed, 3)
+        self.assertEqual(processor.errors, 0)
+
+        colors = {row[4]: row for batch in batches for row in batch}
+        self.assertEqual(sorted(colors), [1, 2, 3])
+        for caa_id, (release_mbid, _) in self.images.items():
+            self.assertEqual(colors[caa_id][0], release_mbid)
+        self.assertColorAlmostEqual(colors[1][1:4], (255, 0, 0))
+        self.assertColorAlmostEqual(colors[2][1:4], (127, 127, 255))
+        self.assertColorAlmostEqual(colors[3][1:4], (20, 200, 40))
+
+    def test_processor_keeps_colors_of_failed_inserts(self):
+        batches = []
+
+        def insert(batch):
+            if not batches:
+                batches.append(None)
+                raise RuntimeError("database is down")
+            batches.append(batch)
+
+        processor = ReleaseColorProcessor(LocalDirectoryFetcher(self.image_dir.name),
+                                          insert=insert, batch_size=2, max_threads=1)
+        for caa_id, (release_mbid, _) in self.images.items():
+            processor.add({"release_mbid": release_mbid, "caa_id": caa_id})
+        processor.finish()
+
+        # the first batch failed to be inserted and was inserted with the remaining color
+        self.assertEqual(processor.errors, 1)
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(sorted(row[4] for row in batches[1]), [1, 2, 3])
+        self.assertEqual(processor.colors, [])
@@ -0,0 +1,158 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import typesense
+import typesense.exceptions
+
+from mapping.typesense_index import import_documents, import_batch, verify_document_count, jsonl_batches, \
+    IMPORT_RETRIES
+
+
+class FakeTypesense:
+    """ A minimal typesense server, which keeps the imported documents of its collections in memory.
+        Documents whose recording name is in fail_once are rejected the first time they are imported. """
+
+    def __init__(self, fail_once=()):
+        self.collections = {}
+        self.fail_once = set(fail_once)
+        self.import_requests = 0
+        self.max_concurrent_imports = 0
+        self.concurrent_imports = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+
+    def _import(self, name, body):
+        with self.lock:
+            self.import_requests += 1
+            self.concurrent_imports += 1
+            self.max_concurrent_imports = max(self.max_concurrent_imports, self.concurrent_imports)
+
+        results = []
+        for line in body.split("\n"):
+            document = json.loads(line)
+            with self.lock:
+                if document["recording_name"] in self.fail_once:
+                    self.fail_once.remove(document["recording_name"])
+                    results.append({"success": False, "error": "Could not write to the store", "document": line})
+                    continue
+                self.collections[name].append(document)
+            results.append({"success": True})
+
+        with self.lock:
+            self.concurrent_imports -= 1
+        return "\n".join(json.dumps(r) for r in results)
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _respond(self, body):
+                if not isinstance(body, str):
+                    body = json.dumps(body)
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                name = self.path.split("?")[0].split("/")[2]
+                self._respond({"name": name, "num_documents": len(fake.collections[name])})
+
+            def do_POST(self):
+                path = self.path.split("?")[0].split("/")
+                body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+                if len(path) == 2:
+                    schema = json.loads(body)
+                    fake.collections[schema["name"]] = []
+                    self._respond(schema)
+                else:
+                    self._respond(fake._import(path[2], body))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def client(self):
+        return typesense.Client({
+            'nodes': [{'host': '127.0.0.1', 'port': self.server.server_address[1], 'protocol': 'http'}],
+            'api_key': 'key',
+            'connection_timeout_seconds': 10
+        })
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_rows(count):
+    return [{
+        "recording_name": "Recording %d" % i,
+        "recording_mbid": "10000000-0000-0000-0000-%012d" % i,
+        "release_name": "Release %d" % i,
+        "release_mbid": "20000000-0000-0000-0000-%012d" % i,
+        "artist_credit_id": i,
+        "artist_credit_name": "Artist %d" % i,
+        "artist_mbids": "{00000000-0000-0000-0000-%012d}" % i,
+        "score": i,
+    } for i in range(count)]
+
+
+@patch("mapping.typesense_index.IMPORT_RETRY_DELAY", 0)
+class TypesenseIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTypesense(fail_once=["Recording 17", "Recording 512"])
+        self.fake.start()
+        self.client = self.fake.client()
+        self.client.collections.create({"name": "mbid_mapping_test", "fields": []})
+
+    def tearDown(self):
+        self.fake.stop()
+
+    def test_jsonl_batches(self):
+        batches = list(jsonl_batches(make_rows(5), 10, batch_size=2))
+        self.assertEqual([count for count, _ in batches], [2, 2, 1])
+        document = json.loads(batches[0][1].split("\n")[1])
+        self.assertEqual(document["score"], 9)
+        self.assertEqual(document["combined"], "recording 1 artist 1")
+
+    def test_import_documents(self):
+        rows = make_rows(1050)
+        count = import_documents(self.client, "mbid_mapping_test", iter(rows), 1050, workers=3, batch_size=100)
+
+        self.assertEqual(count, 1050)
+        documents = self.fake.collections["mbid_mapping_test"]
+        self.assertEqual(sorted(d["artist_credit_id"] for d in documents), list(range(1050)))
+        # 11 batches and one retry each for the two batches with a failed document
+        self.assertEqual(self.fake.import_requests, 13)
+        self.assertLessEqual(self.fake.max_concurrent_imports, 3)
+        verify_document_count(self.client, "mbid_mapping_test", 1050, timeout=0)
+
+    def test_import_fails_after_retries(self):
+        self.fake.fail_once = set()
+        with patch.object(FakeTypesense, "_import", lambda fake, name, body: json.dumps({"success": False, "error": "full"})), \
+                self.assertRaises(typesense.exceptions.TypesenseClientError):
+            import_documents(self.client, "mbid_mapping_test", iter(make_rows(10)), 10, workers=2)
+
+    def test_no_sleep_after_last_attempt(self):
+        with patch.object(FakeTypesense, "_import", lambda fake, name, body: json.dumps({"success": False, "error": "full"})), \
+                patch("mapping.typesense_index.time.sleep") as sleep, \
+                self.assertRaises(typesense.exceptions.TypesenseClientError):
+            import_batch(self.client, "mbid_mapping_test", json.dumps({"id": "1"}))
+        self.assertEqual(sleep.call_count, IMPORT_RETRIES)
+
+    def test_verify_document_count_mismatch(self):
+        import_documents(self.client, "mbid_mapping_test", iter(make_rows(10)), 10)
+        with self.assertRaises(typesense.exceptions.TypesenseClientError):
+            verify_document_count(self.client, "mbid_mapping_test", 11, timeout=0)
@@ -2,11 +2,15 @@ import sys
 import re
 import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import zip_longest
 
 import typesense
 import typesense.exceptions
 from unidecode import unidecode
 import psycopg2
+import psycopg2.extras
+import ujson
 
 import config
 from mapping.utils import log
@@ -15,6 +19,16 @@ from mapping.utils import log
 BATCH_SIZE = 5000
 COLLECTION_NAME_PREFIX = 'mbid_mapping_'
 
+# The number of import requests that are sent to typesense at the same time
+IMPORT_WORKERS = 4
+
+# How often the documents of a batch that typesense failed to import are sent again
+IMPORT_RETRIES = 3
+IMPORT_RETRY_DELAY = 2
+
+# How long to wait for the collection to contain all imported documents, in seconds
+COUNT_VERIFY_TIMEOUT = 60
+
 
 def prepare_string(text):
     return unidecode(re.sub(" +", " ", re.sub(r'[^\w ]+', '', text)).lower())
@@ -66,7 +80,7 @@ def build_index():
     return 0
 
 
-def build(client, collection_name):
+def build(client, collection_name, workers=IMPORT_WORKERS):
 
     schema = {
         'name': collection_name,
@@ -88,38 +102,129 @@ def build(client, collection_name):
 
     with psycopg2.connect(config.MBID_MAPPING_DATABASE_URI) as conn:
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as curs:
-
             curs.execute("SELECT max(score) FROM mapping.mbid_mapping")
             max_score = curs.fetchone()[0]
 
-            query = ("""SELECT recording_name,
-                               recording_mbid,
-                               release_name,
-                               release_mbid,
-                               artist_credit_id,
-                               artist_credit_name,
-                               artist_mbids,
-                               score
-                          FROM mapping.mbid_mapping""")
-
-            curs.execute(query)
-            documents = []
-            for i, row in enumerate(curs):
-                document = dict(row)
-                document['artist_mbids'] = "{" + row["artist_mbids"][1:-1] + "}"
-                document['score'] = max_score - document['score']
-                document['combined'] = prepare_string(document['recording_name'] + " " + document['artist_credit_name'])
-                documents.append(document)
-
-                if len(documents) == BATCH_SIZE:
-                    client.collections[collection_name].documents.import_(documents)
-                    documents = []
-
-                if i and i % 1000000 == 0:
-                    log("typesense index: Indexed %d rows" % i)
-
-            if documents:
-                client.collections[collection_name].documents.import_(documents)
-
-    log("typesense index: indexing complete. waiting for background tasks to finish.")
-    time.sleep(5)
+        # Stream the rows through a server side cursor instead of fetching the whole table into memory
+        with conn.cursor("typesense_index", cursor_factory=psycopg2.extras.DictCursor) as curs:
+            curs.itersize = BATCH_SIZE
+            curs.execute("""SELECT recording_name,
+                                   recording_mbid,
+                                   release_name,
+                                   release_mbid,
+                                   artist_credit_id,
+                                   artist_credit_name,
+                                   artist_mbids,
+                                   score
+                              FROM mapping.mbid_mapping""")
+            count = import_documents(client, collection_name, curs, max_score, workers)
+
+    log("typesense index: indexing complete. verify document count.")
+    verify_document_count(client, collection_name, count)
+
+
+def make_document(row, max_score):
+    """ Make the typesense document of a mapping row """
+
+    document = dict(row)
+    document['recording_mbid'] = str(row['recording_mbid'])
+    document['release_mbid'] = str(row['release_mbid'])
+    document['artist_mbids'] = "{" + row["artist_mbids"][1:-1] + "}"
+    document['score'] = max_score - document['score']
+    document['combined'] = prepare_string(document['recording_name'] + " " + document['artist_credit_name'])
+    return document
+
+
+def jsonl_batches(rows, max_score, batch_size=BATCH_SIZE):
+    """ Serialize the mapping rows to typesense documents and yield them in JSONL batches
+        of up to batch_size documents, as (number of documents, JSONL text) """
+
+    lines = []
+    for row in rows:
+        lines.append(ujson.dumps(make_document(row, max_score)))
+        if len(lines) == batch_size:
+            yield len(lines), "\n".join(lines)
+            lines = []
+
+    if lines:
+        yield len(lines), "\n".join(lines)
+
+
+def import_batch(client, collection_name, jsonl):
+    """ Import one JSONL batch of documents. Typesense imports each document of a batch separately and
+        reports a result per document, so the documents that failed are sent again, up to IMPORT_RETRIES
+        times. Raises TypesenseClientError if documents still fail after that. """
+
+    documents = client.collections[collection_name].documents
+    for attempt in range(IMPORT_RETRIES + 1):
+        response = documents.import_(jsonl, {"action": "create"})
+        lines = jsonl.split("\n")
+        failed = []
+        error = None
+        # a document without a result is treated as failed
+        for line, result in zip_longest(lines, response.split("\n")[:len(lines)], fillvalue="{}"):
+            result = ujson.loads(result)
+            if not result.get("success", False):
+                failed.append(line)
+                error = result.get("error")
+
+        if not failed:
+            return
+
+        log("typesense index: %d of %d documents failed to import (%s)%s" %
+            (len(failed), len(lines), error, ", retrying" if attempt < IMPORT_RETRIES else ""))
+        jsonl = "\n".join(failed)
+        if attempt < IMPORT_RETRIES:
+            time.sleep(IMPORT_RETRY_DELAY * (attempt + 1))
+
+    raise typesense.exceptions.TypesenseClientError("%d documents failed to import: %s" % (len(failed), error))
+
+
+def import_documents(client, collection_name, rows, max_score, workers=IMPORT_WORKERS, batch_size=BATCH_SIZE):
+    """ Import the mapping rows into the collection, with up to workers import requests in flight
+        at once. Serializing the next batches stops while all workers are busy, so that only a few
+        batches are held in memory at any time. Returns the number of documents imported. """
+
+    count = 0
+    next_report = 1000000
+    start = time.monotonic()
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for batch_count, jsonl in jsonl_batches(rows, max_score, batch_size):
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+
+                in_flight.add(executor.submit(import_batch, client, collection_name, jsonl))
+                count += batch_count
+                if count >= next_report:
+                    log("typesense index: Indexed %d rows, %d docs/s" % (count, count / (time.monotonic() - start)))
+                    next_report += 1000000
+
+            for future in in_flight:
+                future.result()
+        except Exception:
+            for future in in_flight:
+                future.cancel()
+            raise
+
+    log("typesense index: imported %d documents in %.1fs, %d docs/s" %
+        (count, time.monotonic() - start, count / max(time.monotonic() - start, 0.001)))
+    return count
+
+
+def verify_document_count(client, collection_name, expected, timeout=COUNT_VERIFY_TIMEOUT):
+    """ Wait until the collection contains the expected number of documents, so that an incomplete
+        index is never aliased into production. Raises TypesenseClientError on timeout. """
+
+    deadline = time.monotonic() + timeout
+    while True:
+        count = client.collections[collection_name].retrieve()["num_documents"]
+        if count == expected:
+            return
+        if time.monotonic() > deadline:
+            raise typesense.exceptions.TypesenseClientError(
+                "collection %s contains %d documents, expected %d" % (collection_name, count, expected))
+        time.sleep(1)
@@ -4,6 +4,7 @@ import time
 import threading
 
 from flask import current_app
+from listenbrainz import listen_trace
 from listenbrainz.webserver import create_app
 from listenbrainz.webserver.views.api_tools import LISTEN_TYPE_PLAYING_NOW
 from listenbrainz.mbid_mapping_writer.job_queue import MappingJobQueue
@@ -20,6 +21,7 @@ class MBIDMappingWriter(threading.Thread):
         self.queue = None
 
     def callback(self, channel, method, properties, body):
+        listen_trace.record(listen_trace.from_headers(properties.headers), listen_trace.STAGE_MAPPING)
         listens = json.loads(body)
         self.queue.add_new_listens(listens)
         channel.basic_ack(method.delivery_tag)
@@ -0,0 +1,98 @@
+""" Decoding of the messages that the spark request consumer publishes to the spark result exchange.
+
+The body of a message is json, compressed if the content_encoding property of the AMQP message is set.
+Messages too large for RabbitMQ are split into parts, published as consecutive AMQP messages with the same
+message_id and the "part" (counting from 0) and "parts" headers. See
+listenbrainz_spark.request_consumer.result_publisher for the publishing side.
+"""
+import gzip
+import logging
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+HEADER_PART = 'part'
+HEADER_PARTS = 'parts'
+
+
+class ResultDecodeError(Exception):
+    pass
+
+
+def decode_body(body: bytes, content_encoding: Optional[str]) -> bytes:
+    """ Decompress the body of a result message according to its content encoding """
+    if not content_encoding:
+        return body
+    if content_encoding == 'gzip':
+        return gzip.decompress(body)
+    if content_encoding == 'zstd':
+        if zstandard is None:
+            raise ResultDecodeError('zstd compressed spark results require the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(body)
+    raise ResultDecodeError('Unknown content encoding of spark result: %s' % content_encoding)
+
+
+class ResultAssembler:
+    """ Joins the parts of the split result messages.
+
+        The parts of the message being received are kept in memory. The spark reader only acknowledges
+        them once the message is complete, so that RabbitMQ delivers them again if the spark reader
+        restarts in the middle of a message. A message whose first parts were lost anyway is dropped.
+    """
+
+    def __init__(self):
+        self.message_id = None
+        self.parts = []
+        self.total = 0
+
+    def _reset(self):
+        self.message_id = None
+        self.parts = []
+        self.total = 0
+
+    @property
+    def pending(self) -> bool:
+        """ Whether parts of a message have been received and the rest of it is still to come """
+        return bool(self.parts)
+
+    def add(self, properties, body: bytes) -> Optional[bytes]:
+        """ Add an AMQP message received from the spark result queue.
+
+            Returns:
+                the decoded json of the result message once it is complete, or None while parts of it
+                are still to be received or if it was dropped
+        """
+        headers = properties.headers or {}
+        if HEADER_PARTS not in headers:
+            if self.parts:
+                logger.error("Dropping incomplete spark result %s, received %d of its %d parts",
+                             self.message_id, len(self.parts), self.total)
+                self._reset()
+            return decode_body(body, properties.content_encoding)
+
+        part, total = headers[HEADER_PART], headers[HEADER_PARTS]
+        if part == 0:
+            if self.parts:
+                # the request consumer publishes a message again from its start when it was interrupted
+                logger.warning("Dropping incomplete spark result %s, received %d of its %d parts",
+                               self.message_id, len(self.parts), self.total)
+            self._reset()
+            self.message_id = properties.message_id
+            self.total = total
+        elif properties.message_id != self.message_id or part != len(self.parts):
+            logger.error("Dropping part %d of spark result %s, its previous parts weren't received",
+                         part, properties.message_id)
+            self._reset()
+            return None
+
+        self.parts.append(body)
+        if len(self.parts) < self.total:
+            return None
+        body, content_encoding = b''.join(self.parts), properties.content_encoding
+        self._reset()
+        return decode_body(body, content_encoding)
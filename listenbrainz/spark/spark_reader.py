@@ -24,6 +24,7 @@ from listenbrainz.spark.handlers import (handle_candidate_sets,
                                          handle_missing_musicbrainz_data,
                                          notify_cf_recording_recommendations_generation,
                                          handle_similar_users, handle_sitewide_listening_activity)
+from listenbrainz.spark.result_assembler import ResultAssembler
 
 from listenbrainz.webserver import create_app
 
@@ -52,6 +53,8 @@ RABBITMQ_HEARTBEAT_TIME = 60 * 60  # 1 hour, in seconds
 class SparkReader:
     def __init__(self):
         self.app = create_app()  # creating a flask app for config values and logging to Sentry
+        self.assembler = ResultAssembler()
+        self.prefetch_count = 1
 
     def get_response_handler(self, response_type):
         return response_handler_map[response_type]
@@ -99,11 +102,31 @@ class SparkReader:
             insert into the database accordingly.
         """
         current_app.logger.debug("Received a message, processing...")
-        response = ujson.loads(body)
-        self.process_response(response)
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        try:
+            body = self.assembler.add(properties, body)
+        except Exception:
+            current_app.logger.error("Error while decoding a spark result, dropping it:", exc_info=True)
+            body = None
+        if self.assembler.pending:
+            # the parts are acknowledged once the whole message has been received, so that RabbitMQ
+            # delivers them again if the reader stops before. Meanwhile, let it deliver all of them.
+            self.set_prefetch_count(ch, self.assembler.total)
+            current_app.logger.debug("Waiting for the rest of the message.")
+            return
+        if body is not None:
+            response = ujson.loads(body)
+            self.process_response(response)
+        # also acknowledges the previous parts of the message, or those of a message that was dropped
+        ch.basic_ack(delivery_tag=method.delivery_tag, multiple=True)
+        self.set_prefetch_count(ch, 1)
         current_app.logger.debug("Done!")
 
+    def set_prefetch_count(self, ch, prefetch_count):
+        """ Set the number of unacknowledged messages RabbitMQ delivers to the channel """
+        if prefetch_count != self.prefetch_count:
+            ch.basic_qos(prefetch_count=prefetch_count)
+            self.prefetch_count = prefetch_count
+
     def start(self):
         """ initiates RabbitMQ connection and starts consuming from the queue
         """
@@ -119,6 +142,9 @@ class SparkReader:
                     callback_function=self.callback,
                     auto_ack=False,
                 )
+                # the unacknowledged parts of a message are delivered again on the new channel
+                self.assembler = ResultAssembler()
+                self.prefetch_count = 1
                 current_app.logger.info('Spark consumer attempt to start consuming!')
                 try:
                     self.incoming_ch.start_consuming()
@@ -0,0 +1,160 @@
+import gzip
+import json
+import unittest
+import uuid
+from unittest.mock import MagicMock, call, patch
+
+import pika
+
+import listenbrainz.utils as utils
+from listenbrainz.spark.result_assembler import ResultAssembler, ResultDecodeError, decode_body
+from listenbrainz.spark.spark_reader import SparkReader
+
+
+def split_message(message, part_size, message_id='id'):
+    """ Encode a message as the spark request consumer does, gzipped and split into parts """
+    body = gzip.compress(json.dumps(message).encode('utf-8'))
+    parts = [body[i:i + part_size] for i in range(0, len(body), part_size)]
+    return [(pika.BasicProperties(content_encoding='gzip', message_id=message_id,
+                                  headers={'part': i, 'parts': len(parts)}), part)
+            for i, part in enumerate(parts)]
+
+
+class ResultAssemblerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.assembler = ResultAssembler()
+        self.message = {'type': 'user_entity', 'data': [{'artist_name': 'Artist %d' % i} for i in range(1000)]}
+
+    def test_decode_body(self):
+        body = json.dumps(self.message).encode('utf-8')
+        self.assertEqual(decode_body(body, None), body)
+        self.assertEqual(decode_body(gzip.compress(body), 'gzip'), body)
+        with self.assertRaises(ResultDecodeError):
+            decode_body(body, 'br')
+
+    def test_add_unsplit_message(self):
+        body = json.dumps(self.message).encode('utf-8')
+        self.assertEqual(self.assembler.add(pika.BasicProperties(), body), body)
+        result = self.assembler.add(pika.BasicProperties(content_encoding='gzip'), gzip.compress(body))
+        self.assertEqual(json.loads(result), self.message)
+
+    def test_add_parts(self):
+        parts = split_message(self.message, 100)
+        self.assertGreater(len(parts), 2)
+        for properties, part in parts[:-1]:
+            self.assertIsNone(self.assembler.add(properties, part))
+            self.assertTrue(self.assembler.pending)
+        properties, part = parts[-1]
+        self.assertEqual(json.loads(self.assembler.add(properties, part)), self.message)
+        self.assertFalse(self.assembler.pending)
+
+    def test_add_parts_of_restarted_message(self):
+        # the request consumer was interrupted after publishing the first parts of the message,
+        # and publishes it again from its first part
+        parts = split_message(self.message, 100)
+        for properties, part in parts[:2]:
+            self.assembler.add(properties, part)
+        results = [self.assembler.add(properties, part) for properties, part in parts]
+        self.assertEqual(json.loads(results[-1]), self.message)
+
+    def test_add_parts_with_missing_first_parts(self):
+        # the first parts of the message were received before the spark reader restarted
+        parts = split_message(self.message, 100)
+        for properties, part in parts[2:]:
+            self.assertIsNone(self.assembler.add(properties, part))
+
+        # the next message is received
+        body = json.dumps({'type': 'similar_users'}).encode('utf-8')
+        self.assertEqual(self.assembler.add(pika.BasicProperties(), body), body)
+
+
+class SparkReaderAckTestCase(unittest.TestCase):
+    """ Checks when the spark reader acknowledges the messages it receives """
+
+    def setUp(self):
+        self.reader = SparkReader()
+        self.channel = MagicMock()
+
+    def receive(self, messages, first_delivery_tag=1):
+        with self.reader.app.app_context():
+            for delivery_tag, (properties, body) in enumerate(messages, start=first_delivery_tag):
+                self.reader.callback(self.channel, MagicMock(delivery_tag=delivery_tag), properties, body)
+
+    @patch('listenbrainz.spark.spark_reader.SparkReader.process_response')
+    def test_parts_are_acknowledged_once_complete(self, mock_process_response):
+        message = {'type': 'user_entity', 'data': [{'artist_name': str(uuid.uuid4())} for _ in range(100)]}
+        parts = split_message(message, 500)
+
+        self.receive(parts[:-1])
+        self.channel.basic_ack.assert_not_called()
+        # all the parts can be delivered without being acknowledged
+        self.channel.basic_qos.assert_called_once_with(prefetch_count=len(parts))
+
+        self.receive(parts[-1:], first_delivery_tag=len(parts))
+        mock_process_response.assert_called_once_with(message)
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=len(parts), multiple=True)
+        self.assertEqual(self.channel.basic_qos.call_args_list[-1], call(prefetch_count=1))
+
+    @patch('listenbrainz.spark.spark_reader.SparkReader.process_response')
+    def test_parts_of_dropped_message_are_acknowledged(self, mock_process_response):
+        parts = split_message({'type': 'user_entity', 'data': []}, 10)
+        small = {'type': 'similar_users', 'data': {}}
+        self.receive(parts[:1] + [(pika.BasicProperties(), json.dumps(small).encode('utf-8'))])
+        mock_process_response.assert_called_once_with(small)
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+
+
+class SparkReaderResultsTestCase(unittest.TestCase):
+    """ Receives results published to a local RabbitMQ with the spark reader """
+
+    def setUp(self):
+        self.reader = SparkReader()
+        config = self.reader.app.config
+        self.connection = utils.connect_to_rabbitmq(
+            username=config['RABBITMQ_USERNAME'],
+            password=config['RABBITMQ_PASSWORD'],
+            host=config['RABBITMQ_HOST'],
+            port=config['RABBITMQ_PORT'],
+            virtual_host=config['RABBITMQ_VHOST'],
+            error_logger=print,
+        )
+        self.channel = self.connection.channel()
+        self.queue = 'test_spark_result_' + str(uuid.uuid4())
+        self.channel.queue_declare(self.queue, exclusive=True)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def receive_all(self):
+        while True:
+            method, properties, body = self.channel.basic_get(self.queue)
+            if method is None:
+                break
+            self.reader.callback(self.channel, method, properties, body)
+
+    @patch('listenbrainz.spark.spark_reader.SparkReader.process_response')
+    def test_callback_reassembles_parts(self, mock_process_response):
+        large = {'type': 'user_entity', 'data': [{'artist_name': str(uuid.uuid4())} for _ in range(2000)]}
+        small = {'type': 'similar_users', 'data': {}}
+        for properties, part in split_message(large, 10000):
+            self.channel.basic_publish(exchange='', routing_key=self.queue, body=part, properties=properties)
+        self.channel.basic_publish(exchange='', routing_key=self.queue, body=json.dumps(small))
+
+        with self.reader.app.app_context():
+            self.receive_all()
+
+        self.assertEqual([call[0][0] for call in mock_process_response.call_args_list], [large, small])
+        # all the parts were acknowledged
+        self.assertEqual(self.channel.queue_declare(self.queue, passive=True).method.message_count, 0)
+
+    @patch('listenbrainz.spark.spark_reader.SparkReader.process_response')
+    def test_callback_drops_undecodable_result(self, mock_process_response):
+        self.channel.basic_publish(exchange='', routing_key=self.queue, body=b'not gzip',
+                                   properties=pika.BasicProperties(content_encoding='gzip'))
+
+        with self.reader.app.app_context():
+            self.receive_all()
+
+        mock_process_response.assert_not_called()
+        self.assertEqual(self.channel.queue_declare(self.queue, passive=True).method.message_count, 0)
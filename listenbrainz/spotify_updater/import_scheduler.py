@@ -0,0 +1,186 @@
+""" Scheduling primitives for the Spotify listens importer.
+
+The importer used to walk every connected user one after another. The classes
+in this module let it fan out over a bounded pool of worker threads while all
+workers share a single request budget for the Spotify API, so that a rate limit
+response seen by one worker slows down every worker.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional, Tuple
+
+from brainzutils import metrics
+
+# Default size of the worker pool used to import listens
+DEFAULT_MAX_WORKERS = 4
+
+# Default number of Spotify API requests allowed per second across all workers
+DEFAULT_REQUESTS_PER_SECOND = 10
+
+# Bounds (in seconds) for the per-user poll interval. Users who are actively listening
+# are polled every MIN_POLL_INTERVAL seconds, idle users back off to MAX_POLL_INTERVAL.
+MIN_POLL_INTERVAL = 60
+MAX_POLL_INTERVAL = 30 * 60
+
+# How often (in seconds) the queue depth is reported while a sweep is running
+QUEUE_DEPTH_REPORT_INTERVAL = 10
+
+
+class TokenBucket:
+    """ A thread safe token bucket shared by all import workers.
+
+    Every request to the Spotify API takes a token from the bucket. Tokens are refilled
+    at a constant rate up to the capacity of the bucket. When Spotify responds with a 429,
+    the bucket is paused for the duration asked for in the Retry-After header and nobody
+    gets a token until the pause is over.
+
+    Args:
+        rate: the number of tokens added to the bucket per second
+        capacity: the maximum number of tokens the bucket can hold, defaults to rate
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """ Block until a token is available and take it. """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait_for = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+    def pause(self, seconds: float):
+        """ Stop handing out tokens for the specified number of seconds.
+
+        Overlapping pauses do not add up, the one ending last wins.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            # the bucket starts empty once the pause is over so that
+            # workers do not hit the API all at once
+            self.tokens = 0
+            self.updated_at = max(self.updated_at, self.paused_until)
+
+
+class ImportScheduler:
+    """ Imports listens for a list of users using a bounded pool of worker threads.
+
+    The scheduler also keeps track of when each user should be polled next. Every user
+    starts out with an interval of MIN_POLL_INTERVAL. Each time we poll a user and find
+    no new listens, the interval is doubled up to MAX_POLL_INTERVAL. As soon as new
+    listens show up the interval is reset.
+
+    Args:
+        app: the flask app, an app context is pushed in each worker thread
+        max_workers: the maximum number of users processed concurrently
+        min_interval: the poll interval for users with new listens, in seconds
+        max_interval: the upper bound of the poll interval for idle users, in seconds
+    """
+
+    def __init__(self, app, max_workers: int = DEFAULT_MAX_WORKERS,
+                 min_interval: float = MIN_POLL_INTERVAL, max_interval: float = MAX_POLL_INTERVAL):
+        self.app = app
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.next_poll: Dict[int, float] = {}
+        self.interval: Dict[int, float] = {}
+
+    def due_users(self, users: List[dict], now: Optional[float] = None) -> List[dict]:
+        """ Filter out the users whose next poll time has not come yet.
+
+        Users that have never been polled by this scheduler are always due.
+        """
+        if now is None:
+            now = time.monotonic()
+        return [u for u in users if self.next_poll.get(u['user_id'], 0) <= now]
+
+    def reschedule(self, user_id: int, imported: Optional[int], now: Optional[float] = None):
+        """ Compute the next poll time of a user after processing.
+
+        Args:
+            user_id: the ListenBrainz row ID of the user
+            imported: the number of listens imported in this pass, None if the import failed
+        """
+        if now is None:
+            now = time.monotonic()
+        if imported:
+            interval = self.min_interval
+        else:
+            interval = min(self.interval.get(user_id, self.min_interval / 2) * 2, self.max_interval)
+        self.interval[user_id] = interval
+        self.next_poll[user_id] = now + interval
+
+    def _process(self, process_user: Callable[[dict], int], user: dict) -> int:
+        with self.app.app_context():
+            return process_user(user)
+
+    def run(self, users: List[dict], process_user: Callable[[dict], int]) -> Tuple[int, int, int]:
+        """ Process all the users which are due and wait for all of them to finish.
+
+        Args:
+            users: the list of users connected to the service
+            process_user: a callable that imports listens for one user and returns the
+                number of listens imported
+
+        Returns:
+            (success, failure, imported) where
+                success: the number of users whose plays were successfully imported.
+                failure: the number of users for whom we faced errors while importing.
+                imported: the total number of listens imported.
+        """
+        start = time.monotonic()
+        due = self.due_users(users, start)
+        self.app.logger.info('%d of %d users are due for an import', len(due), len(users))
+
+        success, failure, imported = 0, 0, 0
+        report_time = start + QUEUE_DEPTH_REPORT_INTERVAL
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._process, process_user, user): user for user in due}
+            pending = set(futures)
+            while pending:
+                completed, pending = wait(pending, timeout=QUEUE_DEPTH_REPORT_INTERVAL,
+                                          return_when=FIRST_COMPLETED)
+                for future in completed:
+                    user = futures[future]
+                    exc = future.exception()
+                    if exc:
+                        self.app.logger.critical('spotify_reader could not import listens for user %s:',
+                                                 user['musicbrainz_id'], exc_info=exc)
+                        failure += 1
+                        self.reschedule(user['user_id'], None)
+                    else:
+                        count = future.result() or 0
+                        imported += count
+                        success += 1
+                        self.reschedule(user['user_id'], count)
+
+                if time.monotonic() > report_time:
+                    report_time = time.monotonic() + QUEUE_DEPTH_REPORT_INTERVAL
+                    metrics.set("spotify_reader", queue_depth=len(pending))
+
+        metrics.set("spotify_reader",
+                    sweep_duration=time.monotonic() - start,
+                    queue_depth=0,
+                    users_due=len(due),
+                    users_deferred=len(users) - len(due))
+        return success, failure, imported
@@ -26,11 +26,16 @@ from listenbrainz.db.exceptions import DatabaseException
 from spotipy import SpotifyException
 from werkzeug.exceptions import InternalServerError, ServiceUnavailable
 from brainzutils.mail import send_mail
+from listenbrainz.spotify_updater.import_scheduler import ImportScheduler, TokenBucket, \
+    DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND
 
 METRIC_UPDATE_INTERVAL = 60  # seconds
 _listens_imported_since_last_update = 0  # number of listens imported since last metric update was submitted
 _metric_submission_time = time.monotonic() + METRIC_UPDATE_INTERVAL
 
+# request budget for the Spotify API shared by all import workers
+rate_limiter = TokenBucket(rate=DEFAULT_REQUESTS_PER_SECOND)
+
 def notify_error(musicbrainz_id: str, error: str):
     """ Notifies specified user via email about error during Spotify import.
 
@@ -150,6 +155,7 @@ def make_api_request(user: dict, endpoint: str, **kwargs):
     tried_to_refresh_token = False
 
     while retries > 0:
+        rate_limiter.acquire()
         try:
             spotipy_client = spotipy.Spotify(auth=user['access_token'])
             spotipy_call = getattr(spotipy_client, endpoint)
@@ -163,13 +169,14 @@ def make_api_request(user: dict, endpoint: str, **kwargs):
             if e.http_status == 429:
                 # Rate Limit Problems -- the client handles these, but it can still give up
                 # after a certain number of retries, so we look at the header and try the
-                # request again, if the error is raised
+                # request again, if the error is raised. The rate limit applies to our app
+                # as a whole, so pause the shared limiter to stop all workers from making requests.
                 try:
-                    time_to_sleep = int(e.headers.get('Retry-After', delay))
+                    time_to_sleep = int((e.headers or {}).get('Retry-After', delay))
                 except ValueError:
                     time_to_sleep = delay
                 current_app.logger.warn('Encountered a rate limit, sleeping %d seconds and trying again...', time_to_sleep)
-                time.sleep(time_to_sleep)
+                rate_limiter.pause(time_to_sleep)
                 delay += 1
                 if retries == 0:
                     raise ExternalServiceError('Encountered a rate limit.')
@@ -354,9 +361,15 @@ def process_one_user(user: dict, service: SpotifyService) -> int:
         raise ExternalServiceError("Could not refresh user token from spotify")
 
 
-def process_all_spotify_users():
+def process_all_spotify_users(scheduler: ImportScheduler = None):
     """ Get a batch of users to be processed and import their Spotify plays.
 
+    Users are processed concurrently by the worker pool of the scheduler.
+
+    Args:
+        scheduler: the scheduler which keeps track of when each user should be polled next.
+            If not specified, a new scheduler is created and all users are processed.
+
     Returns:
         (success, failure) where
             success: the number of users whose plays were successfully imported.
@@ -375,22 +388,18 @@ def process_all_spotify_users():
     if not users:
         return 0, 0
 
+    if scheduler is None:
+        scheduler = ImportScheduler(current_app._get_current_object(),
+                                    max_workers=current_app.config.get('SPOTIFY_IMPORT_WORKERS', DEFAULT_MAX_WORKERS))
+
     current_app.logger.info('Process %d users...' % len(users))
-    success = 0
-    failure = 0
-    for u in users:
-        try:
-            _listens_imported_since_last_update += process_one_user(u, service)
-            success += 1
-        except Exception:
-            current_app.logger.critical('spotify_reader could not import listens for user %s:',
-                                        u['musicbrainz_id'], exc_info=True)
-            failure += 1
-
-        if time.monotonic() > _metric_submission_time:
-            _metric_submission_time += METRIC_UPDATE_INTERVAL
-            metrics.set("spotify_reader", imported_listens=_listens_imported_since_last_update)
-            _listens_imported_since_last_update = 0
+    success, failure, imported = scheduler.run(users, lambda user: process_one_user(user, service))
+
+    _listens_imported_since_last_update += imported
+    if time.monotonic() > _metric_submission_time:
+        _metric_submission_time = time.monotonic() + METRIC_UPDATE_INTERVAL
+        metrics.set("spotify_reader", imported_listens=_listens_imported_since_last_update)
+        _listens_imported_since_last_update = 0
 
     current_app.logger.info('Processed %d users successfully!', success)
     current_app.logger.info('Encountered errors while processing %d users.', failure)
@@ -401,9 +410,12 @@ def main():
     app = listenbrainz.webserver.create_app()
     with app.app_context():
         current_app.logger.info('Spotify Reader started...')
+        rate_limiter.rate = rate_limiter.capacity = \
+            app.config.get('SPOTIFY_IMPORT_REQUESTS_PER_SECOND', DEFAULT_REQUESTS_PER_SECOND)
+        scheduler = ImportScheduler(app, max_workers=app.config.get('SPOTIFY_IMPORT_WORKERS', DEFAULT_MAX_WORKERS))
         while True:
             t = time.monotonic()
-            success, failure = process_all_spotify_users()
+            success, failure = process_all_spotify_users(scheduler)
             total_users = success + failure
             if total_users > 0:
                 total_time = time.monotonic() - t
@@ -0,0 +1,170 @@
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from spotipy import SpotifyException
+
+import listenbrainz.webserver
+from listenbrainz.spotify_updater import spotify_read_listens
+from listenbrainz.spotify_updater.import_scheduler import ImportScheduler, TokenBucket
+
+
+class FakeSpotipy:
+    """ A stand-in for spotipy.Spotify which takes some time to respond
+    and answers the first few requests with a rate limit error. """
+
+    lock = threading.Lock()
+    latency = 0.1
+    rate_limited_calls = 0
+    retry_after = '1'
+    calls = []
+    max_concurrent = 0
+    concurrent = 0
+
+    @classmethod
+    def reset(cls, latency=0.1, rate_limited_calls=0):
+        cls.latency = latency
+        cls.rate_limited_calls = rate_limited_calls
+        cls.calls = []
+        cls.max_concurrent = 0
+        cls.concurrent = 0
+
+    def __init__(self, auth):
+        self.auth = auth
+
+    def _request(self, endpoint):
+        cls = type(self)
+        with cls.lock:
+            cls.calls.append((endpoint, time.monotonic()))
+            if cls.rate_limited_calls > 0:
+                cls.rate_limited_calls -= 1
+                raise SpotifyException(429, -1, 'rate limited', headers={'Retry-After': cls.retry_after})
+            cls.concurrent += 1
+            cls.max_concurrent = max(cls.max_concurrent, cls.concurrent)
+        time.sleep(cls.latency)
+        with cls.lock:
+            cls.concurrent -= 1
+
+    def current_user_playing_track(self):
+        self._request('current_user_playing_track')
+        return None
+
+    def current_user_recently_played(self, limit, after):
+        self._request('current_user_recently_played')
+        return None
+
+
+def make_user(user_id):
+    return {
+        'user_id': user_id,
+        'musicbrainz_id': 'user_%d' % user_id,
+        'access_token': 'token',
+        'refresh_token': 'refresh',
+        'latest_listened_at': None,
+    }
+
+
+class TokenBucketTestCase(TestCase):
+
+    def test_acquire_respects_rate(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        # first token is available immediately, the rest come in at 20/s
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_pause_blocks_all_callers(self):
+        bucket = TokenBucket(rate=1000)
+        bucket.pause(0.3)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.29)
+
+    def test_overlapping_pauses_do_not_add_up(self):
+        bucket = TokenBucket(rate=1000)
+        bucket.pause(0.3)
+        bucket.pause(0.1)
+        self.assertAlmostEqual(bucket.paused_until - time.monotonic(), 0.3, delta=0.05)
+
+
+class ImportSchedulerTestCase(TestCase):
+
+    def setUp(self):
+        self.app = listenbrainz.webserver.create_app()
+        FakeSpotipy.reset()
+        self.service = MagicMock()
+        self.service.user_oauth_token_has_expired.return_value = False
+
+    def test_reschedule_backs_off_idle_users(self):
+        scheduler = ImportScheduler(self.app, min_interval=10, max_interval=35)
+        scheduler.reschedule(1, 0, now=0)
+        self.assertEqual(scheduler.next_poll[1], 10)
+        scheduler.reschedule(1, 0, now=10)
+        self.assertEqual(scheduler.next_poll[1], 30)
+        scheduler.reschedule(1, None, now=30)
+        self.assertEqual(scheduler.next_poll[1], 65)
+        scheduler.reschedule(1, 0, now=65)
+        self.assertEqual(scheduler.next_poll[1], 100)
+
+        # new listens reset the interval
+        scheduler.reschedule(1, 5, now=100)
+        self.assertEqual(scheduler.next_poll[1], 110)
+
+    def test_due_users(self):
+        scheduler = ImportScheduler(self.app)
+        users = [make_user(1), make_user(2), make_user(3)]
+        scheduler.next_poll = {1: 50, 2: 150}
+        self.assertListEqual([u['user_id'] for u in scheduler.due_users(users, now=100)], [1, 3])
+
+    @patch('spotipy.Spotify', FakeSpotipy)
+    @patch('listenbrainz.spotify_updater.spotify_read_listens.rate_limiter', TokenBucket(rate=1000))
+    def test_users_are_processed_concurrently(self):
+        users = [make_user(i) for i in range(8)]
+        scheduler = ImportScheduler(self.app, max_workers=4)
+
+        start = time.monotonic()
+        success, failure, imported = scheduler.run(
+            users, lambda user: spotify_read_listens.process_one_user(user, self.service))
+        duration = time.monotonic() - start
+
+        self.assertEqual((success, failure, imported), (8, 0, 0))
+        self.assertEqual(len(FakeSpotipy.calls), 16)
+        self.assertEqual(FakeSpotipy.max_concurrent, 4)
+        # two requests of 0.1s per user, a serial sweep would take 1.6s
+        self.assertLess(duration, 1.0)
+
+        # nobody had new listens, so nobody is due again right away
+        self.assertListEqual(scheduler.due_users(users), [])
+
+    @patch('spotipy.Spotify', FakeSpotipy)
+    @patch('listenbrainz.spotify_updater.spotify_read_listens.rate_limiter', TokenBucket(rate=1000))
+    def test_retry_after_is_honoured_by_all_workers(self):
+        FakeSpotipy.reset(latency=0.01, rate_limited_calls=1)
+        users = [make_user(i) for i in range(4)]
+        scheduler = ImportScheduler(self.app, max_workers=4)
+
+        with self.app.app_context():
+            success, failure, _ = scheduler.run(
+                users, lambda user: spotify_read_listens.process_one_user(user, self.service))
+
+        self.assertEqual((success, failure), (4, 0))
+        rate_limited_at = FakeSpotipy.calls[0][1]
+        later_calls = [t for _, t in FakeSpotipy.calls[1:]]
+        # every request after the 429 waited for the Retry-After of 1s, including those of other users
+        self.assertTrue(all(t - rate_limited_at >= 0.95 for t in later_calls
+                            if t - rate_limited_at > 0.05))
+        self.assertEqual(len(FakeSpotipy.calls), 9)
+
+    def test_failures_are_counted(self):
+        users = [make_user(1), make_user(2)]
+
+        def process_user(user):
+            if user['user_id'] == 1:
+                raise Exception('borked')
+            return 3
+
+        scheduler = ImportScheduler(self.app)
+        success, failure, imported = scheduler.run(users, process_user)
+        self.assertEqual((success, failure, imported), (1, 1, 3))
@@ -7,6 +7,7 @@ from flask import url_for, current_app
 import listenbrainz.db.user as db_user
 import listenbrainz.db.user_relationship as db_user_relationship
 from listenbrainz import db
+from listenbrainz.listenstore.listen_delete_jobs import queue_listen_deletion, process_listen_delete_jobs
 from listenbrainz.tests.integration import ListenAPIIntegrationTestCase
 from listenbrainz.webserver import timescale_connection
 from listenbrainz.webserver.views.api_tools import is_valid_uuid
@@ -877,6 +878,33 @@ class APITestCase(ListenAPIIntegrationTestCase):
         self.assertEqual(
             response.json["error"], "invalid recording_msid: Recording MSID format invalid.")
 
+    def test_get_delete_listens_job(self):
+        job_id = queue_listen_deletion(self.user['musicbrainz_id'])
+        job_url = url_for('api_v1.get_delete_listens_job', job_id=job_id)
+        headers = {'Authorization': 'Token {}'.format(self.user['auth_token'])}
+
+        response = self.client.get(job_url, headers=headers)
+        self.assert200(response)
+        self.assertEqual(response.json["job_id"], job_id)
+        self.assertEqual(response.json["status"], "pending")
+        self.assertIsNone(response.json["completed"])
+
+        process_listen_delete_jobs()
+        response = self.client.get(job_url, headers=headers)
+        self.assert200(response)
+        self.assertEqual(response.json["status"], "completed")
+        self.assertIsNotNone(response.json["completed"])
+
+        # the jobs of other users aren't found
+        response = self.client.get(job_url, headers={'Authorization': 'Token {}'.format(self.user2['auth_token'])})
+        self.assert404(response)
+
+        response = self.client.get(url_for('api_v1.get_delete_listens_job', job_id=job_id + 1), headers=headers)
+        self.assert404(response)
+
+        response = self.client.get(job_url)
+        self.assert401(response)
+
     def test_followers_returns_the_followers_of_a_user(self):
         r = self.client.post(self.follow_user_url, headers=self.follow_user_headers)
         self.assert200(r)
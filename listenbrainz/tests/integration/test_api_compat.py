@@ -19,6 +19,7 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
 
+import json
 import time
 import logging
 import xmltodict
@@ -251,12 +252,82 @@ class APICompatTestCase(APICompatIntegrationTestCase):
         listens, _, _ = self.ls.fetch_listens(self.lb_user['musicbrainz_id'], from_ts=timestamp-1)
         self.assertEqual(len(listens), 2)
 
+    def test_record_listen_json(self):
+        """ Tests that the response of a scrobble is rendered in json if requested. """
+
+        token = Token.generate(self.lfm_user.api_key)
+        token.approve(self.lfm_user.name)
+        session = Session.create(token)
+
+        timestamp = int(time.time())
+        data = {
+            'method': 'track.scrobble',
+            'format': 'json',
+            'api_key': self.lfm_user.api_key,
+            'sk': session.sid,
+            'artist[0]': 'Kishore Kumar',
+            'track[0]': 'Saamne Ye Kaun Aya',
+            'timestamp[0]': timestamp,
+        }
+
+        r = self.client.post(url_for('api_compat.api_methods'), data=data)
+        self.assert200(r)
+        self.assertEqual(json.loads(r.data), {
+            'scrobbles': {
+                'accepted': '1',
+                'ignored': '0',
+                'scrobble': {
+                    'track': {'corrected': '0', '#text': 'Saamne Ye Kaun Aya'},
+                    'artist': {'corrected': '0', '#text': 'Kishore Kumar'},
+                    'album': {'corrected': '0'},
+                    'albumArtist': {'corrected': '0', '#text': 'Kishore Kumar'},
+                    'timestamp': str(timestamp),
+                    'ignoredMessage': {'code': '0'},
+                },
+            },
+        })
+
+    def test_render_response(self):
+        """ Tests that render_response renders the same documents as format_response. """
+
+        from listenbrainz.webserver.views.api_compat import format_response, render_response
+
+        scrobble = ('scrobble', {}, [
+            ('track', {'corrected': '1'}, 'Saamne Ye Kaun Aya & <Other>'),
+            ('album', {'corrected': '0'}, ''),
+            ('timestamp', {}, '1600000000'),
+        ])
+        for scrobbles in ([scrobble], [scrobble, scrobble]):
+            element = ('lfm', {'status': 'ok'}, [('scrobbles', {'accepted': str(len(scrobbles))}, scrobbles)])
+            xml = render_response(element)
+            self.assertEqual(xmltodict.parse(xml)['lfm']['scrobbles']['@accepted'], str(len(scrobbles)))
+            self.assertEqual(json.loads(render_response(element, 'json')), json.loads(format_response(xml, 'json')))
+
+    def test_parse_bracket_keys(self):
+        from listenbrainz.webserver.views.api_compat import parse_bracket_keys
+
+        lookup = parse_bracket_keys({
+            'method': 'track.scrobble',
+            'sk': 'session key',
+            'format': 'json',
+            'artist[0]': 'Kishore Kumar',
+            'track[0]': 'Saamne Ye Kaun Aya',
+            'artist[1]': 'Fifth Harmony',
+            'track': 'Deliver',
+        })
+        self.assertEqual(lookup, {
+            '0': {'artist': 'Kishore Kumar', 'track': 'Saamne Ye Kaun Aya'},
+            '1': {'artist': 'Fifth Harmony'},
+            0: {'track': 'Deliver'},
+        })
+
     def test_create_response_for_single_listen(self):
         """ Tests create_response_for_single_listen method in api_compat
             to check if responses are generated correctly.
         """
 
         from listenbrainz.webserver.views.api_compat import create_response_for_single_listen
+        from listenbrainz.webserver.views.api_tools import LISTEN_TYPE_IMPORT, LISTEN_TYPE_PLAYING_NOW
 
         timestamp = int(time.time())
 
@@ -281,7 +352,7 @@ class APICompatTestCase(APICompatIntegrationTestCase):
         }
 
         # If original listen and augmented listen are same
-        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type="listens")
+        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type=LISTEN_TYPE_IMPORT)
         response = xmltodict.parse(xml_response)
 
         self.assertEqual(response['scrobble']['track']['#text'], 'Saamne Ye Kaun Aya')
@@ -292,7 +363,7 @@ class APICompatTestCase(APICompatIntegrationTestCase):
         self.assertEqual(response['scrobble']['timestamp'], str(timestamp))
 
         # If listen type is 'playing_now'
-        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type="playing_now")
+        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type=LISTEN_TYPE_PLAYING_NOW)
         response = xmltodict.parse(xml_response)
 
         self.assertEqual(response['nowplaying']['track']['#text'], 'Saamne Ye Kaun Aya')
@@ -306,7 +377,7 @@ class APICompatTestCase(APICompatIntegrationTestCase):
         # If artist was corrected
         original_listen['artist'] = 'Pink'
 
-        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type="listens")
+        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type=LISTEN_TYPE_IMPORT)
         response = xmltodict.parse(xml_response)
 
         self.assertEqual(response['scrobble']['track']['#text'], 'Saamne Ye Kaun Aya')
@@ -321,7 +392,7 @@ class APICompatTestCase(APICompatIntegrationTestCase):
         original_listen['artist'] = 'Kishore Kumar'
         original_listen['track'] = 'Deliver'
 
-        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type="listens")
+        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type=LISTEN_TYPE_IMPORT)
         response = xmltodict.parse(xml_response)
 
         self.assertEqual(response['scrobble']['track']['#text'], 'Saamne Ye Kaun Aya')
@@ -336,7 +407,7 @@ class APICompatTestCase(APICompatIntegrationTestCase):
         original_listen['track'] = 'Saamne Ye Kaun Aya'
         original_listen['album'] = 'Good Life'
 
-        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type="listens")
+        xml_response = create_response_for_single_listen(original_listen, augmented_listen, listen_type=LISTEN_TYPE_IMPORT)
         response = xmltodict.parse(xml_response)
 
         self.assertEqual(response['scrobble']['track']['#text'], 'Saamne Ye Kaun Aya')
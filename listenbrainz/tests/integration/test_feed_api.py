@@ -16,7 +16,8 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
-from data.model.user_timeline_event import UserTimelineEventMetadata, RecordingRecommendationMetadata
+from data.model.user_timeline_event import UserTimelineEventMetadata, RecordingRecommendationMetadata, \
+    NotificationMetadata
 from listenbrainz.tests.integration import ListenAPIIntegrationTestCase
 from flask import url_for, current_app
 
@@ -225,6 +226,79 @@ class FeedAPITestCase(ListenAPIIntegrationTestCase):
         self.assertEqual('follow', r.json['payload']['events'][2]['metadata']['relationship_type'])
 
 
+    def test_it_pages_through_events_with_cursor(self):
+        # make the users you're following follow new users, so that several events share a timestamp
+        for i in range(3):
+            new_user = db_user.get_or_create(104 + i, 'new_user_%d' % i)
+            db_user_relationship.insert(self.following_user_1['id'], new_user['id'], 'follow')
+
+        first_page = self.client.get(
+            url_for('user_timeline_event_api_bp.user_feed', user_name=self.main_user['musicbrainz_id']),
+            headers={'Authorization': f"Token {self.main_user['auth_token']}"},
+            query_string={'max_ts': int(time.time()) + 1, 'count': 3}
+        )
+        self.assert200(first_page)
+        self.assertEqual(3, first_page.json['payload']['count'])
+        self.assertIsNotNone(first_page.json['payload']['next_cursor'])
+
+        second_page = self.client.get(
+            url_for('user_timeline_event_api_bp.user_feed', user_name=self.main_user['musicbrainz_id']),
+            headers={'Authorization': f"Token {self.main_user['auth_token']}"},
+            query_string={'cursor': first_page.json['payload']['next_cursor'], 'count': 3}
+        )
+        self.assert200(second_page)
+        # 3 follows by following_1 and 2 own follow events, nothing is repeated or lost between the pages
+        self.assertEqual(2, second_page.json['payload']['count'])
+        self.assertIsNone(second_page.json['payload']['next_cursor'])
+        followed = [event['metadata']['user_name_1']
+                    for page in (first_page, second_page) for event in page.json['payload']['events']]
+        self.assertCountEqual(followed, ['new_user_0', 'new_user_1', 'new_user_2', 'following_1', 'following_2'])
+
+    def test_it_pages_through_notifications_with_cursor(self):
+        notifications = [
+            db_user_timeline_event.create_user_notification_event(
+                self.main_user['id'],
+                NotificationMetadata(creator='troi-bot', message='notification %d' % i),
+            )
+            for i in range(3)
+        ]
+
+        # notifications are filtered by max_ts like the other events
+        r = self.client.get(
+            url_for('user_timeline_event_api_bp.user_feed', user_name=self.main_user['musicbrainz_id']),
+            headers={'Authorization': f"Token {self.main_user['auth_token']}"},
+            query_string={'max_ts': int(time.time()) - 60},
+        )
+        self.assert200(r)
+        self.assertEqual(0, r.json['payload']['count'])
+
+        events = []
+        query_string = {'max_ts': int(time.time()) + 1, 'count': 2}
+        while True:
+            r = self.client.get(
+                url_for('user_timeline_event_api_bp.user_feed', user_name=self.main_user['musicbrainz_id']),
+                headers={'Authorization': f"Token {self.main_user['auth_token']}"},
+                query_string=query_string,
+            )
+            self.assert200(r)
+            events.extend(r.json['payload']['events'])
+            if r.json['payload']['next_cursor'] is None:
+                break
+            query_string = {'cursor': r.json['payload']['next_cursor'], 'count': 2}
+
+        # the 3 notifications and the 2 own follow events, nothing is repeated or lost between the pages
+        self.assertCountEqual([event['id'] for event in events if event['event_type'] == 'notification'],
+                              [notification.id for notification in notifications])
+        self.assertEqual(5, len(events))
+
+    def test_it_raises_bad_request_for_invalid_cursor(self):
+        r = self.client.get(
+            url_for('user_timeline_event_api_bp.user_feed', user_name=self.main_user['musicbrainz_id']),
+            headers={'Authorization': f"Token {self.main_user['auth_token']}"},
+            query_string={'cursor': 'not a cursor'}
+        )
+        self.assert400(r)
+
     def test_it_returns_recording_recommendation_events(self):
         # create a recording recommendation ourselves
         db_user_timeline_event.create_user_track_recommendation_event(
@@ -8,7 +8,8 @@ from listenbrainz.tests.integration import IntegrationTestCase
 import listenbrainz.db.user as db_user
 from listenbrainz.webserver.views.api import DEFAULT_NUMBER_OF_PLAYLISTS_PER_CALL
 from listenbrainz.webserver.views import playlist_api
-from listenbrainz.webserver.views.playlist_api import PLAYLIST_TRACK_URI_PREFIX, PLAYLIST_URI_PREFIX, PLAYLIST_EXTENSION_URI
+from listenbrainz.webserver.views.playlist_api import PLAYLIST_TRACK_URI_PREFIX, PLAYLIST_URI_PREFIX, PLAYLIST_EXTENSION_URI, \
+    PLAYLIST_TRACK_EXTENSION_URI
 
 
 # NOTE: This test module includes all the tests for playlist features, even those served from the
@@ -690,6 +691,41 @@ class PlaylistAPITestCase(IntegrationTestCase):
         self.assert200(response)
         self.assertEqual(response.json["playlist"]["extension"][PLAYLIST_EXTENSION_URI]["copied_from_deleted"], True)
 
+    def test_playlist_copy_keeps_recordings_in_order(self):
+        """ Copying a playlist with many recordings keeps their order and who added them """
+
+        mbids = ["e8f9b188-f819-4e43-ab0f-4bd26ce9ff%02d" % i for i in range(20)]
+        playlist = get_test_data()
+        playlist["playlist"]["track"] = [
+            {"identifier": "https://musicbrainz.org/recording/" + mbid} for mbid in mbids
+        ]
+        response = self.client.post(
+            url_for("playlist_api_v1.create_playlist"),
+            json=playlist,
+            headers={"Authorization": "Token {}".format(self.user["auth_token"])}
+        )
+        self.assert200(response)
+        playlist_mbid = response.json["playlist_mbid"]
+
+        response = self.client.post(
+            url_for("playlist_api_v1.copy_playlist", playlist_mbid=playlist_mbid),
+            json={},
+            headers={"Authorization": "Token {}".format(self.user2["auth_token"])}
+        )
+        self.assert200(response)
+        new_playlist_mbid = response.json["playlist_mbid"]
+
+        response = self.client.get(
+            url_for("playlist_api_v1.get_playlist", playlist_mbid=new_playlist_mbid, fetch_metadata="false"),
+            headers={"Authorization": "Token {}".format(self.user["auth_token"])}
+        )
+        self.assert200(response)
+        tracks = response.json["playlist"]["track"]
+        self.assertEqual([t["identifier"] for t in tracks],
+                         ["https://musicbrainz.org/recording/" + mbid for mbid in mbids])
+        for track in tracks:
+            self.assertEqual(track["extension"][PLAYLIST_TRACK_EXTENSION_URI]["added_by"], "testuserpleaseignore")
+
     def test_playlist_copy_private_playlist(self):
 
         playlist = {
@@ -6,8 +6,8 @@ from redis import Redis
 from brainzutils import cache
 
 import listenbrainz.db.user as db_user
+from listenbrainz.listenstore.listen_delete_jobs import process_listen_delete_jobs
 from listenbrainz.tests.integration import IntegrationTestCase
-from listenbrainz.listenstore.timescale_listenstore import REDIS_USER_LISTEN_COUNT
 from listenbrainz.utils import init_cache
 
 
@@ -98,8 +98,6 @@ class ProfileViewsTestCase(IntegrationTestCase):
         self.assert200(resp)
         self.assertEqual(resp.json['latest_import'], val)
 
-        self.assertNotEqual(self.redis.ttl(cache._prep_key(REDIS_USER_LISTEN_COUNT + self.user['musicbrainz_id'])), 0)
-
         # check that listens have been successfully submitted
         resp = self.client.get(url_for('api_v1.get_listen_count', user_name=self.user['musicbrainz_id']))
         self.assert200(resp)
@@ -112,7 +110,8 @@ class ProfileViewsTestCase(IntegrationTestCase):
         resp = self.client.post(url_for('profile.delete_listens'), data={'csrf_token': g.csrf_token})
         self.assertRedirects(resp, url_for('user.profile', user_name=self.user['musicbrainz_id']))
 
-        time.sleep(2)
+        # the listens are deleted in the background
+        self.assertEqual(process_listen_delete_jobs(), 1)
 
         # check that listens have been successfully deleted
         resp = self.client.get(url_for('api_v1.get_listen_count', user_name=self.user['musicbrainz_id']))
@@ -12,8 +12,9 @@ from flask import url_for
 import listenbrainz.db.user as db_user
 import time
 import json
+from unittest.mock import patch
 
-from listenbrainz import config
+from listenbrainz import config, listen_trace
 from datetime import datetime
 
 
@@ -156,3 +157,17 @@ class TimescaleWriterTestCase(IntegrationTestCase):
         to_ts = int(time.time())
         listens, _, _ = self.ls.fetch_listens(user['musicbrainz_id'], to_ts=to_ts)
         self.assertEqual(len(listens), 4)
+
+    @patch("listenbrainz.config.LISTEN_TRACE_SAMPLE_RATE", 1, create=True)
+    def test_trace_listens(self):
+        """ Test that the timescale writer records the timings of the stages of traced batches """
+        user = db_user.get_or_create(1, 'tracedtimescaleuser')
+        r = self.send_listen(user, 'valid_single.json')
+        self.assert200(r)
+        time.sleep(2)
+
+        latencies = listen_trace.get_stage_latencies()
+        for stage in (listen_trace.STAGE_INCOMING, listen_trace.STAGE_MESSYBRAINZ, listen_trace.STAGE_INSERT,
+                      listen_trace.STAGE_DURABLE, listen_trace.STAGE_UNIQUE):
+            self.assertEqual(latencies[stage]["count"], 1)
+        self.assertLessEqual(latencies[listen_trace.STAGE_DURABLE]["max"], latencies[listen_trace.STAGE_UNIQUE]["max"])
@@ -1,10 +1,14 @@
+import os
 import unittest
-from listenbrainz.listen import Listen
+from copy import deepcopy
+from listenbrainz.listen import Listen, flatten_dict, timescale_row_to_api
 from datetime import datetime
 import time
 import uuid
 import ujson
 
+TEST_DATA_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'testdata')
+
 class ListenTestCase(unittest.TestCase):
 
     def test_from_timescale(self):
@@ -127,3 +131,50 @@ class ListenTestCase(unittest.TestCase):
         listen = Listen.from_json(json_row)
 
         self.assertEqual(listen.timestamp, json_row['listened_at'])
+
+    def test_timescale_row_to_api(self):
+        """ timescale_row_to_api returns the same as converting a Listen created from the row """
+        with open(os.path.join(TEST_DATA_PATH, 'timescale_listenstore_test_listens.json')) as f:
+            listens = ujson.load(f)['payload']
+
+        rows = []
+        for listen in listens:
+            listened_at, track_name, user_name, data = Listen.from_json(listen).to_timescale()
+            rows.append((listened_at, track_name, user_name, datetime(2021, 1, 1), ujson.loads(data)))
+        # a mapped listen, with nested additional_info
+        rows.append((1525557084, 'Every Step Every Way', 'iliekcomputers', None, {
+            'user_id': 1,
+            'track_metadata': {
+                'artist_name': 'Majid Jordan',
+                'additional_info': {
+                    'recording_msid': 'db9a7483-a8f4-4a2c-99af-c8ab58850200',
+                    'we_dict_now': {'hello': 'afb', 'we_nested_now': {'hi': '312'}},
+                }
+            }
+        }, uuid.UUID('2cfad207-3f55-4aec-8120-86cf66e34d59'), uuid.UUID('8294645a-f996-44b6-9060-7f189b9f59f3'),
+            [uuid.UUID('abaa7001-0d80-4e58-be5d-d2d246fd9d87')]))
+
+        for row in rows:
+            expected = Listen.from_timescale(*deepcopy(row)).to_api()
+            self.assertEqual(timescale_row_to_api(*deepcopy(row)), expected)
+
+        mapped = timescale_row_to_api(*rows[-1])
+        self.assertEqual(mapped['track_metadata']['mbid_mapping']['artist_mbids'],
+                         ['abaa7001-0d80-4e58-be5d-d2d246fd9d87'])
+        self.assertEqual(mapped['track_metadata']['additional_info']['we_dict_now.we_nested_now.hi'], '312')
+
+    def test_to_timescale_does_not_modify_listen(self):
+        data = {
+            'artist_name': 'Radiohead',
+            'track_name': 'True Love Waits',
+            'additional_info': {'release_type': ['ALBUM', 'REMIX']},
+        }
+        listen = Listen(timestamp=1525557084, user_name='testuser', artist_msid=str(uuid.uuid4()),
+                        recording_msid=str(uuid.uuid4()), data=deepcopy(data))
+        listen.to_timescale()
+        self.assertEqual(listen.data, data)
+
+    def test_flatten_dict(self):
+        self.assertEqual(flatten_dict({'a': 1, 'b': {'c': 2, 'd': {'e': 3}}, 4: {5: 6}}),
+                         {'a': 1, 'b.c': 2, 'b.d.e': 3, '4.5': 6})
+        self.assertEqual(flatten_dict({'a': {'b': 1}}, '_', 'x'), {'x_a.b': 1})
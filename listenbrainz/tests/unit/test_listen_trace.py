@@ -0,0 +1,73 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from listenbrainz import listen_trace
+
+
+class FakeStreamRedis:
+    """ Stores the entries of redis streams, with ids in ms like redis does """
+
+    def __init__(self):
+        self.streams = {}
+        self.fail = False
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        if self.fail:
+            raise ConnectionError("redis is down")
+        stream = self.streams.setdefault(name, [])
+        stream.append(("%d-%d" % (time.time() * 1000, len(stream)), dict(fields)))
+        if maxlen:
+            del stream[:-maxlen]
+
+    def xrevrange(self, name, max="+", min="-", count=None):
+        min_ms = 0 if min == "-" else int(min.split("-")[0])
+        entries = [entry for entry in reversed(self.streams.get(name, []))
+                   if int(entry[0].split("-")[0]) >= min_ms]
+        return entries[:count]
+
+
+class ListenTraceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = FakeStreamRedis()
+        self.redis_patch = patch("listenbrainz.listen_trace.cache._r", self.redis, create=True)
+        self.redis_patch.start()
+        self.key_patch = patch("listenbrainz.listen_trace.cache._prep_key", lambda key: "lb:" + key, create=True)
+        self.key_patch.start()
+
+    def tearDown(self):
+        self.redis_patch.stop()
+        self.key_patch.stop()
+
+    def test_sampling(self):
+        with patch("listenbrainz.config.LISTEN_TRACE_SAMPLE_RATE", 0, create=True):
+            self.assertIsNone(listen_trace.new_trace())
+        with patch("listenbrainz.config.LISTEN_TRACE_SAMPLE_RATE", 1, create=True):
+            trace = listen_trace.new_trace()
+        self.assertEqual(listen_trace.from_headers(dict(trace, other="header")), trace)
+        self.assertIsNone(listen_trace.from_headers(None))
+        self.assertIsNone(listen_trace.from_headers({"other": "header"}))
+
+    def test_stage_latencies(self):
+        trace = {listen_trace.TRACE_ID_HEADER: "abc", listen_trace.SUBMITTED_HEADER: int(time.time() * 1000) - 2000}
+        for duration in range(1, 101):
+            listen_trace.record(trace, listen_trace.STAGE_INSERT, duration)
+        listen_trace.record(trace, listen_trace.STAGE_DURABLE)
+        # batches which aren't traced aren't recorded
+        listen_trace.record(None, listen_trace.STAGE_WEBSOCKET)
+
+        latencies = listen_trace.get_stage_latencies()
+        self.assertEqual(set(latencies), {listen_trace.STAGE_INSERT, listen_trace.STAGE_DURABLE})
+        self.assertEqual(latencies[listen_trace.STAGE_INSERT],
+                         {"count": 100, "p50": 51.0, "p90": 91.0, "p99": 100.0, "max": 100.0})
+        self.assertGreaterEqual(latencies[listen_trace.STAGE_DURABLE]["p50"], 2000)
+
+        with patch("listenbrainz.listen_trace.metrics.set") as metrics_set:
+            listen_trace.submit_stage_latencies(latencies)
+        self.assertEqual(metrics_set.call_args[1]["listenstore_insert_p99"], 100.0)
+
+    def test_record_errors_are_ignored(self):
+        self.redis.fail = True
+        trace = {listen_trace.TRACE_ID_HEADER: "abc", listen_trace.SUBMITTED_HEADER: int(time.time() * 1000)}
+        listen_trace.record(trace, listen_trace.STAGE_DURABLE)
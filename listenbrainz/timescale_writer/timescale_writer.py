@@ -17,7 +17,7 @@ from listenbrainz.listenstore import TimescaleListenStore
 from listenbrainz.webserver import create_app
 from brainzutils import metrics
 
-from listenbrainz import messybrainz
+from listenbrainz import messybrainz, listen_trace
 from listenbrainz.webserver.views.api_tools import MAX_ITEMS_PER_MESSYBRAINZ_LOOKUP
 
 METRIC_UPDATE_INTERVAL = 60  # seconds
@@ -41,11 +41,16 @@ class TimescaleWriterSubscriber(ListenWriter):
 
     def callback(self, ch, method, properties, body):
 
+        trace = listen_trace.from_headers(properties.headers)
+        listen_trace.record(trace, listen_trace.STAGE_INCOMING)
+
         listens = ujson.loads(body)
 
+        t0 = monotonic()
         msb_listens = []
         for chunk in chunked(listens, MAX_ITEMS_PER_MESSYBRAINZ_LOOKUP):
             msb_listens.extend(self.messybrainz_lookup(chunk))
+        listen_trace.record(trace, listen_trace.STAGE_MESSYBRAINZ, (monotonic() - t0) * 1000)
 
         submit = []
         for listen in msb_listens:
@@ -54,7 +59,7 @@ class TimescaleWriterSubscriber(ListenWriter):
             except ValueError:
                 pass
 
-        ret = self.insert_to_listenstore(submit)
+        ret = self.insert_to_listenstore(submit, trace)
 
         # If there is an error, we do not ack the message so that rabbitmq redelivers it later.
         if ret == LISTEN_INSERT_ERROR_SENTINEL:
@@ -137,7 +142,7 @@ class TimescaleWriterSubscriber(ListenWriter):
             augmented_listens.append(listen)
         return augmented_listens
 
-    def insert_to_listenstore(self, data):
+    def insert_to_listenstore(self, data, trace=None):
         """
         Inserts a batch of listens to the ListenStore. Timescale will report back as
         to which rows were actually inserted into the DB, allowing us to send those
@@ -145,7 +150,7 @@ class TimescaleWriterSubscriber(ListenWriter):
 
         Args:
             data: the data to be inserted into the ListenStore
-            retries: the number of retries to make before deciding that we've failed
+            trace: the trace context of the batch, see listenbrainz.listen_trace
 
         Returns: number of listens successfully sent or LISTEN_INSERT_ERROR_SENTINEL
         if there was an error in inserting listens
@@ -155,12 +160,15 @@ class TimescaleWriterSubscriber(ListenWriter):
             return 0
 
         self.incoming_listens += len(data)
+        t0 = monotonic()
         try:
             rows_inserted = self.ls.insert(data)
         except psycopg2.OperationalError as err:
             current_app.logger.error("Cannot write data to listenstore: %s. Sleep." % str(err), exc_info=True)
             sleep(self.ERROR_RETRY_DELAY)
             return LISTEN_INSERT_ERROR_SENTINEL
+        listen_trace.record(trace, listen_trace.STAGE_INSERT, (monotonic() - t0) * 1000)
+        listen_trace.record(trace, listen_trace.STAGE_DURABLE)
 
         if not rows_inserted:
             return len(data)
@@ -190,11 +198,12 @@ class TimescaleWriterSubscriber(ListenWriter):
                     exchange=current_app.config['UNIQUE_EXCHANGE'],
                     routing_key='',
                     body=ujson.dumps(unique),
-                    properties=pika.BasicProperties(delivery_mode=2,),
+                    properties=pika.BasicProperties(delivery_mode=2, headers=trace),
                 )
                 break
             except pika.exceptions.ConnectionClosed:
                 self.connect_to_rabbitmq()
+        listen_trace.record(trace, listen_trace.STAGE_UNIQUE)
 
         self.redis_listenstore.update_recent_listens(unique)
         self.unique_listens += len(unique)
@@ -157,3 +157,8 @@ def get_fallback_connection_name():
     if client_name is None:
         client_name = socket.gethostname()
     return client_name
+
+
+def percentile(values, percentile):
+    """ The nearest rank percentile of a sorted list of values """
+    return values[min(len(values) - 1, len(values) * percentile // 100)]
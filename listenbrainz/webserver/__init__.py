@@ -99,6 +99,8 @@ def gen_app(debug=None):
     # Initialize BU cache and metrics
     cache.init(host=app.config['REDIS_HOST'], port=app.config['REDIS_PORT'], namespace=app.config['REDIS_NAMESPACE'])
     metrics.init("listenbrainz")
+    from listenbrainz.db import user_cache
+    user_cache.enable_reporting()
 
     # Redis connection
     create_redis(app)
@@ -119,6 +121,8 @@ def gen_app(debug=None):
     db.init_db_connection(app.config['SQLALCHEMY_DATABASE_URI'])
     ts.init_db_connection(app.config['SQLALCHEMY_TIMESCALE_URI'])
     msb.init_db_connection(app.config['MESSYBRAINZ_SQLALCHEMY_DATABASE_URI'])
+    db.init_read_db_connection(app.config.get('SQLALCHEMY_DATABASE_REPLICA_URI'))
+    ts.init_read_db_connection(app.config.get('SQLALCHEMY_TIMESCALE_REPLICA_URI'))
 
     if app.config['MB_DATABASE_URI']:
         from brainzutils import musicbrainz_db
@@ -19,10 +19,11 @@ from brainzutils.ratelimit import ratelimit
 import listenbrainz.webserver.redis_connection as redis_connection
 from listenbrainz.webserver.models import SubmitListenUserMetadata
 from listenbrainz.webserver.utils import REJECT_LISTENS_WITHOUT_EMAIL_ERROR
-from listenbrainz.webserver.views.api_tools import insert_payload, log_raise_400, validate_listen, parse_param_list, \
+from listenbrainz.webserver.views.api_tools import insert_payload, log_raise_400, validate_listens, parse_param_list, \
     is_valid_uuid, MAX_LISTEN_SIZE, LISTEN_TYPE_SINGLE, LISTEN_TYPE_IMPORT, _validate_get_endpoint_params, \
     _parse_int_arg, LISTEN_TYPE_PLAYING_NOW, validate_auth_header, get_non_negative_param
 from listenbrainz.webserver.views.playlist_api import serialize_jspf
+from listenbrainz.listenstore.listen_delete_jobs import get_listen_delete_job
 from listenbrainz.listenstore.timescale_listenstore import TimescaleListenStoreException
 from listenbrainz.webserver.timescale_connection import _ts
 
@@ -82,15 +83,12 @@ def submit_listen():
                 "JSON document requires a valid listen_type key.", payload)
 
         listen_type = _get_listen_type(data['listen_type'])
-        if (listen_type == LISTEN_TYPE_SINGLE or listen_type == LISTEN_TYPE_PLAYING_NOW) and len(payload) > 1:
-            log_raise_400("JSON document contains more than listen for a single/playing_now. "
-                          "It should contain only one.", payload)
     except KeyError:
         log_raise_400("Invalid JSON document submitted.", raw_data)
 
     try:
         # validate listens to make sure json is okay
-        validated_payload = [validate_listen(listen, listen_type) for listen in payload]
+        validated_payload = validate_listens(payload, listen_type)
     except ListenValidationError as err:
         raise APIBadRequest(err.message, err.payload)
 
@@ -129,15 +127,13 @@ def get_listens(user_name):
     if min_ts and max_ts and min_ts >= max_ts:
         raise APIBadRequest("min_ts should be less than max_ts")
 
-    listens, _, max_ts_per_user = db_conn.fetch_listens(
+    listen_data, _, max_ts_per_user = db_conn.fetch_listens(
         user_name,
         limit=count,
         from_ts=min_ts,
-        to_ts=max_ts
+        to_ts=max_ts,
+        as_api=True
     )
-    listen_data = []
-    for listen in listens:
-        listen_data.append(listen.to_api())
 
     return jsonify({'payload': {
         'user_id': user_name,
@@ -242,13 +238,11 @@ def get_recent_listens_for_user_list(user_list):
         raise APIBadRequest("user_list is empty or invalid.")
 
     db_conn = webserver.create_timescale(current_app)
-    listens = db_conn.fetch_recent_listens_for_users(
+    listen_data = db_conn.fetch_recent_listens_for_users(
         users,
-        limit=limit
+        limit=limit,
+        as_api=True
     )
-    listen_data = []
-    for listen in listens:
-        listen_data.append(listen.to_api())
 
     return jsonify({'payload': {
         'user_list': user_list,
@@ -396,11 +390,6 @@ def latest_import():
             current_app.logger.error("Error while updating latest import: ", exc_info=True)
             raise APIInternalServerError('Could not update latest_import, try again')
 
-        # During unrelated tests _ts may be None -- improving this would be a great headache.
-        # However, during the test of this code and while serving requests _ts is set.
-        if _ts:
-            _ts.set_listen_count_expiry_for_user(user['musicbrainz_id'])
-
         return jsonify({'status': 'ok'})
 
 
@@ -530,6 +519,50 @@ def delete_listen():
     return jsonify({'status': 'ok'})
 
 
+@api_bp.route('/delete-listens-job/<int:job_id>', methods=['GET', 'OPTIONS'])
+@crossdomain(headers="Authorization, Content-Type")
+@ratelimit()
+def get_delete_listens_job(job_id):
+    """
+    Get the status of a job deleting a user's listen history, as started from the profile page.
+    Only the user whose listens are deleted by the job can get its status.
+
+    A sample response from the endpoint may look like:
+
+    .. code-block:: json
+
+        {
+            "job_id": 42,
+            "status": "pending",
+            "deleted_count": 12000,
+            "created": 1634574832,
+            "completed": null
+        }
+
+    ``status`` is ``pending`` while the listens are being deleted and ``completed`` once all of them
+    have been, ``deleted_count`` is the number of listens deleted so far.
+
+    :reqheader Authorization: Token <user token>
+    :statuscode 200: the status of the job.
+    :statuscode 401: invalid authorization. See error message for details.
+    :statuscode 404: job not found.
+    :resheader Content-Type: *application/json*
+    """
+    user = validate_auth_header()
+
+    job = get_listen_delete_job(job_id)
+    if job is None or job["user_name"] != user["musicbrainz_id"]:
+        raise APINotFound("Cannot find listen deletion job %d" % job_id)
+
+    return jsonify({
+        "job_id": job["id"],
+        "status": "completed" if job["completed"] else "pending",
+        "deleted_count": job["deleted_count"],
+        "created": int(job["created"].timestamp()),
+        "completed": int(job["completed"].timestamp()) if job["completed"] else None,
+    })
+
+
 def serialize_playlists(playlists, playlist_count, count, offset):
     """
         Serialize the playlist metadata for the get playlists commands.
@@ -2,6 +2,7 @@ import json
 import re
 import listenbrainz.db.user as db_user
 from collections import defaultdict
+from xml.sax.saxutils import escape
 from yattag import Doc
 import yattag
 from flask import Blueprint, request, render_template, current_app
@@ -12,7 +13,8 @@ from listenbrainz.webserver.errors import InvalidAPIUsage, CompatError, ListenVa
 import xmltodict
 
 from listenbrainz.webserver.models import SubmitListenUserMetadata
-from listenbrainz.webserver.views.api_tools import insert_payload, validate_listen
+from listenbrainz.webserver.views.api_tools import insert_payload, validate_listens, LISTEN_TYPE_IMPORT, \
+    LISTEN_TYPE_PLAYING_NOW
 from listenbrainz.db.lastfm_user import User
 from listenbrainz.db.lastfm_session import Session
 from listenbrainz.db.lastfm_token import Token
@@ -22,6 +24,14 @@ from listenbrainz.webserver import timescale_connection
 
 api_bp = Blueprint('api_compat', __name__)
 
+# The listens of a scrobble are submitted as artist[0], track[0], ..., artist[1], ...
+BRACKET_KEY_RE = re.compile(r'(.*)\[(\d+)\]')
+
+# Keys which are parameters of the request rather than of the submitted listens
+REQUEST_KEYS = frozenset(["sk", "token", "api_key", "method", "api_sig", "format"])
+
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>\n'
+
 
 @api_bp.route('/api/auth/', methods=['GET'])
 @ratelimit()
@@ -197,10 +207,10 @@ def _to_native_api(lookup, method="track.scrobble", output_format="xml"):
         to the native ListenBrainz API format.
         Returns: type_of_listen and listen_payload
     """
-    listen_type = 'listens'
-    if method == 'track.updateNowPlaying':
-        listen_type = 'playing_now'
-        if len(list(lookup.keys())) != 1:
+    listen_type = LISTEN_TYPE_IMPORT
+    if method.lower() == 'track.updatenowplaying':
+        listen_type = LISTEN_TYPE_PLAYING_NOW
+        if len(lookup) != 1:
             raise InvalidAPIUsage(CompatError.INVALID_PARAMETERS, output_format=output_format)       # Invalid parameters
 
     listens = []
@@ -214,7 +224,8 @@ def _to_native_api(lookup, method="track.scrobble", output_format="xml"):
             listen['track_metadata']['artist_name'] = data['artist']
         if 'track' in data:
             listen['track_metadata']['track_name'] = data['track']
-        if 'timestamp' in data:
+        # playing now listens are not listened at any time yet
+        if 'timestamp' in data and listen_type != LISTEN_TYPE_PLAYING_NOW:
             listen['listened_at'] = data['timestamp']
         if 'album' in data:
             listen['track_metadata']['release_name'] = data['album']
@@ -235,6 +246,26 @@ def _to_native_api(lookup, method="track.scrobble", output_format="xml"):
     return listen_type, listens
 
 
+def parse_bracket_keys(data):
+    """ Group the submitted values by the index of the listen they belong to, e.g. artist[0] and
+        track[0] are the artist and track of listen "0". Keys without an index belong to listen 0.
+
+        Returns:
+            dict of index -> dict of key -> value, in the order in which the listens were submitted
+    """
+    lookup = defaultdict(dict)
+    for key, value in data.items():
+        if key in REQUEST_KEYS:
+            continue
+        number = 0
+        if '[' in key:
+            matches = BRACKET_KEY_RE.match(key)
+            if matches:
+                key, number = matches.group(1), matches.group(2)
+        lookup[number][key] = value
+    return lookup
+
+
 def record_listens(request, data):
     """ Submit the listen in the lastfm format to be inserted in db.
         Accepts listens for both track.updateNowPlaying and track.scrobble methods.
@@ -245,29 +276,18 @@ def record_listens(request, data):
     except KeyError:
         raise InvalidAPIUsage(CompatError.INVALID_PARAMETERS, output_format=output_format)    # Invalid parameters
 
-    session = Session.load(sk)
-    if not session:
+    user = db_user.get_by_session_key(sk, fetch_email=True)
+    if not user:
         if not Token.is_valid_api_key(api_key):
             raise InvalidAPIUsage(CompatError.INVALID_API_KEY, output_format=output_format)   # Invalid API_KEY
         raise InvalidAPIUsage(CompatError.INVALID_SESSION_KEY, output_format=output_format)   # Invalid Session KEY
 
-    user = db_user.get(session.user_id, fetch_email=True)
     if mb_engine and current_app.config["REJECT_LISTENS_WITHOUT_USER_EMAIL"] and user["email"] is None:
         raise InvalidAPIUsage(CompatError.NO_EMAIL, output_format=output_format)  # No email available for user in LB
 
-    lookup = defaultdict(dict)
-    for key, value in data.items():
-        if key in ["sk", "token", "api_key", "method", "api_sig"]:
-            continue
-        matches = re.match('(.*)\[(\d+)\]', key)
-        if matches:
-            key = matches.group(1)
-            number = matches.group(2)
-        else:
-            number = 0
-        lookup[number][key] = value
+    lookup = parse_bracket_keys(data)
 
-    if request.form['method'].lower() == 'track.updatenowplaying':
+    if data['method'].lower() == 'track.updatenowplaying':
         for i, listen in lookup.items():
             if 'timestamp' not in listen:
                 listen['timestamp'] = calendar.timegm(datetime.now().utctimetuple())
@@ -275,7 +295,7 @@ def record_listens(request, data):
     # Convert to native payload then submit 'em after validation.
     listen_type, native_payload = _to_native_api(lookup, data['method'], output_format)
     try:
-        validated_payload = [validate_listen(listen, listen_type) for listen in native_payload]
+        validated_payload = validate_listens(native_payload, listen_type)
     except ListenValidationError as err:
         raise InvalidAPIUsage(err.message, 400, output_format)
 
@@ -283,19 +303,40 @@ def record_listens(request, data):
     augmented_listens = insert_payload(validated_payload, user_metadata, listen_type=listen_type)
 
     # With corrections than the original submitted listen.
-    doc, tag, text = Doc().tagtext()
-    with tag('lfm', status='ok'):
-        if listen_type == 'playing_now':
-            doc.asis(create_response_for_single_listen(list(lookup.values())[0], augmented_listens[0], listen_type))
-        else:
-            accepted_listens = len(lookup.values())
-            # Currently LB accepts all the listens and ignores none
-            with tag('scrobbles', accepted=accepted_listens, ignored='0'):
-                for original_listen, augmented_listen in zip(list(lookup.values()), augmented_listens):
-                    doc.asis(create_response_for_single_listen(original_listen, augmented_listen, listen_type))
+    original_listens = list(lookup.values())
+    if listen_type == LISTEN_TYPE_PLAYING_NOW:
+        content = [_single_listen_element(original_listens[0], augmented_listens[0], listen_type)]
+    else:
+        # Currently LB accepts all the listens and ignores none
+        content = [('scrobbles', {'accepted': str(len(original_listens)), 'ignored': '0'}, [
+            _single_listen_element(original_listen, augmented_listen, listen_type)
+            for original_listen, augmented_listen in zip(original_listens, augmented_listens)
+        ])]
 
-    return format_response('<?xml version="1.0" encoding="utf-8"?>\n' + yattag.indent(doc.getvalue()),
-                           output_format)
+    return render_response(('lfm', {'status': 'ok'}, content), output_format)
+
+
+def _single_listen_element(original_listen, augmented_listen, listen_type):
+    """ The element of the response for a single listen, see create_response_for_single_listen. """
+    track_metadata = augmented_listen['track_metadata']
+
+    track = track_metadata['track_name']
+    artist = track_metadata['artist_name']
+    album = track_metadata.get('release_name', '')
+    # playing now listens have no listened_at, respond with the time they were submitted at
+    ts = augmented_listen.get('listened_at', original_listen.get('timestamp'))
+
+    albumArtist = artist
+    corrected_album_artist = original_listen.get('albumArtist', original_listen['artist']) != artist
+
+    return ('nowplaying' if listen_type == LISTEN_TYPE_PLAYING_NOW else 'scrobble', {}, [
+        ('track', {'corrected': '1' if original_listen['track'] != track else '0'}, track),
+        ('artist', {'corrected': '1' if original_listen['artist'] != artist else '0'}, artist),
+        ('album', {'corrected': '1' if original_listen.get('album', '') != album else '0'}, album),
+        ('albumArtist', {'corrected': '1' if corrected_album_artist else '0'}, albumArtist),
+        ('timestamp', {}, str(ts)),
+        ('ignoredMessage', {'code': '0'}, ''),
+    ])
 
 
 def create_response_for_single_listen(original_listen, augmented_listen, listen_type):
@@ -304,7 +345,7 @@ def create_response_for_single_listen(original_listen, augmented_listen, listen_
     Args:
         original_listen (dict): Original submitted listen.
         augmented_listen (dict): Augmented(corrected) listen.
-        listen_type (string): Type of listen ('playing_now' or 'listens').
+        listen_type (int): Type of listen (LISTEN_TYPE_PLAYING_NOW or LISTEN_TYPE_IMPORT).
 
     Returns:
         XML response for a single listen.
@@ -313,42 +354,64 @@ def create_response_for_single_listen(original_listen, augmented_listen, listen_
         Otherwise response is as described in following link
         https://www.last.fm/api/show/track.scrobble .
     """
-    corrected = defaultdict(lambda: '0')
+    return ''.join(_write_xml(_single_listen_element(original_listen, augmented_listen, listen_type)))
 
-    track = augmented_listen['track_metadata']['track_name']
-    if original_listen['track'] != augmented_listen['track_metadata']['track_name']:
-        corrected['track'] = '1'
 
-    artist = augmented_listen['track_metadata']['artist_name']
-    if original_listen['artist'] != augmented_listen['track_metadata']['artist_name']:
-        corrected['artist'] = '1'
+def _escape_attribute(value):
+    return escape(value, {'"': '&quot;'})
 
-    ts = augmented_listen['listened_at']
 
-    albumArtist = artist
-    if original_listen.get('albumArtist', original_listen['artist']) != artist:
-        corrected['albumArtist'] = '1'
+def _write_xml(element):
+    """ Write an element of a response as XML, without any indentation. An element is a
+        (name, attributes, content) tuple, where content is either the text of the element
+        or a list of child elements.
+
+        Yields:
+            the XML of the element, in chunks
+    """
+    name, attributes, content = element
+    yield '<' + name
+    for key, value in attributes.items():
+        yield ' %s="%s"' % (key, _escape_attribute(value))
+    yield '>'
+    if isinstance(content, str):
+        yield escape(content)
+    else:
+        for child in content:
+            yield from _write_xml(child)
+    yield '</' + name + '>'
+
+
+def _to_json(element):
+    """ Convert an element of a response to the JSON representation described in format_response. """
+    _, attributes, content = element
+    if isinstance(content, str):
+        if not attributes:
+            return content or None
+        value = dict(attributes)
+        if content:
+            value['#text'] = content
+        return value
+
+    value = dict(attributes)
+    for child in content:
+        child_name, child_value = child[0], _to_json(child)
+        if child_name not in value:
+            value[child_name] = child_value
+        elif isinstance(value[child_name], list):
+            value[child_name].append(child_value)
+        else:
+            value[child_name] = [value[child_name], child_value]
+    return value
 
-    album = augmented_listen['track_metadata'].get('release_name', '')
-    if original_listen.get('album', '') != album:
-        corrected['album'] = '1'
 
-    doc, tag, text = Doc().tagtext()
-    with tag('nowplaying' if listen_type == 'playing_now' else 'scrobble'):
-        with tag('track', corrected=corrected['track']):
-            text(track)
-        with tag('artist', corrected=corrected['artist']):
-            text(artist)
-        with tag('album', corrected=corrected['album']):
-            text(album)
-        with tag('albumArtist', corrected=corrected['albumArtist']):
-            text(albumArtist)
-        with tag('timestamp'):
-            text(ts)
-        with tag('ignoredMessage', code="0"):
-            text('')
-
-    return doc.getvalue()
+def render_response(element, output_format="xml"):
+    """ Render a response given as an element (see _write_xml) in the required format, like
+        format_response does for XML documents, but without parsing the XML again. The attributes
+        of the root element are left out of JSON responses. """
+    if output_format == 'json':
+        return json.dumps(_to_json((element[0], {}, element[2])))
+    return XML_DECLARATION + ''.join(_write_xml(element))
 
 
 def format_response(data, format="xml"):
@@ -373,7 +436,7 @@ def format_response(data, format="xml"):
     elif format == 'json':
         # Remove the <lfm> tag and its attributes
         jsonData = xmltodict.parse(data)['lfm']
-        for k in jsonData.keys():
+        for k in list(jsonData.keys()):
             if k[0] == '@':
                 jsonData.pop(k)
 
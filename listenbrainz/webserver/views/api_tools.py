@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 from urllib.parse import urlparse
 
 import bleach
@@ -7,6 +7,8 @@ import bleach
 import listenbrainz.webserver.rabbitmq_connection as rabbitmq_connection
 import listenbrainz.webserver.redis_connection as redis_connection
 import listenbrainz.db.user as db_user
+from listenbrainz.db import replica
+from listenbrainz import listen_trace
 import pika
 import pika.exceptions
 import time
@@ -55,7 +57,11 @@ def insert_payload(payload, user: SubmitListenUserMetadata, listen_type=LISTEN_T
         Returns: augmented_listens
     """
     augmented_listens = _get_augmented_listens(payload, user)
-    _send_listens_to_queue(listen_type, augmented_listens)
+    trace = listen_trace.new_trace() if listen_type != LISTEN_TYPE_PLAYING_NOW else None
+    _send_listens_to_queue(listen_type, augmented_listens, trace)
+    if listen_type != LISTEN_TYPE_PLAYING_NOW:
+        # the listens are written by the timescale writer, users should see them once it's done
+        replica.mark_write(user.musicbrainz_id)
     return augmented_listens
 
 
@@ -87,7 +93,7 @@ def handle_playing_now(listen):
     return listen
 
 
-def _send_listens_to_queue(listen_type, listens):
+def _send_listens_to_queue(listen_type, listens, trace=None):
     submit = []
     for listen in listens:
         if listen_type == LISTEN_TYPE_PLAYING_NOW:
@@ -122,6 +128,7 @@ def _send_listens_to_queue(listen_type, listens):
             exchange=exchange,
             queue=queue,
             error_msg='Cannot submit listens to queue, please try again later.',
+            headers=trace,
         )
 
 
@@ -235,6 +242,19 @@ def validate_listen(listen: Dict, listen_type) -> Dict:
     return listen
 
 
+def validate_listens(payload: List[Dict], listen_type) -> List[Dict]:
+    """Validate a batch of listens submitted together with the given listen type, see validate_listen.
+    Used by both the ListenBrainz API and the Last.fm compatible API."""
+    if len(payload) == 0:
+        raise ListenValidationError("JSON document does not contain any listens")
+
+    if listen_type in (LISTEN_TYPE_SINGLE, LISTEN_TYPE_PLAYING_NOW) and len(payload) > 1:
+        raise ListenValidationError("JSON document contains more than listen for a single/playing_now. "
+                                    "It should contain only one.")
+
+    return [validate_listen(listen, listen_type) for listen in payload]
+
+
 def is_valid_uuid(u):
     if u is None:
         return False
@@ -342,7 +362,7 @@ def validate_listened_at(listen):
                                     "should be greater than 1033410600 (2002-10-01 00:00:00 UTC).", listen)
 
 
-def publish_data_to_queue(data, exchange, queue, error_msg):
+def publish_data_to_queue(data, exchange, queue, error_msg, headers=None):
     """ Publish specified data to the specified queue.
 
     Args:
@@ -350,6 +370,7 @@ def publish_data_to_queue(data, exchange, queue, error_msg):
         exchange (str): the name of the exchange
         queue (str): the name of the queue
         error_msg (str): the error message to be returned in case of an error
+        headers (dict): the headers of the message, such as the trace context of listens
     """
     try:
         with rabbitmq_connection._rabbitmq.get() as connection:
@@ -360,7 +381,7 @@ def publish_data_to_queue(data, exchange, queue, error_msg):
                 exchange=exchange,
                 routing_key='',
                 body=ujson.dumps(data),
-                properties=pika.BasicProperties(delivery_mode=2, ),
+                properties=pika.BasicProperties(delivery_mode=2, headers=headers),
             )
     except pika.exceptions.ConnectionClosed as e:
         current_app.logger.error("Connection to rabbitmq closed while trying to publish: %s" % str(e), exc_info=True)
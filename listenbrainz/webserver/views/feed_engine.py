@@ -0,0 +1,147 @@
+""" Fan-in engine for the user feed.
+
+Each kind of feed event (listens, follows, recommendations, ...) comes from a separate source.
+The sources are queried concurrently, each one returns its newest events first, and the
+results are merged lazily with a heap so that merging stops as soon as enough events
+have been produced for the page.
+
+The events of the feed are ordered by the second they were created in, then by their source in
+the order the sources are given, then by a key which is unique within the source (such as the
+row id of the event), all descending except for the sources. Pages are fetched with a cursor
+pointing to the last event of the previous page in that order, which every source applies in
+its query, so that events are neither repeated nor lost between pages.
+"""
+import base64
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import ujson
+from flask import current_app
+
+from data.model.user_timeline_event import APITimelineEvent
+
+# The maximum number of feed sources queried at the same time, across all requests
+MAX_SOURCE_WORKERS = 10
+
+# A feed source is called with (min_ts, max_ts, before_key, count). It returns up to count events created
+# after min_ts and before max_ts, and if before_key is not None, created in the second of max_ts with a key
+# lower than before_key too, as (key, event) tuples ordered by the second of the event and its key, descending.
+FeedSource = Callable[[Optional[int], Optional[int], Any, int], List[Tuple[Any, APITimelineEvent]]]
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_SOURCE_WORKERS, thread_name_prefix="feed")
+    return _executor
+
+
+class FeedCursor:
+    """ Points to the last event of a page of the feed, the next page starts after it.
+
+    Args:
+        ts: the second the event was created in
+        source: the name of the source of the event
+        key: the key of the event in its source
+    """
+
+    def __init__(self, ts: int, source: str, key):
+        self.ts = ts
+        self.source = source
+        self.key = key
+
+    def encode(self) -> str:
+        data = ujson.dumps({"ts": self.ts, "source": self.source, "key": self.key}).encode("utf-8")
+        return base64.urlsafe_b64encode(data).decode("ascii")
+
+    @classmethod
+    def decode(cls, token: str) -> "FeedCursor":
+        """ Parse a cursor token.
+
+        Raises:
+            ValueError: if the token is not a valid cursor
+        """
+        try:
+            data = ujson.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+            ts, source, key = int(data["ts"]), data["source"], data["key"]
+        except (TypeError, KeyError, UnicodeEncodeError, ValueError) as e:
+            raise ValueError("Invalid cursor: %s" % str(e))
+        if not isinstance(source, str) or key is None:
+            raise ValueError("Invalid cursor: source and key are required")
+        return cls(ts=ts, source=source, key=key)
+
+
+def _run_source(app, source: FeedSource, min_ts, max_ts, before_key, count) -> Tuple[List[Tuple[Any, APITimelineEvent]], float]:
+    with app.app_context():
+        start = time.monotonic()
+        events = source(min_ts, max_ts, before_key, count)
+        return events, time.monotonic() - start
+
+
+def _bounds(names: List[str], name: str, max_ts: Optional[int], cursor: Optional[FeedCursor]) -> Tuple[Optional[int], Any]:
+    """ The max_ts and before_key arguments with which a source is queried for the page after the cursor """
+    if cursor is None:
+        return max_ts, None
+    rank, cursor_rank = names.index(name), names.index(cursor.source)
+    if rank < cursor_rank:
+        # the events of this source in the second of the cursor came before it
+        return cursor.ts, None
+    if rank == cursor_rank:
+        return cursor.ts, cursor.key
+    # and the events of this source in the second of the cursor come after it
+    return cursor.ts + 1, None
+
+
+def fetch_feed(sources: Dict[str, FeedSource], min_ts: Optional[int], max_ts: Optional[int], count: int,
+               cursor: Optional[FeedCursor] = None) -> Tuple[List[APITimelineEvent], Optional[FeedCursor], Dict[str, float]]:
+    """ Query all feed sources concurrently and merge their events, newest first.
+
+    Args:
+        sources: the feed sources by name, in the order of their events created in the same second
+        min_ts: only return events created after this timestamp
+        max_ts: only return events created before this timestamp
+        count: the number of events to return
+        cursor: the last event of the previous page, if this is not the first page. Overrides max_ts.
+
+    Returns:
+        a tuple of (the events, the cursor of the next page or None if this is the last page,
+        the time in seconds each source took by name)
+
+    Raises:
+        ValueError: if the cursor is for a source which isn't one of the given sources
+    """
+    names = list(sources)
+    if cursor is not None and cursor.source not in sources:
+        raise ValueError("Invalid cursor: unknown source %s" % cursor.source)
+
+    app = current_app._get_current_object()
+    executor = _get_executor()
+    futures = {
+        name: executor.submit(_run_source, app, source, min_ts, *_bounds(names, name, max_ts, cursor), count)
+        for name, source in sources.items()
+    }
+
+    timings = {}
+    streams = []
+    for rank, (name, future) in enumerate(futures.items()):
+        events, timings[name] = future.result()
+        # the sources return their events in order, their position breaks the ties of keys of any type
+        streams.append([((-event.created, rank, position), name, key, event)
+                        for position, (key, event) in enumerate(events)])
+
+    page = list(islice(heapq.merge(*streams), count))
+    next_cursor = None
+    if len(page) == count:
+        _, name, key, event = page[-1]
+        next_cursor = FeedCursor(ts=event.created, source=name, key=key)
+    return [event for _, _, _, event in page], next_cursor, timings
+
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    """ Format the time taken by each source as a Server-Timing header value. """
+    return ", ".join("%s;dur=%.1f" % (name, duration * 1000) for name, duration in timings.items())
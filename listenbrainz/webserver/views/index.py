@@ -211,7 +211,8 @@ def mb_user_deleter(musicbrainz_row_id):
 
     Args: musicbrainz_row_id (int): the MusicBrainz row ID of the user to be deleted.
 
-    Returns: 200 if the user has been successfully found and deleted from LB
+    Returns: 200 if the user has been successfully found and deleted from LB, with the id of the job
+        deleting the user's listens
 
     Raises:
         NotFound if the user is not found in the LB database
@@ -221,8 +222,8 @@ def mb_user_deleter(musicbrainz_row_id):
     user = db_user.get_by_mb_row_id(musicbrainz_row_id)
     if user is None:
         raise NotFound('Could not find user with MusicBrainz Row ID: %d' % musicbrainz_row_id)
-    delete_user(user['musicbrainz_id'])
-    return jsonify({'status': 'ok'}), 200
+    job_id = delete_user(user['musicbrainz_id'])
+    return jsonify({'status': 'ok', 'job_id': job_id}), 200
 
 
 def _authorize_mb_user_deleter(auth_token):
@@ -9,6 +9,7 @@ from flask import Blueprint, current_app, jsonify, request
 import requests
 import listenbrainz.db.playlist as db_playlist
 import listenbrainz.db.user as db_user
+from listenbrainz.db import recording_metadata
 
 from listenbrainz.webserver.utils import parse_boolean_arg
 from listenbrainz.webserver.decorators import crossdomain, api_listenstore_needed
@@ -192,7 +193,20 @@ def fetch_playlist_recording_metadata(playlist: Playlist):
         This interim function will soon be replaced with a more complete service layer
     """
 
-    mbids = [{'[recording_mbid]': str(item.mbid)} for item in playlist.recordings]
+    if not playlist.recordings:
+        return
+
+    # Recordings that have been listened to are in the mapping, look up the rest with the lookup server
+    _, mbid_metadata = recording_metadata.get_metadata(mbids=[item.mbid for item in playlist.recordings])
+    for rec in playlist.recordings:
+        metadata = mbid_metadata.get(str(rec.mbid))
+        if metadata is not None:
+            rec.artist_credit = metadata["artist_name"]
+            rec.artist_mbids = [UUID(mbid) for mbid in metadata["artist_mbids"] or []]
+            rec.title = metadata["track_name"]
+
+    mbids = [{'[recording_mbid]': str(item.mbid)} for item in playlist.recordings
+             if str(item.mbid) not in mbid_metadata]
     if not mbids:
         return
 
@@ -271,15 +285,13 @@ def create_playlist():
     if created_for:
         username_lookup.append(created_for)
 
-    users = {}
-    if username_lookup:
-        users = db_user.get_many_users_by_mb_id(username_lookup)
+    user_ids = db_user.get_user_ids_by_mb_id(username_lookup)
 
     collaborator_ids = []
     for collaborator in collaborators:
-        if collaborator.lower() not in users:
+        if collaborator.lower() not in user_ids:
             log_raise_400("Collaborator {} doesn't exist".format(collaborator))
-        collaborator_ids.append(users[collaborator.lower()]["id"])
+        collaborator_ids.append(user_ids[collaborator.lower()])
 
     # filter description
     description = data["playlist"].get("annotation", None)
@@ -306,10 +318,10 @@ def create_playlist():
     if data["playlist"].get("created_for", None):
         if user["musicbrainz_id"] not in current_app.config["APPROVED_PLAYLIST_BOTS"]:
             raise APIForbidden("Playlist contains a created_for field, but submitting user is not an approved playlist bot.")
-        created_for_user = users.get(data["playlist"]["created_for"].lower())
-        if not created_for_user:
+        created_for_id = user_ids.get(data["playlist"]["created_for"].lower())
+        if created_for_id is None:
             log_raise_400("created_for user does not exist.")
-        playlist.created_for_id = created_for_user["id"]
+        playlist.created_for_id = created_for_id
 
     if "track" in data["playlist"]:
         for track in data["playlist"]["track"]:
@@ -382,7 +394,6 @@ def edit_playlist(playlist_mbid):
     collaborators = data.get("playlist", {}).\
         get("extension", {}).get(PLAYLIST_EXTENSION_URI, {}).\
         get("collaborators", [])
-    users = {}
 
     # Uniquify collaborators list
     collaborators = list(set(collaborators))
@@ -391,14 +402,13 @@ def edit_playlist(playlist_mbid):
     if user["musicbrainz_id"] in collaborators:
         collaborators.remove(user["musicbrainz_id"])
 
-    if collaborators:
-        users = db_user.get_many_users_by_mb_id(collaborators)
+    user_ids = db_user.get_user_ids_by_mb_id(collaborators)
 
     collaborator_ids = []
     for collaborator in collaborators:
-        if collaborator.lower() not in users:
+        if collaborator.lower() not in user_ids:
             log_raise_400("Collaborator {} doesn't exist".format(collaborator))
-        collaborator_ids.append(users[collaborator.lower()]["id"])
+        collaborator_ids.append(user_ids[collaborator.lower()])
 
     playlist.collaborators = collaborators
     playlist.collaborator_ids = collaborator_ids
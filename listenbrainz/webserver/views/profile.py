@@ -126,11 +126,11 @@ def fetch_listens(musicbrainz_id, to_ts):
     """
     db_conn = webserver.create_timescale(current_app)
     while True:
-        batch, _, _ = db_conn.fetch_listens(current_user.musicbrainz_id, to_ts=to_ts, limit=EXPORT_FETCH_COUNT)
+        batch, _, _ = db_conn.fetch_listens(current_user.musicbrainz_id, to_ts=to_ts, limit=EXPORT_FETCH_COUNT, as_api=True)
         if not batch:
             break
         yield from batch
-        to_ts = batch[-1].ts_since_epoch  # new to_ts will be the the timestamp of the last listen fetched
+        to_ts = batch[-1]['listened_at']  # new to_ts will be the the timestamp of the last listen fetched
 
 
 def fetch_feedback(user_id):
@@ -170,7 +170,7 @@ def export_data():
         # immediately.
         to_ts = int(time())
         listens = fetch_listens(current_user.musicbrainz_id, to_ts)
-        output = stream_json_array(listen.to_api() for listen in listens)
+        output = stream_json_array(listens)
 
         response = Response(stream_with_context(output))
         response.headers["Content-Disposition"] = "attachment; filename=" + filename
@@ -216,8 +216,9 @@ def delete():
     form = FlaskForm()
     if form.validate_on_submit():
         try:
-            delete_user(current_user.musicbrainz_id)
-            flash.success("Successfully deleted account for %s." % current_user.musicbrainz_id)
+            job_id = delete_user(current_user.musicbrainz_id)
+            flash.success("Successfully deleted account for %s, its listens are being deleted by job %d."
+                          % (current_user.musicbrainz_id, job_id))
             return redirect(url_for('index.index'))
         except Exception:
             current_app.logger.error('Error while deleting user: %s', current_user.musicbrainz_id, exc_info=True)
@@ -251,8 +252,9 @@ def delete_listens():
     form = FlaskForm()
     if form.validate_on_submit():
         try:
-            delete_listens_history(current_user.musicbrainz_id)
-            flash.info('Successfully deleted listens for %s.' % current_user.musicbrainz_id)
+            job_id = delete_listens_history(current_user.musicbrainz_id)
+            flash.info('The listens of %s are being deleted by job %d, this can take a while.'
+                       % (current_user.musicbrainz_id, job_id))
             return redirect(url_for('user.profile', user_name=current_user.musicbrainz_id))
         except Exception:
             current_app.logger.error('Error while deleting listens for user: %s', current_user.musicbrainz_id, exc_info=True)
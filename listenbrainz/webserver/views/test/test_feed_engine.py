@@ -0,0 +1,82 @@
+import time
+from unittest import TestCase
+
+import listenbrainz.webserver
+from data.model.user_timeline_event import APITimelineEvent, UserTimelineEventType, NotificationMetadata
+from listenbrainz.webserver.views.feed_engine import FeedCursor, fetch_feed
+
+
+def make_event(created, key):
+    return APITimelineEvent(
+        id=key,
+        event_type=UserTimelineEventType.NOTIFICATION,
+        user_name='param',
+        created=created,
+        metadata=NotificationMetadata(creator='param', message=str(created)),
+    )
+
+
+def make_source(timestamps, latency=0.0):
+    """ A feed source which returns the events created at timestamps, keyed by their position in the list,
+        as the sources of the feed do """
+    items = sorted(((ts, key) for key, ts in enumerate(timestamps)), reverse=True)
+
+    def source(min_ts, max_ts, before_key, count):
+        time.sleep(latency)
+        events = [(key, make_event(ts, key)) for ts, key in items
+                  if (min_ts is None or ts > min_ts)
+                  and (max_ts is None or ts < max_ts or (ts == max_ts and before_key is not None and key < before_key))]
+        return events[:count]
+
+    return source
+
+
+class FeedEngineTestCase(TestCase):
+
+    def setUp(self):
+        self.app = listenbrainz.webserver.create_app()
+
+    def test_events_are_merged_newest_first(self):
+        sources = {
+            'a': make_source([1, 4, 7, 10]),
+            'b': make_source([2, 5, 8]),
+            'c': make_source([3, 6, 9]),
+        }
+        with self.app.app_context():
+            events, next_cursor, timings = fetch_feed(sources, min_ts=2, max_ts=10, count=5)
+        self.assertListEqual([event.created for event in events], [9, 8, 7, 6, 5])
+        self.assertEqual((next_cursor.ts, next_cursor.source, next_cursor.key), (5, 'b', 1))
+        self.assertCountEqual(timings.keys(), ['a', 'b', 'c'])
+
+    def test_sources_are_queried_concurrently(self):
+        sources = {name: make_source([1, 2], latency=0.2) for name in 'abcd'}
+        start = time.monotonic()
+        with self.app.app_context():
+            fetch_feed(sources, min_ts=None, max_ts=None, count=2)
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_cursor_pages_through_events_with_the_same_timestamp(self):
+        sources = {
+            'a': make_source([10, 10, 10, 20, 5]),
+            'b': make_source([10, 10, 30]),
+        }
+        pages = []
+        cursor = None
+        with self.app.app_context():
+            while True:
+                events, cursor, _ = fetch_feed(sources, min_ts=None, max_ts=100, count=2, cursor=cursor)
+                pages.append([(event.created, event.id) for event in events])
+                if cursor is None:
+                    break
+                cursor = FeedCursor.decode(cursor.encode())
+        # in the same second, the events of a come first, then those of b, by descending key
+        self.assertListEqual(pages, [[(30, 2), (20, 3)], [(10, 2), (10, 1)], [(10, 0), (10, 1)], [(10, 0), (5, 4)], []])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            FeedCursor.decode('not a cursor')
+        with self.assertRaises(ValueError):
+            FeedCursor.decode(FeedCursor(ts=10, source='a', key=None).encode())
+        with self.app.app_context(), self.assertRaises(ValueError):
+            fetch_feed({'a': make_source([1])}, min_ts=None, max_ts=None, count=1,
+                       cursor=FeedCursor(ts=10, source='b', key=1))
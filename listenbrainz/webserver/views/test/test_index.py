@@ -205,9 +205,11 @@ class IndexViewsTestCase(ServerTestCase, DatabaseTestCase):
     @mock.patch('listenbrainz.webserver.views.index._authorize_mb_user_deleter')
     @mock.patch('listenbrainz.webserver.views.index.delete_user')
     def test_mb_user_deleter_valid_account(self, mock_delete_user, mock_authorize_mb_user_deleter):
+        mock_delete_user.return_value = 42
         user1 = db_user.create(1, 'iliekcomputers')
         r = self.client.get(url_for('index.mb_user_deleter', musicbrainz_row_id=1, access_token='132'))
         self.assert200(r)
+        self.assertEqual(r.json, {'status': 'ok', 'job_id': 42})
         mock_authorize_mb_user_deleter.assert_called_once_with('132')
         mock_delete_user.assert_called_once_with('iliekcomputers')
 
@@ -223,6 +225,7 @@ class IndexViewsTestCase(ServerTestCase, DatabaseTestCase):
     @mock.patch('listenbrainz.webserver.views.index.requests.get')
     @mock.patch('listenbrainz.webserver.views.index.delete_user')
     def test_mb_user_deleter_valid_access_token(self, mock_delete_user, mock_requests_get):
+        mock_delete_user.return_value = 42
         mock_requests_get.return_value = MagicMock()
         mock_requests_get.return_value.json.return_value = {
             'sub': 'UserDeleter',
@@ -60,7 +60,8 @@ class ProfileViewsTestCase(IntegrationTestCase):
         self.assertStatus(response, 302)
         self.assertRedirects(response, url_for('login.index', next=profile_info_url))
 
-    def test_delete_listens(self):
+    @patch('listenbrainz.webserver.views.profile.delete_listens_history', return_value=42)
+    def test_delete_listens(self, mock_delete_listens_history):
         """Tests delete listens end point"""
         self.temporary_login(self.user['login_id'])
         # we do a get request first to put the CSRF token in the flask global context
@@ -70,7 +71,8 @@ class ProfileViewsTestCase(IntegrationTestCase):
         self.assert200(response)
 
         response = self.client.post(delete_listens_url, data={'csrf_token': g.csrf_token})
-        self.assertMessageFlashed("Successfully deleted listens for %s." % self.user['musicbrainz_id'], 'info')
+        self.assertMessageFlashed("The listens of %s are being deleted by job 42, this can take a while." % self.user['musicbrainz_id'], 'info')
+        mock_delete_listens_history.assert_called_once_with(self.user['musicbrainz_id'])
         self.assertRedirects(response, url_for('user.profile', user_name=self.user['musicbrainz_id']))
 
     def test_delete_listens_not_logged_in(self):
@@ -235,6 +237,9 @@ class ProfileViewsTestCase(IntegrationTestCase):
             ),
         ]
 
+        # fetch_listens is asked for the listens in the format of the api
+        listens = [listen.to_api() for listen in listens]
+
         # We expect three calls to fetch_listens, and we return two, one, and
         # zero listens in the batch. This tests that we fetch all batches.
         mock_fetch_listens.side_effect = [(listens[0:2], 0, 0), (listens[2:3], 0, 0), ([], 0, 0)]
@@ -16,6 +16,7 @@ from listenbrainz.db.playlist import get_playlists_for_user, get_playlists_creat
 from listenbrainz.db.model.pinned_recording import fetch_track_metadata_for_pins
 from listenbrainz.db.pinned_recording import get_current_pin_for_user, get_pin_count_for_user, get_pin_history_for_user
 from listenbrainz.db.feedback import get_feedback_count_for_user, get_feedback_for_user
+from listenbrainz.listenstore.listen_delete_jobs import queue_listen_deletion
 from listenbrainz.webserver.decorators import web_listenstore_needed
 from listenbrainz.webserver import timescale_connection
 from listenbrainz.webserver.errors import APIBadRequest
@@ -99,12 +100,8 @@ def profile(user_name):
         args['to_ts'] = max_ts
     else:
         args['from_ts'] = min_ts
-    data, min_ts_per_user, max_ts_per_user = db_conn.fetch_listens(
-        user_name, limit=LISTENS_PER_PAGE, **args)
-
-    listens = []
-    for listen in data:
-        listens.append(listen.to_api())
+    listens, min_ts_per_user, max_ts_per_user = db_conn.fetch_listens(
+        user_name, limit=LISTENS_PER_PAGE, as_api=True, **args)
 
     # If there are no previous listens then display now_playing
     if not listens or listens[0]['listened_at'] >= max_ts_per_user:
@@ -416,33 +413,39 @@ def _get_user(user_name):
 
 def delete_user(musicbrainz_id):
     """ Delete a user from ListenBrainz completely.
-    First, drops the user's listens and then deletes the user from the
-    database.
+    First, queues the deletion of the user's listens and then deletes the user
+    from the database. The listens are deleted in the background.
     Args:
         musicbrainz_id (str): the MusicBrainz ID of the user
+    Returns:
+        the id of the job deleting the user's listens
     Raises:
         NotFound if user isn't present in the database
     """
 
     user = _get_user(musicbrainz_id)
-    timescale_connection._ts.delete(user.musicbrainz_id)
+    job_id = queue_listen_deletion(user.musicbrainz_id)
     db_user.delete(user.id)
+    return job_id
 
 
 def delete_listens_history(musicbrainz_id):
-    """ Delete a user's listens from ListenBrainz completely.
+    """ Delete a user's listens from ListenBrainz completely. The listens are
+    deleted in the background.
     Args:
         musicbrainz_id (str): the MusicBrainz ID of the user
+    Returns:
+        the id of the job deleting the user's listens
     Raises:
         NotFound if user isn't present in the database
     """
 
     user = _get_user(musicbrainz_id)
-    timescale_connection._ts.delete(user.musicbrainz_id)
-    timescale_connection._ts.reset_listen_count(user.musicbrainz_id)
+    job_id = queue_listen_deletion(user.musicbrainz_id)
     listens_importer.update_latest_listened_at(
         user.id, ExternalServiceType.LASTFM, 0)
     db_stats.delete_user_stats(user.id)
+    return job_id
 
 
 @user_bp.route("/<user_name>/feedback/")
@@ -20,8 +20,7 @@ import pydantic
 import time
 import ujson
 
-from collections import defaultdict
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from flask import Blueprint, jsonify, request, current_app
 
@@ -33,15 +32,16 @@ from data.model.listen import APIListen, TrackMetadata, AdditionalInfo
 from data.model.user_timeline_event import RecordingRecommendationMetadata, APITimelineEvent, UserTimelineEventType, \
     APIFollowEvent, NotificationMetadata, APINotificationEvent, APIPinEvent
 from listenbrainz.db.pinned_recording import get_pins_for_feed
+from listenbrainz.db import recording_metadata
 from listenbrainz.db.model.pinned_recording import fetch_track_metadata_for_pins
 from listenbrainz import webserver
 from listenbrainz.db.exceptions import DatabaseException
-from listenbrainz.listenstore import TimescaleListenStore
 from listenbrainz.webserver.decorators import crossdomain, api_listenstore_needed
 from listenbrainz.webserver.errors import APIBadRequest, APIInternalServerError, APIUnauthorized, APINotFound, \
     APIForbidden
 from listenbrainz.webserver.views.api_tools import validate_auth_header, _filter_description_html, \
     _validate_get_endpoint_params
+from listenbrainz.webserver.views.feed_engine import FeedCursor, fetch_feed, format_server_timing
 from brainzutils.ratelimit import ratelimit
 
 MAX_LISTEN_EVENTS_PER_USER = 2 # the maximum number of listens we want to return in the feed per user
@@ -168,6 +168,9 @@ def user_feed(user_name: str):
     :param min_ts: If you specify a ``min_ts`` timestamp, events with timestamps greater than the value will be returned
     :param count: Optional, number of events to return. Default: :data:`~webserver.views.api.DEFAULT_ITEMS_PER_GET` . Max: :data:`~webserver.views.api.MAX_ITEMS_PER_GET`
     :type count: ``int``
+    :param cursor: Optional, the ``next_cursor`` returned with the previous page of events. If specified, the
+        events following that page are returned and ``max_ts`` is ignored.
+    :type cursor: ``str``
     :statuscode 200: Successful query, you have feed events!
     :statuscode 400: Bad request, check ``response['error']`` for more details.
     :statuscode 401: Unauthorized, you do not have permission to view this user's feed.
@@ -179,63 +182,85 @@ def user_feed(user_name: str):
     if user_name != user['musicbrainz_id']:
         raise APIUnauthorized("You don't have permissions to view this user's timeline.")
 
-    db_conn = webserver.create_timescale(current_app)
     min_ts, max_ts, count = _validate_get_endpoint_params()
     if min_ts is None and max_ts is None:
         max_ts = int(time.time())
 
-    users_following = db_user_relationship.get_following_for_user(user['id'])
+    cursor = None
+    cursor_token = request.args.get('cursor')
+    if cursor_token:
+        try:
+            cursor = FeedCursor.decode(cursor_token)
+        except ValueError as e:
+            raise APIBadRequest(str(e))
 
-    # get all listen events
+    users_following = db_user_relationship.get_following_for_user(user['id'])
     musicbrainz_ids = [user['musicbrainz_id'] for user in users_following]
-    if len(users_following) == 0:
-        listen_events = []
-    else:
-        listen_events = get_listen_events(db_conn, musicbrainz_ids, min_ts, max_ts, count)
 
     # for events like "follow" and "recording recommendations", we want to show the user
     # their own events as well
     users_for_feed_events = users_following + [user]
-    follow_events = get_follow_events(
-        user_ids=tuple(user['id'] for user in users_for_feed_events),
-        min_ts=min_ts or 0,
-        max_ts=max_ts or int(time.time()),
-        count=count,
-    )
-
-    recording_recommendation_events = get_recording_recommendation_events(
-        users_for_events=users_for_feed_events,
-        min_ts=min_ts or 0,
-        max_ts=max_ts or int(time.time()),
-        count=count,
-    )
-
-    notification_events = get_notification_events(user, count)
-
-    recording_pin_events = get_recording_pin_events(
-        users_for_events=users_for_feed_events,
-        min_ts=min_ts or 0,
-        max_ts=max_ts or int(time.time()),
-        count=count,
-    )
+    user_ids = tuple(user['id'] for user in users_for_feed_events)
 
+    # each source returns a page of its events newest first, the feed engine queries them concurrently
+    # and merges them. The order of the sources is the order of their events created in the same second.
     # TODO: add playlist event and like event
-    all_events = sorted(
-        listen_events + follow_events + recording_recommendation_events + recording_pin_events + notification_events,
-        key=lambda event: -event.created,
-    )
+    sources = {
+        'listen': lambda min_ts, max_ts, before, count: get_listen_events(
+            musicbrainz_ids,
+            min_ts=min_ts or 0,
+            max_ts=max_ts or int(time.time()),
+            count=count,
+            before=before,
+        ),
+        'follow': lambda min_ts, max_ts, before, count: get_follow_events(
+            user_ids=user_ids,
+            min_ts=min_ts or 0,
+            max_ts=max_ts or int(time.time()),
+            count=count,
+            before=before,
+        ),
+        'recommendation': lambda min_ts, max_ts, before, count: get_recording_recommendation_events(
+            users_for_events=users_for_feed_events,
+            min_ts=min_ts or 0,
+            max_ts=max_ts or int(time.time()),
+            count=count,
+            before_id=before,
+        ),
+        'pin': lambda min_ts, max_ts, before, count: get_recording_pin_events(
+            users_for_events=users_for_feed_events,
+            min_ts=min_ts or 0,
+            max_ts=max_ts or int(time.time()),
+            count=count,
+            before_id=before,
+        ),
+        'notification': lambda min_ts, max_ts, before, count: get_notification_events(
+            user,
+            min_ts=min_ts or 0,
+            max_ts=max_ts or int(time.time()),
+            count=count,
+            before_id=before,
+        ),
+    }
+
+    if cursor is not None and cursor.source not in sources:
+        raise APIBadRequest("Invalid cursor: unknown source %s" % cursor.source)
+
+    all_events, next_cursor, timings = fetch_feed(sources, min_ts, max_ts, count, cursor)
 
     # sadly, we need to serialize the event_type ourselves, otherwise, jsonify converts it badly
     for index, event in enumerate(all_events):
         all_events[index].event_type = event.event_type.value
 
-    all_events = all_events[:count]
-
-    return jsonify({'payload': {
+    response = jsonify({'payload': {
         'count': len(all_events),
         'user_id': user_name,
         'events': [event.dict() for event in all_events],
+        'next_cursor': next_cursor.encode() if next_cursor else None,
     }})
+    if current_app.debug:
+        response.headers['Server-Timing'] = format_server_timing(timings)
+    return response
 
 
 @user_timeline_event_api_bp.route("/user/<user_name>/feed/events/delete", methods=['OPTIONS', 'POST'])
@@ -296,61 +321,57 @@ def delete_feed_events(user_name):
 
 
 def get_listen_events(
-    db_conn: TimescaleListenStore,
     musicbrainz_ids: List[str],
     min_ts: int,
     max_ts: int,
     count: int,
-) -> List[APITimelineEvent]:
-    """ Gets all listen events in the feed.
+    before: Optional[List[str]] = None,
+) -> List[Tuple[List[str], APITimelineEvent]]:
+    """ Gets a page of listen events in the feed, at most MAX_LISTEN_EVENTS_PER_USER of each user, as
+    ([user_name, track_name], event) tuples.
     """
+    if not musicbrainz_ids:
+        return []
 
-    # NOTE: For now, we get a bunch of listens for the users the current
-    # user is following and take a max of 2 out of them per user. This
-    # could be done better by writing a complex query to get exactly 2 listens for each user,
-    # but I'm happy with this heuristic for now and we can change later.
     db_conn = webserver.create_timescale(current_app)
-    listens, _, _ = db_conn.fetch_listens_for_multiple_users_from_storage(
+    listens = db_conn.fetch_listens_for_feed(
         musicbrainz_ids,
-        limit=count,
-        from_ts=min_ts,
-        to_ts=max_ts,
-        order=0,  # descending
+        min_ts=min_ts,
+        max_ts=max_ts,
+        count=count,
+        per_user=MAX_LISTEN_EVENTS_PER_USER,
+        before=tuple(before) if before else None,
     )
 
-    user_listens_map = defaultdict(list)
-    for listen in listens:
-        if len(user_listens_map[listen.user_name]) < MAX_LISTEN_EVENTS_PER_USER:
-            user_listens_map[listen.user_name].append(listen)
-
     events = []
-    for user in user_listens_map:
-        for listen in user_listens_map[user]:
-            try:
-                listen_dict = listen.to_api()
-                listen_dict['inserted_at'] = listen_dict['inserted_at'].timestamp()
-                api_listen = APIListen(**listen_dict)
-                events.append(APITimelineEvent(
-                    event_type=UserTimelineEventType.LISTEN,
-                    user_name=api_listen.user_name,
-                    created=api_listen.listened_at,
-                    metadata=api_listen,
-                ))
-            except pydantic.ValidationError as e:
-                current_app.logger.error('Validation error: ' + str(e), exc_info=True)
-                continue
+    for listen_dict in listens:
+        try:
+            key = [listen_dict['user_name'], listen_dict['track_metadata']['track_name']]
+            listen_dict['inserted_at'] = listen_dict['inserted_at'].timestamp()
+            api_listen = APIListen(**listen_dict)
+            events.append((key, APITimelineEvent(
+                event_type=UserTimelineEventType.LISTEN,
+                user_name=api_listen.user_name,
+                created=api_listen.listened_at,
+                metadata=api_listen,
+            )))
+        except pydantic.ValidationError as e:
+            current_app.logger.error('Validation error: ' + str(e), exc_info=True)
+            continue
 
     return events
 
 
-def get_follow_events(user_ids: Tuple[int], min_ts: int, max_ts: int, count: int) -> List[APITimelineEvent]:
-    """ Gets all follow events in the feed.
+def get_follow_events(user_ids: Tuple[int], min_ts: int, max_ts: int, count: int,
+                      before: Optional[List[int]] = None) -> List[Tuple[List[int], APITimelineEvent]]:
+    """ Gets a page of follow events in the feed, as ([follower row id, followed row id], event) tuples.
     """
     follow_events_db = db_user_relationship.get_follow_events(
         user_ids=user_ids,
         min_ts=min_ts,
         max_ts=max_ts,
         count=count,
+        before=tuple(before) if before else None,
     )
 
     events = []
@@ -362,35 +383,43 @@ def get_follow_events(user_ids: Tuple[int], min_ts: int, max_ts: int, count: int
                 relationship_type='follow',
                 created=event['created'].timestamp(),
             )
-            events.append(APITimelineEvent(
+            events.append(([event['user_0'], event['user_1']], APITimelineEvent(
                 event_type=UserTimelineEventType.FOLLOW,
                 user_name=follow_event.user_name_0,
                 created=follow_event.created,
                 metadata=follow_event,
-            ))
+            )))
         except pydantic.ValidationError as e:
             current_app.logger.error('Validation error: ' + str(e), exc_info=True)
             continue
     return events
 
 
-def get_notification_events(user: dict, count: int) -> List[APITimelineEvent]:
-    """ Gets notification events for the user in the feed."""
-    notification_events_db = db_user_timeline_event.get_user_notification_events(user_id=user['id'], count=count)
+def get_notification_events(user: dict, min_ts: int, max_ts: int, count: int,
+                            before_id: Optional[int] = None) -> List[Tuple[int, APITimelineEvent]]:
+    """ Gets a page of notification events for the user in the feed, as (event id, event) tuples."""
+    notification_events_db = db_user_timeline_event.get_user_notification_events_for_feed(
+        user_id=user['id'],
+        min_ts=min_ts,
+        max_ts=max_ts,
+        count=count,
+        before_id=before_id,
+    )
     events = []
     for event in notification_events_db:
-        events.append(APITimelineEvent(
+        events.append((event.id, APITimelineEvent(
             id=event.id,
             event_type=UserTimelineEventType.NOTIFICATION,
             user_name=event.metadata.creator,
             created=event.created.timestamp(),
             metadata=APINotificationEvent(message=event.metadata.message)
-        ))
+        )))
     return events
 
 
-def get_recording_recommendation_events(users_for_events: List[dict], min_ts: int, max_ts: int, count: int) -> List[APITimelineEvent]:
-    """ Gets all recording recommendation events in the feed.
+def get_recording_recommendation_events(users_for_events: List[dict], min_ts: int, max_ts: int, count: int,
+                                        before_id: Optional[int] = None) -> List[Tuple[int, APITimelineEvent]]:
+    """ Gets a page of recording recommendation events in the feed, as (event id, event) tuples.
     """
 
     id_username_map = {user['id']: user['musicbrainz_id'] for user in users_for_events}
@@ -399,10 +428,17 @@ def get_recording_recommendation_events(users_for_events: List[dict], min_ts: in
         min_ts=min_ts,
         max_ts=max_ts,
         count=count,
+        before_id=before_id,
+    )
+
+    # add the MBIDs that the recommended recordings are mapped to
+    msid_metadata, _ = recording_metadata.get_metadata(
+        msids=[event.metadata.recording_msid for event in recording_recommendation_events_db]
     )
 
     events = []
     for event in recording_recommendation_events_db:
+        mapping = (msid_metadata.get(event.metadata.recording_msid) or {}).get("mapping") or {}
         try:
             listen = APIListen(
                 user_name=id_username_map[event.user_id],
@@ -412,26 +448,29 @@ def get_recording_recommendation_events(users_for_events: List[dict], min_ts: in
                     release_name=event.metadata.release_name,
                     additional_info=AdditionalInfo(
                         recording_msid=event.metadata.recording_msid,
-                        recording_mbid=event.metadata.recording_mbid,
+                        recording_mbid=event.metadata.recording_mbid or mapping.get("recording_mbid"),
+                        release_mbid=mapping.get("release_mbid"),
+                        artist_mbids=mapping.get("artist_mbids"),
                     )
                 ),
             )
 
-            events.append(APITimelineEvent(
+            events.append((event.id, APITimelineEvent(
                 id=event.id,
                 event_type=UserTimelineEventType.RECORDING_RECOMMENDATION,
                 user_name=listen.user_name,
                 created=event.created.timestamp(),
                 metadata=listen,
-            ))
+            )))
         except pydantic.ValidationError as e:
             current_app.logger.error('Validation error: ' + str(e), exc_info=True)
             continue
     return events
 
 
-def get_recording_pin_events(users_for_events: List[dict], min_ts: int, max_ts: int, count: int) -> List[APITimelineEvent]:
-    """ Gets all recording pin events in the feed."""
+def get_recording_pin_events(users_for_events: List[dict], min_ts: int, max_ts: int, count: int,
+                             before_id: Optional[int] = None) -> List[Tuple[int, APITimelineEvent]]:
+    """ Gets a page of recording pin events in the feed, as (pin row id, event) tuples."""
 
     id_username_map = {user['id']: user['musicbrainz_id'] for user in users_for_events}
     recording_pin_events_db = get_pins_for_feed(
@@ -439,11 +478,15 @@ def get_recording_pin_events(users_for_events: List[dict], min_ts: int, max_ts:
         min_ts=min_ts,
         max_ts=max_ts,
         count=count,
+        before_id=before_id,
     )
     recording_pin_events_db = fetch_track_metadata_for_pins(recording_pin_events_db)
 
     events = []
     for pin in recording_pin_events_db:
+        if pin.track_metadata is None:
+            # the pinned recording is missing from MessyBrainz
+            continue
         try:
             pinEvent = APIPinEvent(
                 user_name=id_username_map[pin.user_id],
@@ -458,12 +501,12 @@ def get_recording_pin_events(users_for_events: List[dict], min_ts: int, max_ts:
                     )
                 )
             )
-            events.append(APITimelineEvent(
+            events.append((pin.row_id, APITimelineEvent(
                 event_type=UserTimelineEventType.RECORDING_PIN,
                 user_name=pinEvent.user_name,
                 created=pin.created.timestamp(),
                 metadata=pinEvent,
-            ))
+            )))
         except pydantic.ValidationError as e:
             current_app.logger.error('Validation error: ' + str(e), exc_info=True)
             continue
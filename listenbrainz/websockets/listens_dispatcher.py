@@ -5,6 +5,7 @@ from kombu.mixins import ConsumerMixin
 
 import ujson
 
+from listenbrainz import listen_trace
 from listenbrainz.listen import Listen, NowPlayingListen
 from listenbrainz.utils import get_fallback_connection_name
 
@@ -39,6 +40,8 @@ class ListensDispatcher(ConsumerMixin):
             else:
                 listen = Listen.from_json(data)
             self.socketio.emit(event_name, json.dumps(listen.to_api()), to=listen.user_name)
+        if event_name == "listen":
+            listen_trace.record(listen_trace.from_headers(message.headers), listen_trace.STAGE_WEBSOCKET)
         message.ack()
 
     def get_consumers(self, _, channel):
@@ -40,6 +40,8 @@ from pyspark.sql.window import Window
 from pyspark.sql.functions import col, row_number
 from pyspark.sql.types import StringType, ArrayType
 
+from listenbrainz_spark.utils.metrics import PipelineMetrics
+
 
 logger = logging.getLogger(__name__)
 
@@ -149,6 +151,9 @@ def get_top_artists(mapped_listens_subset, top_artist_limit, users):
     """ Get top artists listened to by users who have a listening history in
         the past X days where X = RECOMMENDATION_GENERATION_WINDOW.
 
+        The top artists are persisted, as both candidate sets and the similar artists are prepared from
+        them. Unpersist them once the candidate sets are saved.
+
         Args:
             df (dataframe): A subset of mapped_listens_df containing user history.
             top_artist_limit (int): number of top artist to calculate
@@ -184,6 +189,7 @@ def get_top_artists(mapped_listens_subset, top_artist_limit, users):
         top_artist_given_users_df = top_artist_df.select('top_artist_credit_id',
                                                          'user_name') \
                                                  .where(top_artist_df.user_name.isin(users))
+        top_artist_given_users_df.persist()
 
         if _is_empty_dataframe(top_artist_given_users_df):
             logger.error('Top artists for {} not fetched'.format(users), exc_info=True)
@@ -191,6 +197,7 @@ def get_top_artists(mapped_listens_subset, top_artist_limit, users):
 
         return top_artist_given_users_df
 
+    top_artist_df.persist()
     if _is_empty_dataframe(top_artist_df):
         logger.error('Top artists not fetched', exc_info=True)
         raise TopArtistNotFetchedException('Users inactive or data missing from msid->mbid mapping')
@@ -239,6 +246,9 @@ def get_similar_artists(top_artist_df, artist_relation_df, similar_artist_limit)
         Returns:
             similar_artist_df (dataframe): Top Z artists similar to top artists where
                                            Z = SIMILAR_ARTISTS_LIMIT.
+            similar_artist_df_html (dataframe): the top artists the similar artists are similar to.
+                                                It is persisted as the similar artists are prepared from it,
+                                                unpersist it once the candidate sets are saved.
     """
     condition = [top_artist_df.top_artist_credit_id == artist_relation_df.id_0]
 
@@ -268,6 +278,7 @@ def get_similar_artists(top_artist_df, artist_relation_df, similar_artist_limit)
                                        'user_name')
 
     similar_artist_df_html = filter_top_artists_from_similar_artists(similar_artist_df_html, top_artist_df)
+    similar_artist_df_html.persist()
 
     # Two or more artists can have same similar artist(s) leading to non-unique recordings
     # therefore we have filtered the distinct similar artists.
@@ -510,20 +521,25 @@ def main(recommendation_generation_window=None, top_artist_limit=None, similar_a
         logger.error(str(err), exc_info=True)
         raise
 
+    metrics = PipelineMetrics('candidate sets')
+
     from_date, to_date = get_dates_to_generate_candidate_sets(mapped_listens_df, recommendation_generation_window)
 
     logger.info('Fetching listens to get top artists...')
     mapped_listens_subset = get_listens_to_fetch_top_artists(mapped_listens_df, from_date, to_date)
 
     logger.info('Fetching top artists...')
-    top_artist_df = get_top_artists(mapped_listens_subset, top_artist_limit, users)
+    with metrics.stage('top artists'):
+        top_artist_df = get_top_artists(mapped_listens_subset, top_artist_limit, users)
 
     logger.info('Preparing top artists candidate set...')
     top_artist_candidate_set_df, top_artist_candidate_set_df_html = get_top_artist_candidate_set(top_artist_df, recordings_df,
                                                                                                  users_df, mapped_listens_subset)
 
     logger.info('Fetching similar artists...')
-    similar_artist_df, similar_artist_df_html = get_similar_artists(top_artist_df, artist_relation_df, similar_artist_limit)
+    with metrics.stage('similar artists'):
+        similar_artist_df, similar_artist_df_html = get_similar_artists(top_artist_df, artist_relation_df,
+                                                                        similar_artist_limit)
 
     logger.info('Preparing similar artists candidate set...')
     similar_artist_candidate_set_df, similar_artist_candidate_set_df_html = get_similar_artist_candidate_set(
@@ -533,19 +549,27 @@ def main(recommendation_generation_window=None, top_artist_limit=None, similar_a
                                                                                 mapped_listens_subset)
 
     logger.info('Saving candidate sets...')
-    save_candidate_sets(top_artist_candidate_set_df, similar_artist_candidate_set_df)
+    with metrics.stage('save candidate sets') as stage:
+        save_candidate_sets(top_artist_candidate_set_df, similar_artist_candidate_set_df)
+        stage.record_written(path.RECOMMENDATION_RECORDING_TOP_ARTIST_CANDIDATE_SET)
+        stage.record_written(path.RECOMMENDATION_RECORDING_SIMILAR_ARTIST_CANDIDATE_SET)
     logger.info('Done!')
 
     # time taken to generate candidate_sets
     total_time = '{:.2f}'.format((time.monotonic() - time_initial) / 60)
     if html_flag:
-        user_data = get_candidate_html_data(similar_artist_candidate_set_df_html, top_artist_candidate_set_df_html,
-                                            top_artist_df, similar_artist_df_html)
+        with metrics.stage('save html'):
+            user_data = get_candidate_html_data(similar_artist_candidate_set_df_html, top_artist_candidate_set_df_html,
+                                                top_artist_df, similar_artist_df_html)
 
-        logger.info('Saving HTML...')
-        save_candidate_html(user_data, total_time, from_date, to_date)
+            logger.info('Saving HTML...')
+            save_candidate_html(user_data, total_time, from_date, to_date)
         logger.info('Done!')
 
+    top_artist_df.unpersist()
+    similar_artist_df_html.unpersist()
+    metrics.log_report()
+
     message = [{
         'type': 'cf_recommendations_recording_candidate_sets',
         'candidate_sets_upload_time': str(datetime.utcnow()),
@@ -28,7 +28,9 @@ users_df, listens_df and recordings_df are used to get the number of times a use
 This number is called count. The dataframe created is called playcounts_df and is saved to HDFS.
 
 A UUID is generated for every run of the script to identify dataframe metadata (users_count, recording_count etc).
-The dataframe_id (UUID) along with dataframe metadata are stored to HDFS.
+The dataframe_id (UUID) along with dataframe metadata are stored to HDFS. The counts are not computed with extra Spark jobs,
+they are read from the files of the saved dataframes or derived from the listen counts of users which thresholding needs
+anyway. For details refer to listenbrainz_spark/utils/metrics.py.
 
 Note: All the dataframes except the dataframe_metadata overwrite the existing dataframes in HDFS.
 """
@@ -58,6 +60,7 @@ from pyspark.sql.window import Window
 from pyspark.sql.functions import rank, col, row_number
 
 from listenbrainz_spark.utils import get_listens_from_new_dump
+from listenbrainz_spark.utils.metrics import PipelineMetrics
 
 logger = logging.getLogger(__name__)
 
@@ -162,7 +165,6 @@ def get_data_missing_from_musicbrainz(listens_df):
         ) \
         .where(col('recording_mbid').isNull())
 
-    logger.info('Number of (artist, recording) pairs missing from mapping: {}'.format(df.count()))
     window = Window.partitionBy('user_name').orderBy(col('listened_at').desc())
 
     # limiting listens to 200 for each user so that messages don't drop
@@ -185,7 +187,7 @@ def get_data_missing_from_musicbrainz(listens_df):
     return missing_musicbrainz_data_itr
 
 
-def save_playcounts_df(listens_df, recordings_df, users_df, metadata, save_path):
+def save_playcounts_df(listens_df, recordings_df, users_df, save_path):
     """ Prepare and save playcounts dataframe.
 
         Args:
@@ -193,7 +195,6 @@ def save_playcounts_df(listens_df, recordings_df, users_df, metadata, save_path)
             recordings_df (dataframe): Dataframe containing distinct recordings and corresponding
                                        mbids and names.
             users_df (dataframe): Dataframe containing user names and user ids.
-            metadata (dict): metadata dataframe to append.
             save_path (str): path where playcounts_df should be saved.
     """
     # listens_df is joined with users_df on user_name.
@@ -205,32 +206,44 @@ def save_playcounts_df(listens_df, recordings_df, users_df, metadata, save_path)
                               .groupBy('user_id', 'recording_id') \
                               .agg(func.count('recording_id').alias('count'))
 
-    metadata['playcounts_count'] = playcounts_df.count()
     save_dataframe(playcounts_df, save_path)
 
 
-def get_threshold_listens_df(mapped_listens_df, mapped_listens_path: str, threshold: int):
+def get_user_listen_counts(listens_df):
+    """ Count the listens of each user, and those of them which are mapped to a recording_mbid.
+
+        Args:
+            listens_df (dataframe): listens fetched from HDFS.
+        Returns:
+            a list of rows with the user_name, listen_count and mapped_listen_count of each user
+    """
+    return listens_df \
+        .groupBy('user_name') \
+        .agg(func.count('*').alias('listen_count'),
+             func.count('recording_mbid').alias('mapped_listen_count')) \
+        .collect()
+
+
+def get_threshold_listens_df(mapped_listens_df, mapped_listens_path: str, threshold_users):
     """ Threshold mapped listens dataframe
 
+        The dataframe is persisted, as the users, recordings and playcounts dataframes are all
+        prepared from it. Unpersist it once they are saved.
+
         Args:
             mapped_listens_df (dataframe): listens mapped with msid_mbid_mapping.
             mapped_listens_path: Path to store mapped listens.
-            threshold: minimum number of listens a user should have to be saved in the dataframe.
+            threshold_users: the users who have more than the minimum number of listens.
         Returns:
              threshold_listens_df: mapped listens dataframe after dropping data below threshold
     """
-    threshold_users_df = mapped_listens_df \
-        .groupBy('user_name') \
-        .agg(func.count('user_name').alias('listen_count')) \
-        .where('listen_count > {}'.format(threshold)) \
-        .collect()
-    threshold_users = [x.user_name for x in threshold_users_df]
     threshold_listens_df = mapped_listens_df.where(col('user_name').isin(threshold_users))
+    threshold_listens_df.persist()
     save_dataframe(threshold_listens_df, mapped_listens_path)
     return threshold_listens_df
 
 
-def get_listens_df(mapped_listens_df, metadata):
+def get_listens_df(mapped_listens_df):
     """ Prepare listens dataframe.
 
         Args:
@@ -239,14 +252,14 @@ def get_listens_df(mapped_listens_df, metadata):
         Returns:
             listens_df : Dataframe containing recording_mbids corresponding to a user.
     """
-    listens_df = mapped_listens_df.select('recording_mbid', 'user_name')
-    metadata['listens_count'] = listens_df.count()
-    return listens_df
+    return mapped_listens_df.select('recording_mbid', 'user_name')
 
 
-def get_recordings_df(mapped_listens_df, metadata, save_path):
+def get_recordings_df(mapped_listens_df, save_path):
     """ Prepare recordings dataframe.
 
+        The dataframe is persisted, as it is joined to prepare the playcounts dataframe after it is saved.
+
         Args:
             mapped_listens_df (dataframe): listens mapped with msid_mbid_mapping.
             save_path (str): path where recordings_df should be saved
@@ -265,14 +278,16 @@ def get_recordings_df(mapped_listens_df, metadata, save_path):
         .distinct() \
         .withColumn('recording_id', rank().over(recording_window))
 
-    metadata['recordings_count'] = recordings_df.count()
+    recordings_df.persist()
     save_dataframe(recordings_df, save_path)
     return recordings_df
 
 
-def get_users_dataframe(mapped_listens_df, metadata, save_path):
+def get_users_dataframe(mapped_listens_df, save_path):
     """ Prepare users dataframe
 
+        The dataframe is persisted, as it is joined to prepare the playcounts dataframe after it is saved.
+
         Args:
             mapped_listens_df (dataframe): listens mapped with msid_mbid_mapping.
             save_path (str): path where users_df should be saved
@@ -286,7 +301,7 @@ def get_users_dataframe(mapped_listens_df, metadata, save_path):
     users_df = mapped_listens_df.select('user_name').distinct() \
                                 .withColumn('user_id', rank().over(user_window))
 
-    metadata['users_count'] = users_df.count()
+    users_df.persist()
     save_dataframe(users_df, save_path)
     return users_df
 
@@ -384,44 +399,65 @@ def main(train_model_window, job_type, minimum_listens_threshold=0):
         logger.error(str(err), exc_info=True)
         raise
 
+    metrics = PipelineMetrics('create dataframes')
+
     logger.info('Fetching listens to create dataframes...')
     to_date, from_date = get_dates_to_train_data(train_model_window)
 
     metadata['to_date'] = to_date
     metadata['from_date'] = from_date
 
+    # The listens are not persisted: they are by far the largest input, and the three jobs which read them
+    # (the listen counts, the mapped listens and the missing data) only scan the columns they need.
     complete_listens_df = get_listens_from_new_dump(from_date, to_date)
-    logger.info(f'Listen count from {from_date} to {to_date}: {complete_listens_df.count()}')
+
+    with metrics.stage('count listens of users') as stage:
+        user_listen_counts = get_user_listen_counts(complete_listens_df)
+        stage.rows = listens_count = sum(row.listen_count for row in user_listen_counts)
+    mapped_listens_count = sum(row.mapped_listen_count for row in user_listen_counts)
+    logger.info(f'Listen count from {from_date} to {to_date}: {listens_count}')
+    logger.info(f'Number of listens missing from mapping: {listens_count - mapped_listens_count}')
 
     logger.info('Discarding listens without mbids...')
     partial_listens_df = complete_listens_df.where(col('recording_mbid').isNotNull())
-    logger.info(f'Listen count after discarding: {partial_listens_df.count()}')
+    logger.info(f'Listen count after discarding: {mapped_listens_count}')
 
     logger.info('Thresholding listens...')
-    threshold_listens_df = get_threshold_listens_df(
-        partial_listens_df,
-        paths["mapped_listens"],
-        minimum_listens_threshold
-    )
-    logger.info(f'Listen count after thresholding: {threshold_listens_df.count()}')
+    threshold_users = [row.user_name for row in user_listen_counts
+                       if row.mapped_listen_count > minimum_listens_threshold]
+    with metrics.stage('save mapped listens') as stage:
+        threshold_listens_df = get_threshold_listens_df(partial_listens_df, paths["mapped_listens"], threshold_users)
+        metadata['listens_count'] = stage.record_written(paths["mapped_listens"])
+    logger.info(f'Listen count after thresholding: {metadata["listens_count"]}')
 
     logger.info('Preparing users data and saving to HDFS...')
-    users_df = get_users_dataframe(threshold_listens_df, metadata, paths["users"])
+    with metrics.stage('save users') as stage:
+        users_df = get_users_dataframe(threshold_listens_df, paths["users"])
+        metadata['users_count'] = stage.record_written(paths["users"])
 
     logger.info('Preparing recordings data and saving to HDFS...')
-    recordings_df = get_recordings_df(threshold_listens_df, metadata, paths["recordings"])
+    with metrics.stage('save recordings') as stage:
+        recordings_df = get_recordings_df(threshold_listens_df, paths["recordings"])
+        metadata['recordings_count'] = stage.record_written(paths["recordings"])
 
     logger.info('Preparing listen data dump and playcounts, saving playcounts to HDFS...')
-    listens_df = get_listens_df(threshold_listens_df, metadata)
+    with metrics.stage('save playcounts') as stage:
+        listens_df = get_listens_df(threshold_listens_df)
+        save_playcounts_df(listens_df, recordings_df, users_df, paths["playcounts"])
+        metadata['playcounts_count'] = stage.record_written(paths["playcounts"])
 
-    save_playcounts_df(listens_df, recordings_df, users_df, metadata, paths["playcounts"])
+    threshold_listens_df.unpersist()
+    users_df.unpersist()
+    recordings_df.unpersist()
 
     metadata['dataframe_id'] = get_dataframe_id(paths["prefix"])
     save_dataframe_metadata_to_hdfs(metadata, paths["metadata"])
 
     logger.info('Preparing missing MusicBrainz data...')
-    missing_musicbrainz_data_itr = get_data_missing_from_musicbrainz(complete_listens_df)
+    with metrics.stage('prepare missing musicbrainz data'):
+        missing_musicbrainz_data_itr = get_data_missing_from_musicbrainz(complete_listens_df)
+        messages = prepare_messages(missing_musicbrainz_data_itr, from_date, to_date, ti)
 
-    messages = prepare_messages(missing_musicbrainz_data_itr, from_date, to_date, ti)
+    metrics.log_report()
 
     return messages
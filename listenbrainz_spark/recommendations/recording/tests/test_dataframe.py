@@ -1,17 +1,21 @@
 import json
 import unittest
 from datetime import datetime
+from unittest.mock import patch
 
 import os
 
 import listenbrainz_spark
 from listenbrainz_spark.path import LISTENBRAINZ_NEW_DATA_DIRECTORY, RECOMMENDATION_RECORDING_MAPPED_LISTENS, \
     RECOMMENDATION_RECORDINGS_DATAFRAME, RECOMMENDATION_RECORDING_USERS_DATAFRAME, \
-    RECOMMENDATION_RECORDING_PLAYCOUNTS_DATAFRAME, RECOMMENDATION_RECORDING_DATAFRAME_METADATA
+    RECOMMENDATION_RECORDING_PLAYCOUNTS_DATAFRAME, RECOMMENDATION_RECORDING_DATAFRAME_METADATA, \
+    USER_SIMILARITY_MAPPED_LISTENS, USER_SIMILARITY_PLAYCOUNTS_DATAFRAME, USER_SIMILARITY_RECORDINGS_DATAFRAME, \
+    USER_SIMILARITY_USERS_DATAFRAME
 from listenbrainz_spark.recommendations.recording.tests import RecommendationsTestCase
 from listenbrainz_spark.tests import TEST_DATA_PATH
 from listenbrainz_spark.recommendations.recording import create_dataframes
 from listenbrainz_spark import schema, utils
+from listenbrainz_spark.utils.metrics import get_written_stats
 
 from pyspark.sql import Row
 import time
@@ -20,9 +24,8 @@ import time
 class CreateDataframeTestCase(RecommendationsTestCase):
 
     def test_get_users_dataframe(self):
-        metadata = {}
         mapped_listens = utils.read_files_from_HDFS(RECOMMENDATION_RECORDING_MAPPED_LISTENS)
-        users_df = create_dataframes.get_users_dataframe(mapped_listens, metadata, RECOMMENDATION_RECORDING_USERS_DATAFRAME)
+        users_df = create_dataframes.get_users_dataframe(mapped_listens, RECOMMENDATION_RECORDING_USERS_DATAFRAME)
         self.assertEqual(users_df.count(), 2)
 
         expected_users_df = listenbrainz_spark.session.createDataFrame([
@@ -31,43 +34,79 @@ class CreateDataframeTestCase(RecommendationsTestCase):
         ])
         self.assertListEqual(list(expected_users_df.toLocalIterator()), list(users_df.toLocalIterator()))
         self.assertCountEqual(expected_users_df.columns, users_df.columns)
-        self.assertEqual(metadata['users_count'], 2)
+        self.assertEqual(get_written_stats(RECOMMENDATION_RECORDING_USERS_DATAFRAME)[0], 2)
 
         status = utils.path_exists(RECOMMENDATION_RECORDING_USERS_DATAFRAME)
         self.assertTrue(status)
 
     def test_get_recordings_dataframe(self):
-        metadata = {}
         mapped_listens = utils.read_files_from_HDFS(RECOMMENDATION_RECORDING_MAPPED_LISTENS)
-        recordings_df = create_dataframes.get_recordings_df(mapped_listens, metadata, RECOMMENDATION_RECORDINGS_DATAFRAME)
+        recordings_df = create_dataframes.get_recordings_df(mapped_listens, RECOMMENDATION_RECORDINGS_DATAFRAME)
         self.assertEqual(recordings_df.count(), 20)
         self.assertCountEqual(['artist_credit_id', 'recording_id', 'recording_mbid'], recordings_df.columns)
-        self.assertEqual(metadata['recordings_count'], 20)
+        self.assertEqual(get_written_stats(RECOMMENDATION_RECORDINGS_DATAFRAME)[0], 20)
 
         status = utils.path_exists(RECOMMENDATION_RECORDINGS_DATAFRAME)
         self.assertTrue(status)
 
     def test_get_listens_df(self):
-        metadata = {}
         mapped_listens = utils.read_files_from_HDFS(RECOMMENDATION_RECORDING_MAPPED_LISTENS)
-        listens_df = create_dataframes.get_listens_df(mapped_listens, metadata)
+        listens_df = create_dataframes.get_listens_df(mapped_listens)
         self.assertEqual(listens_df.count(), 24)
         self.assertCountEqual(['recording_mbid', 'user_name'], listens_df.columns)
-        self.assertEqual(metadata['listens_count'], 24)
 
     def test_save_playcounts_df(self):
-        metadata = {}
         mapped_listens = utils.read_files_from_HDFS(RECOMMENDATION_RECORDING_MAPPED_LISTENS)
-        users_df = create_dataframes.get_users_dataframe(mapped_listens, {}, RECOMMENDATION_RECORDING_USERS_DATAFRAME)
-        recordings_df = create_dataframes.get_recordings_df(mapped_listens, {}, RECOMMENDATION_RECORDINGS_DATAFRAME)
-        listens_df = create_dataframes.get_listens_df(mapped_listens, {})
+        users_df = create_dataframes.get_users_dataframe(mapped_listens, RECOMMENDATION_RECORDING_USERS_DATAFRAME)
+        recordings_df = create_dataframes.get_recordings_df(mapped_listens, RECOMMENDATION_RECORDINGS_DATAFRAME)
+        listens_df = create_dataframes.get_listens_df(mapped_listens)
 
-        create_dataframes.save_playcounts_df(listens_df, recordings_df, users_df, metadata, RECOMMENDATION_RECORDING_PLAYCOUNTS_DATAFRAME)
+        create_dataframes.save_playcounts_df(listens_df, recordings_df, users_df, RECOMMENDATION_RECORDING_PLAYCOUNTS_DATAFRAME)
         playcounts_df = utils.read_files_from_HDFS(RECOMMENDATION_RECORDING_PLAYCOUNTS_DATAFRAME)
         self.assertEqual(playcounts_df.count(), 20)
 
         self.assertListEqual(['user_id', 'recording_id', 'count'], playcounts_df.columns)
-        self.assertEqual(metadata['playcounts_count'], 20)
+        self.assertEqual(get_written_stats(RECOMMENDATION_RECORDING_PLAYCOUNTS_DATAFRAME)[0], 20)
+
+    def test_get_user_listen_counts(self):
+        listens = utils.read_files_from_HDFS(LISTENBRAINZ_NEW_DATA_DIRECTORY)
+        counts = create_dataframes.get_user_listen_counts(listens)
+        self.assertEqual(sum(row.listen_count for row in counts), listens.count())
+        self.assertEqual(sum(row.mapped_listen_count for row in counts),
+                         listens.where(listens.recording_mbid.isNotNull()).count())
+
+    @patch('listenbrainz_spark.recommendations.recording.create_dataframes.save_dataframe_metadata_to_hdfs')
+    @patch('listenbrainz_spark.recommendations.recording.create_dataframes.get_dates_to_train_data')
+    @patch('listenbrainz_spark.recommendations.recording.create_dataframes.get_listens_from_new_dump')
+    def test_main_runs_no_extra_jobs(self, mock_listens, mock_dates, mock_save_metadata):
+        mock_listens.return_value = utils.read_files_from_HDFS(LISTENBRAINZ_NEW_DATA_DIRECTORY)
+        mock_dates.return_value = (self.end_date, self.begin_date)
+
+        context = listenbrainz_spark.context
+        context.setJobGroup('test_create_dataframes', 'create dataframes')
+        try:
+            create_dataframes.main(train_model_window=20, job_type='similar_users', minimum_listens_threshold=0)
+        finally:
+            context.setLocalProperty('spark.jobGroup.id', None)
+
+        # the counts are read from the saved dataframes rather than computed with extra jobs
+        tracker = context.statusTracker()
+        stage_names = []
+        for job_id in tracker.getJobIdsForGroup('test_create_dataframes'):
+            for stage_id in tracker.getJobInfo(job_id).stageIds:
+                stage = tracker.getStageInfo(stage_id)
+                if stage:
+                    stage_names.append(stage.name)
+        self.assertTrue(stage_names)
+        self.assertEqual([name for name in stage_names if name.startswith('count at')], [])
+
+        metadata = mock_save_metadata.call_args[0][0]
+        self.assertEqual(metadata['listens_count'], utils.read_files_from_HDFS(USER_SIMILARITY_MAPPED_LISTENS).count())
+        self.assertEqual(metadata['users_count'], utils.read_files_from_HDFS(USER_SIMILARITY_USERS_DATAFRAME).count())
+        self.assertEqual(metadata['recordings_count'],
+                         utils.read_files_from_HDFS(USER_SIMILARITY_RECORDINGS_DATAFRAME).count())
+        self.assertEqual(metadata['playcounts_count'],
+                         utils.read_files_from_HDFS(USER_SIMILARITY_PLAYCOUNTS_DATAFRAME).count())
 
     def test_save_dataframe_metadata_to_HDFS(self):
         df_id = "3acb406f-c716-45f8-a8bd-96ca3939c2e5"
@@ -20,22 +20,36 @@ import pika
 import json
 import time
 import logging
+from collections import Counter
 
 import listenbrainz_spark
 import listenbrainz_spark.query_map
 from listenbrainz_spark import config, hdfs_connection
+from listenbrainz_spark.request_consumer.result_publisher import HEADER_PART, HEADER_PARTS, PublishProgress, \
+    compress_body, serialize_message, split_body
 from listenbrainz_spark.utils import init_rabbitmq
 
 from py4j.protocol import Py4JJavaError
 
 RABBITMQ_HEARTBEAT_TIME = 2 * 60 * 60  # 2 hours -- a full dump import takes 40 minutes right now
 
+# The number of times the results of a request interrupted by crashes are tried to be published
+MAX_PUBLISH_ATTEMPTS = 3
+
 rc = None
 logger = logging.getLogger(__name__)
 
 
 class RequestConsumer:
 
+    def __init__(self):
+        self.progress = PublishProgress(getattr(config, 'SPARK_RESULT_PROGRESS_DIR', None))
+        self.compression = getattr(config, 'SPARK_RESULT_COMPRESSION', 'gzip')
+        self.compression_min_size = getattr(config, 'SPARK_RESULT_COMPRESSION_MIN_SIZE', 1024)
+        self.max_message_size = getattr(config, 'SPARK_RESULT_MAX_MESSAGE_SIZE', 16 * 1024 * 1024)
+        self.window_messages = getattr(config, 'SPARK_RESULT_PUBLISH_WINDOW', 100)
+        self.window_size = getattr(config, 'SPARK_RESULT_PUBLISH_WINDOW_SIZE', 32 * 1024 * 1024)
+
     def get_result(self, request):
         try:
             query = request['query']
@@ -70,39 +84,128 @@ class RequestConsumer:
             logger.error("Error in the query handler for query '%s': %s", query, str(e), exc_info=True)
             return None
 
-    def push_to_result_queue(self, messages):
-        logger.debug("Pushing result to RabbitMQ...")
-        num_of_messages = 0
-        avg_size_of_message = 0
-        for message in messages:
-            num_of_messages += 1
-            body = json.dumps(message)
-            avg_size_of_message += len(body)
-            while message is not None:
-                try:
+    def reconnect_to_rabbitmq(self):
+        time.sleep(1)
+        self.rabbitmq.close()
+        self.connect_to_rabbitmq()
+        self.init_rabbitmq_channels()
+
+    def publish_window(self, window):
+        """ Publish a window of AMQP messages and wait for the broker to take responsibility for them.
+
+            The result channel is transactional, so the messages of the window are published in one
+            go and confirmed together by the commit. If the connection fails, the window is published
+            again on a new connection.
+
+            Args:
+                window: a list of (body, properties) of the AMQP messages to publish
+        """
+        while True:
+            try:
+                for body, properties in window:
                     self.result_channel.basic_publish(
                         exchange=config.SPARK_RESULT_EXCHANGE,
                         routing_key='',
                         body=body,
-                        properties=pika.BasicProperties(delivery_mode=2,),
+                        properties=properties,
                     )
-                    break
-                except (pika.exceptions.ConnectionClosed, pika.exceptions.ChannelClosed) as e:
-                    logger.error('RabbitMQ Connection error while publishing results: %s', str(e), exc_info=True)
-                    time.sleep(1)
-                    self.rabbitmq.close()
-                    self.connect_to_rabbitmq()
-                    self.init_rabbitmq_channels()
+                self.result_channel.tx_commit()
+                return
+            except (pika.exceptions.ConnectionClosed, pika.exceptions.ChannelClosed) as e:
+                if str(e).find("is larger than configured max size") >= 0:
+                    logger.error("Spark attempted to send a message larger than the allowed maximum message size, "
+                                 "SPARK_RESULT_MAX_MESSAGE_SIZE should be lowered.")
+                logger.error('RabbitMQ Connection error while publishing results: %s', str(e), exc_info=True)
+                self.reconnect_to_rabbitmq()
 
-        try:
-            avg_size_of_message //= num_of_messages
-        except ZeroDivisionError:
-            avg_size_of_message = 0
-            logger.warning("No messages calculated", exc_info=True)
+    def push_to_result_queue(self, messages, already_published: Counter = None):
+        """ Publish the result messages of a request to the spark result exchange. The messages are
+            compressed and split into parts as described in listenbrainz_spark.request_consumer.result_publisher,
+            and published in windows of SPARK_RESULT_PUBLISH_WINDOW messages or
+            SPARK_RESULT_PUBLISH_WINDOW_SIZE bytes.
+
+            Args:
+                messages: the result messages of the request
+                already_published: the number of times each message id was published before the request
+                    was interrupted, when it is resumed. These messages are skipped as many times.
+        """
+        logger.debug("Pushing result to RabbitMQ...")
+        num_of_messages = 0
+        num_of_skipped = 0
+        num_of_parts = 0
+        size_of_messages = 0
+        size_published = 0
+
+        window, window_ids, window_size = [], [], 0
+        for message in messages:
+            body, message_id = serialize_message(message)
+            if already_published and already_published[message_id] > 0:
+                already_published[message_id] -= 1
+                num_of_skipped += 1
+                continue
+            num_of_messages += 1
+            size_of_messages += len(body)
+
+            body, content_encoding = compress_body(body, self.compression, self.compression_min_size)
+            parts = split_body(body, self.max_message_size)
+            for i, part in enumerate(parts):
+                properties = pika.BasicProperties(
+                    delivery_mode=2,
+                    content_type='application/json',
+                    content_encoding=content_encoding,
+                    message_id=message_id,
+                    headers={HEADER_PART: i, HEADER_PARTS: len(parts)} if len(parts) > 1 else None,
+                )
+                window.append((part, properties))
+            num_of_parts += len(parts)
+            size_published += len(body)
+            window_ids.append(message_id)
+            window_size += len(body)
+
+            if len(window_ids) >= self.window_messages or window_size >= self.window_size:
+                self.publish_window(window)
+                self.progress.record(window_ids)
+                window, window_ids, window_size = [], [], 0
+
+        if window:
+            self.publish_window(window)
+            self.progress.record(window_ids)
 
         logger.info("Done!")
         logger.info("Number of messages sent: {}".format(num_of_messages))
-        logger.info("Average size of message: {} bytes".format(avg_size_of_message))
+        if num_of_skipped:
+            logger.info("Number of messages skipped, sent before the request was interrupted: {}".format(num_of_skipped))
+        if num_of_messages:
+            logger.info("Average size of message: {} bytes".format(size_of_messages // num_of_messages))
+            logger.info("Average size of message published: {} bytes, in {} AMQP messages".format(
+                size_published // num_of_messages, num_of_parts))
+        else:
+            logger.warning("No messages calculated")
+
+    def process_request(self, request, already_published: Counter = None):
+        """ Run a request and publish its results, keeping track of the progress of the publishing """
+        messages = self.get_result(request)
+        if messages:
+            self.push_to_result_queue(messages, already_published)
+        self.progress.finish()
+
+    def resume_publishing(self):
+        """ Run the request which was interrupted while its results were published again, and
+            publish the rest of its results """
+        state = self.progress.load()
+        if state is None:
+            return
+        request, attempts = state['request'], state['attempts']
+        if attempts >= MAX_PUBLISH_ATTEMPTS:
+            logger.error('Giving up on publishing the results of request %s, interrupted %d times',
+                         json.dumps(request), attempts)
+            self.progress.finish()
+            return
+        logger.info('Resuming the publishing of the results of request %s, %d messages were already published',
+                    json.dumps(request), sum(self.progress.published.values()))
+        self.progress.save_request(request, attempts + 1)
+        self.process_request(request, Counter(self.progress.published))
+        logger.info('Request done!')
 
     def callback(self, channel, method, properties, body):
         request = json.loads(body.decode('utf-8'))
@@ -116,14 +219,10 @@ class RequestConsumer:
                     logger.error("Spark attempted to send a message larger than the allowed maximum message size.")
                 else:
                     logger.error('RabbitMQ Connection error when acknowledging request: %s', str(e), exc_info=True)
-                time.sleep(1)
-                self.rabbitmq.close()
-                self.connect_to_rabbitmq()
-                self.init_rabbitmq_channels()
+                self.reconnect_to_rabbitmq()
 
-        messages = self.get_result(request)
-        if messages:
-            self.push_to_result_queue(messages)
+        self.progress.start(request)
+        self.process_request(request)
 
         logger.info('Request done!')
 
@@ -150,12 +249,14 @@ class RequestConsumer:
 
         self.result_channel = self.rabbitmq.channel()
         self.result_channel.exchange_declare(exchange=config.SPARK_RESULT_EXCHANGE, exchange_type='fanout')
+        self.result_channel.tx_select()
 
     def run(self):
         while True:
             try:
                 self.connect_to_rabbitmq()
                 self.init_rabbitmq_channels()
+                self.resume_publishing()
                 logger.info('Request consumer started!')
 
                 try:
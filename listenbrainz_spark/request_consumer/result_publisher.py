@@ -0,0 +1,146 @@
+""" Encoding of the results that the request consumer publishes to the spark result exchange, and the
+persisted progress of their publishing.
+
+Each result message is serialized to json. If the json is larger than SPARK_RESULT_COMPRESSION_MIN_SIZE, it
+is compressed and the content_encoding property of the AMQP message is set to the compression used ("gzip",
+or "zstd" if the zstandard package is installed). If the body is still larger than
+SPARK_RESULT_MAX_MESSAGE_SIZE, it is split into parts which are published as consecutive AMQP messages with
+the same message_id and the "part" (counting from 0) and "parts" headers, which the spark reader joins
+before decoding the body. The message_id of a message is the sha1 of its json.
+
+The progress of the publishing of the results of a request is kept in a directory, with the request in
+request.json and the message ids of the messages published in published, one per line. If the request
+consumer crashes while publishing, the request is run again when it restarts and the messages which were
+already published are skipped, as many times as they were published. Messages are only skipped when a
+request is resumed, a request run for the first time publishes all of its messages, even identical ones.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from collections import Counter
+from typing import List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+HEADER_PART = 'part'
+HEADER_PARTS = 'parts'
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+
+# gzip levels above 5 barely shrink the json of the results further, but take much longer
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+
+def serialize_message(message) -> Tuple[bytes, str]:
+    """ Returns the json of a result message and its message id """
+    body = json.dumps(message).encode('utf-8')
+    return body, hashlib.sha1(body).hexdigest()
+
+
+def compress_body(body: bytes, compression: Optional[str], min_size: int) -> Tuple[bytes, Optional[str]]:
+    """ Compress the body of a message if it is larger than min_size.
+
+        Args:
+            body: the body of the message
+            compression: the compression to use, "gzip", "zstd" or None to never compress
+            min_size: the size in bytes above which bodies are compressed
+
+        Returns:
+            the body to publish, and its content encoding or None if it isn't compressed
+    """
+    if compression is None or len(body) <= min_size:
+        return body, None
+    if compression == COMPRESSION_GZIP:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), COMPRESSION_GZIP
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError('zstd compression of spark results requires the zstandard package')
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), COMPRESSION_ZSTD
+    raise ValueError('Unknown compression of spark results: {}'.format(compression))
+
+
+def split_body(body: bytes, max_size: int) -> List[bytes]:
+    """ Split a body into parts of at most max_size bytes """
+    if len(body) <= max_size:
+        return [body]
+    return [body[i:i + max_size] for i in range(0, len(body), max_size)]
+
+
+class PublishProgress:
+    """ The messages published for the request being processed, persisted to a directory. If the
+        directory is None, the progress isn't persisted and interrupted requests aren't resumed. """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        self.published = Counter()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def save_request(self, request: dict, attempts: int):
+        """ Save the request and the number of times it has been processed """
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self._path('request.json.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump({'request': request, 'attempts': attempts}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._path('request.json'))
+
+    def start(self, request: dict):
+        """ Start the progress of a new request, which hasn't published any messages yet """
+        self.published = Counter()
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        open(self._path('published'), 'w').close()
+        self.save_request(request, attempts=1)
+
+    def load(self) -> Optional[dict]:
+        """ Load the progress of an interrupted request.
+
+            Returns:
+                a dict with the request and the number of attempts to process it, or None if no
+                request was interrupted
+        """
+        self.published = Counter()
+        if self.directory is None or not os.path.exists(self._path('request.json')):
+            return None
+        with open(self._path('request.json')) as f:
+            state = json.load(f)
+        if os.path.exists(self._path('published')):
+            with open(self._path('published')) as f:
+                self.published = Counter(line.strip() for line in f if line.strip())
+        return state
+
+    def record(self, message_ids: List[str]):
+        """ Record messages as published, once the broker has taken responsibility for them """
+        self.published.update(message_ids)
+        if self.directory is None or not message_ids:
+            return
+        with open(self._path('published'), 'a') as f:
+            f.write(''.join(message_id + '\n' for message_id in message_ids))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def finish(self):
+        """ Remove the progress of the request, all its results have been published """
+        self.published = Counter()
+        if self.directory is None:
+            return
+        for name in ('request.json', 'published'):
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
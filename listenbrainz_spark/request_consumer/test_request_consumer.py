@@ -1,6 +1,14 @@
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+import uuid
 from unittest.mock import patch, MagicMock
 
-from listenbrainz_spark.request_consumer.request_consumer import RequestConsumer
+from listenbrainz_spark import config
+from listenbrainz_spark.request_consumer.request_consumer import RequestConsumer, MAX_PUBLISH_ATTEMPTS
+from listenbrainz_spark.request_consumer.result_publisher import PublishProgress, serialize_message
 from listenbrainz_spark.tests import SparkNewTestCase
 
 
@@ -38,3 +46,119 @@ class RequestConsumerTestCase(SparkNewTestCase):
         self.assertEqual(self.consumer.get_result({'query': 'i_know_what_this_means'}), {'result': 'ok'})
         mock_get_query_handler.assert_called_once()
         mock_query_handler.assert_called_once()
+
+
+def generate_messages(count, fail_at=None):
+    for i in range(count):
+        if i == fail_at:
+            raise RuntimeError('the request consumer crashed')
+        yield {'type': 'test', 'index': i}
+
+
+class ResultPublishingTestCase(unittest.TestCase):
+    """ Publishes results to a local RabbitMQ """
+
+    def setUp(self):
+        suffix = str(uuid.uuid4())
+        patcher = patch.multiple(
+            config,
+            SPARK_REQUEST_EXCHANGE='test_spark_request_' + suffix,
+            SPARK_REQUEST_QUEUE='test_spark_request_' + suffix,
+            SPARK_RESULT_EXCHANGE='test_spark_result_' + suffix,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.progress_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.progress_dir)
+
+        self.consumer = self.create_consumer()
+        self.channel = self.consumer.rabbitmq.channel()
+        self.queue = self.channel.queue_declare('', exclusive=True).method.queue
+        self.channel.queue_bind(exchange=config.SPARK_RESULT_EXCHANGE, queue=self.queue)
+
+    def tearDown(self):
+        self.channel.exchange_delete(config.SPARK_RESULT_EXCHANGE)
+        self.channel.exchange_delete(config.SPARK_REQUEST_EXCHANGE)
+        self.channel.queue_delete(config.SPARK_REQUEST_QUEUE)
+
+    def create_consumer(self):
+        consumer = RequestConsumer()
+        consumer.progress = PublishProgress(self.progress_dir)
+        consumer.max_message_size = 10000
+        consumer.window_messages = 2
+        consumer.connect_to_rabbitmq()
+        consumer.init_rabbitmq_channels()
+        self.addCleanup(consumer.rabbitmq.close)
+        return consumer
+
+    def receive_all(self):
+        received = []
+        while True:
+            method, properties, body = self.channel.basic_get(self.queue, auto_ack=True)
+            if method is None:
+                return received
+            received.append((properties, body))
+
+    def test_push_to_result_queue(self):
+        small = {'type': 'test', 'data': 'small'}
+        large = {'type': 'test', 'data': [str(uuid.uuid4()) for _ in range(2000)]}
+        self.consumer.push_to_result_queue([small, large])
+
+        received = self.receive_all()
+        properties, body = received[0]
+        self.assertIsNone(properties.content_encoding)
+        self.assertIsNone(properties.headers)
+        self.assertEqual(json.loads(body), small)
+
+        parts = received[1:]
+        self.assertGreater(len(parts), 1)
+        for i, (properties, body) in enumerate(parts):
+            self.assertEqual(properties.content_encoding, 'gzip')
+            self.assertEqual(properties.message_id, parts[0][0].message_id)
+            self.assertEqual(properties.headers, {'part': i, 'parts': len(parts)})
+            self.assertLessEqual(len(body), self.consumer.max_message_size)
+        body = gzip.decompress(b''.join(body for _, body in parts))
+        self.assertEqual(json.loads(body), large)
+
+    def test_push_to_result_queue_identical_messages(self):
+        self.consumer.progress.start({'query': 'test'})
+        # identical messages in different windows are all published
+        messages = [{'type': 'test', 'index': 0}] * 5
+        self.consumer.push_to_result_queue(messages)
+        self.assertEqual([json.loads(body) for _, body in self.receive_all()], messages)
+
+    def test_resume_publishing(self):
+        request = {'query': 'test'}
+        self.consumer.progress.start(request)
+        # the messages are published in windows of 2, the fifth message is never published
+        with self.assertRaises(RuntimeError):
+            self.consumer.push_to_result_queue(generate_messages(7, fail_at=5))
+
+        consumer = self.create_consumer()
+        with patch.object(consumer, 'get_result', return_value=generate_messages(7)) as mock_get_result:
+            consumer.resume_publishing()
+        mock_get_result.assert_called_once_with(request)
+
+        indexes = [json.loads(body)['index'] for _, body in self.receive_all()]
+        self.assertEqual(indexes, list(range(7)))
+        self.assertIsNone(consumer.progress.load())
+
+    def test_resume_publishing_identical_messages(self):
+        request = {'query': 'test'}
+        self.consumer.progress.start(request)
+        # two of the three identical messages were published before the crash
+        self.consumer.progress.record([serialize_message({'type': 'test'})[1]] * 2)
+
+        messages = [{'type': 'test'}] * 3 + [{'type': 'test', 'index': 1}]
+        with patch.object(self.consumer, 'get_result', return_value=iter(messages)):
+            self.consumer.resume_publishing()
+
+        self.assertEqual([json.loads(body) for _, body in self.receive_all()], messages[2:])
+
+    def test_resume_publishing_gives_up(self):
+        self.consumer.progress.save_request({'query': 'test'}, MAX_PUBLISH_ATTEMPTS)
+        with patch.object(self.consumer, 'get_result') as mock_get_result:
+            self.consumer.resume_publishing()
+        mock_get_result.assert_not_called()
+        self.assertIsNone(self.consumer.progress.load())
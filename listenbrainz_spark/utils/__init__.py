@@ -194,7 +194,8 @@ def get_listens_from_new_dump(start: datetime, end: datetime) -> DataFrame:
         # file does not have any listens newer than from_ts, the remaining files will
         # not have those either.
         df = df.where(f"listened_at >= to_timestamp('{start}')")
-        if df.count() == 0:
+        # only look for the first listen rather than counting them all, which would read the whole file
+        if not df.take(1):
             break
 
         # cannot merge this condition with the above one because, consider the following case:
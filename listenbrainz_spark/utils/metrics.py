@@ -0,0 +1,108 @@
+""" Instrumentation of Spark jobs which doesn't run any Spark jobs of its own.
+
+Counting the rows of a dataframe with .count() runs a job which executes the whole lineage of the
+dataframe again, only to log a number. Instead, the number of rows and size of the dataframes that
+a job writes are read on the driver from the listing and the footers of the parquet files written,
+and the counts of intermediate dataframes are derived from aggregations the job computes anyway.
+
+PipelineMetrics times the stages of a job, keeps the rows they wrote and logs a report of them.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import listenbrainz_spark
+from listenbrainz_spark import config
+
+logger = logging.getLogger(__name__)
+
+
+def get_written_stats(hdfs_path: str) -> Tuple[int, int]:
+    """ Get the number of rows and the size of a dataframe written as parquet, from the metadata of
+        its files. Only the footers of the files are read, by the driver, no Spark job is run.
+
+        Args:
+            hdfs_path: the path in HDFS the dataframe was saved to with save_parquet.
+
+        Returns:
+            the number of rows and the size in bytes of the parquet files at the path
+    """
+    jvm = listenbrainz_spark.context._jvm
+    hadoop_conf = listenbrainz_spark.context._jsc.hadoopConfiguration()
+    directory = jvm.org.apache.hadoop.fs.Path(config.HDFS_CLUSTER_URI + hdfs_path)
+    file_system = directory.getFileSystem(hadoop_conf)
+
+    rows = size = 0
+    for status in file_system.listStatus(directory):
+        if not status.getPath().getName().endswith('.parquet'):
+            continue
+        size += status.getLen()
+        input_file = jvm.org.apache.parquet.hadoop.util.HadoopInputFile.fromStatus(status, hadoop_conf)
+        reader = jvm.org.apache.parquet.hadoop.ParquetFileReader.open(input_file)
+        try:
+            rows += sum(block.getRowCount() for block in reader.getFooter().getBlocks())
+        finally:
+            reader.close()
+    return rows, size
+
+
+class Stage:
+    """ The duration of a stage of a job, and the rows and bytes it wrote """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = None
+        self.rows = None
+        self.bytes = None
+
+    def record_written(self, hdfs_path: str) -> int:
+        """ Add the rows and bytes of a dataframe saved by the stage to those of the stage.
+
+            Returns:
+                the number of rows of the saved dataframe
+        """
+        rows, size = get_written_stats(hdfs_path)
+        self.rows = (self.rows or 0) + rows
+        self.bytes = (self.bytes or 0) + size
+        return rows
+
+
+class PipelineMetrics:
+    """ The stages of a job, in the order in which they ran """
+
+    def __init__(self, job_name: str):
+        self.job_name = job_name
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """ Time the stage of the job in the with block, which can set the rows of the stage on the
+            yielded Stage, or record them from the dataframes it saved. """
+        stage = Stage(name)
+        self.stages.append(stage)
+        start = time.monotonic()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.monotonic() - start
+
+    def report(self) -> List[Dict]:
+        """ Returns the name, duration in seconds, rows and bytes of each stage """
+        return [{
+            'name': stage.name,
+            'seconds': round(stage.seconds, 2) if stage.seconds is not None else None,
+            'rows': stage.rows,
+            'bytes': stage.bytes,
+        } for stage in self.stages]
+
+    def log_report(self):
+        lines = ['{:<40} {:>10} {:>14} {:>14}'.format('stage', 'seconds', 'rows', 'bytes')]
+        for stage in self.report():
+            lines.append('{:<40} {:>10} {:>14} {:>14}'.format(
+                stage['name'],
+                '' if stage['seconds'] is None else '{:.2f}'.format(stage['seconds']),
+                '' if stage['rows'] is None else stage['rows'],
+                '' if stage['bytes'] is None else stage['bytes'],
+            ))
+        logger.info('Stages of {}:\n{}'.format(self.job_name, '\n'.join(lines)))
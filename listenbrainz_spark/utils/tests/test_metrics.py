@@ -0,0 +1,59 @@
+import listenbrainz_spark
+from listenbrainz_spark import utils
+from listenbrainz_spark.tests import SparkNewTestCase
+from listenbrainz_spark.utils.metrics import PipelineMetrics, get_written_stats
+
+from pyspark.sql import Row
+
+
+class MetricsTestCase(SparkNewTestCase):
+    # use path_ as prefix for all paths in this class.
+    path_ = "/test"
+
+    def tearDown(self):
+        if utils.path_exists(self.path_):
+            utils.delete_dir(self.path_, recursive=True)
+
+    def save_test_dataframe(self, hdfs_path, count):
+        df = listenbrainz_spark.session.createDataFrame([Row(column1=i, column2=str(i)) for i in range(count)])
+        # several files are written, all of them are counted
+        utils.save_parquet(df.repartition(3), hdfs_path)
+
+    def test_get_written_stats(self):
+        hdfs_path = self.path_ + '/test_df.parquet'
+        self.save_test_dataframe(hdfs_path, 100)
+
+        context = listenbrainz_spark.context
+        context.setJobGroup('test_get_written_stats', 'get written stats')
+        try:
+            rows, size = get_written_stats(hdfs_path)
+        finally:
+            context.setLocalProperty('spark.jobGroup.id', None)
+
+        self.assertEqual(rows, 100)
+        self.assertGreater(size, 0)
+        # the stats are read from the metadata of the files, without running a job
+        self.assertEqual(list(context.statusTracker().getJobIdsForGroup('test_get_written_stats')), [])
+
+    def test_pipeline_metrics(self):
+        hdfs_path_1 = self.path_ + '/test_df_1.parquet'
+        hdfs_path_2 = self.path_ + '/test_df_2.parquet'
+
+        metrics = PipelineMetrics('test')
+        with metrics.stage('count') as stage:
+            stage.rows = 5
+        with metrics.stage('save') as stage:
+            self.save_test_dataframe(hdfs_path_1, 10)
+            self.save_test_dataframe(hdfs_path_2, 20)
+            self.assertEqual(stage.record_written(hdfs_path_1), 10)
+            self.assertEqual(stage.record_written(hdfs_path_2), 20)
+        with metrics.stage('other'):
+            pass
+
+        report = metrics.report()
+        self.assertEqual([stage['name'] for stage in report], ['count', 'save', 'other'])
+        self.assertEqual([stage['rows'] for stage in report], [5, 30, None])
+        self.assertIsNone(report[0]['bytes'])
+        self.assertGreater(report[1]['bytes'], 0)
+        self.assertTrue(all(stage['seconds'] >= 0 for stage in report))
+        metrics.log_report()
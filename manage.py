@@ -1,8 +1,9 @@
 from datetime import datetime
 
+import listenbrainz.benchmarks.benchmark_manage as benchmark_manage
 import listenbrainz.db.dump_manager as dump_manager
 import listenbrainz.spark.request_manage as spark_request_manage
-from listenbrainz.listenstore.timescale_utils import recalculate_all_user_data as ts_recalculate_all_user_data, \
+from listenbrainz.listenstore.timescale_utils import check_listen_user_metadata as ts_check_listen_user_metadata, \
     refresh_listen_count_aggregate as ts_refresh_listen_count_aggregate
 
 from listenbrainz import db
@@ -239,6 +240,9 @@ def init_ts_db(force, create_db):
         print('TS: Creating views...')
         ts.run_sql_script_without_transaction(os.path.join(TIMESCALE_SQL_DIR, 'create_views.sql'))
 
+        print('TS: Enabling compression...')
+        ts.run_sql_script_without_transaction(os.path.join(TIMESCALE_SQL_DIR, 'create_compression.sql'))
+
         print('TS: Creating indexes...')
         ts.run_sql_script(os.path.join(TIMESCALE_SQL_DIR, 'create_indexes.sql'))
         ts.create_view_indexes()
@@ -271,13 +275,52 @@ def set_rate_limits(per_token_limit, per_ip_limit, window_size):
         set_rate_limits(per_token_limit, per_ip_limit, window_size)
 
 
-@cli.command(name="recalculate_all_user_data")
-def recalculate_all_user_data():
+@cli.command(name="check_listen_user_metadata")
+@click.option("--dry-run", is_flag=True, help="Only log the users whose listen counts have drifted.")
+def check_listen_user_metadata(dry_run):
+    """
+        Check the listen counts and timestamps of all users against the listen table, and fix
+        the ones that have drifted.
+    """
+    ts_check_listen_user_metadata(dry_run)
+
+
+@cli.command(name="process_listen_delete_jobs")
+def process_listen_delete_jobs():
+    """
+        Delete the listens of the users whose listens are queued for deletion.
+    """
+    from listenbrainz.listenstore.listen_delete_jobs import process_listen_delete_jobs, DEFAULT_BATCH_SIZE
+    application = webserver.create_app()
+    with application.app_context():
+        process_listen_delete_jobs(
+            batch_size=application.config.get("LISTEN_DELETE_BATCH_SIZE", DEFAULT_BATCH_SIZE),
+            max_rows_per_second=application.config.get("LISTEN_DELETE_MAX_ROWS_PER_SECOND", 0),
+            max_replication_lag=application.config.get("LISTEN_DELETE_MAX_REPLICATION_LAG", 0),
+        )
+
+
+@cli.command(name="compress_listen_chunks")
+def compress_listen_chunks():
+    """
+        Compress the chunks of the listen table which were decompressed to write to them, without
+        waiting for the compression policy.
+    """
+    from listenbrainz.listenstore.timescale_compression import compress_listen_chunks
+    application = webserver.create_app()
+    with application.app_context():
+        print("Compressed %d chunks" % compress_listen_chunks())
+
+
+@cli.command(name="benchmark_listen_compression")
+@click.option("--seed", type=int, default=0, help="Seed of the generated listens")
+@click.option("--scale", type=float, default=1.0, help="Number of listens, relative to the default number")
+@click.option("--output", "-o", default=None, help="Write the results as json to this file")
+def benchmark_listen_compression(seed, scale, output):
     """
-        Recalculate all user timestamps and listen counts. ONLY USE THIS WHEN YOU KNOW
-        WHAT YOU ARE DOING!
+        Compare the storage size and read latency of generated listens with and without compression.
     """
-    ts_recalculate_all_user_data()
+    benchmark_manage.run_and_report(["listen_reads_uncompressed", "listen_reads_compressed"], seed, scale, output)
 
 
 @cli.command(name="refresh_continuous_aggregates")
@@ -312,9 +355,83 @@ def submit_release(user, token, releasembid):
     listenbrainz.misc.submit_release.submit_release_impl(token, releaseid, "http://web:7000")
 
 
+@cli.command(name="build_mbid_mapping_index")
+def build_mbid_mapping_index():
+    """
+        Build the in-memory exact match index of the MBID mapping. Run this after each mapping rebuild,
+        running labs API processes pick up the new index automatically.
+    """
+    from listenbrainz import config
+    from listenbrainz.labs_api.labs.api.mapping_index import build_index
+    count = build_index(config.MBID_MAPPING_INDEX_PATH, config.MBID_MAPPING_DATABASE_URI)
+    print("Wrote %d entries to %s" % (count, config.MBID_MAPPING_INDEX_PATH))
+
+
+@cli.command(name="benchmark_mbid_mapping_index")
+@click.option("--seed", type=int, default=0, help="Seed of the looked up strings")
+@click.option("--scale", type=float, default=1.0, help="Number of lookups, relative to the default number")
+@click.option("--output", "-o", default=None, help="Write the results as json to this file")
+def benchmark_mbid_mapping_index(seed, scale, output):
+    """
+        Compare the lookup speed of the exact match index of the MBID mapping with the database.
+    """
+    benchmark_manage.run_and_report(["mbid_mapping_index_lookup", "mbid_mapping_database_lookup"],
+                                    seed, scale, output)
+
+
+@cli.command(name="benchmark_listen_serialization")
+@click.option("--seed", type=int, default=0, help="Seed of the generated listens")
+@click.option("--scale", type=float, default=1.0, help="Number of listens, relative to the default number")
+@click.option("--output", "-o", default=None, help="Write the results as json to this file")
+def benchmark_listen_serialization(seed, scale, output):
+    """
+        Time the conversion of listens from submitted json to timescale rows and back to the api format.
+    """
+    benchmark_manage.run_and_report(["listen_serialization_write", "listen_serialization_read",
+                                     "listen_serialization_read_direct"], seed, scale, output)
+
+
+@cli.command(name="listen_pipeline_latency")
+@click.option("--window", "-w", type=int, default=3600, help="Report the timings of the last this many seconds")
+@click.option("--submit-metrics", is_flag=True, help="Also report the percentiles to the metrics store")
+def listen_pipeline_latency(window, submit_metrics):
+    """
+        Show the distribution of the timings of the stages of the listen pipeline, recorded for the batches
+        of listens sampled by LISTEN_TRACE_SAMPLE_RATE.
+    """
+    from listenbrainz import listen_trace
+    application = webserver.create_app()
+    with application.app_context():
+        latencies = listen_trace.get_stage_latencies(window)
+        if submit_metrics:
+            listen_trace.submit_stage_latencies(latencies)
+    if not latencies:
+        print("No listens were traced in the last %d seconds" % window)
+        return
+    print("%-28s %8s %10s %10s %10s %10s" % ("stage (ms)", "count", "p50", "p90", "p99", "max"))
+    for stage in listen_trace.STAGES:
+        if stage in latencies:
+            latency = latencies[stage]
+            print("%-28s %8d %10.1f %10.1f %10.1f %10.1f" % (stage, latency["count"], latency["p50"],
+                                                           latency["p90"], latency["p99"], latency["max"]))
+
+
+@cli.command(name="build_mbid_mapping_trigram_index")
+def build_mbid_mapping_trigram_index():
+    """
+        Build the embedded trigram index of the MBID mapping, used by the fuzzy mapping lookup when
+        MBID_MAPPING_SEARCH_BACKEND is "trigram". Running labs API processes pick up the new index automatically.
+    """
+    from listenbrainz import config
+    from listenbrainz.labs_api.labs.api.trigram_index import build_index
+    count = build_index(config.MBID_MAPPING_TRIGRAM_INDEX_PATH, config.MBID_MAPPING_DATABASE_URI)
+    print("Wrote %d documents to %s" % (count, config.MBID_MAPPING_TRIGRAM_INDEX_PATH))
+
+
 # Add other commands here
 cli.add_command(spark_request_manage.cli, name="spark")
 cli.add_command(dump_manager.cli, name="dump")
+cli.add_command(benchmark_manage.cli, name="benchmark")
 
 
 if __name__ == '__main__':
@@ -148,7 +148,7 @@ function spark_setup {
     echo "Running spark test setup"
     docker-compose -f $SPARK_COMPOSE_FILE_LOC \
                    -p $SPARK_COMPOSE_PROJECT_NAME \
-                  up -d namenode datanode
+                  up -d namenode datanode rabbitmq
 }
 
 function build_spark_containers {